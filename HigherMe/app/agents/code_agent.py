@@ -1,14 +1,17 @@
 import os
 import subprocess
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from dotenv import load_dotenv
 from db import crud
 from tools.xp_calculator import calculateXp
 from db.database import get_db_session
-from db.models import CodeLog, XPEvent
+from observability.logger import get_logger, sampled
+from observability.metrics import GIT_STATS_SECONDS
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 WAKATIME_API_KEY = os.getenv("wakatime_api")
 SUMMARIES_API_URL = "https://wakatime.com/api/v1/users/current/summaries"
 
@@ -27,10 +30,11 @@ def get_git_stats():
             '--numstat'
         ]
         
-        result = subprocess.run(git_cmd, capture_output=True, text=True, cwd=os.getcwd())
+        with GIT_STATS_SECONDS.time(command="today"):
+            result = subprocess.run(git_cmd, capture_output=True, text=True, cwd=os.getcwd())
         
         if result.returncode != 0:
-            print(f"⚠️ Git command failed: {result.stderr}")
+            logger.warning("⚠️ Git command failed: %s", result.stderr)
             # Try alternative approach - get stats from last few commits
             return get_recent_commit_stats()
         
@@ -53,7 +57,7 @@ def get_git_stats():
         }
         
     except Exception as e:
-        print(f"⚠️ Error getting git stats: {e}")
+        logger.warning("⚠️ Error getting git stats: %s", e)
         return {"lines_added": 0, "lines_removed": 0}
 
 def get_recent_commit_stats():
@@ -66,7 +70,8 @@ def get_recent_commit_stats():
             '--numstat'
         ]
         
-        result = subprocess.run(git_cmd, capture_output=True, text=True, cwd=os.getcwd())
+        with GIT_STATS_SECONDS.time(command="recent"):
+            result = subprocess.run(git_cmd, capture_output=True, text=True, cwd=os.getcwd())
         
         if result.returncode != 0:
             return {"lines_added": 0, "lines_removed": 0}
@@ -87,7 +92,7 @@ def get_recent_commit_stats():
         }
         
     except Exception as e:
-        print(f"⚠️ Error getting recent commit stats: {e}")
+        logger.warning("⚠️ Error getting recent commit stats: %s", e)
         return {"lines_added": 0, "lines_removed": 0}
 
 def log_code_activity(user_id : int):
@@ -127,82 +132,56 @@ def log_code_activity(user_id : int):
         crud.award_xp("code", xp_result["xp"], user_id=user_id)
         
         # Mark this log as processed since we've already awarded XP
-        code_log.processed = True
-        code_log.processed_at = datetime.now()
-        db_session.add(code_log)
-        db_session.commit()
+        crud.mark_logs_as_processed(db_session, [code_log.id], "code")
+        # Reload after the commit so the returned log is still readable once the session closes
+        db_session.refresh(code_log)
         
-        print(f"✅ Code activity logged: +{git_stats['lines_added']}/-{git_stats['lines_removed']} lines")
-        print(f"🎮 {xp_result['details']}")
+        logger.info("✅ Code activity logged: +%s/-%s lines", git_stats['lines_added'], git_stats['lines_removed'])
+        logger.debug("🎮 %s", xp_result['details'])
         return code_log
         
     except Exception as e:
-        print(f"❌ Error logging code activity: {e}")
+        logger.error("❌ Error logging code activity: %s", e)
     finally:
         db_session.close()
 
-def run_code_agent(user_id : int):
+def run_code_agent(user_id : int, day: date = None):
     """
-    Calculate XP for all unprocessed code logs.
+    Calculate XP for all unprocessed code logs of `day` (default: the user's today).
     This function is called by the scheduler.
     """
     db_session = get_db_session()
     try:
-        today = datetime.now().date()
-        
-        # Check if XP has already been awarded for code today
-        xp_awarded = db_session.query(XPEvent).filter(
-            XPEvent.timestamp >= today,
-            XPEvent.xp_type == "code",
-            XPEvent.user_id == user_id
-        ).first()
-        
-        if xp_awarded:
-            print(f"⚠️ Code XP already awarded today ({xp_awarded.amount} XP). Skipping.")
-            return
+        day = day or crud.user_today(db_session, user_id=user_id)
         
-        # Get unprocessed code logs from today
-        code_logs = db_session.query(CodeLog).filter(
-            CodeLog.user_id == user_id,
-            CodeLog.date >= today,
-            CodeLog.processed == False
-        ).order_by(CodeLog.date).all()
+        # Claim the day's unprocessed logs and total them in one statement.
+        # Nothing is claimed if code XP was already awarded that day.
+        totals = crud.claim_code_logs(db_session, user_id=user_id, day=day)
         
-        if not code_logs:
-            print("ℹ️ No unprocessed code logs found for today. No XP awarded.")
+        if not totals["count"]:
+            logger.debug("ℹ️ No unprocessed code logs to award for %s (or code XP already awarded).", day)
+            db_session.rollback()
             return
         
-        # Calculate total metrics for the day
-        total_lines_added = sum(log.lines_added for log in code_logs)
-        total_lines_removed = sum(log.lines_removed for log in code_logs)
-        total_time = sum(log.total_time_minutes for log in code_logs)
-        
-        # Calculate XP once for all activity
         metrics = {
-            "lines_added": total_lines_added,
-            "lines_removed": total_lines_removed,
-            "total_time_minutes": total_time
+            "lines_added": totals["lines_added"],
+            "lines_removed": totals["lines_removed"],
+            "total_time_minutes": totals["total_time_minutes"]
         }
         
-        xp_result = calculateXp(event_type="code", metrics=metrics)
-        
-        # Award XP
-        crud.award_xp("code", xp_result["xp"] ,user_id)
-        
-        # Mark all logs as processed
-        now = datetime.now()
-        for log in code_logs:
-            log.processed = True
-            log.processed_at = now
+        xp_result = calculateXp(event_type="coding", metrics=metrics)
         
-        db_session.commit()
+        # Award XP in the same transaction as the claim
+        if crud.award_xp("code", xp_result["xp"], user_id, db=db_session, day=day) is None:
+            return False
         
-        print(f"🧠 Daily Code XP Awarded: +{xp_result['xp']} XP")
+        logger.info("🧠 Daily Code XP Awarded: +%s XP", xp_result['xp'], extra=sampled())
         if 'details' in xp_result:
-            print(f"📝 {xp_result['details']}")
+            logger.debug("📝 %s", xp_result['details'])
             
     except Exception as e:
-        print(f"❌ Error calculating code XP: {e}")
+        logger.error("❌ Error calculating code XP: %s", e)
         db_session.rollback()
+        return False
     finally:
         db_session.close()
\ No newline at end of file
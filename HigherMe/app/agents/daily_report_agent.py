@@ -1,53 +1,42 @@
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy.orm import Session
-from db.models import XPEvent, MoodLog, HealthLog, CodeLog, Level
+from db import crud
+from db.models import XPEvent, MoodLog, HealthLog, CodeLog, Level, ReportSnapshot
+from db.database import get_db_session
+from db.mood_similarity import distinct_entries
 import os
-from langchain_groq import ChatGroq
+from tools.llm import create_llm
+from tools.prompt_budget import (bounded_list_prompt, select_entries, truncate_tokens, count_tokens,
+                                 LLM_PROMPT_MAX_TOKENS, LLM_PROMPT_ITEM_MAX_TOKENS, LLM_SUMMARY_MAX_TOKENS)
+from observability.metrics import LLM_FALLBACKS
 from dotenv import load_dotenv
+from observability.logger import get_logger
 
 load_dotenv()
 
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.0,
-    max_retries=2,
-    # other params...
-)
-
-def get_today_logs(db: Session , user_id : int):
-    print(f"Fetching today's logs for user {user_id}...")
-    today = datetime.now().date()
-    tomorrow = today + timedelta(days=1)
-
-    xp_events = db.query(XPEvent).filter(
-        XPEvent.user_id == user_id,
-        XPEvent.timestamp >= today,
-        XPEvent.timestamp < tomorrow
-    ).all()
-    print(f"Found {len(xp_events)} XP events for today.")
-    mood_logs = db.query(MoodLog).filter(
-        MoodLog.user_id == user_id,
-        MoodLog.timestamp >= today,
-        MoodLog.timestamp < tomorrow
-    ).all()
-    print(f"Found {len(mood_logs)} mood logs for today.")
-    health_logs = db.query(HealthLog).filter(
-        HealthLog.user_id == user_id,
-        HealthLog.date >= today,
-        HealthLog.date < tomorrow
-    ).all()
-
-    code_logs = db.query(CodeLog).filter(
-        CodeLog.user_id == user_id,
-        CodeLog.date >= today,
-        CodeLog.date < tomorrow
-    ).all()
+logger = get_logger(__name__)
+
+llm = create_llm(__name__, max_tokens=LLM_SUMMARY_MAX_TOKENS)
+
+# Budget for the free-form XP details quoted in a prompt
+XP_DETAILS_MAX_TOKENS = 4 * LLM_PROMPT_ITEM_MAX_TOKENS
+
+def get_today_logs(db: Session , user_id : int, day = None):
+    logger.debug("Fetching today's logs for user %s...", user_id)
+    today = day or crud.user_today(db, user_id=user_id)
+
+    xp_events = crud.get_day_logs(db, XPEvent, user_id=user_id, day=today)
+    logger.debug("Found %s XP events for today.", len(xp_events))
+    mood_logs = crud.get_day_logs(db, MoodLog, user_id=user_id, day=today)
+    logger.debug("Found %s mood logs for today.", len(mood_logs))
+    health_logs = crud.get_day_logs(db, HealthLog, user_id=user_id, day=today)
+    code_logs = crud.get_day_logs(db, CodeLog, user_id=user_id, day=today)
 
     level_info = db.query(Level).filter(Level.user_id == user_id).first()
     
     # Create level record if it doesn't exist
     if not level_info:
-        print(f"⚠️ No level record found for user {user_id}. Creating one...")
+        logger.warning("⚠️ No level record found for user %s. Creating one...", user_id)
         level_info = Level(
             user_id=user_id,
             current_level=1,
@@ -57,9 +46,9 @@ def get_today_logs(db: Session , user_id : int):
         db.add(level_info)
         db.commit()
         db.refresh(level_info)
-        print(f"✅ Created level record for user {user_id}")
+        logger.debug("✅ Created level record for user %s", user_id)
     
-    print(f"Fetched {len(xp_events)} XP events, {len(mood_logs)} mood logs, {len(health_logs)} health logs, and {len(code_logs)} code logs. , level info: {level_info}")
+    logger.debug("Fetched %s XP events, %s mood logs, %s health logs, and %s code logs. , level: %s", len(xp_events), len(mood_logs), len(health_logs), len(code_logs), level_info.current_level)
     return {
         "xp_events": xp_events,
         "mood_logs": mood_logs,
@@ -69,7 +58,7 @@ def get_today_logs(db: Session , user_id : int):
     }
     
 def format_xp_breakdown(xp_events):
-    print(f"🔢 Inside format_xp_breakdown - Processing {len(xp_events)} XP events")
+    logger.debug("🔢 Inside format_xp_breakdown - Processing %s XP events", len(xp_events))
     
     summary = {}
     details = {}
@@ -83,11 +72,11 @@ def format_xp_breakdown(xp_events):
         # Store details for each XP type
         if xp.details:
             details[xp_type] = xp.details
-            print(f"🔢 Added details for {xp_type}: {xp.details}")
+            logger.debug("🔢 Added details for %s: %s", xp_type, xp.details)
 
-    print(f"🔢 XP Summary: {summary}")
-    print(f"🔢 XP Details: {details}")
-    print(f"🔢 Total XP: {total}")
+    logger.debug("🔢 XP Summary: %s", summary)
+    logger.debug("🔢 XP Details: %s", details)
+    logger.debug("🔢 Total XP: %s", total)
 
     lines = [f"🔢 **XP Breakdown:**"]
     for key, value in summary.items():
@@ -95,16 +84,16 @@ def format_xp_breakdown(xp_events):
     lines.append(f"\n🏆 **Total XP Today:** +{total}")
     
     formatted_breakdown = "\n".join(lines)
-    print(f"🔢 Formatted XP breakdown: {formatted_breakdown}")
+    logger.debug("🔢 Formatted XP breakdown: %s", formatted_breakdown)
     
     return formatted_breakdown, details
 
 
 def build_mood_summary(mood_logs, xp_details):
-    print(f"🧠 Inside build_mood_summary - Processing {len(mood_logs)} mood logs")
+    logger.debug("🧠 Inside build_mood_summary - Processing %s mood logs", len(mood_logs))
     
     if not mood_logs:
-        print("🧠 No mood logs found for today")
+        logger.debug("🧠 No mood logs found for today")
         return "🧠 **Mood:** No mood logs today."
 
     # First, try to use our enhanced mood summary function that leverages actual mood text
@@ -121,83 +110,73 @@ def build_mood_summary(mood_logs, xp_details):
             target_date = datetime.now().date()
             if mood_logs:
                 # Use the date from the first mood log if available
-                target_date = mood_logs[0].timestamp.date()
+                target_date = mood_logs[0].local_day
             
-            # Generate enhanced summary using actual mood text for the specific date
+            # Read the rolling summary kept up to date as mood entries were logged
             enhanced_summary = mood_summary_with_sentiment(user_id, target_date)
             
             if enhanced_summary and enhanced_summary["summary"] and "No mood entries" not in enhanced_summary["summary"] and "Unable to generate summary" not in enhanced_summary["summary"]:
-                print(f"🧠 Using enhanced mood summary: {enhanced_summary['summary']}")
+                logger.debug("🧠 Using enhanced mood summary: %s", enhanced_summary['summary'])
                 return f"🧠 **Mood:** {enhanced_summary['summary']}"
             elif len(mood_logs) == 1 and mood_logs[0].mood_text:
                 # Special case for single mood entry
                 mood_text = mood_logs[0].mood_text
                 simple_summary = f"Aha! You shared that you're feeling \"{mood_text[:30]}...\" today - thanks for letting me know!"
-                print(f"🧠 Using simple mood summary for single entry: {simple_summary}")
+                logger.debug("🧠 Using simple mood summary for single entry: %s", simple_summary)
                 return f"🧠 **Mood:** {simple_summary}"
     except Exception as e:
-        print(f"🧠 Error generating enhanced mood summary: {e}")
+        logger.error("🧠 Error generating enhanced mood summary: %s", e)
         # Continue with fallback approaches
 
     # Use XP details if available, otherwise fallback to basic summary
     if xp_details:
-        print(f"🧠 Using XP details for mood summary: {xp_details}")
+        logger.debug("🧠 Using XP details for mood summary: %s", xp_details)
         prompt = f"""
 You are a wise and grounded mentor. Based on the following XP analysis, write a brief (2-3 sentence) summary of today's emotional progress.
 
 Avoid over-enthusiasm. Be realistic, encouraging, and thoughtful. Highlight emotional awareness, reflection, and meaningful changes.
 
-Mood XP Details: {xp_details}
+Mood XP Details: {truncate_tokens(str(xp_details), XP_DETAILS_MAX_TOKENS)}
 """
         try:
-            response = llm.invoke(prompt).content.strip()
-            print(f"🧠 Generated mood summary: {response}")
+            response = llm.invoke(prompt, kind="mood_summary_from_xp").content.strip()
+            logger.debug("🧠 Generated mood summary: %s", response)
             return f"🧠 **Mood:** {response}"
         except Exception as e:
-            print(f"🧠 Error generating mood summary: {e}")
+            logger.error("🧠 Error generating mood summary: %s", e)
+            LLM_FALLBACKS.inc(path="report_mood_error")
             return f"🧠 **Mood:** ❌ Failed to generate summary: {e}"
     else:
         # Fallback to basic count with more detail
-        mood_texts = [log.mood_text for log in mood_logs if log.mood_text]
+        mood_texts = [log.mood_text for log in distinct_entries([log for log in mood_logs if log.mood_text])]
         if mood_texts:
             # Create a more meaningful summary from actual mood texts
-            prompt = f"""
-You are a friendly, witty, and empathetic companion who understands human emotions deeply. Based on the following mood journal entries from a single day, write a concise 2-3 sentence summary that captures the emotional journey of the day in a warm, relatable way.
-
-Instructions:
-- Be silly, witty, empathic, and considerate
-- Use casual, friendly language that a close friend might use
-- Focus on the human experience and emotional patterns
-- Avoid technical terms like "sentiment" or "emotional stimuli"
-- Keep it brief and readable
-
-Mood Entries:
-{chr(10).join(f'- "{text}"' for text in mood_texts[:5])}
-
-Summary:"""
+            from agents.mood_summary import MOOD_PROMPT_HEAD, MOOD_PROMPT_TAIL
+            prompt = bounded_list_prompt(MOOD_PROMPT_HEAD, [f'- "{text}"' for text in mood_texts], MOOD_PROMPT_TAIL)
             
             try:
-                response = llm.invoke(prompt).content.strip()
+                response = llm.invoke(prompt, kind="mood_summary_from_entries").content.strip()
                 if response:
-                    print(f"🧠 Generated mood summary from actual entries: {response}")
+                    logger.debug("🧠 Generated mood summary from actual entries: %s", response)
                     return f"🧠 **Mood:** {response}"
             except Exception as e:
-                print(f"🧠 Error generating mood summary from entries: {e}")
+                logger.error("🧠 Error generating mood summary from entries: %s", e)
         
         # Ultimate fallback to basic count
+        LLM_FALLBACKS.inc(path="report_mood_canned")
         if len(mood_logs) == 1:
             fallback_summary = "🧠 **Mood:** Aha! You shared your mood today - thanks for letting me know!"
         else:
             fallback_summary = f"🧠 **Mood:** You shared {len(mood_logs)} mood updates today - that's awesome!"
-        print(f"🧠 Using fallback mood summary: {fallback_summary}")
+        logger.debug("🧠 Using fallback mood summary: %s", fallback_summary)
         return fallback_summary
 
 
 def build_health_summary(health_logs, xp_details):
-    print(f"💪 Inside build_health_summary - Processing {len(health_logs)} health logs")
+    logger.debug("💪 Inside build_health_summary - Processing %s health logs", len(health_logs))
     
     if not health_logs:
-        print("💪 No health logs found for today")
+        logger.debug("💪 No health logs found for today")
         return "💪 **Health:** No health logs today."
     
     # First, try to use our enhanced health summary function that leverages actual health log strings
@@ -209,7 +188,7 @@ def build_health_summary(health_logs, xp_details):
         # Get the user_id from the first health log (assuming all logs are from the same user)
         if health_logs:
             user_id = health_logs[0].user_id
-            today = datetime.now().date()
+            today = health_logs[0].local_day
             
             # Generate summary using actual health log strings
             summary_text = health_summary(user_id, today)
@@ -217,14 +196,14 @@ def build_health_summary(health_logs, xp_details):
             if summary_text and not summary_text.startswith("Unable to retrieve") and not summary_text.startswith("No health entries"):
                 return f"💪 **Health:** {summary_text}"
             else:
-                print(f"💪 Health summary function returned fallback: {summary_text}")
+                logger.debug("💪 Health summary function returned fallback: %s", summary_text)
         
     except Exception as e:
-        print(f"💪 Error using health summary function: {e}")
+        logger.error("💪 Error using health summary function: %s", e)
     
     # Fallback to XP details if available
     if xp_details:
-        print(f"💪 Using XP details for health summary: {xp_details}")
+        logger.debug("💪 Using XP details for health summary: %s", xp_details)
         prompt = f"""
 You are a friendly, witty, and empathetic health companion who understands that health journeys are personal and unique. Based on the health activities below, write a 2-3 sentence summary of today's health journey in a warm, encouraging way.
 
@@ -235,28 +214,30 @@ Instructions:
 - Celebrate wins and gently encourage continued growth
 - Avoid technical terms and keep it relatable
 
-Health Activities: {xp_details}
+Health Activities: {truncate_tokens(str(xp_details), XP_DETAILS_MAX_TOKENS)}
 """
         try:
-            response = llm.invoke(prompt).content.strip()
-            print(f"💪 Generated health summary from XP details: {response}")
+            response = llm.invoke(prompt, kind="health_summary_from_xp").content.strip()
+            logger.debug("💪 Generated health summary from XP details: %s", response)
             if response:
                 return f"💪 **Health:** {response}"
             else:
                 # Fallback if LLM returns empty response
+                LLM_FALLBACKS.inc(path="report_health_canned")
                 if len(health_logs) == 1:
                     return "💪 **Health:** Nice work taking care of yourself today!"
                 else:
                     return f"💪 **Health:** You focused on your health {len(health_logs)} times today - that's awesome!"
         except Exception as e:
-            print(f"💪 Error generating health summary from XP details: {e}")
+            logger.error("💪 Error generating health summary from XP details: %s", e)
     
     # Ultimate fallback to basic summary
+    LLM_FALLBACKS.inc(path="report_health_canned")
     if len(health_logs) == 1:
         fallback_summary = "💪 **Health:** Nice work taking care of yourself today!"
     else:
         fallback_summary = f"💪 **Health:** You focused on your health {len(health_logs)} times today - that's awesome!"
-    print(f"💪 Using ultimate fallback health summary: {fallback_summary}")
+    logger.debug("💪 Using ultimate fallback health summary: %s", fallback_summary)
     return fallback_summary
 
 
@@ -284,25 +265,32 @@ Health Activities: {xp_details}
 
 
 def build_overall_summary(mood_summary, health_summary, code_logs, xp_events, xp_details):
-    print(f"🎯 Inside build_overall_summary - Processing overall summary")
-    print(f"🎯 Mood summary: {mood_summary}")
-    print(f"🎯 Health summary: {health_summary}")
-    print(f"🎯 Code logs count: {len(code_logs)}")
-    print(f"🎯 XP events count: {len(xp_events)}")
-    print(f"🎯 XP details: {xp_details}")
+    logger.debug("🎯 Inside build_overall_summary - Processing overall summary")
+    logger.debug("🎯 Mood summary: %s", mood_summary)
+    logger.debug("🎯 Health summary: %s", health_summary)
+    logger.debug("🎯 Code logs count: %s", len(code_logs))
+    logger.debug("🎯 XP events count: %s", len(xp_events))
+    logger.debug("🎯 XP details: %s", xp_details)
     
     # Prepare context for overall summary
     total_xp = sum(xp.amount for xp in xp_events)
-    print(f"🎯 Total XP calculated: {total_xp}")
+    logger.debug("🎯 Total XP calculated: %s", total_xp)
     
-    # Include XP details in the context if available
+    # The section summaries are already short; cap them anyway so the prompt stays bounded
+    mood_summary = truncate_tokens(mood_summary, LLM_PROMPT_ITEM_MAX_TOKENS + LLM_SUMMARY_MAX_TOKENS)
+    health_summary = truncate_tokens(health_summary, LLM_PROMPT_ITEM_MAX_TOKENS + LLM_SUMMARY_MAX_TOKENS)
+
+    # Include XP details in the context if available, within what's left of the budget
     details_context = ""
     if xp_details:
         details_lines = []
         for xp_type, details in xp_details.items():
             details_lines.append(f"- {xp_type.capitalize()}: {details}")
+        # The rest of the template is about 100 tokens
+        room = LLM_PROMPT_MAX_TOKENS - count_tokens(mood_summary) - count_tokens(health_summary) - 150
+        details_lines, _ = select_entries(details_lines, room, item_max_tokens=XP_DETAILS_MAX_TOKENS)
         details_context = f"\n\nXP Analysis Details:\n" + "\n".join(details_lines)
-        print(f"🎯 XP details context: {details_context}")
+        logger.debug("🎯 XP details context: %s", details_context)
     
     context = f"""
 You are a wise accountability partner. Given this overview of today's activity, write a grounded, encouraging 2–3 sentence summary.
@@ -316,42 +304,46 @@ Summary Data:
 - Total XP Earned: {total_xp}{details_context}
 """
     
-    print(f"🎯 Context for LLM: {context}")
+    logger.debug("🎯 Context for LLM: %s", context)
     
     try:
-        response = llm.invoke(context).content.strip()
-        print(f"🎯 Generated overall summary: {response}")
+        response = llm.invoke(context, kind="overall_summary").content.strip()
+        logger.debug("🎯 Generated overall summary: %s", response)
         return f"\n🎯 **Overall:** {response}"
     except Exception as e:
-        print(f"🎯 Error generating overall summary: {e}")
+        logger.error("🎯 Error generating overall summary: %s", e)
+        LLM_FALLBACKS.inc(path="report_overall_error")
         return f"\n🎯 **Overall:** ❌ Failed to generate summary: {e}"
 
 
 
-def build_daily_report(db: Session , user_id : int):
-    print(f"📄 Starting daily report generation for user {user_id}")
+def build_daily_report(db: Session , user_id : int, day = None):
+    logger.debug("📄 Starting daily report generation for user %s", user_id)
     
-    logs = get_today_logs(db, user_id)
-    print(f"📄 Retrieved logs: {len(logs['xp_events'])} XP events, {len(logs['mood_logs'])} mood logs, {len(logs['health_logs'])} health logs, {len(logs['code_logs'])} code logs")
+    day = day or crud.user_today(db, user_id=user_id)
+    # Read before the logs, so a write racing this build leaves the snapshot stale rather than wrong
+    data_version = crud.get_data_version(db, user_id=user_id)
+    logs = get_today_logs(db, user_id, day)
+    logger.debug("📄 Retrieved logs: %s XP events, %s mood logs, %s health logs, %s code logs", len(logs['xp_events']), len(logs['mood_logs']), len(logs['health_logs']), len(logs['code_logs']))
     
     # Generate XP breakdown and extract details
-    print("📄 Generating XP breakdown...")
+    logger.debug("📄 Generating XP breakdown...")
     xp_section, xp_details = format_xp_breakdown(logs["xp_events"])
-    print(f"📄 XP section generated: {xp_section}")
-    print(f"📄 XP details extracted: {xp_details}")
+    logger.debug("📄 XP section generated: %s", xp_section)
+    logger.debug("📄 XP details extracted: %s", xp_details)
     
     # Generate section summaries using XP details
-    print("📄 Building mood summary...")
+    logger.debug("📄 Building mood summary...")
     mood_section = build_mood_summary(logs["mood_logs"], xp_details.get("mood"))
-    print(f"📄 Mood section result: {mood_section}")
+    logger.debug("📄 Mood section result: %s", mood_section)
     
-    print("📄 Building health summary...")
+    logger.debug("📄 Building health summary...")
     health_section = build_health_summary(logs["health_logs"], xp_details.get("health"))
-    print(f"📄 Health section result: {health_section}")
+    logger.debug("📄 Health section result: %s", health_section)
     
     # code_section = build_code_summary(logs["code_logs"], xp_details.get("code"))
     
-    print("📄 Building overall summary...")
+    logger.debug("📄 Building overall summary...")
     overall_section = build_overall_summary(
         mood_section, 
         health_section, 
@@ -359,10 +351,10 @@ def build_daily_report(db: Session , user_id : int):
         logs["xp_events"],
         xp_details
     )
-    print(f"📄 Overall section result: {overall_section}")
+    logger.debug("📄 Overall section result: %s", overall_section)
 
     level_info = logs["level"]
-    print(f"📄 Level info: {level_info}")
+    logger.debug("📄 Level info: %s", level_info)
     
     # Handle case where user has no level record yet
     if level_info:
@@ -370,7 +362,7 @@ def build_daily_report(db: Session , user_id : int):
     else:
         level_line = f"\n🧬 Current Level: 1 | Total XP: 0 (No level record found)"
     
-    print(f"📄 Level line: {level_line}")
+    logger.debug("📄 Level line: %s", level_line)
 
     report = "\n".join([
         "🌅 **Daily Report**",
@@ -384,4 +376,86 @@ def build_daily_report(db: Session , user_id : int):
         overall_section,
         level_line
     ])
-    return report
\ No newline at end of file
+
+    # Keep the day's narrative and totals for the weekly and monthly reports to reduce over.
+    # Without a narrative (the LLM failed) the snapshot is rebuilt the next time it's needed.
+    overall = overall_section.strip().removeprefix("🎯 **Overall:**").strip()
+    crud.save_report_snapshot(db, user_id=user_id, period="day", start=day, end=day,
+                              summary=None if overall.startswith("❌") else overall,
+                              report=report, metrics=day_metrics(logs), data_version=data_version)
+    return report
+
+
+def day_metrics(logs: dict) -> dict:
+    """The additive totals of one day's logs (see agents/period_report_agent.py)."""
+    xp_by_type = {}
+    for xp in logs["xp_events"]:
+        xp_by_type[xp.xp_type] = xp_by_type.get(xp.xp_type, 0) + xp.amount
+    sentiments = [log.sentiment for log in logs["mood_logs"] if log.sentiment is not None]
+    # Health rows are cumulative snapshots, so the day's totals are the largest values
+    health_logs = logs["health_logs"]
+    sleep = max((log.sleep_hours or 0 for log in health_logs), default=0)
+    water = max((log.water_intake_liter or 0 for log in health_logs), default=0)
+    active = bool(logs["xp_events"] or logs["mood_logs"] or health_logs or logs["code_logs"])
+    return {
+        "days": 1,
+        "active_days": int(active),
+        "xp_total": sum(xp_by_type.values()),
+        "xp_by_type": xp_by_type,
+        "mood_entries": len(logs["mood_logs"]),
+        "sentiment_sum": sum(sentiments),
+        "sentiment_count": len(sentiments),
+        "sleep_hours_sum": sleep,
+        "sleep_days": int(sleep > 0),
+        "exercise_minutes": max((log.exercise_minutes or 0 for log in health_logs), default=0),
+        "water_liters_sum": water,
+        "water_days": int(water > 0),
+        "code_sessions": len(logs["code_logs"]),
+        "code_minutes": sum(log.total_time_minutes or 0 for log in logs["code_logs"]),
+    }
+
+
+def build_day_snapshot(db: Session, user_id: int, day):
+    """
+    The day's ReportSnapshot, built now. A day without any logs gets its
+    totals only, without calling the LLM.
+    """
+    data_version = crud.get_data_version(db, user_id=user_id)
+    metrics = day_metrics(get_today_logs(db, user_id, day))
+    if metrics["active_days"]:
+        build_daily_report(db, user_id, day)
+    else:
+        crud.save_report_snapshot(db, user_id=user_id, period="day", start=day, end=day, summary=None,
+                                  report=None, metrics=metrics, data_version=data_version)
+    return crud.get_report_snapshots(db, user_id=user_id, period="day", start=day, end=day).get((day, day))
+
+
+def day_totals_snapshot(db: Session, user_id: int, day) -> ReportSnapshot:
+    """
+    A stand-in for a day without a usable snapshot: its totals from the logs
+    and no narrative. Nothing is stored and the LLM isn't called.
+    """
+    return ReportSnapshot(user_id=user_id, period="day", period_start=day, period_end=day, summary=None,
+                          report=None, metrics=day_metrics(get_today_logs(db, user_id, day)))
+
+
+def run_daily_report_agent(user_id: int, day=None):
+    """
+    Build and store the day's report snapshot, so weekly and monthly reports
+    can reduce over it. This function is called by the scheduler, after the
+    day's XP is awarded. A snapshot already built from the current data is kept.
+    """
+    db = get_db_session()
+    try:
+        day = day or crud.user_today(db, user_id=user_id)
+        stored = crud.get_report_snapshots(db, user_id=user_id, period="day", start=day, end=day).get((day, day))
+        if stored is not None and stored.summary and stored.data_version == crud.get_data_version(db, user_id=user_id):
+            logger.debug("ℹ️ Report snapshot for %s is already current.", day)
+            return
+        build_day_snapshot(db, user_id, day)
+    except Exception as e:
+        logger.error("❌ Error building the daily report snapshot: %s", e)
+        db.rollback()
+        return False
+    finally:
+        db.close()
\ No newline at end of file
@@ -1,20 +1,21 @@
+from datetime import date
 from db import crud
 from tools.xp_calculator import calculateXp
-from datetime import datetime, timedelta
-from langchain_groq import ChatGroq
+from tools.llm import create_llm
+from tools import food_matcher
+from tools.structured_output import invoke_number
+from observability.metrics import LLM_FALLBACKS
 import os
 from dotenv import load_dotenv
 from db.database import get_db_session
-from db.models import HealthLog, XPEvent
+from observability.logger import get_logger, sampled
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 #initializing llm
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.0,
-    max_retries=2,
-)
+llm = create_llm(__name__)
 
 def score_meal_sentiment(meal_text: str) -> float:
     prompt = f"""
@@ -24,10 +25,10 @@ def score_meal_sentiment(meal_text: str) -> float:
       Meal: {meal_text}
       """
     try:
-        result = llm.invoke(prompt)
-        return float(result.content.strip())
+        return invoke_number(llm, prompt, kind="meal_score", low=-1, high=1)
     except Exception as e:
-        print(f"Error scoring meal sentiment: {e}")
+        logger.error("Error scoring meal sentiment: %s", e)
+        LLM_FALLBACKS.inc(path="meal_score")
         return 0.0 
 
 def log_meal(meal_description: str , user_id : int):
@@ -37,14 +38,10 @@ def log_meal(meal_description: str , user_id : int):
     """
     db_session = get_db_session()
     try:
-        today = datetime.now().date()
+        today = crud.user_today(db_session, user_id=user_id)
         
         # Check if we already have a health log for today to get sleep and exercise
-        existing_log = db_session.query(HealthLog).filter(
-            HealthLog.user_id == user_id,
-            HealthLog.date >= today,
-            HealthLog.date < today + timedelta(days=1)
-        ).order_by(HealthLog.date.desc()).first()
+        existing_log = crud.get_latest_health_log(db_session, user_id=user_id, day=today)
         
         # Use existing values or defaults
         sleep_hours = existing_log.sleep_hours if existing_log else 0.0
@@ -65,8 +62,7 @@ def log_meal(meal_description: str , user_id : int):
         )
         
         # Calculate and award XP immediately for this meal
-        # Simple meal scoring: assume neutral meal (0) for now, can be enhanced later
-        meal_score = 0.0  # Range: -1 (unhealthy) to 1 (very healthy)
+        meal_score = food_matcher.meal_score(meal_description)  # Range: -1 (unhealthy) to 1 (very healthy)
         from tools.xp_calculator import calculateXp
         xp_result = calculateXp(event_type="health", metrics={
             "meal_score": meal_score,
@@ -77,11 +73,11 @@ def log_meal(meal_description: str , user_id : int):
         # Award XP immediately
         crud.award_xp("health_meal", xp_result["xp"], user_id=user_id)
         
-        print("✅ Meal logged successfully")
-        print(f"🎮 {xp_result['details']}")
+        logger.info("✅ Meal logged successfully")
+        logger.debug("🎮 %s", xp_result['details'])
         return health_log
     except Exception as e:
-        print(f"❌ Error logging meal: {e}")
+        logger.error("❌ Error logging meal: %s", e)
     finally:
         db_session.close()
 
@@ -91,14 +87,10 @@ def log_water_intake(water_liters: float , user_id : int):
     """
     db_session = get_db_session()
     try:
-        today = datetime.now().date()
+        today = crud.user_today(db_session, user_id=user_id)
         
         # Check if we already have a health log for today
-        existing_log = db_session.query(HealthLog).filter(
-            HealthLog.date >= today,
-            HealthLog.date < today + timedelta(days=1),
-            HealthLog.user_id == user_id
-        ).order_by(HealthLog.date.desc()).first()
+        existing_log = crud.get_latest_health_log(db_session, user_id=user_id, day=today)
         
         # Use existing values or defaults
         sleep_hours = existing_log.sleep_hours if existing_log else 0.0
@@ -129,11 +121,11 @@ def log_water_intake(water_liters: float , user_id : int):
         # Award XP immediately
         crud.award_xp("health_water", xp_result["xp"], user_id=user_id)
         
-        print(f"✅ Water intake logged: {water_liters}L (Daily total: {water_intake}L)")
-        print(f"🎮 {xp_result['details']}")
+        logger.info("✅ Water intake logged: %sL (Daily total: %sL)", water_liters, water_intake)
+        logger.debug("🎮 %s", xp_result['details'])
         return health_log
     except Exception as e:
-        print(f"❌ Error logging water intake: {e}")
+        logger.error("❌ Error logging water intake: %s", e)
     finally:
         db_session.close()
 
@@ -143,14 +135,10 @@ def log_sleep(hours: float , user_id : int):
     """
     db_session = get_db_session()
     try:
-        today = datetime.now().date()
+        today = crud.user_today(db_session, user_id=user_id)
         
         # Check if we already have a health log for today
-        existing_log = db_session.query(HealthLog).filter(
-            HealthLog.user_id == user_id,
-            HealthLog.date >= today,
-            HealthLog.date < today + timedelta(days=1)
-        ).order_by(HealthLog.date.desc()).first()
+        existing_log = crud.get_latest_health_log(db_session, user_id=user_id, day=today)
         
         # Use existing values or defaults
         water_intake = existing_log.water_intake_liter if existing_log else 0.0
@@ -177,11 +165,11 @@ def log_sleep(hours: float , user_id : int):
         # Award XP immediately
         crud.award_xp("health_sleep", xp_result["xp"], user_id=user_id)
         
-        print(f"✅ Sleep logged: {hours} hours")
-        print(f"🎮 {xp_result['details']}")
+        logger.info("✅ Sleep logged: %s hours", hours)
+        logger.debug("🎮 %s", xp_result['details'])
         return health_log
     except Exception as e:
-        print(f"❌ Error logging sleep: {e}")
+        logger.error("❌ Error logging sleep: %s", e)
     finally:
         db_session.close()
 
@@ -191,14 +179,10 @@ def log_exercise(minutes: int , user_id : int):
     """
     db_session = get_db_session()
     try:
-        today = datetime.now().date()
+        today = crud.user_today(db_session, user_id=user_id)
         
         # Check if we already have a health log for today
-        existing_log = db_session.query(HealthLog).filter(
-            HealthLog.user_id == user_id,
-            HealthLog.date >= today,
-            HealthLog.date < today + timedelta(days=1)
-        ).order_by(HealthLog.date.desc()).first()
+        existing_log = crud.get_latest_health_log(db_session, user_id=user_id, day=today)
         
         # Use existing values or defaults
         water_intake = existing_log.water_intake_liter if existing_log else 0.0
@@ -225,78 +209,60 @@ def log_exercise(minutes: int , user_id : int):
         # Award XP immediately
         crud.award_xp("health_exercise", xp_result["xp"], user_id=user_id)
         
-        print(f"✅ Exercise logged: {minutes} minutes")
-        print(f"🎮 {xp_result['details']}")
+        logger.info("✅ Exercise logged: %s minutes", minutes)
+        logger.debug("🎮 %s", xp_result['details'])
         return health_log
     except Exception as e:
-        print(f"❌ Error logging exercise: {e}")
+        logger.error("❌ Error logging exercise: %s", e)
     finally:
         db_session.close()
 
 
-def run_health_agent(user_id : int):
+def run_health_agent(user_id : int, day: date = None):
     """
-    Calculate XP for all unprocessed health logs.
+    Calculate XP for all unprocessed health logs of `day` (default: the user's today).
     This function is called by the scheduler.
     """
     db_session = get_db_session()
     try:
-        today = datetime.now().date()
-        
-        # Check if XP has already been awarded for health today
-        xp_awarded = db_session.query(XPEvent).filter(
-            XPEvent.user_id == user_id,
-            XPEvent.timestamp >= today,
-            XPEvent.xp_type == "health"
-        ).fir
-        
-        if xp_awarded:
-            print(f"⚠️ Health XP already awarded today ({xp_awarded.amount} XP). Skipping.")
-            return
+        day = day or crud.user_today(db_session, user_id=user_id)
         
-        # Get unprocessed health logs from today
-        health_logs = db_session.query(HealthLog).filter(
-            HealthLog.user_id == user_id,
-            HealthLog.date >= today,
-            HealthLog.processed == False
-        ).order_by(HealthLog.date).all()
+        # Claim the day's unprocessed health logs in one statement and get back
+        # the most recent one, which holds the cumulative data for the day.
+        # Nothing is claimed if health XP was already awarded that day.
+        latest_log = crud.claim_health_logs(db_session, user_id=user_id, day=day)
         
-        if not health_logs:
-            print("ℹ️ No unprocessed health logs found for today. No XP awarded.")
+        if not latest_log:
+            logger.debug("ℹ️ No unprocessed health logs to award for %s (or health XP already awarded).", day)
+            db_session.rollback()
             return
         
-        # For calculating XP, we'll use the most recent log of the day
-        # which should contain the cumulative data for the day
-        latest_log = health_logs[-1]
-        
-        # Score meals
-        meal_score = score_meal_sentiment(latest_log.meals)
+        # Score meals locally; only ask the LLM about meals the knowledge base doesn't know
+        meal_score = food_matcher.score_meal(latest_log["meals"])
+        if meal_score is None:
+            meal_score = score_meal_sentiment(latest_log["meals"]) if latest_log["meals"] else 0.0
         
         # Calculate XP
         metrics = {
-            "sleep_hours": latest_log.sleep_hours,
-            "water_intake_liters": latest_log.water_intake_liter,
-            "exercise_minutes": latest_log.exercise_minutes,
+            "sleep_hours": latest_log["sleep_hours"],
+            "water_intake_liters": latest_log["water_intake_liter"],
+            "exercise_minutes": latest_log["exercise_minutes"],
             "meal_score": meal_score,
-            "meals": latest_log.meals
+            "meals": latest_log["meals"]
         }
         
         xp_result = calculateXp(event_type="health", metrics=metrics)
         total_xp = xp_result["xp"]
         
-        # Mark all logs as processed
-        for log in health_logs:
-            log.processed = True
-            log.processed_at = datetime.now()
-        
-        # Award XP for the day
-        crud.award_xp("health", total_xp , user_id)
-        db_session.commit()
+        # Award XP for the day in the same transaction as the claim
+        if crud.award_xp("health", total_xp , user_id, db=db_session, day=day) is None:
+            return False
         
-        print(f"🧠 Daily Health XP Awarded: +{total_xp} XP")
+        logger.info("🧠 Daily Health XP Awarded: +%s XP", total_xp, extra=sampled())
         
     except Exception as e:
-        print(f"❌ Error calculating health XP: {e}")
+        logger.error("❌ Error calculating health XP: %s", e)
         db_session.rollback()
+        return False
     finally:
-        db_session.close()
+        db_session.close()
\ No newline at end of file
@@ -1,18 +1,19 @@
 from sqlalchemy.orm import Session
-from datetime import datetime, date
+from datetime import date
 from db.models import HealthLog
-from langchain_groq import ChatGroq
+from tools.llm import create_llm
+from tools.prompt_budget import bounded_list_prompt, LLM_SUMMARY_MAX_TOKENS
+from observability.metrics import LLM_FALLBACKS
 from dotenv import load_dotenv
 import os
+from observability.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # Initialize LLM for health summarization
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.0,
-    max_retries=2,
-)
+llm = create_llm(__name__, max_tokens=LLM_SUMMARY_MAX_TOKENS)
 
 def health_summary(user_id: int, target_date: date = None) -> str:
     """
@@ -26,19 +27,16 @@ def health_summary(user_id: int, target_date: date = None) -> str:
     Returns:
         str: A summary of the health entries for the specified date
     """
+    from db import crud
     from db.database import get_db_session
     
-    if target_date is None:
-        target_date = datetime.now().date()
-    
     db = get_db_session()
     try:
+        if target_date is None:
+            target_date = crud.user_today(db, user_id=user_id)
+
         # Get all health logs for the user on the specified date
-        health_logs = db.query(HealthLog).filter(
-            HealthLog.user_id == user_id,
-            HealthLog.date >= datetime.combine(target_date, datetime.min.time()),
-            HealthLog.date < datetime.combine(target_date, datetime.max.time())
-        ).all()
+        health_logs = crud.get_day_logs(db, HealthLog, user_id=user_id, day=target_date)
         
         if not health_logs:
             return "No health entries recorded for this date."
@@ -66,8 +64,9 @@ def health_summary(user_id: int, target_date: date = None) -> str:
             else:
                 return f"You focused on your health {len(health_logs)} times today - that's awesome!"
         
-        # Create a prompt for the LLM to summarize the health entries
-        prompt = f"""
+        # Create a prompt for the LLM to summarize the health entries. Rows are cumulative,
+        # so the budgeted prompt drops the earlier rows a later one already covers
+        prompt = bounded_list_prompt("""
 You are a friendly, witty, and empathetic health companion who understands that health journeys are personal and unique. Based on the following health activities from a single day, write a concise 2-3 sentence summary that captures the health journey of the day in a warm, relatable way.
 
 Instructions:
@@ -78,32 +77,34 @@ Instructions:
 - Avoid technical terms and keep it relatable
 
 Health Activities:
-{chr(10).join(f'- {entry}' for entry in health_entries if entry)}
+""", [f'- {entry}' for entry in health_entries if entry], """
 
-Summary:"""
+Summary:""")
         
         # Generate summary using LLM
         try:
-            response = llm.invoke(prompt)
+            response = llm.invoke(prompt, kind="health_summary")
             summary = response.content.strip()
             if summary:
                 return summary
             else:
                 # Fallback to simple summary if LLM returns empty response
+                LLM_FALLBACKS.inc(path="health_summary")
                 if len(health_entries) == 1:
                     return "Nice work taking care of yourself today!"
                 else:
                     return f"You focused on your health {len(health_logs)} times today - that's awesome!"
         except Exception as e:
-            print(f"Error generating health summary: {e}")
+            logger.error("Error generating health summary: %s", e)
             # Fallback to simple summary
+            LLM_FALLBACKS.inc(path="health_summary")
             if len(health_entries) == 1:
                 return "Nice work taking care of yourself today!"
             else:
                 return f"You focused on your health {len(health_logs)} times today - that's awesome!"
     
     except Exception as e:
-        print(f"Error retrieving health logs: {e}")
+        logger.error("Error retrieving health logs: %s", e)
         return "Unable to retrieve health entries for summary."
     finally:
         db.close()
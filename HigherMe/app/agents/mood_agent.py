@@ -1,21 +1,21 @@
-from db import crud
+from datetime import date
+from db import crud, mood_similarity
 from sqlalchemy.orm import Session
-from datetime import datetime
 import os
 from dotenv import load_dotenv
-from langchain_groq import ChatGroq
+from tools.llm import create_llm
+from tools.structured_output import invoke_number
+from observability.metrics import LLM_FALLBACKS
 from db.database import get_db_session
-from db.models import MoodLog, XPEvent
+from observability.logger import get_logger, sampled
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 
 # initializing llm
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.0,
-    max_retries=2,
-)
+llm = create_llm(__name__)
 
 def analyze_mood_sentiment(text: str) -> float:
     prompt = f"""
@@ -26,11 +26,10 @@ def analyze_mood_sentiment(text: str) -> float:
     """
     
     try:
-        response = llm.invoke(prompt)
-        sentiment_score = float(response.content.strip())
-        return sentiment_score
+        return invoke_number(llm, prompt, kind="mood_sentiment", low=-1, high=1)
     except Exception as e:
-        print(f"Error analyzing mood sentiment: {e}")
+        logger.error("Error analyzing mood sentiment: %s", e)
+        LLM_FALLBACKS.inc(path="mood_sentiment")
         return 0.0
 
 def log_mood(mood_text: str , user_id : int):
@@ -49,11 +48,11 @@ def log_mood(mood_text: str , user_id : int):
             mood_text=mood_text,
             sentiment=sentiment_score,
             user_id= user_id,
-            summary=None  # Will be populated later during daily summary
+            summary=None  # Set when the rolling summary is folded forward below
         )
         
         if mood_log:
-            print(f"✅ Mood logged with sentiment score: {sentiment_score}")
+            logger.info("✅ Mood logged with sentiment score: %s", sentiment_score)
             
             # Calculate XP for this specific mood entry
             from tools.xp_calculator import calculateXp
@@ -63,12 +62,17 @@ def log_mood(mood_text: str , user_id : int):
             crud.award_xp("mood", xp_result["xp"], user_id=user_id)
             
             # Mark this log as processed since we've already awarded XP
-            mood_log.processed = True
-            mood_log.processed_at = datetime.now()
-            db.add(mood_log)
-            db.commit()
+            crud.mark_logs_as_processed(db, [mood_log.id], "mood")
+
+            # Fold just this entry into the day's running summary, so the report only has to read it
+            from agents.mood_summary import fold_mood_summary
+            fold_mood_summary(db, user_id, mood_log.local_day)
+
+            # "You've felt like this before": the closest past entries, from the LSH buckets
+            similar = mood_similarity.similar_entries(db, user_id=user_id, sig=mood_similarity.unpack(mood_log.minhash),
+                                                      exclude_id=mood_log.id)
             
-            print(f"🎮 {xp_result['details']}")
+            logger.debug("🎮 %s", xp_result['details'])
             
             # Return standardized response for frontend
             return {
@@ -76,16 +80,19 @@ def log_mood(mood_text: str , user_id : int):
                 "mood_log_id": mood_log.id,
                 "xp_awarded": xp_result["xp"],
                 "xp_details": xp_result["details"],
-                "sentiment_score": sentiment_score
+                "sentiment_score": sentiment_score,
+                "similar_entries": [
+                    {**entry, "timestamp": entry["timestamp"].isoformat()} for entry in similar
+                ]
             }
         else:
-            print("❌ Failed to log mood")
+            logger.error("❌ Failed to log mood")
             return {
                 "success": False,
                 "error": "Failed to log mood"
             }
     except Exception as e:
-        print(f"Error logging mood: {e}")
+        logger.error("Error logging mood: %s", e)
         return {
             "success": False,
             "error": str(e)
@@ -93,58 +100,40 @@ def log_mood(mood_text: str , user_id : int):
     finally:
         db.close()
 
-def calculate_daily_mood_xp(user_id: int):
+def calculate_daily_mood_xp(user_id: int, day: date = None):
     """
-    Calculate XP for all unprocessed mood logs.
+    Calculate XP for all unprocessed mood logs of `day` (default: the user's today).
     This function is called by the scheduler.
     """
     from tools.xp_calculator import calculateXp
     
     db = get_db_session()
     try:
-        today = datetime.now().date()
+        day = day or crud.user_today(db, user_id=user_id)
         
-        # Check if XP has already been awarded for mood today
-        xp_awarded = db.query(XPEvent).filter(
-            XPEvent.user_id == user_id,
-            XPEvent.timestamp >= today,
-            XPEvent.xp_type == "mood"
-        ).first()
-        
-        if xp_awarded:
-            print(f"⚠️ Mood XP already awarded today ({xp_awarded.amount} XP). Skipping.")
-            return
-        
-        # Get unprocessed mood logs from today
-        mood_logs = db.query(MoodLog).filter(
-            MoodLog.user_id == user_id,
-            MoodLog.timestamp >= today,
-            MoodLog.processed == False
-        ).order_by(MoodLog.timestamp).all()
+        # Claim the day's unprocessed mood logs in one statement.
+        # Nothing is claimed if mood XP was already awarded that day.
+        mood_logs = crud.claim_mood_logs(db, user_id=user_id, day=day)
         
         if not mood_logs:
-            print("ℹ️ No unprocessed mood logs found for today. No XP awarded.")
+            logger.debug("ℹ️ No unprocessed mood logs to award for %s (or mood XP already awarded).", day)
+            db.rollback()
             return
         
         # Calculate XP
         xp_result = calculateXp(event_type="mood", metrics={"mood_logs": mood_logs})
         
-        # Award XP
-        crud.award_xp("mood", xp_result["xp"] , user_id=user_id)
-        
-        # Update processed status
-        now = datetime.now()
-        for log in mood_logs:
-            log.processed = True
-            log.processed_at = now
-        db.commit()
+        # Award XP in the same transaction as the claim
+        if crud.award_xp("mood", xp_result["xp"], user_id=user_id, db=db, day=day) is None:
+            return False
         
-        print(f"🧠 Daily Mood XP Awarded: +{xp_result['xp']} XP")
+        logger.info("🧠 Daily Mood XP Awarded: +%s XP", xp_result['xp'], extra=sampled())
         if 'details' in xp_result:
-            print(f"📝 {xp_result['details']}")
+            logger.debug("📝 %s", xp_result['details'])
         
     except Exception as e:
-        print(f"❌ Error calculating mood XP: {e}")
+        logger.error("❌ Error calculating mood XP: %s", e)
         db.rollback()
+        return False
     finally:
         db.close()
\ No newline at end of file
@@ -1,18 +1,61 @@
 from sqlalchemy.orm import Session
-from datetime import datetime, date
+from datetime import date
 from db.models import MoodLog
-from langchain_groq import ChatGroq
+from db.mood_similarity import distinct_entries
+from tools.llm import create_llm
+from tools.prompt_budget import bounded_list_prompt, truncate_tokens, LLM_SUMMARY_MAX_TOKENS
+from observability.metrics import LLM_FALLBACKS
 from dotenv import load_dotenv
 import os
+from observability.logger import get_logger
 
 load_dotenv()
 
+logger = get_logger(__name__)
+
 # Initialize LLM for mood summarization
-llm = ChatGroq(
-    model="llama-3.1-8b-instant",
-    temperature=0.0,
-    max_retries=2,
-)
+llm = create_llm(__name__, max_tokens=LLM_SUMMARY_MAX_TOKENS)
+
+MOOD_PROMPT_HEAD = """
+You are a friendly, witty, and empathetic companion who understands human emotions deeply. Based on the following mood journal entries from a single day, write a concise 2-3 sentence summary that captures the emotional journey of the day in a warm, relatable way.
+
+Instructions:
+- Be silly, witty, empathic, and considerate
+- Use casual, friendly language that a close friend might use
+- Focus on the human experience and emotional patterns
+- Avoid technical terms like "sentiment" or "emotional stimuli"
+- Keep it brief and readable
+
+Mood Entries:
+"""
+MOOD_PROMPT_TAIL = """
+
+Summary:"""
+
+ROLLING_PROMPT_HEAD = """
+You are a friendly, witty, and empathetic companion who understands human emotions deeply. Below is your running summary of someone's mood journal so far today, followed by their newest entries. Rewrite it as a concise 2-3 sentence summary of the whole day's emotional journey, in a warm, relatable way.
+
+Instructions:
+- Be silly, witty, empathic, and considerate
+- Use casual, friendly language that a close friend might use
+- Focus on the human experience and emotional patterns
+- Avoid technical terms like "sentiment" or "emotional stimuli"
+- Keep it brief and readable
+
+Summary so far:
+{previous}
+
+New Entries:
+"""
+ROLLING_PROMPT_TAIL = """
+
+Updated summary:"""
+
+
+def _entry_score(text: str, sentiment) -> float:
+    """Entries with more to say and stronger feelings are kept first when the prompt is over budget."""
+    return len(set(text.lower().split())) + 10 * abs(sentiment or 0.0)
+
 
 def mood_summary(user_id: int, target_date: date = None) -> str:
     """
@@ -26,19 +69,16 @@ def mood_summary(user_id: int, target_date: date = None) -> str:
     Returns:
         str: A summary of the mood entries for the specified date
     """
+    from db import crud
     from db.database import get_db_session
     
-    if target_date is None:
-        target_date = datetime.now().date()
-    
     db = get_db_session()
     try:
+        if target_date is None:
+            target_date = crud.user_today(db, user_id=user_id)
+
         # Get all mood logs for the user on the specified date
-        mood_logs = db.query(MoodLog).filter(
-            MoodLog.user_id == user_id,
-            MoodLog.timestamp >= datetime.combine(target_date, datetime.min.time()),
-            MoodLog.timestamp < datetime.combine(target_date, datetime.max.time())
-        ).all()
+        mood_logs = crud.get_day_logs(db, MoodLog, user_id=user_id, day=target_date)
         
         if not mood_logs:
             return "No mood entries recorded for this date."
@@ -46,85 +86,117 @@ def mood_summary(user_id: int, target_date: date = None) -> str:
         # Extract mood texts
         mood_texts = [log.mood_text for log in mood_logs]
         
-        # Create a prompt for the LLM to summarize the mood entries
-        prompt = f"""
-You are a friendly, witty, and empathetic companion who understands human emotions deeply. Based on the following mood journal entries from a single day, write a concise 2-3 sentence summary that captures the emotional journey of the day in a warm, relatable way.
-
-Instructions:
-- Be silly, witty, empathic, and considerate
-- Use casual, friendly language that a close friend might use
-- Focus on the human experience and emotional patterns
-- Avoid technical terms like "sentiment" or "emotional stimuli"
-- Keep it brief and readable
-
-Mood Entries:
-{chr(10).join(f'- "{text}"' for text in mood_texts if text)}
-
-Summary:"""
+        # Create a prompt for the LLM to summarize the mood entries, bounded however much was logged
+        entry_logs = distinct_entries([log for log in mood_logs if log.mood_text])
+        prompt = bounded_list_prompt(
+            MOOD_PROMPT_HEAD,
+            [f'- "{log.mood_text}"' for log in entry_logs],
+            MOOD_PROMPT_TAIL,
+            scores=[_entry_score(log.mood_text, log.sentiment) for log in entry_logs],
+        )
         
         # Generate summary using LLM
         try:
-            response = llm.invoke(prompt)
+            response = llm.invoke(prompt, kind="mood_summary")
             summary = response.content.strip()
             if summary:
                 return summary
             else:
                 # Fallback to simple summary if LLM returns empty response
+                LLM_FALLBACKS.inc(path="mood_summary")
                 if len(mood_texts) == 1:
                     return f"Aha! You shared that you're feeling \"{mood_texts[0][:30]}...\" today - thanks for letting me know!"
                 else:
                     return f"You shared {len(mood_logs)} mood updates today - that's awesome! Some of them were: {', '.join(mood_texts[:3])}..."
         except Exception as e:
-            print(f"Error generating mood summary: {e}")
+            logger.error("Error generating mood summary: %s", e)
             # Fallback to simple summary
+            LLM_FALLBACKS.inc(path="mood_summary")
             if len(mood_texts) == 1:
                 return f"Aha! You shared that you're feeling \"{mood_texts[0][:30]}...\" today - thanks for letting me know!"
             else:
                 return f"You shared {len(mood_logs)} mood updates today - that's awesome! Some of them were: {', '.join(mood_texts[:3])}..."
     
     except Exception as e:
-        print(f"Error retrieving mood logs: {e}")
+        logger.error("Error retrieving mood logs: %s", e)
         return "Unable to retrieve mood entries for summary."
     finally:
         db.close()
 
+def fold_mood_summary(db: Session, user_id: int, day: date = None):
+    """
+    Bring the day's rolling summary up to date: the previous summary plus
+    only the entries it doesn't cover yet (normally just the newest one) go
+    to the LLM, so the cost per entry stays flat however much is logged.
+    If the call fails, the summary stays where it was and the next fold
+    picks up the missed entries. Returns the day's MoodDaySummary, or None.
+    """
+    from db import crud
+
+    day = day or crud.user_today(db, user_id=user_id)
+    state = crud.get_mood_day(db, user_id=user_id, day=day)
+    if state is None:
+        return None
+    previous_through_id = state.summarized_through_id or 0
+    new_logs = crud.get_mood_logs_after(db, user_id=user_id, day=day, after_id=previous_through_id)
+    if not new_logs:
+        return state
+
+    entries = distinct_entries([log for log in new_logs if log.mood_text])
+    summary = state.summary
+    if entries:
+        previous = truncate_tokens(state.summary, LLM_SUMMARY_MAX_TOKENS) if state.summary else "(nothing yet, these are the first entries)"
+        prompt = bounded_list_prompt(
+            ROLLING_PROMPT_HEAD.format(previous=previous),
+            [f'- "{log.mood_text}"' for log in entries],
+            ROLLING_PROMPT_TAIL,
+            scores=[_entry_score(log.mood_text, log.sentiment) for log in entries],
+        )
+        try:
+            summary = llm.invoke(prompt, kind="mood_summary_rolling").content.strip()
+        except Exception as e:
+            logger.error("Error updating rolling mood summary: %s", e)
+            summary = ""
+        if not summary:
+            LLM_FALLBACKS.inc(path="mood_summary_rolling")
+            return state
+
+    crud.advance_mood_summary(db, user_id=user_id, day=day, summary=summary,
+                              previous_through_id=previous_through_id, through_id=new_logs[-1].id)
+    db.refresh(state)
+    return state
+
+
 def mood_summary_with_sentiment(user_id: int, target_date: date = None) -> dict:
     """
-    Generate a summary of mood entries with sentiment analysis for a specific date.
-    
+    The day's mood summary with sentiment statistics, read from the rolling
+    summary kept by `fold_mood_summary` (caught up first if it's behind).
+
     Args:
         user_id (int): The ID of the user
         target_date (date, optional): The date to summarize. Defaults to today.
-    
+
     Returns:
         dict: A dictionary containing the summary and sentiment statistics
     """
+    from db import crud
     from db.database import get_db_session
-    
-    if target_date is None:
-        target_date = datetime.now().date()
-    
+
     db = get_db_session()
     try:
-        # Get all mood logs for the user on the specified date
-        mood_logs = db.query(MoodLog).filter(
-            MoodLog.user_id == user_id,
-            MoodLog.timestamp >= datetime.combine(target_date, datetime.min.time()),
-            MoodLog.timestamp < datetime.combine(target_date, datetime.max.time())
-        ).all()
-        
-        if not mood_logs:
+        if target_date is None:
+            target_date = crud.user_today(db, user_id=user_id)
+        state = fold_mood_summary(db, user_id, target_date)
+        if state is None or not state.entry_count:
             return {
                 "summary": "No mood entries recorded for this date.",
                 "total_entries": 0,
                 "average_sentiment": 0.0,
                 "sentiment_trend": "neutral"
             }
-        
-        # Calculate sentiment statistics
-        sentiments = [log.sentiment for log in mood_logs if log.sentiment is not None]
-        if sentiments:
-            avg_sentiment = sum(sentiments) / len(sentiments)
+
+        if state.sentiment_count:
+            avg_sentiment = state.sentiment_sum / state.sentiment_count
             if avg_sentiment > 0.3:
                 trend = "positive"
             elif avg_sentiment < -0.3:
@@ -134,64 +206,28 @@ def mood_summary_with_sentiment(user_id: int, target_date: date = None) -> dict:
         else:
             avg_sentiment = 0.0
             trend = "neutral"
-        
-        # Extract mood texts
-        mood_texts = [log.mood_text for log in mood_logs]
-        
-        # Create a prompt for the LLM to summarize the mood entries
-        # Include sentiment information when available, but don't filter out entries without sentiment
-        mood_entries = []
-        for text, log in zip(mood_texts, mood_logs):
-            if text:  # Only include entries with actual text
-                if log.sentiment is not None:
-                    mood_entries.append(f'- "{text}" (sentiment: {log.sentiment:.2f})')
-                else:
-                    mood_entries.append(f'- "{text}"')
-        
-        prompt = f"""
-You are a friendly, witty, and empathetic companion who understands human emotions deeply. Based on the following mood journal entries from a single day, write a concise 2-3 sentence summary that captures the emotional journey of the day in a warm, relatable way.
-
-Instructions:
-- Be silly, witty, empathic, and considerate
-- Use casual, friendly language that a close friend might use
-- Focus on the human experience and emotional patterns
-- Avoid technical terms like "sentiment" or "emotional stimuli"
-- Keep it brief and readable
-
-Mood Entries:
-{chr(10).join(mood_entries)}
 
-Summary:"""
-        
-        # Generate summary using LLM
-        try:
-            response = llm.invoke(prompt)
-            summary = response.content.strip()
-            if summary:
-                summary_text = summary
-            else:
-                # Fallback to simple summary if LLM returns empty response
-                if len(mood_texts) == 1:
-                    summary_text = f"Aha! You shared that you're feeling \"{mood_texts[0][:30]}...\" today - thanks for letting me know!"
-                else:
-                    summary_text = f"You shared {len(mood_logs)} mood updates today - that's awesome!"
-        except Exception as e:
-            print(f"Error generating mood summary: {e}")
-            # Fallback to simple summary
-            if len(mood_texts) == 1:
-                summary_text = f"Aha! You shared that you're feeling \"{mood_texts[0][:30]}...\" today - thanks for letting me know!"
+        summary_text = state.summary
+        if not summary_text:
+            # No entry could be summarized yet
+            LLM_FALLBACKS.inc(path="mood_summary_with_sentiment")
+            if state.entry_count == 1:
+                first = crud.get_mood_logs_after(db, user_id=user_id, day=target_date, after_id=0)[0].mood_text or ""
+                summary_text = f"Aha! You shared that you're feeling \"{first[:30]}...\" today - thanks for letting me know!"
             else:
-                summary_text = f"You shared {len(mood_logs)} mood updates today - that's awesome!"
-        
+                summary_text = f"You shared {state.entry_count} mood updates today - that's awesome!"
+
         return {
             "summary": summary_text,
-            "total_entries": len(mood_logs),
+            "total_entries": state.entry_count,
             "average_sentiment": round(avg_sentiment, 2),
-            "sentiment_trend": trend
+            "sentiment_trend": trend,
+            "sentiment_min": state.sentiment_min,
+            "sentiment_max": state.sentiment_max
         }
-    
+
     except Exception as e:
-        print(f"Error retrieving mood logs: {e}")
+        logger.error("Error retrieving mood logs: %s", e)
         return {
             "summary": "Unable to retrieve mood entries for summary.",
             "total_entries": 0,
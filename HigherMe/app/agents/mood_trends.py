@@ -0,0 +1,138 @@
+"""
+Multi-day mood trends: rolling sentiment, weekday patterns and how mood
+moves with sleep and exercise.
+
+Nothing here hydrates ORM objects. Two GROUP BY queries on the
+(user_id, local_day) indexes return one row per day in the user's
+timezone: the day's mean sentiment and entry count from mood_logs, and
+the day's sleep and exercise from health_logs (rows there are cumulative,
+so the day's max is its total). Everything else is vectorized NumPy over a dense
+array with one slot per calendar day, NaN where nothing was logged:
+
+- rolling 7- and 30-day mean and volatility (population standard
+  deviation) of the daily means, over calendar days, skipping empty days,
+  from cumulative sums in O(days),
+- mean daily sentiment per weekday,
+- Pearson correlation of daily sentiment with sleep hours and exercise
+  minutes, over the days that have both (None under MIN_CORRELATION_DAYS
+  or when either side doesn't vary).
+
+A year for one user is two small indexed queries and a few array passes.
+"""
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from db import crud
+from db.models import HealthLog, MoodLog
+
+WINDOWS = (7, 30)
+MIN_CORRELATION_DAYS = 5
+WEEKDAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+
+def _daily_columns(db: Session, model, values: dict, user_id: int, start: date, days: int) -> dict:
+    """{name: float array with one slot per day from `start`, NaN where there's no row} for each aggregate in `values`."""
+    rows = db.execute(
+        select(model.local_day.label("day"), *(aggregate.label(name) for name, aggregate in values.items()))
+        .where(model.user_id == user_id,
+               model.local_day >= start,
+               model.local_day < start + timedelta(days=days))
+        .group_by(model.local_day)
+    ).all()
+    columns = {name: np.full(days, np.nan) for name in values}
+    if rows:
+        offsets = np.array([(row.day - start).days for row in rows])
+        for name in values:
+            columns[name][offsets] = np.array([getattr(row, name) for row in rows], dtype=float)
+    return columns
+
+
+def _rolling(values, window: int) -> tuple:
+    """(mean, population std) over each trailing `window` days, ignoring NaN days; NaN where there's too little data."""
+    present = ~np.isnan(values)
+    x = np.where(present, values, 0.0)
+    count = np.concatenate(([0], np.cumsum(present)))
+    total = np.concatenate(([0.0], np.cumsum(x)))
+    squares = np.concatenate(([0.0], np.cumsum(x * x)))
+    end = np.arange(1, len(values) + 1)
+    begin = np.maximum(end - window, 0)
+    n = count[end] - count[begin]
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = (total[end] - total[begin]) / n
+        variance = (squares[end] - squares[begin]) / n - mean * mean
+    mean = np.where(n > 0, mean, np.nan)
+    std = np.where(n > 1, np.sqrt(np.maximum(variance, 0.0)), np.nan)
+    return mean, std
+
+
+def _correlation(a, b) -> dict:
+    both = ~np.isnan(a) & ~np.isnan(b)
+    days = int(both.sum())
+    r = None
+    if days >= MIN_CORRELATION_DAYS and a[both].std() > 0 and b[both].std() > 0:
+        r = round(float(np.corrcoef(a[both], b[both])[0, 1]), 3)
+    return {"r": r, "days": days}
+
+
+def _rounded(values, digits: int = 3) -> list:
+    """Array -> list of rounded floats, with None for NaN."""
+    return [None if value != value else value for value in np.round(values, digits).tolist()]
+
+
+def mood_trends(db: Session, *, user_id: int, days: int = 365, end: date = None) -> dict:
+    """
+    Sentiment trends over the `days` days ending on `end` (the user's today by default).
+    Returns {"start", "end", "days_with_entries", "daily", "day_of_week",
+    "correlations"}; "daily" has one row per calendar day.
+    """
+    end = end or crud.user_today(db, user_id=user_id)
+    start = end - timedelta(days=days - 1)
+    # Fetch enough earlier days that the first day's longest window is complete
+    lead = max(WINDOWS) - 1
+    fetch_start = start - timedelta(days=lead)
+    fetch_days = days + lead
+
+    mood = _daily_columns(db, MoodLog,
+                          {"sentiment": func.avg(MoodLog.sentiment), "entries": func.count(MoodLog.id)},
+                          user_id, fetch_start, fetch_days)
+    health = _daily_columns(db, HealthLog,
+                            {"sleep_hours": func.max(HealthLog.sleep_hours),
+                             "exercise_minutes": func.max(HealthLog.exercise_minutes)},
+                            user_id, fetch_start, fetch_days)
+
+    sentiment = mood["sentiment"]
+    rolling = {window: _rolling(sentiment, window) for window in WINDOWS}
+    shown = slice(lead, None)
+
+    columns = {
+        "sentiment": _rounded(sentiment[shown]),
+        "entries": np.nan_to_num(mood["entries"][shown]).astype(int).tolist(),
+    }
+    for window, (mean, std) in rolling.items():
+        columns[f"mean_{window}d"] = _rounded(mean[shown])
+        columns[f"volatility_{window}d"] = _rounded(std[shown])
+    daily = [
+        {"day": (start + timedelta(days=i)).isoformat(), **{name: values[i] for name, values in columns.items()}}
+        for i in range(days)
+    ]
+
+    recent = sentiment[shown]
+    present = ~np.isnan(recent)
+    weekdays = (start.weekday() + np.arange(days)) % 7
+    weekday_days = np.bincount(weekdays[present], minlength=7)
+    weekday_totals = np.bincount(weekdays[present], weights=recent[present], minlength=7)
+    day_of_week = [
+        {"day": WEEKDAYS[i], "days": int(weekday_days[i]),
+         "mean_sentiment": round(float(weekday_totals[i] / weekday_days[i]), 3) if weekday_days[i] else None}
+        for i in range(7)
+    ]
+
+    return {
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "days_with_entries": int(present.sum()),
+        "daily": daily,
+        "day_of_week": day_of_week,
+        "correlations": {name: _correlation(recent, health[name][shown]) for name in health},
+    }
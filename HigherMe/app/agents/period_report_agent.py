@@ -0,0 +1,232 @@
+"""
+Weekly and monthly reports, reduced from stored daily snapshots.
+
+Every daily report stores a ReportSnapshot: its one-paragraph overall
+summary plus the day's additive totals (XP by type, mood entries and
+sentiment sum, sleep, exercise, water, code sessions). Longer periods
+never go back to the raw logs:
+
+    day snapshots --reduce--> week (or the part of a week inside a month)
+    week snapshots --reduce--> month
+
+A reduce sums the children's totals and sends the LLM one prompt with
+those totals and one line per child. A week has at most 7 children and a
+month at most 6 (its weeks, clipped at the month's edges), so every level
+costs one call of about the same size as the daily overall summary. A
+full Monday-Sunday week inside a month is the same snapshot the weekly
+report uses.
+
+Snapshots are the cache. A period that had ended when its snapshot was
+built is final, with or without a narrative. An open period (the current
+week or month) is rebuilt once the user's data_version moves past the one
+it was built from, or, if its LLM call failed, the next time it's needed.
+
+Day snapshots are built by the nightly scheduler run (and whenever the
+user opens their daily report). A day whose snapshot is missing or stale,
+such as today, stands in with its totals from the logs and no narrative,
+so a weekly or monthly report costs at most its own reduce calls and
+never runs daily reports inline.
+"""
+from datetime import date, timedelta
+from sqlalchemy.orm import Session
+from db import crud
+from agents.daily_report_agent import day_totals_snapshot
+from tools.llm import create_llm
+from tools.prompt_budget import bounded_list_prompt, LLM_SUMMARY_MAX_TOKENS
+from observability.metrics import LLM_FALLBACKS
+from observability.logger import get_logger
+from tools.timezones import local_day
+
+logger = get_logger(__name__)
+
+llm = create_llm(__name__, max_tokens=LLM_SUMMARY_MAX_TOKENS)
+
+PERIODS = ("week", "month")
+TITLES = {"week": "Weekly Report", "month": "Monthly Report"}
+
+REVIEW_PROMPT_HEAD = """
+You are a wise accountability partner. Below are the totals for someone's {label} ({start} to {end}) and a short summary of each {part} in it. Write a grounded, encouraging 3-4 sentence review of the {label}.
+
+Avoid overhyping. Be real, constructive, and human. Name the patterns across the {label}, what went well, and one thing to focus on next.
+
+Totals:
+{totals}
+
+{part_title} summaries:
+"""
+REVIEW_PROMPT_TAIL = """
+
+Review:"""
+
+
+def period_bounds(period: str, day: date) -> tuple:
+    """(first day, last day) of the week (Monday-Sunday) or month containing `day`."""
+    if period == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=6)
+    if period == "month":
+        start = day.replace(day=1)
+        following = (start + timedelta(days=32)).replace(day=1)
+        return start, following - timedelta(days=1)
+    raise ValueError(f"unknown report period {period!r}")
+
+
+def week_segments(start: date, end: date) -> list:
+    """start..end split at Mondays into (first, last) spans."""
+    spans = []
+    while start <= end:
+        last = min(end, start + timedelta(days=6 - start.weekday()))
+        spans.append((start, last))
+        start = last + timedelta(days=1)
+    return spans
+
+
+def merge_metrics(parts: list) -> dict:
+    """Sum the totals of consecutive spans."""
+    merged = {}
+    for metrics in parts:
+        for key, value in metrics.items():
+            if isinstance(value, dict):
+                bucket = merged.setdefault(key, {})
+                for name, amount in value.items():
+                    bucket[name] = bucket.get(name, 0) + amount
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def format_totals(metrics: dict) -> str:
+    by_type = ", ".join(f"{name.capitalize()} +{amount}" for name, amount in sorted(metrics.get("xp_by_type", {}).items()))
+    lines = [
+        f"- XP earned: +{metrics.get('xp_total', 0)}" + (f" ({by_type})" if by_type else ""),
+        f"- Active days: {metrics.get('active_days', 0)} of {metrics.get('days', 0)}",
+    ]
+    if metrics.get("mood_entries"):
+        line = f"- Mood entries: {metrics['mood_entries']}"
+        if metrics.get("sentiment_count"):
+            line += f" (average sentiment {metrics['sentiment_sum'] / metrics['sentiment_count']:+.2f})"
+        lines.append(line)
+    if metrics.get("sleep_days"):
+        lines.append(f"- Sleep: {metrics['sleep_hours_sum'] / metrics['sleep_days']:.1f} hours a night on average ({metrics['sleep_days']} nights logged)")
+    if metrics.get("exercise_minutes"):
+        lines.append(f"- Exercise: {metrics['exercise_minutes']} minutes")
+    if metrics.get("water_days"):
+        lines.append(f"- Water: {metrics['water_liters_sum'] / metrics['water_days']:.1f} L a day on average ({metrics['water_days']} days logged)")
+    if metrics.get("code_sessions"):
+        lines.append(f"- Code sessions: {metrics['code_sessions']} ({round(metrics.get('code_minutes', 0))} minutes)")
+    return "\n".join(lines)
+
+
+def is_fresh(snapshot, data_version: int, timezone: str = None) -> bool:
+    """Whether `snapshot` can be served; `timezone` is its user's, which decides whether it was built after the period closed."""
+    if snapshot is None:
+        return False
+    # built_at is server time and period_end a day in the user's timezone
+    if local_day(timezone, snapshot.built_at) > snapshot.period_end:
+        return True
+    if snapshot.summary is None and snapshot.metrics.get("active_days"):
+        return False
+    return snapshot.data_version == data_version
+
+
+def _child_text(snapshot) -> str:
+    if snapshot.summary:
+        return snapshot.summary
+    return "(no summary) " + format_totals(snapshot.metrics).splitlines()[0].removeprefix("- ")
+
+
+def _day_snapshots(db: Session, user_id: int, start: date, end: date, data_version: int, timezone: str) -> list:
+    stored = crud.get_report_snapshots(db, user_id=user_id, period="day", start=start, end=end)
+    snapshots = []
+    for offset in range((end - start).days + 1):
+        day = start + timedelta(days=offset)
+        snapshot = stored.get((day, day))
+        if not is_fresh(snapshot, data_version, timezone):
+            snapshot = day_totals_snapshot(db, user_id, day)
+        snapshots.append(snapshot)
+    return snapshots
+
+
+def _reduce(db: Session, user_id: int, period: str, start: date, end: date, children: list, *,
+            part: str, label_child, data_version: int):
+    """Build and store the snapshot of start..end from its children's snapshots."""
+    metrics = merge_metrics([child.metrics for child in children])
+    metrics["days"] = (end - start).days + 1
+    summary = None
+    if metrics.get("active_days"):
+        # Quiet children only count in the totals
+        lines = [f"- {label_child(child)}: {_child_text(child)}" for child in children if child.metrics.get("active_days")]
+        prompt = bounded_list_prompt(
+            REVIEW_PROMPT_HEAD.format(label=period, start=start.isoformat(), end=end.isoformat(),
+                                      totals=format_totals(metrics), part=part, part_title=part.capitalize()),
+            lines,
+            REVIEW_PROMPT_TAIL,
+        )
+        try:
+            summary = llm.invoke(prompt, kind=f"{period}_review").content.strip() or None
+        except Exception as e:
+            logger.error("Error generating %s review for user %s: %s", period, user_id, e)
+        if summary is None:
+            LLM_FALLBACKS.inc(path=f"{period}_review")
+
+    if summary:
+        overall = summary
+    elif metrics.get("active_days"):
+        overall = f"❌ Failed to generate a review. You were active on {metrics['active_days']} days - nice!"
+    else:
+        overall = f"No activity logged this {period}."
+    report = "\n".join([
+        f"📅 **{TITLES[period]}** ({start.isoformat()} – {end.isoformat()})",
+        "-" * 30,
+        "🔢 **Totals:**",
+        format_totals(metrics),
+        "",
+        f"🎯 **Overall:** {overall}",
+    ])
+    return crud.save_report_snapshot(db, user_id=user_id, period=period, start=start, end=end, summary=summary,
+                                     report=report, metrics=metrics, data_version=data_version)
+
+
+def _week_snapshot(db: Session, user_id: int, start: date, end: date, data_version: int, timezone: str, today: date,
+                   stored: dict):
+    """The snapshot of start..end, a Monday-Sunday week or the part of one inside a month."""
+    snapshot = stored.get((start, end))
+    if is_fresh(snapshot, data_version, timezone):
+        return snapshot
+    days = _day_snapshots(db, user_id, start, min(end, today), data_version, timezone)
+    return _reduce(db, user_id, "week", start, end, days, part="day", data_version=data_version,
+                   label_child=lambda child: child.period_start.strftime("%a %d %b"))
+
+
+def build_period_snapshot(db: Session, user_id: int, period: str, day: date = None):
+    """The week's or month's ReportSnapshot containing `day` (default the user's today), built only if it's missing or stale."""
+    timezone = crud.get_user_timezone(db, user_id=user_id)
+    today = local_day(timezone)
+    day = day or today
+    start, end = period_bounds(period, day)
+    if start > today:
+        raise ValueError("report period hasn't started yet")
+    data_version = crud.get_data_version(db, user_id=user_id)
+    stored = crud.get_report_snapshots(db, user_id=user_id, period="week", start=start, end=end)
+
+    if period == "week":
+        return _week_snapshot(db, user_id, start, end, data_version, timezone, today, stored)
+
+    snapshot = crud.get_report_snapshots(db, user_id=user_id, period="month", start=start, end=start).get((start, end))
+    if is_fresh(snapshot, data_version, timezone):
+        return snapshot
+    # Weeks are clipped at the month's edges, never at today, so a span keeps its snapshot as the month goes on
+    weeks = [
+        _week_snapshot(db, user_id, first, last, data_version, timezone, today, stored)
+        for first, last in week_segments(start, end) if first <= today
+    ]
+    return _reduce(db, user_id, "month", start, end, [week for week in weeks if week is not None], part="week",
+                   data_version=data_version,
+                   label_child=lambda child: f"{child.period_start.strftime('%d %b')} – {child.period_end.strftime('%d %b')}")
+
+
+def build_period_report(db: Session, user_id: int, period: str, day: date = None) -> str:
+    snapshot = build_period_snapshot(db, user_id, period, day)
+    if snapshot is None:
+        raise RuntimeError(f"could not build the {period} report")
+    return snapshot.report
@@ -0,0 +1,297 @@
+"""
+Idempotency-Key support for the mutating endpoints.
+
+Clients on flaky networks retry POSTs. Without this, every retry of
+/api/v1/mood or /api/v1/health/meal scores the entry with the LLM again,
+writes another row and awards the XP twice. A POST, PUT, PATCH or DELETE
+that sends an `Idempotency-Key` header runs at most once per user and key.
+The key is any unique string of up to IDEMPOTENCY_KEY_MAX_LENGTH
+characters, e.g. a UUID per user action.
+
+- The first request claims the key in the `idempotency_keys` table and
+  runs. Its response is stored, unless it's a 5xx, both in the table and
+  in an in-process LRU until the key expires.
+- A retry gets the stored response back, headers included, without the
+  endpoint running. It carries an `Idempotent-Replayed: true` header.
+- A duplicate that arrives while the first is still running waits for it.
+  In the same process it watches the LRU; in another worker it polls the
+  table. It then gets the same response, or a 409 after
+  IDEMPOTENCY_WAIT_SECONDS.
+- Reusing a key for a different request (method, path, query or body)
+  gets a 422.
+- A 5xx or an exception releases the claim, so the retry runs again. A
+  claim whose worker died is taken over after IDEMPOTENCY_LOCK_SECONDS.
+
+Keys are scoped to the user of the bearer token. Requests without a valid
+token (register, login) pass through untouched. If the database can't be
+reached, requests run unprotected rather than fail.
+
+Configuration (environment):
+    IDEMPOTENCY_TTL_SECONDS   how long a key's response is replayed (86400)
+    IDEMPOTENCY_WAIT_SECONDS  how long a duplicate waits for the running request (30)
+    IDEMPOTENCY_LOCK_SECONDS  age at which an unfinished claim counts as abandoned (120)
+    IDEMPOTENCY_CACHE_SIZE    responses kept in the in-process LRU (10000)
+"""
+import asyncio
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from auth.auth import username_from_token
+from db import crud
+from db.database import get_db_session
+from observability.logger import get_logger
+from observability.metrics import IDEMPOTENT_REQUESTS
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+IDEMPOTENCY_TTL_SECONDS = float(os.getenv("IDEMPOTENCY_TTL_SECONDS", "86400"))
+IDEMPOTENCY_WAIT_SECONDS = float(os.getenv("IDEMPOTENCY_WAIT_SECONDS", "30"))
+IDEMPOTENCY_LOCK_SECONDS = float(os.getenv("IDEMPOTENCY_LOCK_SECONDS", "120"))
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+IDEMPOTENCY_KEY_MAX_LENGTH = 255
+
+MUTATING_METHODS = frozenset({"POST", "PUT", "PATCH", "DELETE"})
+
+# Polling for a duplicate's result backs off from the first to the second
+_POLL_SECONDS = (0.02, 0.5)
+
+
+@dataclass
+class StoredResponse:
+    fingerprint: str
+    status_code: int  # None while the first request is still running
+    content_type: str
+    body: bytes
+    expires_at: datetime
+    headers: list = None  # [name, value] pairs; None for rows stored before headers were kept
+
+
+class ResponseStore:
+    """Completed responses in a bounded LRU, plus the keys this process is running."""
+
+    def __init__(self, max_entries: int = IDEMPOTENCY_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._running = {}
+        self._lock = threading.Lock()
+
+    def get(self, scope: tuple):
+        with self._lock:
+            entry = self._entries.get(scope)
+            if entry is None:
+                return None
+            if entry.expires_at <= datetime.now():
+                del self._entries[scope]
+                return None
+            self._entries.move_to_end(scope)
+            return entry
+
+    def put(self, scope: tuple, entry: StoredResponse):
+        with self._lock:
+            self._entries[scope] = entry
+            self._entries.move_to_end(scope)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def start(self, scope: tuple) -> tuple:
+        """(event, owner): owner is True if this caller now runs `scope`, else `event` is set when the runner finishes."""
+        with self._lock:
+            event = self._running.get(scope)
+            if event is not None:
+                return event, False
+            event = self._running[scope] = threading.Event()
+            return event, True
+
+    def finish(self, scope: tuple):
+        with self._lock:
+            event = self._running.pop(scope, None)
+        if event is not None:
+            event.set()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+store = ResponseStore()
+
+
+def _fingerprint(request: Request, body: bytes) -> str:
+    digest = hashlib.blake2b(digest_size=16)
+    for part in (request.method, request.url.path, request.url.query):
+        digest.update(part.encode())
+        digest.update(b"\0")
+    digest.update(body)
+    return digest.hexdigest()
+
+
+def _stored(row) -> StoredResponse:
+    return StoredResponse(fingerprint=row.fingerprint, status_code=row.status_code, content_type=row.content_type,
+                          body=row.body, expires_at=row.expires_at, headers=row.headers)
+
+
+def _header_pairs(response: Response) -> list:
+    """The response's raw headers as [name, value] strings, without content-length (it's recomputed on replay)."""
+    return [[name.decode("latin-1"), value.decode("latin-1")]
+            for name, value in response.raw_headers if name != b"content-length"]
+
+
+def _with_headers(status_code: int, body: bytes, headers: list) -> Response:
+    # Set raw headers directly: a headers dict would keep only one of each repeated header
+    response = Response(content=body, status_code=status_code)
+    response.raw_headers = [(name.encode("latin-1"), value.encode("latin-1")) for name, value in headers]
+    response.raw_headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    return response
+
+
+def _claim(username: str, key: str, fingerprint: str) -> tuple:
+    """
+    (user id, the key's existing response or None if this request now holds
+    it). The user id is None when the request can't be protected.
+    """
+    db = get_db_session()
+    try:
+        user_id = crud.get_user_id(db, username=username)
+        if user_id is None:
+            return None, None
+        row = crud.claim_idempotency_key(db, user_id=user_id, key=key, fingerprint=fingerprint,
+                                         ttl_seconds=IDEMPOTENCY_TTL_SECONDS, lock_seconds=IDEMPOTENCY_LOCK_SECONDS)
+        return user_id, _stored(row) if row is not None else None
+    except Exception as e:
+        logger.error("Idempotency store unavailable, running request unprotected: %s", e)
+        return None, None
+    finally:
+        db.close()
+
+
+def _load(user_id: int, key: str):
+    db = get_db_session()
+    try:
+        row = crud.get_idempotency_key(db, user_id=user_id, key=key)
+        return _stored(row) if row is not None else None
+    finally:
+        db.close()
+
+
+def _complete(user_id: int, key: str, entry: StoredResponse):
+    db = get_db_session()
+    try:
+        crud.complete_idempotency_key(db, user_id=user_id, key=key, status_code=entry.status_code,
+                                      content_type=entry.content_type, body=entry.body, headers=entry.headers)
+    finally:
+        db.close()
+
+
+def _release(user_id: int, key: str):
+    db = get_db_session()
+    try:
+        crud.release_idempotency_key(db, user_id=user_id, key=key)
+    finally:
+        db.close()
+
+
+def _error(status_code: int, detail: str, outcome: str) -> Response:
+    IDEMPOTENT_REQUESTS.inc(outcome=outcome)
+    return JSONResponse({"detail": detail}, status_code=status_code)
+
+
+def _replay(entry: StoredResponse, fingerprint: str) -> Response:
+    if entry.fingerprint != fingerprint:
+        return _error(422, "Idempotency-Key was already used for a different request", "mismatch")
+    IDEMPOTENT_REQUESTS.inc(outcome="replayed")
+    if entry.headers is None:
+        return Response(content=entry.body, status_code=entry.status_code, media_type=entry.content_type,
+                        headers={"Idempotent-Replayed": "true"})
+    return _with_headers(entry.status_code, entry.body, entry.headers + [["idempotent-replayed", "true"]])
+
+
+def _in_progress() -> Response:
+    return _error(409, "A request with this Idempotency-Key is still in progress", "in_progress")
+
+
+async def _sleep(attempt: int, deadline: float) -> bool:
+    """Back off before the next look at a duplicate's result; False once the wait is over."""
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        return False
+    await asyncio.sleep(min(_POLL_SECONDS[0] * 2 ** attempt, _POLL_SECONDS[1], remaining))
+    return True
+
+
+async def idempotent_requests(request: Request, call_next):
+    """Middleware: run a mutating request with an Idempotency-Key once per user and key, replaying its response to retries."""
+    key = request.headers.get("idempotency-key")
+    if not key or request.method not in MUTATING_METHODS:
+        return await call_next(request)
+    if len(key) > IDEMPOTENCY_KEY_MAX_LENGTH:
+        return JSONResponse({"detail": f"Idempotency-Key must be at most {IDEMPOTENCY_KEY_MAX_LENGTH} characters"},
+                            status_code=400)
+    scheme, _, token = request.headers.get("authorization", "").partition(" ")
+    username = username_from_token(token) if scheme.lower() == "bearer" else None
+    if username is None:
+        return await call_next(request)
+
+    fingerprint = _fingerprint(request, await request.body())
+    scope = (username, key)
+    deadline = time.monotonic() + IDEMPOTENCY_WAIT_SECONDS
+
+    # A duplicate running in this process: wait for it without touching the database
+    attempt = 0
+    while True:
+        entry = store.get(scope)
+        if entry is not None:
+            return _replay(entry, fingerprint)
+        event, owner = store.start(scope)
+        if owner:
+            break
+        while not event.is_set():
+            if not await _sleep(attempt, deadline):
+                return _in_progress()
+            attempt += 1
+
+    held = False
+    try:
+        user_id, entry = await run_in_threadpool(_claim, username, key, fingerprint)
+        # A duplicate running in another worker: poll the table until it finishes or gives the key up
+        while entry is not None and entry.status_code is None:
+            if entry.fingerprint != fingerprint:
+                return _replay(entry, fingerprint)
+            if not await _sleep(attempt, deadline):
+                return _in_progress()
+            attempt += 1
+            entry = await run_in_threadpool(_load, user_id, key)
+            if entry is None:
+                user_id, entry = await run_in_threadpool(_claim, username, key, fingerprint)
+        if entry is not None:
+            store.put(scope, entry)
+            return _replay(entry, fingerprint)
+
+        held = user_id is not None
+        IDEMPOTENT_REQUESTS.inc(outcome="executed" if held else "unprotected")
+        response = await call_next(request)
+        body = b"".join([chunk async for chunk in response.body_iterator])
+        headers = _header_pairs(response)
+        if held and response.status_code < 500:
+            entry = StoredResponse(fingerprint=fingerprint, status_code=response.status_code,
+                                   content_type=response.headers.get("content-type"), body=body,
+                                   expires_at=datetime.now() + timedelta(seconds=IDEMPOTENCY_TTL_SECONDS),
+                                   headers=headers)
+            store.put(scope, entry)
+            await run_in_threadpool(_complete, user_id, key, entry)
+            held = False
+        return _with_headers(response.status_code, body, headers)
+    finally:
+        if held:
+            # Failed: let the retry run it again
+            await run_in_threadpool(_release, user_id, key)
+        store.finish(scope)
@@ -1,16 +1,31 @@
-from fastapi import FastAPI, Request , HTTPException , Depends
+from fastapi import FastAPI, Request , HTTPException , Depends, WebSocket
+from db import crud
 from db.database import get_db_session
 from agents.mood_agent import log_mood
 from agents.code_agent import log_code_activity
 from agents.health_agent import log_meal , log_exercise , log_sleep , log_water_intake
 from agents.daily_report_agent import build_daily_report
+from agents.mood_trends import mood_trends
+from agents.period_report_agent import build_period_report, period_bounds, is_fresh
 from sqlalchemy.orm import Session
 from db.models import Level , XPEvent , CodeLog
-from datetime import datetime
+from db.mood_search import search_mood_logs
+from datetime import datetime, date
 from auth.auth import get_current_user
 from db.models import User
 from auth.auth import get_password_hash , verify_password, create_access_token, verify_password_async, hash_password_async
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse
+from observability.logger import get_logger, sampled
+from observability.metrics import HTTP_REQUEST_SECONDS, render as render_metrics
+from observability import profiling
+from api.response_cache import cached_json_response
+from api.rate_limit import llm_rate_limit
+from api import idempotency
+from api.xp_stream import serve_xp_updates
+from tools import llm_deadline
+from tools.timezones import local_day, is_valid_timezone
+import time
 
 # Configure CORS
 app = FastAPI(
@@ -21,6 +36,57 @@ import os
 from dotenv import load_dotenv
 load_dotenv()
 
+logger = get_logger(__name__)
+
+MOOD_SEARCH_MAX_LIMIT = 50
+MOOD_TRENDS_MAX_DAYS = 730
+DASHBOARD_REPORT_MODES = ("auto", "inline", "none")
+TIMEZONE_ERROR = "timezone must be an IANA name like Europe/Berlin"
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    """Record total latency per route template (not raw path, to keep label cardinality bounded)"""
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        HTTP_REQUEST_SECONDS.observe(
+            time.perf_counter() - start,
+            route=getattr(route, "path", "unmatched"),
+            method=request.method,
+            status=status_code,
+        )
+
+@app.middleware("http")
+async def apply_latency_budget(request: Request, call_next):
+    """Give the request its latency budget; LLM calls inside get what's left of it"""
+    budget = llm_deadline.REQUEST_LATENCY_BUDGET_SECONDS
+    requested = request.headers.get("x-latency-budget-ms")
+    if requested:
+        try:
+            # Clients can only shorten the budget (or set one when it's disabled)
+            requested = max(float(requested), 1.0) / 1000
+            budget = requested if budget <= 0 else min(budget, requested)
+        except ValueError:
+            pass
+    if budget <= 0:
+        return await call_next(request)
+    with llm_deadline.deadline(budget):
+        return await call_next(request)
+
+# Request profiling is only wired in when PROFILING_TOKEN is set
+if profiling.PROFILING_ENABLED:
+    app.middleware("http")(profiling.profile_request)
+
+# The middleware registered last runs outermost. Idempotency goes outside
+# everything but CORS, so a replayed retry skips the rest of the stack and
+# still gets its CORS headers.
+app.middleware("http")(idempotency.idempotent_requests)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],  # Load from .env file
@@ -29,12 +95,35 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+def require_profiling_token(req: Request):
+    token = req.headers.get("x-profile-token") or req.query_params.get("profile_token", "")
+    if not profiling.token_is_valid(token):
+        raise HTTPException(status_code=404, detail="Not Found")
+
 # Health check endpoint for Docker and Google Cloud Run
 @app.get("/health")
 async def health_check():
     """Health check endpoint for container orchestration platforms"""
     return {"status": "healthy", "timestamp": datetime.now().isoformat()}
 
+@app.get("/metrics")
+async def metrics():
+    """Prometheus scrape endpoint"""
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/v1/admin/profiles", dependencies=[Depends(require_profiling_token)])
+async def list_profiles():
+    """Explicit captures and the slowest sampled requests per route"""
+    return profiling.store.list()
+
+@app.get("/api/v1/admin/profiles/{profile_id}", dependencies=[Depends(require_profiling_token)])
+async def get_profile(profile_id: str):
+    """Collapsed stacks (sample mode) or pstats text (cprofile mode) for one capture"""
+    capture = profiling.store.get(profile_id)
+    if capture is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(capture.report())
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -48,7 +137,7 @@ def get_db():
         db.close()
 
 
-@app.post("/api/v1/mood")
+@app.post("/api/v1/mood", dependencies=[Depends(llm_rate_limit("mood"))])
 async def create_mood_log(request  : Request, current_user : User = Depends(get_current_user)):
     
     
@@ -56,13 +145,52 @@ async def create_mood_log(request  : Request, current_user : User = Depends(get_
         data = await request.json()
         mood_text = data.get("mood_text" , "")
         
-        print(f"mood text from req: {mood_text}")
+        logger.debug("mood text from req: %s", mood_text)
         
-        log_mood(mood_text , current_user.id)
-        print("Mood logged successfully")
-        return {"message": "Mood logged successfully",}
+        result = log_mood(mood_text , current_user.id)
+        logger.info("Mood logged successfully", extra=sampled())
+        return {"message": "Mood logged successfully", "similar_entries": result.get("similar_entries", [])}
+    except Exception as e:
+        logger.error("Error logging mood: %s", e)
+        raise HTTPException(status_code=500 , detail=str(e))
+
+
+@app.get("/api/v1/mood/search")
+def search_mood(q : str = "", limit : int = 20, offset : int = 0, db : Session = Depends(get_db) , current_user : User = Depends(get_current_user)):
+    query = q.strip()
+    if not query:
+        raise HTTPException(status_code=400 , detail="search query cant be empty")
+    if not 1 <= limit <= MOOD_SEARCH_MAX_LIMIT or offset < 0:
+        raise HTTPException(status_code=400 , detail=f"limit must be 1-{MOOD_SEARCH_MAX_LIMIT} and offset at least 0")
+    try:
+        page = search_mood_logs(db, user_id=current_user.id, query=query, limit=limit, offset=offset)
+        return {
+            "query": query,
+            "results": [
+                {**result, "timestamp": result["timestamp"].isoformat()}
+                for result in page["results"]
+            ],
+            "limit": limit,
+            "offset": offset,
+            "has_more": page["has_more"],
+        }
+    except Exception as e:
+        logger.error("error searching mood logs for user %s: %s", current_user.id, e)
+        raise HTTPException(status_code=500 , detail=str(e))
+
+
+@app.get("/api/v1/mood/trends")
+def get_mood_trends(request : Request, days : int = 365, db : Session = Depends(get_db) , current_user : User = Depends(get_current_user)):
+    if not 1 <= days <= MOOD_TRENDS_MAX_DAYS:
+        raise HTTPException(status_code=400 , detail=f"days must be 1-{MOOD_TRENDS_MAX_DAYS}")
+
+    def compute():
+        return mood_trends(db, user_id=current_user.id, days=days)
+
+    try:
+        return cached_json_response(request, f"mood-trends-{days}", current_user, compute)
     except Exception as e:
-        print(f"Error logging mood: {e}")
+        logger.error("error computing mood trends for user %s: %s", current_user.id, e)
         raise HTTPException(status_code=500 , detail=str(e))
 
 
@@ -71,12 +199,12 @@ async def create_meal_log(request: Request, current_user : User = Depends(get_cu
     try:
         data = await request.json()
         meal = data.get("meal" , "")
-        print(f"meal from request  : {meal}")
+        logger.debug("meal from request  : %s", meal)
         log_meal(meal , current_user.id)
-        print("Meal logged successfully")
+        logger.info("Meal logged successfully", extra=sampled())
         return {"message": "Meals logged successfully"}
     except Exception as e:
-        print(f"Error logging meals: {e}")
+        logger.error("Error logging meals: %s", e)
         raise HTTPException(status_code=500 , detail=str(e))
 
 
@@ -87,14 +215,14 @@ async def create_exercise_log(req  : Request, current_user : User = Depends(get_
     try:
        data = await req.json()
        exercise_minutes = data.get("exercise_minutes" , 0)
-       print(f"excercise minutes from request :  {exercise_minutes}")
+       logger.debug("excercise minutes from request :  %s", exercise_minutes)
        
        log_exercise(exercise_minutes , current_user.id)
-       print("Exercise logged successfully")
+       logger.info("Exercise logged successfully", extra=sampled())
        response = {"message": "Exercise logged successfully"}
        return response
     except Exception as e:
-        print(f"Error logging exercise: {e}")
+        logger.error("Error logging exercise: %s", e)
         raise HTTPException(status_code=500 , detail=str(e))
 
 @app.post("/api/v1/health/sleep")
@@ -104,13 +232,13 @@ async def create_sleep_log(req : Request, current_user : User = Depends(get_curr
         data = await req.json()
         
         sleep_hours = data.get("sleep_hours" , 0)
-        print(f"Sleep hours from request: {sleep_hours}")
+        logger.debug("Sleep hours from request: %s", sleep_hours)
         log_sleep(sleep_hours , current_user.id)
-        print("sleep logged successfully")
+        logger.info("sleep logged successfully", extra=sampled())
         return {"message": "Sleep logged successfully"}
     
     except Exception as e:
-        print(f"Error logging sleep: {e}")
+        logger.error("Error logging sleep: %s", e)
         raise HTTPException(status_code=500 , detail=str(e))
 
 @app.post("/api/v1/health/water")
@@ -119,10 +247,10 @@ async def create_water_log(req: Request, current_user : User = Depends(get_curre
         data = await req.json()
         water_intake_liter  = data.get("water_intake", 0.0)
         log_water_intake(water_intake_liter , current_user.id)
-        print("Water intake logged successfully")
+        logger.info("Water intake logged successfully", extra=sampled())
         return {"message": "Water intake logged successfully"}
     except Exception as e:
-        print(f"Error logging water intake: {e}")
+        logger.error("Error logging water intake: %s", e)
         raise HTTPException(status_code=500 , detail=str(e))
     
 
@@ -137,71 +265,171 @@ async def create_code_activity(current_user : User = Depends(get_current_user)):
             }
     
     except Exception as e:
-        print(f"Error logging code activity: {e}")
+        logger.error("Error logging code activity: %s", e)
         return {"error": "Failed to load code activity"}
 
+def _code_activity(db : Session, current_user : User):
+    today  = local_day(current_user.timezone)
+    
+    #todays's code logs
+    code_logs = crud.get_day_logs(db, CodeLog, user_id=current_user.id, day=today)
+    
+    return {
+        "code_logs": [
+            {
+                "id": log.id,
+                "lines_added": log.lines_added,
+                "lines_removed": log.lines_removed,
+                "total_time_minutes": log.total_time_minutes,
+                "date": log.date.isoformat(),
+                "processed": log.processed
+            }
+            for log in code_logs
+        ],
+        "total_logs": len(code_logs)
+    }
+
+
 @app.get("/api/v1/get-code-activity")
 async def get_code_activity(current_user : User = Depends(get_current_user) , db : Session = Depends(get_db)):
     try: 
-        today  = datetime.now().date()
-        
-        #todays's code logs
-        code_logs = db.query(CodeLog).filter(
-            CodeLog.user_id == current_user.id,
-            CodeLog.date >= today
-        ).all()
-        
-        return {
-            "code_logs": [
-                {
-                    "id": log.id,
-                    "lines_added": log.lines_added,
-                    "lines_removed": log.lines_removed,
-                    "total_time_minutes": log.total_time_minutes,
-                    "date": log.date.isoformat(),
-                    "processed": log.processed
-                }
-                for log in code_logs
-            ],
-            "total_logs": len(code_logs)
-        }
+        return _code_activity(db, current_user)
     
     except Exception as e:
-        print(f"error getting code logs: {e}")
+        logger.error("error getting code logs: %s", e)
         return {"message" : "error getting code logs"}
 
 
-@app.get("/api/v1/daily-report")
-async def get_daily_report(db : Session = Depends(get_db) , current_user  : User = Depends(get_current_user)):
-    try:
-        print(f"🌅 Daily report requested for user: {current_user.id} ({current_user.username})")
-        report = build_daily_report(db , current_user.id)
-        print(f"🌅 Daily report successfully generated for user {current_user.id}")
-        print(f"🌅 Report content: {report}")
+@app.get("/api/v1/daily-report", dependencies=[Depends(llm_rate_limit("report"))])
+async def get_daily_report(request : Request, db : Session = Depends(get_db) , current_user  : User = Depends(get_current_user)):
+    def compute():
+        logger.debug("🌅 Daily report requested for user: %s (%s)", current_user.id, current_user.username)
+        # Another worker may already have built it for this version of the user's data
+        report = _stored_daily_report(db, current_user) or build_daily_report(db , current_user.id)
+        logger.info("🌅 Daily report successfully generated for user %s", current_user.id)
+        logger.debug("🌅 Report content: %s", report)
         return {"report" : report}
+
+    try:
+        return cached_json_response(request, "daily-report", current_user, compute)
     except Exception as e:
-        print(f"🌅 Error occurred generating daily report for user {current_user.id}: {e}")
+        logger.error("🌅 Error occurred generating daily report for user %s: %s", current_user.id, e)
         raise HTTPException(status_code=500 , detail= str(e))
     
+def _period_report(request : Request, db : Session, current_user : User, period : str, day : str = None):
+    try:
+        target = date.fromisoformat(day) if day else local_day(current_user.timezone)
+        start, _ = period_bounds(period, target)
+    except ValueError:
+        raise HTTPException(status_code=400 , detail="date must be YYYY-MM-DD")
+    if start > local_day(current_user.timezone):
+        raise HTTPException(status_code=400 , detail=f"that {period} hasn't started yet")
+
+    def compute():
+        logger.debug("📅 %s report requested for user %s from %s", period.capitalize(), current_user.id, start)
+        return {"report" : build_period_report(db , current_user.id, period, target), "start" : start.isoformat()}
+
+    try:
+        return cached_json_response(request, f"{period}-report-{start.isoformat()}", current_user, compute)
+    except Exception as e:
+        logger.error("📅 Error generating %s report for user %s: %s", period, current_user.id, e)
+        raise HTTPException(status_code=500 , detail= str(e))
+
+
+@app.get("/api/v1/weekly-report", dependencies=[Depends(llm_rate_limit("report"))])
+def get_weekly_report(request : Request, date : str = None, db : Session = Depends(get_db) , current_user  : User = Depends(get_current_user)):
+    return _period_report(request, db, current_user, "week", date)
+
+
+@app.get("/api/v1/monthly-report", dependencies=[Depends(llm_rate_limit("report"))])
+def get_monthly_report(request : Request, date : str = None, db : Session = Depends(get_db) , current_user  : User = Depends(get_current_user)):
+    return _period_report(request, db, current_user, "month", date)
+
+def _user_stats(db : Session, current_user : User):
+    level = db.query(Level).filter(Level.user_id == current_user.id).first()
+    
+    today = local_day(current_user.timezone)
+    today_xp = crud.get_day_logs(db, XPEvent, user_id=current_user.id, day=today)
+    return {
+        "current_level" : level.current_level if level else 1,
+        "total_xp" : level.total_xp if level else 0,
+        "todays_xp" : sum(xp.amount for xp in today_xp),
+        "xp_breakdown" : {xp.xp_type : xp.amount for xp in today_xp}
+    }
+
+
+@app.websocket("/api/v1/ws/xp")
+async def xp_updates(websocket : WebSocket):
+    """Live XP awards for one user; see api/xp_stream.py for the protocol."""
+    await serve_xp_updates(websocket, _user_stats)
+
+
 @app.get("/api/v1/stats")
-def get_user_stats(db : Session = Depends(get_db) , current_user : User = Depends(get_current_user)):
+def get_user_stats(request : Request, db : Session = Depends(get_db) , current_user : User = Depends(get_current_user)):
+    def compute():
+        return _user_stats(db, current_user)
+
     try:
-        level = db.query(Level).filter(Level.user_id == current_user.id).first()
-        
-        today = datetime.now().date()
-        today_xp = db.query(XPEvent).filter(
-            XPEvent.timestamp >= today,
-            XPEvent.user_id == current_user.id
-            ).all()
+        return cached_json_response(request, "stats", current_user, compute)
+    except Exception as e:
+        logger.error("error in getting stats : %s", e)
+        raise HTTPException(status_code=500 , detail = str(e))
+
+
+def _stored_daily_report(db : Session, current_user : User):
+    """Today's report as last built, if the user's data hasn't changed since; else None."""
+    today = local_day(current_user.timezone)
+    snapshot = crud.get_report_snapshots(db, user_id=current_user.id, period="day", start=today, end=today).get((today, today))
+    return snapshot.report if is_fresh(snapshot, current_user.data_version or 0, current_user.timezone) else None
+
+
+@app.get("/api/v1/dashboard", dependencies=[Depends(llm_rate_limit("report"))])
+def get_dashboard(request : Request, report : str = "auto", db : Session = Depends(get_db) , current_user : User = Depends(get_current_user)):
+    """
+    Everything the dashboard shows, for one authenticated request and one DB
+    session: the user, their stats, today's code activity and the daily report.
+
+    The report is the only slow part (it calls the LLM), so by default it's
+    only included if it's already built for the current data ("report_status":
+    "ready"); otherwise it's "pending" and the client fetches
+    /api/v1/daily-report separately. report=inline builds it in this request,
+    report=none leaves it out.
+    """
+    if report not in DASHBOARD_REPORT_MODES:
+        raise HTTPException(status_code=400 , detail=f"report must be one of {', '.join(DASHBOARD_REPORT_MODES)}")
+
+    stored = None if report == "none" else _stored_daily_report(db, current_user)
+    if report == "none":
+        status = "skipped"
+    elif stored is not None or report == "inline":
+        status = "ready"
+    else:
+        status = "pending"
+
+    def compute():
+        report_text = stored
+        if status == "ready" and report_text is None:
+            report_text = build_daily_report(db , current_user.id)
         return {
-            "current_level" : level.current_level if level else 1,
-            "total_xp" : level.total_xp if level else 0,
-            "todays_xp" : sum(xp.amount for xp in today_xp),
-            "xp_breakdown" : {xp.xp_type : xp.amount for xp in today_xp}
+            "user" : {
+                "id" : current_user.id,
+                "username" : current_user.username,
+                "email" : current_user.email,
+                "created_at" : current_user.created_at,
+                "is_active" : current_user.is_active
+            },
+            "stats" : _user_stats(db, current_user),
+            "code_activity" : _code_activity(db, current_user),
+            "report" : report_text,
+            "report_status" : status,
         }
+
+    try:
+        # The report's status is part of the route, so a report finished elsewhere changes the ETag
+        return cached_json_response(request, f"dashboard-{status}", current_user, compute)
     except Exception as e:
-        print(f"error in getting stats : {e}")
-        raise HTTPException(status_code=500 , detail = str(e))
+        logger.error("error building dashboard for user %s: %s", current_user.id, e)
+        raise HTTPException(status_code=500 , detail=str(e))
 
 
 @app.post("/api/v1/auth/register")
@@ -211,6 +439,7 @@ async def register(req : Request):
         username = data.get("username").strip().lower()
         email = data.get("email").strip().lower()
         password = data.get("password")
+        timezone = data.get("timezone")
         
         if not username or len(username) < 3:
             raise HTTPException(status_code=400 , detail="username too small")
@@ -221,6 +450,9 @@ async def register(req : Request):
         if not password or len(password) < 6:
             raise HTTPException(status_code=400 , detail="password must be atleast 6 characters long")
 
+        if timezone is not None and not is_valid_timezone(timezone):
+            raise HTTPException(status_code=400 , detail=TIMEZONE_ERROR)
+
         db = get_db_session()
         
         try:
@@ -243,7 +475,8 @@ async def register(req : Request):
                 email=email,
                 hashed_password = hashed_password,
                 created_at = datetime.now(),
-                is_active = True
+                is_active = True,
+                timezone = timezone
             )
             
             db.add(new_user)
@@ -272,14 +505,15 @@ async def register(req : Request):
                 "user" : {
                     "id" : new_user.id,
                     "username" : new_user.username,
-                    "email" : new_user.email
+                    "email" : new_user.email,
+                    "timezone" : new_user.timezone
                 }
             }
             
         except HTTPException:
             raise
         except Exception as e:
-            print(f"registration error : {e}")
+            logger.error("registration error : %s", e)
             db.rollback()
             raise HTTPException(status_code=500 ,  detail="error registring user")
         finally:
@@ -288,7 +522,7 @@ async def register(req : Request):
     except HTTPException:
         raise
     except Exception as e:
-        print(f"Registration request error: {e}")
+        logger.error("Registration request error: %s", e)
         raise HTTPException(status_code=400, detail="Invalid request data")
 
 
@@ -336,7 +570,7 @@ async def login(req : Request):
         except HTTPException:
             raise
         except Exception as e:
-            print(f"error while loggin in : {e}")
+            logger.error("error while loggin in : %s", e)
             raise HTTPException(status_code=500 , detail="something went wrong")
         finally:
             db.close()
@@ -344,7 +578,7 @@ async def login(req : Request):
     except HTTPException:
         raise
     except Exception as e:
-        print("login req error : {e}")
+        logger.error("login req error : %s", e)
         raise HTTPException(status_code=400, detail="Invalid request data")
  
  
@@ -356,6 +590,30 @@ async def get_current_user_info(current_user : User = Depends(get_current_user))
             "username" : current_user.username,
             "email"  : current_user.email,
             "created_at" : current_user.created_at,
-            "is_active" : current_user.is_active
+            "is_active" : current_user.is_active,
+            "timezone" : current_user.timezone
+        }
+    }
+
+
+@app.patch("/api/v1/auth/me")
+async def update_current_user_info(req : Request, current_user : User = Depends(get_current_user) , db : Session = Depends(get_db)):
+    try:
+        data = await req.json()
+        timezone = data.get("timezone")
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid request data")
+
+    if not is_valid_timezone(timezone):
+        raise HTTPException(status_code=400 , detail=TIMEZONE_ERROR)
+    # Only what's logged from now on is filed under the new timezone's days
+    if not crud.set_user_timezone(db, user_id=current_user.id, timezone=timezone):
+        raise HTTPException(status_code=500 , detail="error updating user")
+    return {
+        "user" : {
+            "id" : current_user.id,
+            "username" : current_user.username,
+            "email"  : current_user.email,
+            "timezone" : timezone
         }
     }
@@ -0,0 +1,146 @@
+"""
+Per-user token buckets for the LLM-backed endpoints.
+
+Each route class has a bucket per user: `capacity` requests of burst,
+refilled at capacity/period per second. Only requests that actually reach
+the LLM take a token, so cache hits and 304s are free. A request that finds
+its bucket empty is not rejected. It runs with LLM calls refused (see
+tools/llm_budget.py), so the mood is still logged with rule-based XP and
+the report falls back to cached or canned summaries. Every call in the scope
+also counts against the user's daily token budget.
+
+Buckets live in process memory by default. That makes limits per worker.
+Set RATE_LIMIT_REDIS_URL to share them across workers and hosts; this needs
+the optional `redis` package.
+
+Configuration (environment):
+    RATE_LIMITS           "class=capacity/seconds,..." (default below)
+    RATE_LIMIT_REDIS_URL  redis://host:port/db for shared buckets
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from fastapi import Depends
+from auth.auth import get_current_user
+from db.models import User
+from observability.logger import get_logger
+from tools import llm_budget
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+DEFAULT_RATE_LIMITS = "mood=12/60,report=6/60"
+
+# LLM priority lane of each route class (tools/llm_queue.py)
+ROUTE_LANES = {"mood": "interactive", "report": "report"}
+RATE_LIMITS = os.getenv("RATE_LIMITS", DEFAULT_RATE_LIMITS)
+RATE_LIMIT_REDIS_URL = os.getenv("RATE_LIMIT_REDIS_URL", "")
+
+
+def parse_limits(spec: str) -> dict:
+    """"mood=12/60" -> {"mood": (12.0, 60.0)}"""
+    limits = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, rate = item.split("=", 1)
+        capacity, period = rate.split("/", 1)
+        limits[name.strip()] = (float(capacity), float(period))
+    return limits
+
+
+class MemoryBucketStore:
+    """Token buckets in a bounded in-process LRU."""
+
+    def __init__(self, max_buckets: int = 200000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def take(self, key: str, capacity: float, period: float, now: float = None) -> bool:
+        now = time.monotonic() if now is None else now
+        refill_per_second = capacity / period
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * refill_per_second)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+            return allowed
+
+
+class RedisBucketStore:
+    """Token buckets shared through Redis; the refill-and-take runs atomically in a Lua script."""
+
+    _SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+  tokens = tokens - 1
+  allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return allowed
+"""
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed for shared buckets
+        self._client = redis.Redis.from_url(url)
+        self._take = self._client.register_script(self._SCRIPT)
+
+    def take(self, key: str, capacity: float, period: float, now: float = None) -> bool:
+        now = time.time() if now is None else now
+        try:
+            return bool(self._take(keys=[f"ratelimit:{key}"], args=[capacity, capacity / period, now]))
+        except Exception as e:
+            # Fail open: a Redis outage shouldn't take the LLM features down with it
+            logger.error("Rate limit store unavailable: %s", e)
+            return True
+
+
+limits = parse_limits(RATE_LIMITS)
+store = RedisBucketStore(RATE_LIMIT_REDIS_URL) if RATE_LIMIT_REDIS_URL else MemoryBucketStore()
+
+
+def allow(route_class: str, user_id: int) -> bool:
+    """Take a token from the user's bucket for `route_class`. Unknown classes are unlimited."""
+    limit = limits.get(route_class)
+    if limit is None:
+        return True
+    capacity, period = limit
+    return store.take(f"{route_class}:{user_id}", capacity, period)
+
+
+def llm_rate_limit(route_class: str):
+    """
+    Dependency for an LLM-backed route. It opens the request's LLM scope; the
+    user's bucket is only drawn from if the request actually calls the LLM.
+    An over-limit request still runs, with its LLM calls refused.
+    """
+    async def dependency(current_user: User = Depends(get_current_user)):
+        user_id = current_user.id
+
+        def rate_check():
+            allowed = allow(route_class, user_id)
+            if not allowed:
+                logger.info("Rate limited %s for user %s; serving without LLM", route_class, user_id)
+            return allowed
+
+        # Each request runs in its own task, so the scope ends with the request
+        llm_budget.set_scope(user_id, rate_check, ROUTE_LANES.get(route_class, "interactive"))
+
+    return dependency
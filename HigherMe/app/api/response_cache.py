@@ -0,0 +1,152 @@
+"""
+Conditional GET and response caching for per-user JSON endpoints.
+
+The ETag of a response is derived from the user's `data_version`, the route
+and the user's day. `data_version` is bumped in the same transaction as every log
+write and XP award (crud.bump_data_version), and `get_current_user` has
+already loaded it. So a matching If-None-Match is answered with 304 without
+running a query or an agent. On a miss the payload is computed once per
+version. It is serialized with orjson and kept, with its compressed
+variants, in an in-process LRU until the version moves on.
+
+Configuration (environment):
+    RESPONSE_CACHE_SIZE      max cached responses per process (10000)
+    RESPONSE_COMPRESS_BYTES  compress bodies at least this large (1024)
+"""
+import gzip
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+import orjson
+import zstandard
+from dotenv import load_dotenv
+from fastapi import Request, Response
+from tools.timezones import local_day
+
+load_dotenv()
+
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "10000"))
+RESPONSE_COMPRESS_BYTES = int(os.getenv("RESPONSE_COMPRESS_BYTES", "1024"))
+
+# Revalidate on every use; the 304 path is what makes polling cheap
+CACHE_CONTROL = "private, no-cache"
+VARY = "Accept-Encoding, Authorization"
+
+_zstd = threading.local()
+
+
+def _zstd_compress(body: bytes) -> bytes:
+    compressor = getattr(_zstd, "compressor", None)
+    if compressor is None:
+        compressor = _zstd.compressor = zstandard.ZstdCompressor(level=3)
+    return compressor.compress(body)
+
+
+_ENCODERS = {
+    "zstd": _zstd_compress,
+    "gzip": lambda body: gzip.compress(body, compresslevel=5),
+}
+
+
+class _Entry:
+    __slots__ = ("etag", "bodies")
+
+    def __init__(self, etag: str, body: bytes):
+        self.etag = etag
+        self.bodies = {"identity": body}
+
+
+class ResponseCache:
+    """LRU of serialized responses keyed by (route, user id)."""
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple, etag: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.etag != etag:
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: _Entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+cache = ResponseCache()
+
+
+def make_etag(route: str, user, day=None) -> str:
+    # The user's day, so cached "today" responses turn over at their midnight
+    day = day or local_day(getattr(user, "timezone", None))
+    version = getattr(user, "data_version", None) or 0
+    digest = hashlib.blake2b(f"{route}:{user.id}:{version}:{day.isoformat()}".encode(), digest_size=12).hexdigest()
+    return f'"{digest}"'
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    return etag in (tag.strip().removeprefix("W/") for tag in header.split(","))
+
+
+def _pick_encoding(accept_encoding: str) -> str:
+    offered = {}
+    for part in accept_encoding.lower().split(","):
+        name, _, params = part.strip().partition(";")
+        quality = 1.0
+        if params.strip().startswith("q="):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                quality = 0.0
+        offered[name.strip()] = quality
+    for encoding in ("zstd", "gzip"):
+        if offered.get(encoding, 0) > 0:
+            return encoding
+    return "identity"
+
+
+def cached_json_response(request: Request, route: str, user, compute) -> Response:
+    """
+    Serve `compute()` for this user and route with ETag revalidation.
+    `compute` runs only when neither the client nor this process has the
+    current version of the payload.
+    """
+    etag = make_etag(route, user)
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL, "Vary": VARY}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    key = (route, user.id)
+    entry = cache.get(key, etag)
+    if entry is None:
+        entry = _Entry(etag, orjson.dumps(compute()))
+        cache.put(key, entry)
+
+    body = entry.bodies["identity"]
+    encoding = "identity"
+    if len(body) >= RESPONSE_COMPRESS_BYTES:
+        encoding = _pick_encoding(request.headers.get("accept-encoding", ""))
+        if encoding != "identity":
+            encoded = entry.bodies.get(encoding)
+            if encoded is None:
+                encoded = entry.bodies[encoding] = _ENCODERS[encoding](body)
+            body = encoded
+            headers["Content-Encoding"] = encoding
+
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,109 @@
+"""
+Live XP updates over a WebSocket, so the dashboard doesn't poll /stats.
+
+A client connects to /api/v1/ws/xp and sends its access token as the first
+message, {"token": "..."}. The token isn't put in the URL, where access
+logs would keep it. The server answers with one stats snapshot:
+
+    {"type": "stats", "current_level", "total_xp", "todays_xp", "xp_breakdown"}
+
+After that it pushes one message per XP award, as crud.award_xp publishes
+it (tools/pubsub.py):
+
+    {"type": "xp", "xp_delta", "total_xp", "current_level", "xp_type", "local_day"}
+
+`local_day` is the user's day the award counts toward, so the client can
+keep todays_xp current without another request. Authenticating and the
+snapshot cost a few queries per connection. After that, an award costs
+the server one message and no queries.
+
+Configuration (environment):
+    XP_STREAM_AUTH_SECONDS  how long a new connection has to send its token (10)
+"""
+import asyncio
+import os
+from dotenv import load_dotenv
+from fastapi import WebSocket, WebSocketDisconnect, status
+from starlette.concurrency import run_in_threadpool
+from auth.auth import username_from_token
+from db.database import get_db_session
+from db.models import User
+from observability.logger import get_logger
+from tools import pubsub
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+XP_STREAM_AUTH_SECONDS = float(os.getenv("XP_STREAM_AUTH_SECONDS", "10"))
+
+
+def _user_id(username: str):
+    db = get_db_session()
+    try:
+        user = db.query(User).filter(User.username == username).first()
+        return user.id if user is not None and user.is_active else None
+    finally:
+        db.close()
+
+
+def _snapshot(user_id: int, stats) -> dict:
+    db = get_db_session()
+    try:
+        return stats(db, db.get(User, user_id))
+    finally:
+        db.close()
+
+
+async def _authenticate(websocket: WebSocket) -> str:
+    """The username of the token in the connection's first message, or None."""
+    try:
+        hello = await asyncio.wait_for(websocket.receive_json(), timeout=XP_STREAM_AUTH_SECONDS)
+    except (asyncio.TimeoutError, ValueError, KeyError):
+        return None
+    token = hello.get("token") if isinstance(hello, dict) else None
+    return username_from_token(token) if isinstance(token, str) else None
+
+
+async def serve_xp_updates(websocket: WebSocket, stats):
+    """
+    Run one client's connection until it disconnects. `stats(db, user)`
+    builds the snapshot, the same payload as /api/v1/stats.
+    """
+    await websocket.accept()
+    try:
+        username = await _authenticate(websocket)
+    except WebSocketDisconnect:
+        return
+    user_id = await run_in_threadpool(_user_id, username) if username else None
+    if user_id is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+
+    # Subscribe before taking the snapshot, so no award falls between the two
+    subscription = pubsub.subscribe(f"xp:{user_id}")
+    # Anything the client sends from here on is ignored; a receive is how a disconnect shows up
+    closed = asyncio.ensure_future(websocket.receive())
+    update = None
+    try:
+        snapshot = await run_in_threadpool(_snapshot, user_id, stats)
+        await websocket.send_json({"type": "stats", **snapshot})
+        while True:
+            update = update or asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({update, closed}, return_when=asyncio.FIRST_COMPLETED)
+            if closed in done:
+                if closed.result()["type"] == "websocket.disconnect":
+                    return
+                closed = asyncio.ensure_future(websocket.receive())
+            if update in done:
+                await websocket.send_json(update.result())
+                update = None
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error("XP stream for user %s failed: %s", user_id, e)
+    finally:
+        for task in (closed, update):
+            if task is not None:
+                task.cancel()
+        subscription.close()
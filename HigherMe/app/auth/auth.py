@@ -10,6 +10,7 @@ import os
 import asyncio
 from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from observability.metrics import PASSWORD_HASH_SECONDS
 
 load_dotenv()
 
@@ -31,12 +32,14 @@ def get_password_hash(password):
 async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
   """Async password verification - runs bcrypt in thread pool to avoid blocking."""
   loop = asyncio.get_event_loop()
-  return await loop.run_in_executor(_executor, pwd_context.verify, plain_password, hashed_password)
+  with PASSWORD_HASH_SECONDS.time(op="verify"):
+    return await loop.run_in_executor(_executor, pwd_context.verify, plain_password, hashed_password)
 
 async def hash_password_async(password: str) -> str:
   """Async password hashing - runs bcrypt in thread pool to avoid blocking."""
   loop = asyncio.get_event_loop()
-  return await loop.run_in_executor(_executor, pwd_context.hash, password)
+  with PASSWORD_HASH_SECONDS.time(op="hash"):
+    return await loop.run_in_executor(_executor, pwd_context.hash, password)
 
 def create_access_token(data : dict , expire_delta : timedelta = None):
   to_encode = data.copy()
@@ -56,6 +59,13 @@ def create_access_token(data : dict , expire_delta : timedelta = None):
   
   
   
+def username_from_token(token : str):
+  """The username a valid access token was issued to, or None. No database lookup."""
+  try:
+    return jwt.decode(token , secret_key , algorithms=[algorithm]).get("sub")
+  except JWTError:
+    return None
+
 def get_current_user(credentials : HTTPAuthorizationCredentials = Depends(security)):
   credential_exception = HTTPException(
     status_code=status.HTTP_401_UNAUTHORIZED,
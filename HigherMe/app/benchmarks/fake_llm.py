@@ -0,0 +1,148 @@
+"""
+Deterministic stand-in for the Groq chat completions API.
+
+Serves POST /openai/v1/chat/completions in the shape the Groq SDK expects,
+so pointing LLM_BASE_URL at it swaps the real LLM out without touching the
+agents. The answer depends only on the prompt:
+
+  * prompts asking for the `{"xp": <number>, ...}` JSON get that JSON
+  * prompts asking for a bare float/number get one in [-1, 1]
+  * everything else (summaries) gets a short sentence
+
+Latency is injected per request: --latency-ms plus up to --jitter-ms of
+extra latency. A fraction --error-rate of requests fail with a 500. Both
+come from an RNG seeded with --seed, the prompt and the call number. Answers
+depend on the prompt alone.
+
+    python -m benchmarks.fake_llm --port 8765 --latency-ms 400 --jitter-ms 200
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+COMPLETIONS_PATH = "/openai/v1/chat/completions"
+
+
+def _prompt_text(body: dict) -> str:
+    return "\n".join(str(message.get("content", "")) for message in body.get("messages", []))
+
+
+def fake_completion(prompt: str) -> str:
+    """The canned answer for a prompt."""
+    digest = hashlib.sha256(prompt.encode("utf-8")).digest()
+    if '"xp": <number>' in prompt:
+        cap = 30 if "0 to 30" in prompt or "MAX 30" in prompt else 100
+        xp = digest[0] % (cap + 1)
+        return json.dumps({"xp": xp, "details": f"⚡ Steady effort today. +{xp} XP"})
+    if "Only return a float" in prompt or "Only return a number" in prompt:
+        return f"{(digest[1] / 255.0) * 2 - 1:.2f}"
+    return f"A fake but friendly summary of your day ({digest.hex()[:8]})."
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path != COMPLETIONS_PATH:
+            self._send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+            return
+
+        server = self.server
+        prompt = _prompt_text(request)
+        rng = random.Random(f"{server.seed}:{prompt}:{server.next_call()}")
+        delay = server.latency_ms + rng.random() * server.jitter_ms
+        if delay:
+            time.sleep(delay / 1000.0)
+        if rng.random() < server.error_rate:
+            self._send_json(500, {"error": {"message": "injected failure", "type": "server_error"}})
+            return
+
+        content = fake_completion(prompt)
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{hashlib.sha1(prompt.encode('utf-8')).hexdigest()[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency_ms=0.0, jitter_ms=0.0, error_rate=0.0, seed=0):
+        super().__init__(address, FakeLLMHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.seed = seed
+        self.calls = 0
+        self._calls_lock = threading.Lock()
+
+    def next_call(self) -> int:
+        with self._calls_lock:
+            self.calls += 1
+            return self.calls
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_llm(host="127.0.0.1", port=0, **options) -> FakeLLMServer:
+    """Start the fake server on a background thread; port 0 picks a free port."""
+    server = FakeLLMServer((host, port), **options)
+    threading.Thread(target=server.serve_forever, name="fake-llm", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Deterministic fake Groq server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = FakeLLMServer((args.host, args.port), latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                           error_rate=args.error_rate, seed=args.seed)
+    print(f"fake LLM listening on {server.base_url} (set LLM_BASE_URL to this)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,338 @@
+"""
+End-to-end load test for the HigherMe API.
+
+Boots `api.main.app` in-process against a local database, with
+benchmarks/fake_llm.py standing in for Groq. It then drives a weighted mix of
+realistic traffic from N concurrent virtual users. Each user registers, logs
+in, then loops over mood/meal/water posts, stats polls and report fetches.
+
+Reported per route: count, errors, RPS, mean/p50/p95/p99 latency and DB
+queries per request. Results are written as JSON so runs can be diffed
+across commits:
+
+    python -m benchmarks.loadtest --users 20 --duration 30 --llm-latency-ms 300
+    python -m benchmarks.loadtest --db-url postgresql://localhost/higherme_bench
+    python -m benchmarks.loadtest compare results/a.json results/b.json
+
+By default requests go through httpx's ASGI transport, with no sockets and no
+uvicorn, so DB queries can be attributed to the route that issued them.
+--url targets an already running server instead; DB query counts are then
+unavailable.
+"""
+import argparse
+import asyncio
+import contextvars
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+DEFAULT_MIX = "mood=3,meal=2,water=2,stats=6,report=1"
+
+MOOD_TEXTS = [
+    "Slept badly but the standup went fine",
+    "Shipped the feature, feeling great!",
+    "Anxious about the deadline tomorrow",
+    "Quiet evening, read a book and relaxed",
+    "Frustrated with flaky tests all afternoon",
+]
+MEALS = [
+    "oatmeal with berries and a coffee",
+    "double cheeseburger and fries",
+    "grilled chicken salad with quinoa",
+    "instant noodles",
+    "salmon, rice and steamed broccoli",
+]
+
+# Per-request DB query counter; SQLAlchemy's cursor hook increments whatever list is current
+_query_counter = contextvars.ContextVar("query_counter", default=None)
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for item in spec.split(","):
+        name, weight = item.split("=", 1)
+        mix[name.strip()] = float(weight)
+    unknown = set(mix) - set(ACTIONS)
+    if unknown:
+        raise ValueError(f"unknown actions in mix: {', '.join(sorted(unknown))}")
+    return mix
+
+
+class RouteStats:
+    def __init__(self):
+        self.latencies = []
+        self.errors = 0
+        self.queries = []
+
+    def summary(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+        return {
+            "count": count,
+            "errors": self.errors,
+            "rps": round(count / elapsed, 2) if elapsed else 0.0,
+            "mean_ms": round(sum(latencies) / count * 1000, 2) if count else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+            "db_queries_per_request": round(sum(self.queries) / len(self.queries), 2) if self.queries else None,
+        }
+
+
+class LoadTest:
+    def __init__(self, client, mix: dict, duration: float, think_ms: float, seed: int, count_queries: bool):
+        self.client = client
+        self.mix = mix
+        self.duration = duration
+        self.think_ms = think_ms
+        self.seed = seed
+        self.count_queries = count_queries
+        self.stats = {}
+
+    async def request(self, name: str, method: str, path: str, token: str = None, **kwargs):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        counter = [0]
+        reset = _query_counter.set(counter)
+        start = time.perf_counter()
+        try:
+            response = await self.client.request(method, path, headers=headers, **kwargs)
+            ok = response.status_code < 400
+        except Exception:
+            response, ok = None, False
+        finally:
+            elapsed = time.perf_counter() - start
+            _query_counter.reset(reset)
+
+        stats = self.stats.setdefault(name, RouteStats())
+        stats.latencies.append(elapsed)
+        if self.count_queries:
+            stats.queries.append(counter[0])
+        if not ok:
+            stats.errors += 1
+        return response if ok else None
+
+    async def virtual_user(self, index: int, deadline: float):
+        rng = random.Random(f"{self.seed}:{index}")
+        username = f"bench_{self.seed}_{index}_{rng.randrange(10 ** 6)}"
+        password = "bench-password"
+        await self.request("register", "POST", "/api/v1/auth/register",
+                           json={"username": username, "email": f"{username}@bench.local", "password": password})
+        response = await self.request("login", "POST", "/api/v1/auth/login",
+                                      json={"email": username, "password": password})
+        if response is None:
+            return
+        token = response.json()["access_token"]
+
+        names = list(self.mix)
+        weights = [self.mix[name] for name in names]
+        while time.perf_counter() < deadline:
+            action = rng.choices(names, weights)[0]
+            await ACTIONS[action](self, token, rng)
+            if self.think_ms:
+                await asyncio.sleep(rng.random() * self.think_ms / 1000.0)
+
+    async def run(self, users: int) -> float:
+        start = time.perf_counter()
+        deadline = start + self.duration
+        await asyncio.gather(*(self.virtual_user(i, deadline) for i in range(users)))
+        return time.perf_counter() - start
+
+
+async def _post_mood(test, token, rng):
+    await test.request("mood", "POST", "/api/v1/mood", token, json={"mood_text": rng.choice(MOOD_TEXTS)})
+
+
+async def _post_meal(test, token, rng):
+    await test.request("meal", "POST", "/api/v1/health/meal", token, json={"meal": rng.choice(MEALS)})
+
+
+async def _post_water(test, token, rng):
+    await test.request("water", "POST", "/api/v1/health/water", token, json={"water_intake": round(rng.uniform(0.2, 0.8), 2)})
+
+
+async def _get_stats(test, token, rng):
+    await test.request("stats", "GET", "/api/v1/stats", token)
+
+
+async def _get_report(test, token, rng):
+    await test.request("report", "GET", "/api/v1/daily-report", token)
+
+
+ACTIONS = {
+    "mood": _post_mood,
+    "meal": _post_meal,
+    "water": _post_water,
+    "stats": _get_stats,
+    "report": _get_report,
+}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=APP_DIR).stdout.strip() or "unknown"
+    except OSError:
+        return "unknown"
+
+
+def _prepare_environment(args) -> dict:
+    """Point the app at the bench database and the fake LLM. Must run before any app import."""
+    info = {}
+    if not args.url:
+        db_url = args.db_url or "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="higherme-bench-"), "bench.db")
+        os.environ["DB_URL"] = db_url
+        info["db"] = db_url.split(":", 1)[0]
+    if not args.real_llm and not args.url:
+        from benchmarks.fake_llm import start_fake_llm
+        server = start_fake_llm(latency_ms=args.llm_latency_ms, jitter_ms=args.llm_jitter_ms,
+                                error_rate=args.llm_error_rate, seed=args.seed)
+        os.environ["LLM_BASE_URL"] = server.base_url
+        info["fake_llm"] = server
+    os.environ.setdefault("GROQ_API_KEY", "bench-key")
+    os.environ.setdefault("SECRET_KEY", "bench-secret")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    return info
+
+
+def _install_query_counter(engine):
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count_query(conn, cursor, statement, parameters, context, executemany):
+        counter = _query_counter.get()
+        if counter is not None:
+            counter[0] += 1
+
+
+async def _run(args) -> dict:
+    import httpx
+
+    info = _prepare_environment(args)
+    mix = parse_mix(args.mix)
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+    else:
+        from db.database import Base, engine
+        import db.models  # noqa: F401  (registers the tables on Base)
+        from api.main import app
+
+        Base.metadata.create_all(bind=engine)
+        _install_query_counter(engine)
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=args.timeout)
+
+    async with client:
+        test = LoadTest(client, mix, args.duration, args.think_ms, args.seed, count_queries=not args.url)
+        elapsed = await test.run(args.users)
+
+    routes = {name: stats.summary(elapsed) for name, stats in sorted(test.stats.items())}
+    all_latencies = [latency for stats in test.stats.values() for latency in stats.latencies]
+    total = RouteStats()
+    total.latencies = all_latencies
+    total.errors = sum(stats.errors for stats in test.stats.values())
+    total.queries = [q for stats in test.stats.values() for q in stats.queries]
+
+    fake_llm = info.get("fake_llm")
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "started_at": datetime.now().isoformat(),
+            "target": args.url or "in-process",
+            "db": info.get("db", "external"),
+            "users": args.users,
+            "duration_s": args.duration,
+            "think_ms": args.think_ms,
+            "mix": mix,
+            "llm": "real" if args.real_llm else {
+                "latency_ms": args.llm_latency_ms,
+                "jitter_ms": args.llm_jitter_ms,
+                "error_rate": args.llm_error_rate,
+                "calls": fake_llm.calls if fake_llm else None,
+            },
+            "elapsed_s": round(elapsed, 3),
+        },
+        "total": total.summary(elapsed),
+        "routes": routes,
+    }
+
+
+def compare(baseline: dict, candidate: dict) -> str:
+    """Side-by-side table of RPS and latency percentiles for two result files."""
+    lines = [f"{'route':<10} {'metric':<8} {'baseline':>10} {'candidate':>10} {'change':>8}"]
+    routes = ["total"] + sorted(set(baseline["routes"]) | set(candidate["routes"]))
+    for route in routes:
+        old = baseline["total"] if route == "total" else baseline["routes"].get(route, {})
+        new = candidate["total"] if route == "total" else candidate["routes"].get(route, {})
+        for metric in ("rps", "p50_ms", "p95_ms", "p99_ms"):
+            a, b = old.get(metric), new.get(metric)
+            change = f"{(b - a) / a * 100:+.1f}%" if a and b is not None else "n/a"
+            lines.append(f"{route:<10} {metric:<8} {a if a is not None else '-':>10} {b if b is not None else '-':>10} {change:>8}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] == "compare":
+        parser = argparse.ArgumentParser(prog="loadtest compare")
+        parser.add_argument("baseline")
+        parser.add_argument("candidate")
+        args = parser.parse_args(argv[1:])
+        with open(args.baseline) as f_old, open(args.candidate) as f_new:
+            print(compare(json.load(f_old), json.load(f_new)))
+        return
+
+    parser = argparse.ArgumentParser(description="HigherMe end-to-end load test")
+    parser.add_argument("--users", type=int, default=10, help="concurrent virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="seconds of traffic after login")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"action weights (default {DEFAULT_MIX})")
+    parser.add_argument("--think-ms", type=float, default=0.0, help="max random pause between a user's requests")
+    parser.add_argument("--db-url", help="database to run against (default: fresh SQLite file)")
+    parser.add_argument("--url", help="drive an already running server instead of booting the app in-process")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0)
+    parser.add_argument("--llm-jitter-ms", type=float, default=100.0)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument("--real-llm", action="store_true", help="use the real Groq API instead of the fake server")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--out", help="result file (default benchmarks/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    result = asyncio.run(_run(args))
+
+    out = args.out or os.path.join(RESULTS_DIR, f"{datetime.now():%Y%m%d-%H%M%S}-{result['meta']['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    total = result["total"]
+    print(f"{total['count']} requests in {result['meta']['elapsed_s']}s: {total['rps']} rps, "
+          f"p50 {total['p50_ms']}ms, p95 {total['p95_ms']}ms, p99 {total['p99_ms']}ms, {total['errors']} errors")
+    for name, route in result["routes"].items():
+        print(f"  {name:<9} n={route['count']:<6} err={route['errors']:<4} rps={route['rps']:<8} "
+              f"p50={route['p50_ms']}ms p95={route['p95_ms']}ms p99={route['p99_ms']}ms "
+              f"queries/req={route['db_queries_per_request']}")
+    print(f"results written to {out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,79 @@
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from db.database import get_db
+from sqlalchemy import update, select, exists, func, any_, bindparam, Integer, case
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import Session
-from db.models import CodeLog, HealthLog, MoodLog, XPEvent, Level
+from sqlalchemy.exc import IntegrityError
+from db.models import CodeLog, HealthLog, MoodLog, XPEvent, Level, User, TaskCompletion, SchedulerCheckpoint, LLMUsage, MoodDaySummary, ReportSnapshot, IdempotencyKey
 from db.database import get_db_session
+from db import mood_search, mood_similarity
+from observability.logger import get_logger, sampled
+from tools.timezones import local_day
+from tools import pubsub
+
+logger = get_logger(__name__)
+
+
+def bump_data_version(db: Session, user_id: int):
+    """
+    Invalidate a user's cached stats/report (their ETags) as part of the
+    caller's transaction, so the bump commits or rolls back with the write.
+    """
+    db.execute(update(User).where(User.id == user_id).values(data_version=User.data_version + 1))
+
+
+def get_user_timezone(db: Session, *, user_id: int) -> str:
+    return db.query(User.timezone).filter(User.id == user_id).scalar()
+
+
+def get_user_timezones(db: Session, *, user_ids: list) -> dict:
+    """{user_id: timezone name or None} for `user_ids`."""
+    if not user_ids:
+        return {}
+    return dict(db.query(User.id, User.timezone).filter(User.id.in_(user_ids)).all())
+
+
+def user_today(db: Session, *, user_id: int) -> date:
+    """Today in the user's timezone, the `local_day` their writes are filed under."""
+    return local_day(get_user_timezone(db, user_id=user_id))
+
+
+def set_user_timezone(db: Session, *, user_id: int, timezone: str) -> bool:
+    """Store the user's IANA timezone. Their "today" moves, so their cached stats and report go stale too."""
+    try:
+        db.execute(update(User).where(User.id == user_id).values(timezone=timezone))
+        bump_data_version(db, user_id)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error setting timezone: %s", e)
+        return False
+
+
+# Models with a local_day column and the column that times their rows
+_DAY_TABLES = {
+    CodeLog: CodeLog.date,
+    HealthLog: HealthLog.date,
+    MoodLog: MoodLog.timestamp,
+    XPEvent: XPEvent.timestamp,
+}
+
+
+def on_day(model, *, user_id: int, day: date) -> tuple:
+    """Filter for a user's rows of `model` on their local `day`: a point lookup on the (user_id, local_day) index."""
+    return (model.user_id == user_id, model.local_day == day)
+
+
+def get_day_logs(db: Session, model, *, user_id: int, day: date) -> list:
+    """A user's rows of `model` (a log model or XPEvent) on their local `day`, oldest first."""
+    return db.query(model).filter(*on_day(model, user_id=user_id, day=day)).order_by(_DAY_TABLES[model], model.id).all()
+
+
+def get_latest_health_log(db: Session, *, user_id: int, day: date):
+    """The day's newest health log, which holds its running totals, or None."""
+    return db.query(HealthLog).filter(*on_day(HealthLog, user_id=user_id, day=day)).order_by(
+        HealthLog.date.desc(), HealthLog.id.desc()).first()
 
 
 def create_code_log(db: Session, *, lines_added: int, lines_removed: int, total_time_minutes: float, user_id: int):
@@ -13,15 +84,17 @@ def create_code_log(db: Session, *, lines_added: int, lines_removed: int, total_
             lines_removed=lines_removed,
             total_time_minutes=total_time_minutes,
             date=datetime.now(),
+            local_day=user_today(db, user_id=user_id),
             processed=False
         )
         db.add(code_log)
+        bump_data_version(db, user_id)
         db.commit()
         db.refresh(code_log)
         return code_log
     except Exception as e:
         db.rollback()
-        print(f"Error creating code log: {e}")
+        logger.error("Error creating code log: %s", e)
         return None
 
 
@@ -34,15 +107,17 @@ def create_health_log(db: Session, *, meals: str, sleep_hours: float, exercise_m
             exercise_minutes=exercise_minutes,
             water_intake_liter=water_intake_liter,
             date=datetime.now(),
+            local_day=user_today(db, user_id=user_id),
             processed=False
         )
         db.add(health_log)
+        bump_data_version(db, user_id)
         db.commit()
         db.refresh(health_log)
         return health_log
     except Exception as e:
         db.rollback()
-        print(f"Error creating health log: {e}")
+        logger.error("Error creating health log: %s", e)
         return None
 
 
@@ -54,43 +129,159 @@ def create_mood_log(db: Session, *, mood_text: str, sentiment: float, user_id: i
             sentiment=sentiment,
             summary=summary,
             timestamp=datetime.now(),
+            local_day=user_today(db, user_id=user_id),
             processed=False
         )
+        if db.bind.dialect.name == "postgresql":
+            mood_log.search_vector = mood_search.search_vector(mood_text)
         db.add(mood_log)
+        sig = mood_similarity.signature(mood_text)
+        if sig is not None:
+            db.flush()  # the bucket rows need the log's id
+            mood_similarity.index_entry(db, mood_log, sig)
+        _add_to_mood_day(db, user_id=user_id, day=mood_log.local_day, sentiment=sentiment)
+        bump_data_version(db, user_id)
         db.commit()
         db.refresh(mood_log)
+        mood_search.index.add(user_id, mood_log.id, mood_text)
         return mood_log
     except Exception as e:
         db.rollback()
-        print(f"Error creating mood log: {e}")
+        logger.error("Error creating mood log: %s", e)
         return None
 
 
+# Log models and the column that dates each row, keyed by log type
+_LOG_TABLES = {
+    "mood": (MoodLog, MoodLog.timestamp),
+    "health": (HealthLog, HealthLog.date),
+    "code": (CodeLog, CodeLog.date),
+}
+
+
+def _ids_filter(column, ids: list, dialect_name: str):
+    """`id = ANY(:ids)` on Postgres (one bind param whatever the list size), `IN (...)` elsewhere."""
+    if dialect_name == "postgresql":
+        return column == any_(bindparam("log_ids", ids, type_=ARRAY(Integer)))
+    return column.in_(ids)
+
+
 def mark_logs_as_processed(db: Session, log_ids: list, log_type: str):
-    """Mark multiple logs as processed"""
-    try:
-        now = datetime.now()
-        if log_type == "mood":
-            db.query(MoodLog).filter(MoodLog.id.in_(log_ids)).update({
-                "processed": True,
-                "processed_at": now
-            })
-        elif log_type == "health":
-            db.query(HealthLog).filter(HealthLog.id.in_(log_ids)).update({
-                "processed": True,
-                "processed_at": now
-            })
-        elif log_type == "code":
-            db.query(CodeLog).filter(CodeLog.id.in_(log_ids)).update({
-                "processed": True,
-                "processed_at": now
-            })
+    """
+    Mark multiple logs as processed with a single UPDATE ... RETURNING.
+    Returns the ids that were flipped, or None on failure.
+    """
+    if not log_ids:
+        return []
+    try:
+        model, _ = _LOG_TABLES[log_type]
+        stmt = update(model).where(
+            _ids_filter(model.id, log_ids, db.bind.dialect.name)
+        ).values(processed=True, processed_at=datetime.now()).returning(model.id)
+        flipped = [row[0] for row in db.execute(stmt)]
         db.commit()
-        return True
+        return flipped
     except Exception as e:
         db.rollback()
-        print(f"Error marking logs as processed: {e}")
-        return False
+        logger.error("Error marking logs as processed: %s", e)
+        return None
+
+
+def _claim_statement(log_type: str, *, user_id: int, day: date, xp_type: str, returning: list):
+    """
+    Build an UPDATE that flips today's unprocessed logs for a user to processed
+    and returns them, unless `xp_type` XP was already awarded that day. The
+    "already awarded" check is a NOT EXISTS inside the same statement, so
+    claiming is one round-trip and two concurrent runs can't both claim a row.
+    """
+    model, _ = _LOG_TABLES[log_type]
+
+    already_awarded = exists().where(
+        *on_day(XPEvent, user_id=user_id, day=day),
+        XPEvent.xp_type == xp_type
+    )
+    return update(model).where(
+        *on_day(model, user_id=user_id, day=day),
+        model.processed == False,
+        ~already_awarded
+    ).values(processed=True, processed_at=datetime.now()).returning(*returning)
+
+
+def claim_code_logs(db: Session, *, user_id: int, day: date, xp_type: str = "code") -> dict:
+    """
+    Claim a user's unprocessed code logs for `day` and return their totals.
+    On Postgres the sums are computed over the UPDATE's RETURNING set in the
+    database. The claim is left uncommitted so it commits together with the XP award.
+    """
+    returning = [CodeLog.lines_added, CodeLog.lines_removed, CodeLog.total_time_minutes]
+    claim = _claim_statement("code", user_id=user_id, day=day, xp_type=xp_type, returning=returning)
+
+    if db.bind.dialect.name == "postgresql":
+        claimed = claim.cte("claimed")
+        row = db.execute(select(
+            func.count(),
+            func.coalesce(func.sum(claimed.c.lines_added), 0),
+            func.coalesce(func.sum(claimed.c.lines_removed), 0),
+            func.coalesce(func.sum(claimed.c.total_time_minutes), 0.0)
+        )).one()
+        count, lines_added, lines_removed, total_time = row
+    else:
+        # SQLite can't put UPDATE ... RETURNING in a CTE
+        rows = db.execute(claim).all()
+        count = len(rows)
+        lines_added = sum(r[0] or 0 for r in rows)
+        lines_removed = sum(r[1] or 0 for r in rows)
+        total_time = sum(r[2] or 0.0 for r in rows)
+
+    return {
+        "count": count,
+        "lines_added": int(lines_added),
+        "lines_removed": int(lines_removed),
+        "total_time_minutes": float(total_time)
+    }
+
+
+def claim_health_logs(db: Session, *, user_id: int, day: date, xp_type: str = "health"):
+    """
+    Claim a user's unprocessed health logs for `day`. Health logs are
+    cumulative snapshots, so only the latest claimed row is returned, along
+    with how many rows were claimed. Returns None when nothing was claimed.
+    """
+    returning = [HealthLog.date, HealthLog.meals, HealthLog.sleep_hours,
+                 HealthLog.exercise_minutes, HealthLog.water_intake_liter]
+    claim = _claim_statement("health", user_id=user_id, day=day, xp_type=xp_type, returning=returning)
+
+    if db.bind.dialect.name == "postgresql":
+        claimed = claim.cte("claimed")
+        latest = db.execute(
+            select(claimed, func.count().over().label("claimed_count"))
+            .order_by(claimed.c.date.desc())
+            .limit(1)
+        ).first()
+        return dict(latest._mapping) if latest else None
+
+    # SQLite can't put UPDATE ... RETURNING in a CTE
+    rows = db.execute(claim).all()
+    if not rows:
+        return None
+    latest = max(rows, key=lambda r: r.date)
+    return {**latest._mapping, "claimed_count": len(rows)}
+
+
+def claim_mood_logs(db: Session, *, user_id: int, day: date, xp_type: str = "mood") -> list:
+    """
+    Claim a user's unprocessed mood logs for `day` and return them as rows
+    (timestamp, mood_text, sentiment) in chronological order.
+    """
+    returning = [MoodLog.timestamp, MoodLog.mood_text, MoodLog.sentiment]
+    claim = _claim_statement("mood", user_id=user_id, day=day, xp_type=xp_type, returning=returning)
+
+    if db.bind.dialect.name == "postgresql":
+        claimed = claim.cte("claimed")
+        return db.execute(select(claimed).order_by(claimed.c.timestamp)).all()
+
+    # SQLite can't put UPDATE ... RETURNING in a CTE
+    return sorted(db.execute(claim).all(), key=lambda r: r.timestamp)
 
 
 def create_xp_event(xp_type: str, amount: int):
@@ -112,7 +303,7 @@ def create_xp_event(xp_type: str, amount: int):
             conn.commit()
             return xp_event_id
     except Exception as e:
-        print(f"Error creating XP event: {e}")
+        logger.error("Error creating XP event: %s", e)
         return None
     finally:
         conn.close()
@@ -142,7 +333,7 @@ def get_or_create_level():
                 return level_id
             return level
     except Exception as e:
-        print(f"Error fetching or creating level: {e}")
+        logger.error("Error fetching or creating level: %s", e)
         return None
     finally:
         conn.close()
@@ -150,7 +341,7 @@ def get_or_create_level():
 
 
 
-def award_xp(xp_type: str, amount: int, user_id: int):
+def award_xp(xp_type: str, amount: int, user_id: int, db: Session = None, day: date = None):
     """
     Award XP for a particular type of event and update the level in one transaction.
     This function allows multiple XP awards per day for the same activity type,
@@ -160,12 +351,19 @@ def award_xp(xp_type: str, amount: int, user_id: int):
         xp_type: The type of activity (e.g., "health", "mood", "coding")
         amount: The amount of XP to award
         user_id: The ID of the user earning XP
+        db: Optional session to award in. Its pending changes (e.g. claimed
+            logs) commit together with the award, and the caller keeps
+            ownership of the session.
+        day: The user's local day the award counts toward. Defaults to
+            their today; the scheduler passes the day it's closing out.
 
     Returns:
         The ID of the created XP event, or None if failed
     """
 
-    db = get_db_session()
+    owns_session = db is None
+    if owns_session:
+        db = get_db_session()
 
     try:
         # Create new XP event (no daily restriction)
@@ -173,7 +371,8 @@ def award_xp(xp_type: str, amount: int, user_id: int):
             user_id=user_id,
             xp_type=xp_type,
             amount=amount,
-            timestamp=datetime.now()
+            timestamp=datetime.now(),
+            local_day=day or user_today(db, user_id=user_id)
         )
 
         db.add(xp_event)
@@ -196,16 +395,418 @@ def award_xp(xp_type: str, amount: int, user_id: int):
             )
             db.add(level)
 
+        bump_data_version(db, user_id)
+        update_message = {"type": "xp", "xp_delta": amount, "total_xp": level.total_xp, "current_level": level.current_level,
+                          "xp_type": xp_type, "local_day": xp_event.local_day.isoformat()}
         db.commit()
         db.refresh(xp_event)
         
-        print(f"Awarded {amount} XP for {xp_type} to user {user_id}. Total XP: {level.total_xp}, Level: {level.current_level}")
+        logger.info("Awarded %s XP for %s to user %s. Total XP: %s, Level: %s", update_message["xp_delta"], xp_type, user_id, update_message["total_xp"], update_message["current_level"], extra=sampled())
+        # Connected clients see the award without polling /stats
+        pubsub.publish(f"xp:{user_id}", update_message)
         
         return xp_event.id
         
     except Exception as e:
         db.rollback()
-        print(f"Error awarding XP: {e}")
+        logger.error("Error awarding XP: %s", e)
         return None
     finally:
-        db.close()
+        if owns_session:
+            db.close()
+
+
+
+def get_active_user_ids(db: Session, *, after_id: int = 0, limit: int = 500, active_only: bool = True) -> list:
+    """
+    Return the next page of active user ids after `after_id`, in id order.
+    Keyset pagination keeps every page an index range scan on users.id.
+    Pass active_only=False to include deactivated users.
+    """
+    query = db.query(User.id).filter(User.id > after_id)
+    if active_only:
+        query = query.filter(User.is_active == True)
+    rows = query.order_by(User.id).limit(limit).all()
+    return [row[0] for row in rows]
+
+
+def get_completed_tasks(db: Session, *, user_ids: list, day: date) -> set:
+    """Return the (user_id, task) pairs already recorded in the ledger for `day`."""
+    if not user_ids:
+        return set()
+    rows = db.query(TaskCompletion.user_id, TaskCompletion.task).filter(
+        TaskCompletion.user_id.in_(user_ids),
+        TaskCompletion.day == day
+    ).all()
+    return {(row[0], row[1]) for row in rows}
+
+
+def record_task_completion(db: Session, *, user_id: int, day: date, task: str) -> bool:
+    """
+    Record that `task` ran for `user_id` on `day`.
+    A duplicate row means another worker got there first, which is still a success.
+    """
+    try:
+        db.add(TaskCompletion(user_id=user_id, day=day, task=task, completed_at=datetime.now()))
+        db.commit()
+        return True
+    except IntegrityError:
+        db.rollback()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error recording task completion: %s", e)
+        return False
+
+
+def get_scheduler_checkpoint(db: Session, *, job: str, run_key: str) -> int:
+    """Return the last fully processed user id for a job run, or 0 if it never started."""
+    checkpoint = db.query(SchedulerCheckpoint).filter(
+        SchedulerCheckpoint.job == job,
+        SchedulerCheckpoint.run_key == run_key
+    ).first()
+    return checkpoint.last_user_id if checkpoint else 0
+
+
+def clear_scheduler_checkpoint(db: Session, *, job: str, run_key: str) -> bool:
+    """Forget a job run's checkpoint, so the next run under the same key starts from the first user."""
+    try:
+        db.query(SchedulerCheckpoint).filter(
+            SchedulerCheckpoint.job == job,
+            SchedulerCheckpoint.run_key == run_key
+        ).delete()
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error clearing scheduler checkpoint: %s", e)
+        return False
+
+
+def save_scheduler_checkpoint(db: Session, *, job: str, run_key: str, last_user_id: int) -> bool:
+    """Advance the checkpoint for a job run. Checkpoints never move backwards."""
+    try:
+        checkpoint = db.query(SchedulerCheckpoint).filter(
+            SchedulerCheckpoint.job == job,
+            SchedulerCheckpoint.run_key == run_key
+        ).first()
+        if checkpoint:
+            checkpoint.last_user_id = max(checkpoint.last_user_id or 0, last_user_id)
+            checkpoint.updated_at = datetime.now()
+        else:
+            db.add(SchedulerCheckpoint(
+                job=job,
+                run_key=run_key,
+                last_user_id=last_user_id,
+                updated_at=datetime.now()
+            ))
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving scheduler checkpoint: %s", e)
+        return False
+
+
+def get_llm_usage(db: Session, *, user_id: int, day: date) -> int:
+    """Tokens the user has spent on LLM calls on `day`."""
+    tokens = db.execute(select(LLMUsage.tokens).where(
+        LLMUsage.user_id == user_id,
+        LLMUsage.day == day
+    )).scalar()
+    return tokens or 0
+
+
+def add_llm_usage(db: Session, *, usage: dict) -> bool:
+    """
+    Add tokens and calls to the per-day counters.
+    `usage` maps (user_id, day) to (tokens, calls). Existing rows are
+    incremented in place, so concurrent writers never lose each other's counts.
+    """
+    try:
+        for (user_id, day), (tokens, calls) in usage.items():
+            updated = db.execute(update(LLMUsage).where(
+                LLMUsage.user_id == user_id,
+                LLMUsage.day == day
+            ).values(
+                tokens=LLMUsage.tokens + tokens,
+                calls=LLMUsage.calls + calls,
+                updated_at=datetime.now()
+            )).rowcount
+            if not updated:
+                try:
+                    with db.begin_nested():
+                        db.add(LLMUsage(user_id=user_id, day=day, tokens=tokens, calls=calls, updated_at=datetime.now()))
+                except IntegrityError:
+                    # Another writer inserted the row first; add to it instead
+                    db.execute(update(LLMUsage).where(
+                        LLMUsage.user_id == user_id,
+                        LLMUsage.day == day
+                    ).values(tokens=LLMUsage.tokens + tokens, calls=LLMUsage.calls + calls))
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error recording LLM usage: %s", e)
+        return False
+
+
+def _mood_day_increment(sentiment):
+    values = {"entry_count": MoodDaySummary.entry_count + 1, "updated_at": datetime.now()}
+    if sentiment is not None:
+        values.update(
+            sentiment_count=MoodDaySummary.sentiment_count + 1,
+            sentiment_sum=MoodDaySummary.sentiment_sum + sentiment,
+            sentiment_min=case((MoodDaySummary.sentiment_min.is_(None), sentiment),
+                               (MoodDaySummary.sentiment_min > sentiment, sentiment),
+                               else_=MoodDaySummary.sentiment_min),
+            sentiment_max=case((MoodDaySummary.sentiment_max.is_(None), sentiment),
+                               (MoodDaySummary.sentiment_max < sentiment, sentiment),
+                               else_=MoodDaySummary.sentiment_max),
+        )
+    return values
+
+
+def _add_to_mood_day(db: Session, *, user_id: int, day: date, sentiment):
+    """Count a new mood entry in the day's running stats, in the caller's transaction."""
+    where = (MoodDaySummary.user_id == user_id, MoodDaySummary.day == day)
+    if db.execute(update(MoodDaySummary).where(*where).values(**_mood_day_increment(sentiment))).rowcount:
+        return
+    try:
+        with db.begin_nested():
+            db.add(MoodDaySummary(
+                user_id=user_id, day=day, summarized_through_id=0, entry_count=1,
+                sentiment_count=0 if sentiment is None else 1,
+                sentiment_sum=sentiment or 0.0, sentiment_min=sentiment, sentiment_max=sentiment,
+                updated_at=datetime.now()
+            ))
+    except IntegrityError:
+        # Another writer created the day's row first
+        db.execute(update(MoodDaySummary).where(*where).values(**_mood_day_increment(sentiment)))
+
+
+def get_mood_day(db: Session, *, user_id: int, day: date):
+    """The day's running mood summary and stats. Days logged before it existed are built from their logs."""
+    row = db.query(MoodDaySummary).filter(MoodDaySummary.user_id == user_id, MoodDaySummary.day == day).first()
+    if row is not None:
+        return row
+
+    entry_count, sentiment_count, sentiment_sum, sentiment_min, sentiment_max = db.query(
+        func.count(MoodLog.id), func.count(MoodLog.sentiment), func.sum(MoodLog.sentiment),
+        func.min(MoodLog.sentiment), func.max(MoodLog.sentiment)
+    ).filter(*on_day(MoodLog, user_id=user_id, day=day)).one()
+    if not entry_count:
+        return None
+    try:
+        with db.begin_nested():
+            db.add(MoodDaySummary(
+                user_id=user_id, day=day, summarized_through_id=0, entry_count=entry_count,
+                sentiment_count=sentiment_count, sentiment_sum=sentiment_sum or 0.0,
+                sentiment_min=sentiment_min, sentiment_max=sentiment_max, updated_at=datetime.now()
+            ))
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+    return db.query(MoodDaySummary).filter(MoodDaySummary.user_id == user_id, MoodDaySummary.day == day).first()
+
+
+def get_mood_logs_after(db: Session, *, user_id: int, day: date, after_id: int) -> list:
+    """The day's mood logs with id > `after_id`, oldest first."""
+    return db.query(MoodLog).filter(
+        *on_day(MoodLog, user_id=user_id, day=day),
+        MoodLog.id > after_id
+    ).order_by(MoodLog.id).all()
+
+
+def advance_mood_summary(db: Session, *, user_id: int, day: date, summary: str, previous_through_id: int, through_id: int) -> bool:
+    """
+    Store the summary folded forward through mood log `through_id`, which also
+    keeps it on that log. Only applies if nobody advanced the summary past
+    `previous_through_id` in the meantime; returns whether it did.
+    """
+    try:
+        advanced = db.execute(update(MoodDaySummary).where(
+            MoodDaySummary.user_id == user_id,
+            MoodDaySummary.day == day,
+            MoodDaySummary.summarized_through_id == previous_through_id
+        ).values(summary=summary, summarized_through_id=through_id, updated_at=datetime.now())).rowcount
+        if advanced:
+            db.execute(update(MoodLog).where(MoodLog.id == through_id).values(summary=summary))
+        db.commit()
+        return bool(advanced)
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving rolling mood summary: %s", e)
+        return False
+
+
+def stream_user_logs(db: Session, log_type: str, *, first_user_id: int, last_user_id: int, chunk_size: int = 2000):
+    """
+    Every `log_type` log of users first_user_id..last_user_id, ordered by user
+    and time. Rows are fetched `chunk_size` at a time (a server-side cursor on
+    Postgres), so the range never has to fit in memory.
+    """
+    model, date_column = _LOG_TABLES[log_type]
+    return db.execute(select(model).where(
+        model.user_id >= first_user_id,
+        model.user_id <= last_user_id
+    ).order_by(model.user_id, date_column, model.id).execution_options(yield_per=chunk_size)).scalars()
+
+
+def stream_xp_events(db: Session, *, first_user_id: int, last_user_id: int, xp_types: list, chunk_size: int = 2000):
+    """(id, user_id, xp_type, amount, timestamp) rows for users first_user_id..last_user_id, ordered by user and time."""
+    return db.execute(select(
+        XPEvent.id, XPEvent.user_id, XPEvent.xp_type, XPEvent.amount, XPEvent.timestamp
+    ).where(
+        XPEvent.user_id >= first_user_id,
+        XPEvent.user_id <= last_user_id,
+        XPEvent.xp_type.in_(xp_types)
+    ).order_by(XPEvent.user_id, XPEvent.timestamp, XPEvent.id).execution_options(yield_per=chunk_size))
+
+
+def apply_xp_corrections(db: Session, corrections: list) -> bool:
+    """
+    Rewrite XP events to corrected amounts and move each user's level by the
+    difference, in one transaction. `corrections` holds (event_id, user_id,
+    old_amount, new_amount). Levels are adjusted by delta rather than set, so
+    awards made while the correction runs are kept.
+    """
+    if not corrections:
+        return True
+    deltas = {}
+    for _, user_id, old_amount, new_amount in corrections:
+        deltas[user_id] = deltas.get(user_id, 0) + new_amount - old_amount
+    try:
+        # Core table UPDATE, so the rows go out as one executemany
+        xp_events = XPEvent.__table__
+        db.execute(
+            update(xp_events).where(xp_events.c.id == bindparam("event_id")).values(amount=bindparam("new_amount")),
+            [{"event_id": event_id, "new_amount": new_amount} for event_id, _, _, new_amount in corrections]
+        )
+        for user_id, delta in deltas.items():
+            if not delta:
+                continue
+            db.execute(update(Level).where(Level.user_id == user_id).values(
+                total_xp=Level.total_xp + delta,
+                current_level=(Level.total_xp + delta) // 100 + 1,
+                last_updated=datetime.now()
+            ))
+            bump_data_version(db, user_id)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error applying XP corrections: %s", e)
+        return False
+
+
+def get_data_version(db: Session, *, user_id: int) -> int:
+    return db.execute(select(User.data_version).where(User.id == user_id)).scalar() or 0
+
+
+def get_report_snapshots(db: Session, *, user_id: int, period: str, start: date, end: date) -> dict:
+    """The user's `period` snapshots that start within start..end, keyed by (period_start, period_end)."""
+    rows = db.query(ReportSnapshot).filter(
+        ReportSnapshot.user_id == user_id,
+        ReportSnapshot.period == period,
+        ReportSnapshot.period_start >= start,
+        ReportSnapshot.period_start <= end
+    ).all()
+    return {(row.period_start, row.period_end): row for row in rows}
+
+
+def save_report_snapshot(db: Session, *, user_id: int, period: str, start: date, end: date, summary: str,
+                         report: str, metrics: dict, data_version: int):
+    """Store (or replace) the snapshot for one user and span. Returns it, or None on error."""
+    where = (ReportSnapshot.user_id == user_id, ReportSnapshot.period == period,
+             ReportSnapshot.period_start == start, ReportSnapshot.period_end == end)
+    values = {"summary": summary, "report": report, "metrics": metrics,
+              "data_version": data_version, "built_at": datetime.now()}
+    try:
+        if not db.execute(update(ReportSnapshot).where(*where).values(**values)).rowcount:
+            try:
+                with db.begin_nested():
+                    db.add(ReportSnapshot(user_id=user_id, period=period, period_start=start, period_end=end, **values))
+            except IntegrityError:
+                # Another request built the same span first; keep the newer build
+                db.execute(update(ReportSnapshot).where(*where).values(**values))
+        db.commit()
+        return db.query(ReportSnapshot).filter(*where).first()
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving report snapshot: %s", e)
+        return None
+
+
+def get_user_id(db: Session, *, username: str):
+    return db.execute(select(User.id).where(User.username == username)).scalar()
+
+
+def get_idempotency_key(db: Session, *, user_id: int, key: str):
+    return db.query(IdempotencyKey).filter(IdempotencyKey.user_id == user_id, IdempotencyKey.key == key).first()
+
+
+def claim_idempotency_key(db: Session, *, user_id: int, key: str, fingerprint: str, ttl_seconds: float, lock_seconds: float):
+    """
+    Claim (user, key) for a request about to run. Returns None when the
+    caller now owns it, else the IdempotencyKey row that's already there
+    (completed, or still in flight). The user's expired keys are dropped
+    first, and an in-flight claim older than `lock_seconds` is taken over:
+    the request that made it died without finishing. On a database error
+    the request runs unprotected (None).
+    """
+    now = datetime.now()
+    where = (IdempotencyKey.user_id == user_id, IdempotencyKey.key == key)
+    claim = {"fingerprint": fingerprint, "created_at": now, "expires_at": now + timedelta(seconds=ttl_seconds)}
+    try:
+        db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.expires_at < now
+        ).delete(synchronize_session=False)
+        if db.execute(update(IdempotencyKey).where(
+            *where,
+            IdempotencyKey.status_code.is_(None),
+            IdempotencyKey.created_at < now - timedelta(seconds=lock_seconds)
+        ).values(**claim)).rowcount:
+            db.commit()
+            return None
+        try:
+            with db.begin_nested():
+                db.add(IdempotencyKey(user_id=user_id, key=key, **claim))
+        except IntegrityError:
+            db.commit()
+            return get_idempotency_key(db, user_id=user_id, key=key)
+        db.commit()
+        return None
+    except Exception as e:
+        db.rollback()
+        logger.error("Error claiming idempotency key: %s", e)
+        return None
+
+
+def complete_idempotency_key(db: Session, *, user_id: int, key: str, status_code: int, content_type: str, body: bytes,
+                             headers: list = None) -> bool:
+    """Store the response of the request holding the claim, for its retries to replay."""
+    try:
+        db.execute(update(IdempotencyKey).where(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)
+        ).values(status_code=status_code, content_type=content_type, headers=headers, body=body))
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error saving idempotent response: %s", e)
+        return False
+
+
+def release_idempotency_key(db: Session, *, user_id: int, key: str) -> bool:
+    """Drop an in-flight claim whose request failed, so a retry runs it again."""
+    try:
+        db.query(IdempotencyKey).filter(
+            IdempotencyKey.user_id == user_id, IdempotencyKey.key == key, IdempotencyKey.status_code.is_(None)
+        ).delete(synchronize_session=False)
+        db.commit()
+        return True
+    except Exception as e:
+        db.rollback()
+        logger.error("Error releasing idempotency key: %s", e)
+        return False
@@ -3,7 +3,9 @@ import os
 from dotenv import load_dotenv
 from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import Session, sessionmaker
+import time
+from observability.metrics import DB_SESSION_SECONDS, DB_COMMIT_SECONDS
 
 load_dotenv()
 
@@ -11,7 +13,30 @@ DATABASE_URL = os.getenv("DB_URL", "")
 
 # SQLAlchemy setup
 engine = create_engine(DATABASE_URL)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+class InstrumentedSession(Session):
+    """Session that records its lifetime and commit latency."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._opened_at = time.perf_counter()
+        self._lifetime_recorded = False
+
+    def commit(self):
+        with DB_COMMIT_SECONDS.time():
+            super().commit()
+
+    def close(self):
+        try:
+            super().close()
+        finally:
+            if not self._lifetime_recorded:
+                self._lifetime_recorded = True
+                DB_SESSION_SECONDS.observe(time.perf_counter() - self._opened_at)
+
+
+SessionLocal = sessionmaker(class_=InstrumentedSession, autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
 
@@ -102,9 +127,10 @@ def create_tables():
 
 
 def create_sqlalchemy_tables():
-    """Create tables using SQLAlchemy ORM"""
+    """Create tables using SQLAlchemy ORM, adding columns/indexes new models need to existing tables"""
+    from db.migrations import upgrade_schema
     try:
-        Base.metadata.create_all(bind=engine)
+        upgrade_schema(engine, Base.metadata)
         print("SQLAlchemy tables created successfully!")
     except Exception as e:
         print(f"Error creating SQLAlchemy tables: {e}")
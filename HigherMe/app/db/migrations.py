@@ -0,0 +1,99 @@
+"""
+Additive schema upgrades for existing databases.
+
+`Base.metadata.create_all` creates missing tables but never changes existing
+ones. Columns added to a model afterwards are added here with ALTER TABLE,
+and missing indexes are created. Only additive changes are handled. A new
+column must be nullable or have a server_default.
+"""
+from sqlalchemy import inspect, text
+from observability.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def add_missing_columns(engine, metadata) -> list:
+    """ALTER TABLE ADD COLUMN for every model column the database doesn't have yet."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    dialect = engine.dialect
+    preparer = dialect.identifier_preparer
+    ddl_compiler = dialect.ddl_compiler(dialect, None)
+
+    added = []
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existing_tables:
+                continue
+            present = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in present:
+                    continue
+                ddl = f"ALTER TABLE {preparer.format_table(table)} ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=dialect)}"
+                default = ddl_compiler.get_column_default_string(column)
+                if default is not None:
+                    ddl += f" DEFAULT {default}"
+                    if not column.nullable:
+                        ddl += " NOT NULL"
+                conn.execute(text(ddl))
+                added.append(f"{table.name}.{column.name}")
+    return added
+
+
+def create_missing_indexes(engine, metadata) -> list:
+    """Create every model index that doesn't exist yet on an existing table."""
+    inspector = inspect(engine)
+    existing_tables = set(inspector.get_table_names())
+    created = []
+    for table in metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        present = {index["name"] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            # Indexes declared for another backend only (e.g. a Postgres GIN index)
+            ddl_if = getattr(index, "_ddl_if", None)
+            if ddl_if is not None and ddl_if.dialect not in (None, engine.dialect.name):
+                continue
+            if index.name not in present:
+                index.create(bind=engine)
+                created.append(index.name)
+    return created
+
+
+def _local_day_backfill(table: str, time_column: str) -> dict:
+    # Rows written before timezones existed were bucketed by the server's day
+    statement = f"UPDATE {table} SET local_day = date({time_column}) WHERE local_day IS NULL"
+    return {"postgresql": statement, "sqlite": statement}
+
+
+# Statements that fill a newly added column for existing rows, by dialect
+COLUMN_BACKFILLS = {
+    "mood_logs.search_vector": {
+        "postgresql": "UPDATE mood_logs SET search_vector = to_tsvector('english', coalesce(mood_text, '')) "
+                      "WHERE search_vector IS NULL",
+    },
+    "code_logs.local_day": _local_day_backfill("code_logs", "date"),
+    "health_logs.local_day": _local_day_backfill("health_logs", "date"),
+    "mood_logs.local_day": _local_day_backfill("mood_logs", "timestamp"),
+    "xp_events.local_day": _local_day_backfill("xp_events", "timestamp"),
+}
+
+
+def backfill_added_columns(engine, added: list):
+    """Run the backfill for each column that was just added, if it has one for this backend."""
+    with engine.begin() as conn:
+        for column in added:
+            statement = COLUMN_BACKFILLS.get(column, {}).get(engine.dialect.name)
+            if statement:
+                conn.execute(text(statement))
+
+
+def upgrade_schema(engine, metadata):
+    """Create missing tables, then add missing columns and indexes to existing ones."""
+    metadata.create_all(bind=engine)
+    added = add_missing_columns(engine, metadata)
+    backfill_added_columns(engine, added)
+    created = create_missing_indexes(engine, metadata)
+    if added or created:
+        logger.info("Schema upgraded: added columns %s, created indexes %s", added, created)
+    return {"columns": added, "indexes": created}
@@ -1,9 +1,22 @@
-from sqlalchemy import Column , Integer , String, DateTime, ForeignKey, Float, Boolean
+from sqlalchemy import Column , Integer , BigInteger, String, LargeBinary, DateTime, Date, ForeignKey, Float, Boolean, JSON, UniqueConstraint, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from .database import Base
 
 
+def _day_of(time_column: str):
+    """
+    Column default for `local_day`: the server-local day of the row's
+    `time_column`. crud passes the day in the user's timezone; this only
+    covers rows inserted directly.
+    """
+    def default(context):
+        moment = context.get_current_parameters().get(time_column)
+        return (moment or datetime.now()).date()
+    return default
+
+
 class User(Base):
   __tablename__ = 'users'
   id = Column(Integer, primary_key=True, index=True)
@@ -12,6 +25,10 @@ class User(Base):
   hashed_password = Column(String , nullable = False)
   created_at = Column(DateTime, default=datetime.now())
   is_active = Column(Boolean, default=True)
+  # Bumped on every write that changes the user's stats or report; part of their ETags
+  data_version = Column(Integer, nullable=False, default=0, server_default="0")
+  # IANA zone name ("Europe/Berlin") that decides the user's calendar day, see tools/timezones.py
+  timezone = Column(String, nullable=True)
   
   #relations
   code_logs = relationship("CodeLog" , back_populates="user" , cascade="all, delete-orphan")
@@ -28,11 +45,19 @@ class CodeLog(Base):
   lines_removed = Column(Integer)
   total_time_minutes = Column(Float)
   date = Column(DateTime, default=datetime.now)
+  # Calendar day in the user's timezone when logged
+  local_day = Column(Date, nullable=True, default=_day_of("date"))
   processed = Column(Boolean, default=False)
   processed_at = Column(DateTime, nullable=True)
   
   user = relationship("User" , back_populates="code_logs")
 
+  # Per-user time-ordered scans (XP backfill) and day lookups (claims, reports)
+  __table_args__ = (
+      Index("ix_code_logs_user_date", "user_id", "date"),
+      Index("ix_code_logs_user_local_day", "user_id", "local_day"),
+  )
+
 class HealthLog(Base):
   __tablename__ = 'health_logs'
   id = Column(Integer, primary_key = True , index=True)
@@ -42,11 +67,17 @@ class HealthLog(Base):
   exercise_minutes = Column(Integer)
   water_intake_liter = Column(Float)
   date = Column(DateTime, default=datetime.now)
+  local_day = Column(Date, nullable=True, default=_day_of("date"))
   processed = Column(Boolean, default=False)
   processed_at = Column(DateTime, nullable=True)
   
   user = relationship("User" , back_populates="health_logs")
 
+  __table_args__ = (
+      Index("ix_health_logs_user_date", "user_id", "date"),
+      Index("ix_health_logs_user_local_day", "user_id", "local_day"),
+  )
+
 class MoodLog(Base):
     __tablename__ = "mood_logs"
     id = Column(Integer, primary_key=True, index=True)
@@ -55,10 +86,22 @@ class MoodLog(Base):
     sentiment = Column(Float)
     summary = Column(String, nullable=True)  # For storing AI-generated summaries
     timestamp = Column(DateTime, default=datetime.now())
+    local_day = Column(Date, nullable=True, default=_day_of("timestamp"))
     processed = Column(Boolean, default=False)
     processed_at = Column(DateTime, nullable=True)
+    # Full-text search vector of mood_text, written by crud.create_mood_log.
+    # Postgres only; other backends search with db/mood_search.py's in-process index.
+    search_vector = Column(String().with_variant(TSVECTOR(), "postgresql"), nullable=True)
+    # Packed MinHash signature of mood_text, see db/mood_similarity.py
+    minhash = Column(LargeBinary, nullable=True)
     
     user = relationship("User" , back_populates="mood_logs")
+
+    __table_args__ = (
+        Index("ix_mood_logs_user_timestamp", "user_id", "timestamp"),
+        Index("ix_mood_logs_user_local_day", "user_id", "local_day"),
+        Index("ix_mood_logs_search_vector", "search_vector", postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
     
 class XPEvent(Base):
     __tablename__ = "xp_events"
@@ -67,10 +110,16 @@ class XPEvent(Base):
     xp_type = Column(String)
     amount = Column(Integer)
     timestamp = Column(DateTime, default=datetime.now)
+    local_day = Column(Date, nullable=True, default=_day_of("timestamp"))
     details = Column(String, nullable=True)
     
     user = relationship("User" , back_populates="xp_events")
 
+    __table_args__ = (
+        Index("ix_xp_events_user_timestamp", "user_id", "timestamp"),
+        Index("ix_xp_events_user_local_day", "user_id", "local_day"),
+    )
+
 class Level(Base):
     __tablename__ = "levels"
     id = Column(Integer, primary_key=True, index=True)
@@ -80,3 +129,126 @@ class Level(Base):
     last_updated = Column(DateTime, default=datetime.now)
     
     user = relationship("User" , back_populates="level")
+
+
+class TaskCompletion(Base):
+    """Ledger of end-of-day agent runs, one row per (user, day, task)."""
+    __tablename__ = "task_completions"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer , ForeignKey('users.id') , nullable = False)
+    day = Column(Date, nullable=False)
+    task = Column(String, nullable=False)
+    completed_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", "task", name="uq_task_completions_user_day_task"),
+    )
+
+class SchedulerCheckpoint(Base):
+    """Highest user id fully processed by a batch job for a given run."""
+    __tablename__ = "scheduler_checkpoints"
+    id = Column(Integer, primary_key=True, index=True)
+    job = Column(String, nullable=False)
+    run_key = Column(String, nullable=False)
+    last_user_id = Column(Integer, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("job", "run_key", name="uq_scheduler_checkpoints_job_run"),
+    )
+
+class LLMUsage(Base):
+    """LLM tokens spent per user per day, for the daily budget."""
+    __tablename__ = "llm_usage"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer , ForeignKey('users.id') , nullable = False)
+    day = Column(Date, nullable=False)
+    tokens = Column(Integer, nullable=False, default=0)
+    calls = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_llm_usage_user_day"),
+    )
+
+class MoodDaySummary(Base):
+    """
+    Running mood summary and sentiment stats per user per day. The stats are
+    updated with every mood log; the summary is folded forward one entry at
+    a time and covers the entries up to `summarized_through_id`.
+    """
+    __tablename__ = "mood_day_summaries"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer , ForeignKey('users.id') , nullable = False)
+    day = Column(Date, nullable=False)
+    summary = Column(String, nullable=True)
+    summarized_through_id = Column(Integer, nullable=False, default=0)
+    entry_count = Column(Integer, nullable=False, default=0)
+    sentiment_count = Column(Integer, nullable=False, default=0)
+    sentiment_sum = Column(Float, nullable=False, default=0.0)
+    sentiment_min = Column(Float, nullable=True)
+    sentiment_max = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "day", name="uq_mood_day_summaries_user_day"),
+    )
+
+class MoodLSHBucket(Base):
+    """One LSH band bucket of a mood entry's MinHash signature; entries sharing a bucket are similarity candidates."""
+    __tablename__ = "mood_lsh_buckets"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer , ForeignKey('users.id') , nullable = False)
+    mood_log_id = Column(Integer , ForeignKey('mood_logs.id') , nullable = False)
+    bucket = Column(BigInteger, nullable=False)
+
+    __table_args__ = (
+        Index("ix_mood_lsh_buckets_user_bucket", "user_id", "bucket"),
+    )
+
+class ReportSnapshot(Base):
+    """
+    A generated report for one user and span of days: a day, a week, a
+    part-week inside a month, or a month. `summary` is the narrative the
+    next level up reduces over and `metrics` its additive totals. Open
+    periods are rebuilt once the user's data_version moves past the one
+    they were built from.
+    """
+    __tablename__ = "report_snapshots"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer , ForeignKey('users.id') , nullable = False)
+    period = Column(String, nullable=False)  # "day", "week" or "month"
+    period_start = Column(Date, nullable=False)
+    period_end = Column(Date, nullable=False)
+    summary = Column(String, nullable=True)
+    report = Column(String, nullable=True)
+    metrics = Column(JSON, nullable=False, default=dict)
+    data_version = Column(Integer, nullable=False, default=0)
+    built_at = Column(DateTime, default=datetime.now)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "period", "period_start", "period_end", name="uq_report_snapshots_user_period"),
+    )
+
+class IdempotencyKey(Base):
+    """
+    The first response to a mutating request per user and Idempotency-Key
+    header, replayed to retries until `expires_at`. `status_code` is NULL
+    while the first request is still running.
+    """
+    __tablename__ = "idempotency_keys"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer , ForeignKey('users.id') , nullable = False)
+    key = Column(String, nullable=False)
+    fingerprint = Column(String, nullable=False)
+    status_code = Column(Integer, nullable=True)
+    content_type = Column(String, nullable=True)
+    # The response's [name, value] header pairs in order, repeated ones (Set-Cookie) included
+    headers = Column(JSON, nullable=True)
+    body = Column(LargeBinary, nullable=True)
+    created_at = Column(DateTime, default=datetime.now)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("user_id", "key", name="uq_idempotency_keys_user_key"),
+    )
@@ -0,0 +1,212 @@
+"""
+Full-text search over a user's mood journal.
+
+On Postgres, mood_logs.search_vector holds to_tsvector('english', mood_text),
+written by crud.create_mood_log and indexed with GIN. A search is one
+indexed query: websearch_to_tsquery matching, ts_rank_cd ranking and a
+ts_headline snippet for the returned page only.
+
+Other backends (SQLite in tests and local runs) use an in-process inverted
+index per user instead: term -> {log id: term frequency}, ranked with BM25.
+A user's index is built from their logs on first search and kept in sync two
+ways: crud.create_mood_log adds each new entry, and every search first picks
+up entries with a higher id than the index has seen, which covers entries
+written by other processes. Indexes of the MOOD_SEARCH_CACHE_USERS most
+recently searched users are kept.
+
+Both backends match entries containing every query word (stemmed, stop
+words ignored), rank the best matches first (newest first among equals) and
+mark matches in the snippet with <b></b>. The snippet is HTML: the entry's
+own text in it is escaped, so the only markup is those <b> tags.
+"""
+import html
+import math
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+from sqlalchemy import func, select, literal
+from sqlalchemy.orm import Session
+from db.models import MoodLog
+
+MOOD_SEARCH_CACHE_USERS = int(os.getenv("MOOD_SEARCH_CACHE_USERS", "1000"))
+SEARCH_CONFIG = "english"
+SNIPPET_WORDS = 35
+# ts_headline marks matches with these, so they can be told apart from the
+# entry's own text once it has been escaped
+_START_SEL, _STOP_SEL = "\x02", "\x03"
+
+_WORD = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+_STOP_WORDS = frozenset("""
+a an and are as at be been but by did do does for from had has have he her him his how i if in into is it its
+just me my myself of on or our she so than that the their them then there these they this to too was we were
+what when where which while who why will with would you your
+""".split())
+
+
+def _stem(word: str) -> str:
+    """A light suffix stripper, so "knees", "running" and "worried" match "knee", "run" and "worry"."""
+    word = word.split("'")[0]
+    if len(word) <= 3:
+        return word
+    for suffix, replacement in (("ies", "y"), ("ied", "y"), ("sses", "ss"), ("ing", ""), ("ed", ""), ("ly", ""),
+                                ("ss", "ss"), ("us", "us"), ("is", "is"), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)] + replacement
+            break
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "aeioulsz":
+        word = word[:-1]  # running -> runn -> run
+    return word
+
+
+def terms(text: str) -> list:
+    """Stemmed, stop-word-free terms of `text`, in order."""
+    return [_stem(word) for word in _WORD.findall((text or "").lower()) if word not in _STOP_WORDS]
+
+
+def _snippet(text: str, query_terms: set) -> str:
+    words = (text or "").split()
+    hits = [i for i, word in enumerate(words) if set(terms(word)) & query_terms]
+    start = max(0, hits[0] - SNIPPET_WORDS // 3) if hits else 0
+    window = words[start:start + SNIPPET_WORDS]
+    marked = [f"<b>{html.escape(word)}</b>" if start + i in hits else html.escape(word)
+              for i, word in enumerate(window)]
+    return ("… " if start else "") + " ".join(marked) + (" …" if start + SNIPPET_WORDS < len(words) else "")
+
+
+def _headline_html(headline: str) -> str:
+    """ts_headline output, marked with _START_SEL/_STOP_SEL, as an escaped snippet with <b></b>."""
+    return html.escape(headline or "").replace(_START_SEL, "<b>").replace(_STOP_SEL, "</b>")
+
+
+class UserIndex:
+    """Inverted index over one user's mood entries."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self.postings = {}  # term -> {log id: term frequency}
+        self.lengths = {}   # log id -> number of terms
+        self.max_id = 0
+        self._total_length = 0
+
+    def add(self, log_id: int, text: str):
+        if log_id in self.lengths:
+            return
+        doc_terms = terms(text)
+        for term, count in Counter(doc_terms).items():
+            self.postings.setdefault(term, {})[log_id] = count
+        self.lengths[log_id] = len(doc_terms)
+        self._total_length += len(doc_terms)
+        self.max_id = max(self.max_id, log_id)
+
+    def search(self, query_terms: list) -> list:
+        """(log id, BM25 score) of entries with every query term, best first, newest first among equals."""
+        if not query_terms or not self.lengths:
+            return []
+        postings = [self.postings.get(term) for term in set(query_terms)]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        matches = set(postings[0]).intersection(*postings[1:])
+        docs = len(self.lengths)
+        average = self._total_length / docs or 1
+        scores = []
+        for log_id in matches:
+            length_norm = self.K1 * (1 - self.B + self.B * self.lengths[log_id] / average)
+            score = 0.0
+            for posting in postings:
+                idf = math.log(1 + (docs - len(posting) + 0.5) / (len(posting) + 0.5))
+                tf = posting[log_id]
+                score += idf * tf * (self.K1 + 1) / (tf + length_norm)
+            scores.append((log_id, score))
+        scores.sort(key=lambda item: (-item[1], -item[0]))
+        return scores
+
+
+class MoodSearchIndex:
+    """Per-user inverted indexes for the most recently searched users."""
+
+    def __init__(self, max_users: int = MOOD_SEARCH_CACHE_USERS):
+        self.max_users = max_users
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, log_id: int, text: str):
+        """Index a new entry, if the user's index is loaded; otherwise it's picked up on their next search."""
+        with self._lock:
+            index = self._users.get(user_id)
+            if index is not None:
+                index.add(log_id, text)
+
+    def search(self, db: Session, user_id: int, query_terms: list) -> list:
+        with self._lock:
+            index = self._users.pop(user_id, None) or UserIndex()
+            self._users[user_id] = index
+            while len(self._users) > self.max_users:
+                self._users.popitem(last=False)
+            after_id = index.max_id
+        # Catch up on entries written since the index last looked, including by other processes
+        rows = db.execute(select(MoodLog.id, MoodLog.mood_text).where(
+            MoodLog.user_id == user_id,
+            MoodLog.id > after_id
+        ).order_by(MoodLog.id)).all()
+        with self._lock:
+            for log_id, text in rows:
+                index.add(log_id, text)
+            return index.search(query_terms)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+index = MoodSearchIndex()
+
+
+def search_vector(text: str):
+    """The SQL expression crud.create_mood_log stores in mood_logs.search_vector on Postgres."""
+    return func.to_tsvector(SEARCH_CONFIG, text or "")
+
+
+def _search_postgres(db: Session, user_id: int, query: str, limit: int, offset: int) -> list:
+    tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+    rank = func.ts_rank_cd(MoodLog.search_vector, tsquery)
+    snippet = func.ts_headline(SEARCH_CONFIG, MoodLog.mood_text, tsquery,
+                               literal(f'MaxWords={SNIPPET_WORDS}, MinWords=15, '
+                                       f'StartSel="{_START_SEL}", StopSel="{_STOP_SEL}"'))
+    rows = db.execute(
+        select(MoodLog.id, MoodLog.timestamp, MoodLog.mood_text, MoodLog.sentiment,
+               rank.label("score"), snippet.label("snippet"))
+        .where(MoodLog.user_id == user_id, MoodLog.search_vector.op("@@")(tsquery))
+        .order_by(rank.desc(), MoodLog.timestamp.desc())
+        .limit(limit).offset(offset)
+    ).all()
+    return [dict(row._mapping, snippet=_headline_html(row.snippet)) for row in rows]
+
+
+def _search_index(db: Session, user_id: int, query: str, limit: int, offset: int) -> list:
+    query_terms = terms(query)
+    ranked = index.search(db, user_id, query_terms)[offset:offset + limit]
+    if not ranked:
+        return []
+    logs = {log.id: log for log in db.query(MoodLog).filter(MoodLog.id.in_([log_id for log_id, _ in ranked]))}
+    return [
+        {"id": log_id, "timestamp": logs[log_id].timestamp, "mood_text": logs[log_id].mood_text,
+         "sentiment": logs[log_id].sentiment, "score": round(score, 4),
+         "snippet": _snippet(logs[log_id].mood_text, set(query_terms))}
+        for log_id, score in ranked if log_id in logs
+    ]
+
+
+def search_mood_logs(db: Session, *, user_id: int, query: str, limit: int = 20, offset: int = 0) -> dict:
+    """
+    One page of a user's mood entries matching `query`, best match first.
+    Returns {"results": [...], "has_more": bool}; each result has id,
+    timestamp, mood_text, sentiment, score and snippet.
+    """
+    search = _search_postgres if db.bind.dialect.name == "postgresql" else _search_index
+    # One extra row tells whether there's another page
+    results = search(db, user_id, query, limit + 1, offset)
+    return {"results": results[:limit], "has_more": len(results) > limit}
@@ -0,0 +1,189 @@
+"""
+"You've felt like this before": similar past mood entries, found locally.
+
+Each mood entry gets a MinHash signature over its character shingles
+(NUM_PERM minimums of salted shingle hashes, stored packed in
+mood_logs.minhash). The share of slots two signatures agree on estimates
+the Jaccard similarity of their shingle sets, so near-identical wording
+scores close to 1 and unrelated entries close to 0.
+
+For lookup, the signature is cut into BANDS bands of ROWS slots, and each
+band's hash is a row in mood_lsh_buckets, written in the same transaction
+as the entry by crud.create_mood_log. Entries that share any band bucket
+are candidates: with 16 bands of 3, a pair at similarity 0.5 shares one
+with ~88% probability, at 0.2 with ~12%. A lookup is one indexed query for
+the new entry's 16 buckets, then an exact signature comparison over at
+most MAX_CANDIDATES rows, whatever the size of the user's history.
+
+Entries logged before signatures existed are indexed by
+    python -m db.mood_similarity
+
+distinct_entries() uses the same signatures to drop near-duplicate entries
+before a summary prompt is built.
+"""
+import argparse
+import hashlib
+import random
+import re
+import struct
+import zlib
+from typing import Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from db.models import MoodLog, MoodLSHBucket
+from observability.logger import get_logger
+
+logger = get_logger(__name__)
+
+SHINGLE_CHARS = 4
+BANDS = 16
+ROWS = 3
+NUM_PERM = BANDS * ROWS
+# Estimated Jaccard similarity from which a past entry counts as similar
+SIMILAR_MIN = 0.35
+SIMILAR_LIMIT = 3
+MAX_CANDIDATES = 50
+# ...and from which two of a day's entries count as near-duplicates in a summary prompt
+DUPLICATE_SIMILARITY = 0.8
+
+_PRIME = (1 << 61) - 1
+_rng = random.Random(20240611)  # fixed, so stored signatures stay comparable across processes
+_PERMUTATIONS = [(_rng.randrange(1, _PRIME), _rng.randrange(0, _PRIME)) for _ in range(NUM_PERM)]
+_NON_WORD = re.compile(r"[^a-z0-9]+")
+_PACKED = struct.Struct(f"<{NUM_PERM}Q")
+
+
+def shingles(text: str) -> set:
+    """Character SHINGLE_CHARS-grams of the lowercased words, joined by single spaces."""
+    text = _NON_WORD.sub(" ", (text or "").lower()).strip()
+    if len(text) <= SHINGLE_CHARS:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_CHARS] for i in range(len(text) - SHINGLE_CHARS + 1)}
+
+
+def signature(text: str) -> Optional[tuple]:
+    """The MinHash signature of `text`, or None if it has no words."""
+    hashes = [zlib.crc32(shingle.encode()) for shingle in shingles(text)]
+    if not hashes:
+        return None
+    return tuple(min((a * h + b) % _PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def pack(sig: tuple) -> bytes:
+    return _PACKED.pack(*sig)
+
+
+def unpack(data: bytes) -> Optional[tuple]:
+    return _PACKED.unpack(data) if data else None
+
+
+def similarity(a: tuple, b: tuple) -> float:
+    """Estimated Jaccard similarity of the shingle sets behind two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / NUM_PERM
+
+
+def buckets(sig: tuple) -> list:
+    """One bucket key per band; the band number is hashed in, so keys of different bands never collide."""
+    keys = []
+    for band in range(BANDS):
+        digest = hashlib.blake2b(struct.pack(f"<H{ROWS}Q", band, *sig[band * ROWS:(band + 1) * ROWS]),
+                                 digest_size=8).digest()
+        keys.append(int.from_bytes(digest, "big") >> 1)  # fits a signed BIGINT
+    return keys
+
+
+def index_entry(db: Session, mood_log: MoodLog, sig: tuple):
+    """Store `mood_log`'s signature and bucket rows. The caller flushes the log first and commits."""
+    mood_log.minhash = pack(sig)
+    db.add_all(MoodLSHBucket(user_id=mood_log.user_id, mood_log_id=mood_log.id, bucket=key) for key in buckets(sig))
+
+
+def similar_entries(db: Session, *, user_id: int, sig: Optional[tuple], exclude_id: int = None,
+                    limit: int = SIMILAR_LIMIT, min_similarity: float = SIMILAR_MIN) -> list:
+    """
+    The user's past entries most similar to `sig`, most similar first (newest
+    first among equals). Each is a dict with id, timestamp, mood_text,
+    sentiment and similarity.
+    """
+    if sig is None:
+        return []
+    shared = func.count().label("shared")
+    query = select(MoodLSHBucket.mood_log_id, shared).where(
+        MoodLSHBucket.user_id == user_id,
+        MoodLSHBucket.bucket.in_(buckets(sig)),
+    )
+    if exclude_id is not None:
+        query = query.where(MoodLSHBucket.mood_log_id != exclude_id)
+    # Entries sharing more bands are likelier to be close; only the best few are compared exactly
+    candidate_ids = [row.mood_log_id for row in db.execute(
+        query.group_by(MoodLSHBucket.mood_log_id).order_by(shared.desc(), MoodLSHBucket.mood_log_id.desc()).limit(MAX_CANDIDATES)
+    )]
+    if not candidate_ids:
+        return []
+
+    scored = []
+    for log in db.query(MoodLog).filter(MoodLog.id.in_(candidate_ids), MoodLog.user_id == user_id):
+        other = unpack(log.minhash)
+        if other is None:
+            continue
+        score = similarity(sig, other)
+        if score >= min_similarity:
+            scored.append((score, log))
+    scored.sort(key=lambda item: (item[0], item[1].timestamp, item[1].id), reverse=True)
+    return [
+        {"id": log.id, "timestamp": log.timestamp, "mood_text": log.mood_text,
+         "sentiment": log.sentiment, "similarity": round(score, 2)}
+        for score, log in scored[:limit]
+    ]
+
+
+def distinct_entries(logs: list, threshold: float = DUPLICATE_SIMILARITY) -> list:
+    """
+    `logs` without the entries that are near-duplicates of a later one (the
+    later wording wins), in their original order. Uses the stored signature
+    when there is one.
+    """
+    kept, kept_sigs = [], []
+    for log in reversed(logs):
+        sig = unpack(getattr(log, "minhash", None)) or signature(log.mood_text)
+        if sig is not None and any(similarity(sig, other) >= threshold for other in kept_sigs):
+            continue
+        kept.append(log)
+        if sig is not None:
+            kept_sigs.append(sig)
+    kept.reverse()
+    return kept
+
+
+def backfill_signatures(db: Session, *, chunk_size: int = 500) -> int:
+    """Sign and bucket every entry that has no signature yet, a chunk per transaction. Returns how many."""
+    done, after_id = 0, 0
+    while True:
+        logs = db.query(MoodLog).filter(MoodLog.id > after_id, MoodLog.minhash.is_(None)).order_by(MoodLog.id).limit(chunk_size).all()
+        if not logs:
+            return done
+        for log in logs:
+            sig = signature(log.mood_text)
+            if sig is not None:
+                index_entry(db, log, sig)
+                done += 1
+        db.commit()
+        after_id = logs[-1].id
+
+
+def main(argv=None):
+    from db.database import get_db_session
+
+    parser = argparse.ArgumentParser(description="Index mood entries logged before MinHash signatures existed.")
+    parser.add_argument("--chunk-size", type=int, default=500)
+    args = parser.parse_args(argv)
+    db = get_db_session()
+    try:
+        done = backfill_signatures(db, chunk_size=args.chunk_size)
+        logger.info("Signed and bucketed %s mood entries", done)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+"""
+Structured, asynchronous logging.
+
+Call sites get a stdlib logger from `get_logger(__name__)` and log with
+%-style arguments. Records go onto an in-memory queue unformatted; a single
+listener thread does the message interpolation, JSON encoding and the write to
+stdout. So a disabled level costs one `isEnabledFor` check, and an enabled one
+costs only a queue put on the request thread, however large the arguments are.
+
+Configuration (environment):
+    LOG_LEVEL       default level for everything (INFO)
+    LOG_LEVELS      per-module overrides, e.g. "agents.daily_report_agent=DEBUG,db.crud=WARNING"
+    LOG_FORMAT      "json" (default) or "text"
+    LOG_QUEUE_SIZE  max queued records before new ones are dropped (10000)
+    LOG_SAMPLE_RATE fraction of `sampled()` lines that are written (0.1)
+
+High-volume lines can be sampled by passing `extra=sampled()` (or
+`extra={"sample_rate": 0.01}`); only that fraction of them is written.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import threading
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATE = float(os.getenv("LOG_SAMPLE_RATE", "0.1"))
+
+# Attributes every LogRecord has; anything else came in through `extra=`
+_RECORD_ATTRS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "taskName", "sample_rate"}
+
+_configured = False
+_configure_lock = threading.Lock()
+_listener = None
+_dropped = 0
+_dropped_lock = threading.Lock()
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: timestamp, level, logger, message, extra fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_ATTRS:
+                payload[key] = value
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class SamplingFilter(logging.Filter):
+    """Drops records logged with `extra={"sample_rate": r}` with probability 1 - r."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = getattr(record, "sample_rate", None)
+        if rate is None:
+            return True
+        return random.random() < rate
+
+
+class DeferredQueueHandler(logging.handlers.QueueHandler):
+    """
+    QueueHandler that skips the stdlib `prepare()` step, which formats the
+    message on the calling thread. Records are queued as-is and formatted by
+    the listener. A full queue drops the record rather than blocking a request.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        global _dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            # Any thread can hit a full queue; += on a global is not atomic
+            with _dropped_lock:
+                _dropped += 1
+
+
+def _parse_levels(spec: str) -> dict:
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = item.split("=", 1)
+        levels[name.strip()] = level.strip().upper()
+    return levels
+
+
+def configure_logging(force: bool = False):
+    """Install the queue handler on the root logger and start the listener. Idempotent."""
+    global _configured, _listener
+    with _configure_lock:
+        if _configured and not force:
+            return
+        if _listener is not None:
+            _listener.stop()
+
+        log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+
+        stream_handler = logging.StreamHandler(sys.stdout)
+        if LOG_FORMAT == "json":
+            stream_handler.setFormatter(JsonFormatter())
+        else:
+            stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+
+        queue_handler = DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(SamplingFilter())
+
+        root = logging.getLogger()
+        for handler in list(root.handlers):
+            if isinstance(handler, DeferredQueueHandler):
+                root.removeHandler(handler)
+        root.addHandler(queue_handler)
+        root.setLevel(LOG_LEVEL)
+
+        for name, level in _parse_levels(LOG_LEVELS).items():
+            logging.getLogger(name).setLevel(level)
+
+        _listener = logging.handlers.QueueListener(log_queue, stream_handler, respect_handler_level=True)
+        _listener.start()
+        _configured = True
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread."""
+    global _configured, _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+        _configured = False
+
+
+def dropped_records() -> int:
+    """Number of records dropped because the queue was full."""
+    with _dropped_lock:
+        return _dropped
+
+
+def sampled(rate: float = None) -> dict:
+    """`extra=` payload that marks a log line as sampled at `rate` (LOG_SAMPLE_RATE by default)."""
+    return {"sample_rate": LOG_SAMPLE_RATE if rate is None else rate}
+
+
+def get_logger(name: str) -> logging.Logger:
+    """Return a logger for `name`, configuring logging on first use."""
+    configure_logging()
+    return logging.getLogger(name)
+
+
+atexit.register(shutdown_logging)
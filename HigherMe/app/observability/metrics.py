@@ -0,0 +1,216 @@
+"""
+In-process latency histograms and counters, rendered in the Prometheus text
+format for the /metrics endpoint.
+
+Recording is lock-free on the hot path: every thread writes to its own shard
+of each metric (a plain dict it alone mutates), and only `render()` walks
+the shards and sums them. The lock is taken once per thread per metric when
+its shard is created.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_registry = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames: tuple, values: tuple, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        with _registry_lock:
+            _registry.append(self)
+
+    def _shard(self) -> dict:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            with self._shards_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+        return shard
+
+    def _label_values(self, labels: dict) -> tuple:
+        return tuple(labels.get(name, "") for name in self.labelnames)
+
+    def _snapshots(self):
+        with self._shards_lock:
+            shards = list(self._shards)
+        # dict.copy() is a single C call, so a writer can't resize it mid-copy
+        return [shard.copy() for shard in shards]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels):
+        shard = self._shard()
+        key = self._label_values(labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = self._label_values(labels)
+        return sum(snapshot.get(key, 0) for snapshot in self._snapshots())
+
+    def render(self) -> list:
+        totals = {}
+        for snapshot in self._snapshots():
+            for key, value in snapshot.items():
+                totals[key] = totals.get(key, 0) + value
+        return [f"{self.name}_total{_format_labels(self.labelnames, key)} {value}"
+                for key, value in sorted(totals.items())]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._label_values(labels)
+        # [per-bucket counts..., +Inf count, sum]
+        cells = shard.get(key)
+        if cells is None:
+            cells = [0] * (len(self.buckets) + 2)
+            shard[key] = cells
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                cells[i] += 1
+                break
+        else:
+            cells[len(self.buckets)] += 1
+        cells[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall time of the `with` block."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def count(self, **labels) -> int:
+        key = self._label_values(labels)
+        return sum(sum(snapshot[key][:-1]) for snapshot in self._snapshots() if key in snapshot)
+
+    def render(self) -> list:
+        merged = {}
+        for snapshot in self._snapshots():
+            for key, cells in snapshot.items():
+                total = merged.setdefault(key, [0] * len(cells))
+                for i, value in enumerate(cells):
+                    total[i] += value
+
+        lines = []
+        for key, cells in sorted(merged.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, cells):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            cumulative += cells[len(self.buckets)]
+            labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {cells[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class Gauge(_Metric):
+    """A level that's set rather than accumulated, e.g. a queue depth. Writes take a lock."""
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+        self._values_lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        with self._values_lock:
+            self._values[self._label_values(labels)] = value
+
+    def value(self, **labels) -> float:
+        with self._values_lock:
+            return self._values.get(self._label_values(labels), 0)
+
+    def render(self) -> list:
+        with self._values_lock:
+            values = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {value}" for key, value in values]
+
+
+def render() -> str:
+    """Render every registered metric in the Prometheus text exposition format."""
+    with _registry_lock:
+        metrics = list(_registry)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.documentation}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+# Metrics shared across the app
+
+LLM_REQUEST_SECONDS = Histogram(
+    "llm_request_seconds", "Latency of LLM invocations", ("module", "kind", "outcome"))
+LLM_FALLBACKS = Counter(
+    "llm_fallback", "Times a rule-based or canned result was used instead of the LLM", ("path",))
+DB_SESSION_SECONDS = Histogram(
+    "db_session_seconds", "Lifetime of SQLAlchemy sessions from creation to close")
+DB_COMMIT_SECONDS = Histogram(
+    "db_commit_seconds", "Latency of SQLAlchemy session commits")
+PASSWORD_HASH_SECONDS = Histogram(
+    "password_hash_seconds", "Latency of bcrypt hashing and verification", ("op",))
+GIT_STATS_SECONDS = Histogram(
+    "git_stats_seconds", "Latency of git subprocesses used for code stats", ("command",))
+HTTP_REQUEST_SECONDS = Histogram(
+    "http_request_seconds", "Total request latency per route", ("route", "method", "status"))
+LLM_PROMPT_TOKENS = Histogram(
+    "llm_prompt_tokens", "Size of LLM prompts in (locally counted) tokens", ("kind",),
+    buckets=(32, 64, 128, 256, 512, 1024, 2048, 4096, 8192))
+LLM_HEDGES = Counter(
+    "llm_hedge", "Second LLM requests fired because the first outlived the p95 delay", ("kind",))
+LLM_HEDGE_WINS = Counter(
+    "llm_hedge_win", "Hedged LLM requests that answered before the original", ("kind",))
+LLM_DEADLINE_EXCEEDED = Counter(
+    "llm_deadline_exceeded", "LLM calls abandoned at the request's latency budget", ("kind",))
+LLM_QUEUE_DEPTH = Gauge(
+    "llm_queue_depth", "LLM calls waiting for a slot", ("lane",))
+LLM_QUEUE_ACTIVE = Gauge(
+    "llm_queue_active", "LLM calls holding a slot", ("lane",))
+LLM_QUEUE_WAIT_SECONDS = Histogram(
+    "llm_queue_wait_seconds", "Time LLM calls waited for a slot", ("lane",))
+LLM_PARSE = Counter(
+    "llm_parse", "Structured LLM replies by parse outcome (clean, salvaged, repaired, failed)", ("kind", "outcome"))
+LLM_DENIED = Counter(
+    "llm_denied", "LLM calls refused for a user (rate limited or over budget)", ("reason", "kind"))
+IDEMPOTENT_REQUESTS = Counter(
+    "idempotent_request", "Requests with an Idempotency-Key by outcome (executed, replayed, in_progress, mismatch, unprotected)", ("outcome",))
+PUBSUB_SUBSCRIBERS = Gauge(
+    "pubsub_subscribers", "Live-update subscriptions open in this process")
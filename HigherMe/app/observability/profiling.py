@@ -0,0 +1,307 @@
+"""
+On-demand request profiling.
+
+Off unless PROFILING_TOKEN is set. When it is off, nothing is installed and
+requests pay no cost. When it is on, two things can trigger a capture:
+
+  * an explicit request: send `X-Profile: sample` (or `cprofile`) together with
+    `X-Profile-Token: <PROFILING_TOKEN>`, or the `?profile=` / `?profile_token=`
+    query parameters. The response gets an `X-Profile-Id` header. Fetch the
+    capture from /api/v1/admin/profiles/{id}.
+  * background sampling: PROFILE_SAMPLE_RATE of ordinary requests are profiled
+    with the sampling profiler. The slowest PROFILE_KEEP per route are kept.
+
+Modes:
+    sample    a thread samples every thread's Python stack every
+              PROFILE_INTERVAL_MS and counts collapsed stacks ("a;b;c 12"),
+              which is flamegraph.pl / speedscope input. It sees sync
+              endpoints running in the threadpool as well as the event loop.
+    cprofile  deterministic cProfile of the event loop thread, returned as
+              pstats text sorted by cumulative time. Best for async endpoints
+              such as /api/v1/daily-report, but heavier. Only one cprofile
+              capture can run at a time; an explicit request for another one
+              while it runs is refused with 409.
+
+Captures are process-wide. The event loop and the threadpool are shared, so a
+capture also holds the stacks of any other request that was in flight at the
+same time. Each capture records how many did (`overlapping`); a capture with
+`overlapping == 0` shows the one request alone.
+
+Nothing leaves the process. Captures live in a bounded in-memory store.
+"""
+import cProfile
+import hmac
+import io
+import itertools
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+
+load_dotenv()
+
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN", "")
+PROFILING_ENABLED = bool(PROFILING_TOKEN)
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", "10"))
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_MAX_BACKGROUND = int(os.getenv("PROFILE_MAX_BACKGROUND", "2"))
+
+MODES = ("sample", "cprofile")
+
+# Leaf frames in these files are threads parked on a lock, queue or selector,
+# not doing work for the request
+_IDLE_FILES = ("threading.py", "queue.py", "selectors.py")
+
+_background_slots = threading.BoundedSemaphore(PROFILE_MAX_BACKGROUND)
+# cProfile hooks the interpreter globally; two at once would fail or mix their counts
+_cprofile_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of all other threads at a fixed interval."""
+
+    def __init__(self, interval: float = PROFILE_INTERVAL_MS / 1000.0):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self) -> Counter:
+        self._stop.set()
+        self._thread.join()
+        return self.stacks
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.samples += 1
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                if os.path.basename(frame.f_code.co_filename) in _IDLE_FILES:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+
+
+class Capture:
+    """One profiled request."""
+
+    _ids = itertools.count(1)
+
+    def __init__(self, mode: str, explicit: bool):
+        self.id = f"{int(time.time())}-{next(self._ids)}"
+        self.mode = mode
+        self.explicit = explicit
+        self.route = None
+        self.method = None
+        self.status = None
+        self.started_at = datetime.now()
+        self.duration = 0.0
+        self.stacks = None
+        self.stats_text = None
+        self.overlapping = None
+
+    def summary(self) -> dict:
+        return {
+            "id": self.id,
+            "mode": self.mode,
+            "explicit": self.explicit,
+            "route": self.route,
+            "method": self.method,
+            "status": self.status,
+            "started_at": self.started_at.isoformat(),
+            "duration_ms": round(self.duration * 1000, 2),
+            "scope": "process",
+            "overlapping": self.overlapping,
+        }
+
+    def collapsed(self) -> str:
+        """Collapsed-stack text for flame graphs (sample mode only)."""
+        if not self.stacks:
+            return ""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.most_common()) + "\n"
+
+    def report(self) -> str:
+        return self.stats_text if self.mode == "cprofile" else self.collapsed()
+
+
+class ProfileStore:
+    """Keeps the slowest `keep` background captures per route and the last `keep` explicit ones."""
+
+    def __init__(self, keep: int = PROFILE_KEEP):
+        self.keep = keep
+        self._slowest = {}
+        self._explicit = []
+        self._lock = threading.Lock()
+
+    def add(self, capture: Capture):
+        with self._lock:
+            if capture.explicit:
+                self._explicit.append(capture)
+                del self._explicit[:-self.keep]
+                return
+            key = (capture.method, capture.route)
+            captures = self._slowest.setdefault(key, [])
+            captures.append(capture)
+            captures.sort(key=lambda c: c.duration, reverse=True)
+            del captures[self.keep:]
+
+    def get(self, capture_id: str):
+        with self._lock:
+            for capture in itertools.chain(self._explicit, *self._slowest.values()):
+                if capture.id == capture_id:
+                    return capture
+        return None
+
+    def list(self) -> dict:
+        with self._lock:
+            return {
+                "explicit": [c.summary() for c in reversed(self._explicit)],
+                "slowest": {f"{method} {route}": [c.summary() for c in captures]
+                            for (method, route), captures in sorted(self._slowest.items())},
+            }
+
+    def clear(self):
+        with self._lock:
+            self._slowest.clear()
+            self._explicit.clear()
+
+
+store = ProfileStore()
+
+
+class _Traffic:
+    """Counts requests through the middleware so a capture can tell what ran alongside it."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.started = 0
+        self._lock = threading.Lock()
+
+    def enter(self) -> tuple:
+        """Count a request in; returns (requests already in flight, requests started so far)."""
+        with self._lock:
+            self.in_flight += 1
+            self.started += 1
+            return self.in_flight - 1, self.started
+
+    def leave(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def overlapping(self, mark: tuple) -> int:
+        """Other requests that overlapped a request counted in with `mark`."""
+        already_running, started = mark
+        with self._lock:
+            return already_running + self.started - started
+
+
+traffic = _Traffic()
+
+
+def token_is_valid(token: str) -> bool:
+    return PROFILING_ENABLED and bool(token) and hmac.compare_digest(token, PROFILING_TOKEN)
+
+
+def requested_mode(request):
+    """The profile mode explicitly asked for by an authorised caller, else None."""
+    mode = request.headers.get("x-profile") or request.query_params.get("profile")
+    if not mode:
+        return None
+    token = request.headers.get("x-profile-token") or request.query_params.get("profile_token", "")
+    if not token_is_valid(token):
+        return None
+    return mode if mode in MODES else "sample"
+
+
+class ProfilerBusy(RuntimeError):
+    pass
+
+
+@contextmanager
+def profile(mode: str, explicit: bool):
+    """Profile the `with` block; yields the Capture, which is complete on exit.
+
+    cprofile mode raises ProfilerBusy if another cprofile capture is running.
+    """
+    capture = Capture(mode, explicit)
+    start = time.perf_counter()
+    if mode == "cprofile":
+        if not _cprofile_lock.acquire(blocking=False):
+            raise ProfilerBusy("another cprofile capture is running")
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield capture
+        finally:
+            profiler.disable()
+            _cprofile_lock.release()
+            capture.duration = time.perf_counter() - start
+            out = io.StringIO()
+            pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(60)
+            capture.stats_text = out.getvalue()
+    else:
+        sampler = SamplingProfiler()
+        sampler.start()
+        try:
+            yield capture
+        finally:
+            capture.stacks = sampler.stop()
+            capture.duration = time.perf_counter() - start
+
+
+async def profile_request(request, call_next):
+    """HTTP middleware: profile explicit requests and a sample of the rest."""
+    mark = traffic.enter()
+    try:
+        return await _profile_request(request, call_next, mark)
+    finally:
+        traffic.leave()
+
+
+async def _profile_request(request, call_next, mark):
+    mode = requested_mode(request)
+    explicit = mode is not None
+    if not explicit:
+        if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+            return await call_next(request)
+        # Cap concurrent background captures so sampling can't pile up sampler threads
+        if not _background_slots.acquire(blocking=False):
+            return await call_next(request)
+        mode = "sample"
+
+    try:
+        with profile(mode, explicit) as capture:
+            response = await call_next(request)
+    except ProfilerBusy as e:
+        return JSONResponse({"detail": str(e)}, status_code=409)
+    finally:
+        if not explicit:
+            _background_slots.release()
+
+    route = request.scope.get("route")
+    capture.route = getattr(route, "path", "unmatched")
+    capture.method = request.method
+    capture.status = response.status_code
+    capture.overlapping = traffic.overlapping(mark)
+    store.add(capture)
+    if explicit:
+        response.headers["X-Profile-Id"] = capture.id
+    return response
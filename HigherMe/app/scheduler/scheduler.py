@@ -0,0 +1,279 @@
+"""
+End-of-day scheduler for the per-user agents.
+
+Active users are enumerated in id-ordered chunks (keyset pagination), each
+chunk is handed to a worker from a thread or process pool, and inside a worker
+the users of the chunk run concurrently on a shared thread pool. Agents that
+call the LLM take a slot from a bounded semaphore so a large pool can't flood
+Groq. Their calls queue in the batch lane (tools/llm_queue.py), behind any
+interactive or report calls in the same process.
+
+Each user is closed out for their own day. By default that's the last day
+that has fully ended in their timezone (yesterday where they are), so the
+job is meant to run hourly: every user is closed out within an hour of
+their local midnight, and runs in between find them already in the ledger.
+An explicit target date closes out that day for everyone instead.
+
+The run is idempotent: every (user, day, task) that finishes is written to the
+`task_completions` ledger and skipped on the next run, and the highest user id
+below which every chunk has finished without failures is saved as a
+checkpoint, so a crashed run resumes from there instead of re-enumerating
+from the start, and a rerun still retries the tasks that failed.
+
+Sizing: 1M users in one hour is ~280 users/s. Users without logs cost one or
+two indexed queries per task, so the limit is the LLM tasks; with ~0.5s per
+call, ~300 LLM calls need to be in flight (SCHEDULER_LLM_CONCURRENCY) spread
+over enough user threads (SCHEDULER_WORKERS * SCHEDULER_USER_THREADS) to keep
+them busy.
+"""
+import os
+import sys
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, date, timedelta
+from dotenv import load_dotenv
+from db import crud
+from db.database import get_db_session, engine
+from agents.code_agent import run_code_agent
+from agents.health_agent import run_health_agent
+from agents.mood_agent import calculate_daily_mood_xp
+from agents.daily_report_agent import run_daily_report_agent
+from observability.logger import get_logger
+from tools.llm_budget import llm_scope
+from tools import llm_queue
+from tools.timezones import local_day
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+JOB_NAME = "daily_tasks"
+
+SCHEDULER_EXECUTOR = os.getenv("SCHEDULER_EXECUTOR", "thread")  # "thread" or "process"
+SCHEDULER_WORKERS = int(os.getenv("SCHEDULER_WORKERS", "8"))
+SCHEDULER_CHUNK_SIZE = int(os.getenv("SCHEDULER_CHUNK_SIZE", "500"))
+SCHEDULER_USER_THREADS = int(os.getenv("SCHEDULER_USER_THREADS", "48"))
+SCHEDULER_LLM_CONCURRENCY = int(os.getenv("SCHEDULER_LLM_CONCURRENCY", "300"))
+
+# (task name, agent(user_id, day), calls the LLM)
+DAILY_TASKS = [
+    ("code", run_code_agent, False),
+    ("health", run_health_agent, True),
+    ("mood", calculate_daily_mood_xp, True),
+    # After the awards, so the day's snapshot has all its XP for weekly and monthly reports
+    ("report", run_daily_report_agent, True),
+]
+
+# Per-process state, created lazily in each worker process
+_user_pool = None
+_llm_slots = None
+_state_lock = threading.Lock()
+
+
+def _init_worker(llm_concurrency: int, user_threads: int, in_subprocess: bool = False):
+    """Set up the user thread pool and LLM semaphore for this process."""
+    global _user_pool, _llm_slots
+    if in_subprocess:
+        # Connections inherited from the parent process must not be reused
+        engine.dispose(close=False)
+    with _state_lock:
+        _llm_slots = threading.BoundedSemaphore(max(1, llm_concurrency))
+        # A worker process only runs batch work, so it needn't hold slots back for interactive calls
+        llm_queue.ensure_batch_capacity(max(1, llm_concurrency), reserved=0 if in_subprocess else None)
+        _user_pool = ThreadPoolExecutor(max_workers=max(1, user_threads), thread_name_prefix="scheduler-user")
+
+
+def _run_user(user_id: int, day: date, done_tasks: set) -> dict:
+    """Run every task not yet in the ledger for one user."""
+    counts = {"ran": 0, "skipped": 0, "failed": 0}
+    db = get_db_session()
+    try:
+        for task_name, agent, uses_llm in DAILY_TASKS:
+            if (user_id, task_name) in done_tasks:
+                counts["skipped"] += 1
+                continue
+            try:
+                if uses_llm:
+                    # LLM spend counts against the user's daily budget; over it, agents fall back to rule-based XP
+                    with _llm_slots, llm_scope(user_id, lane="batch"):
+                        result = agent(user_id, day)
+                else:
+                    result = agent(user_id, day)
+            except Exception as e:
+                logger.error("❌ Scheduler task %s failed for user %s: %s", task_name, user_id, e)
+                result = False
+
+            if result is False:
+                counts["failed"] += 1
+                continue
+
+            crud.record_task_completion(db, user_id=user_id, day=day, task=task_name)
+            counts["ran"] += 1
+    finally:
+        db.close()
+    return counts
+
+
+def closing_day(timezone: str = None, moment: datetime = None) -> date:
+    """The last day that has ended in `timezone` at `moment` (default now): yesterday there."""
+    return local_day(timezone, moment) - timedelta(days=1)
+
+
+def run_shard(user_ids: list, day_iso: str = None) -> dict:
+    """
+    Process one chunk of users, for `day_iso` or each user's closing day.
+    Runs inside a pool worker, so it only takes picklable arguments and
+    returns plain counts.
+    """
+    db = get_db_session()
+    try:
+        if day_iso:
+            days = dict.fromkeys(user_ids, date.fromisoformat(day_iso))
+        else:
+            timezones = crud.get_user_timezones(db, user_ids=user_ids)
+            days = {user_id: closing_day(timezones.get(user_id)) for user_id in user_ids}
+        # A chunk's users are spread over at most a few days, one ledger query each
+        done_tasks = set()
+        for day in set(days.values()):
+            done_tasks |= crud.get_completed_tasks(db, user_ids=[u for u in user_ids if days[u] == day], day=day)
+    finally:
+        db.close()
+
+    totals = {"users": len(user_ids), "ran": 0, "skipped": 0, "failed": 0}
+    futures = [_user_pool.submit(_run_user, user_id, days[user_id], done_tasks) for user_id in user_ids]
+    for future in futures:
+        counts = future.result()
+        for key, value in counts.items():
+            totals[key] += value
+    return totals
+
+
+def _iter_user_chunks(after_id: int, chunk_size: int):
+    """Yield lists of active user ids after `after_id`, one page at a time."""
+    db = get_db_session()
+    try:
+        while True:
+            user_ids = crud.get_active_user_ids(db, after_id=after_id, limit=chunk_size)
+            if not user_ids:
+                return
+            yield user_ids
+            after_id = user_ids[-1]
+    finally:
+        db.close()
+
+
+def _make_pool(executor: str, workers: int, llm_concurrency: int, user_threads: int):
+    if executor == "process":
+        # Each process gets its own share of the global LLM budget
+        per_process_llm = max(1, llm_concurrency // workers)
+        return ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(per_process_llm, user_threads, True),
+        )
+
+    # Thread mode shares one user pool and one semaphore across all shards
+    _init_worker(llm_concurrency, user_threads * workers)
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scheduler-shard")
+
+
+def _save_checkpoint(run_key: str, last_user_id: int):
+    db = get_db_session()
+    try:
+        crud.save_scheduler_checkpoint(db, job=JOB_NAME, run_key=run_key, last_user_id=last_user_id)
+    finally:
+        db.close()
+
+
+def run_all_daily_tasks(target_date: date = None, *, executor: str = None, workers: int = None,
+                        chunk_size: int = None, llm_concurrency: int = None, user_threads: int = None) -> dict:
+    """
+    Run the end-of-day code, health and mood agents, then the daily report
+    snapshot, for every active user.
+
+    Args:
+        target_date: The day being closed out for every user. Defaults to
+            each user's closing day, yesterday in their timezone.
+        executor: "thread" or "process". Defaults to SCHEDULER_EXECUTOR.
+        workers: Number of shards processed at once. Defaults to SCHEDULER_WORKERS.
+        chunk_size: Users per shard. Defaults to SCHEDULER_CHUNK_SIZE.
+        llm_concurrency: Max in-flight LLM-backed tasks. Defaults to SCHEDULER_LLM_CONCURRENCY.
+        user_threads: Users processed concurrently per shard. Defaults to SCHEDULER_USER_THREADS.
+
+    Returns:
+        dict: Totals for users seen and tasks ran, skipped and failed.
+    """
+    # Without a target date the run key is the hour, so each hourly run starts
+    # from the first user and a crashed one resumes within its hour
+    run_key = target_date.isoformat() if target_date else "local:" + datetime.now().strftime("%Y-%m-%dT%H")
+    day_iso = target_date.isoformat() if target_date else None
+    executor = executor or SCHEDULER_EXECUTOR
+    workers = max(1, workers or SCHEDULER_WORKERS)
+    chunk_size = chunk_size or SCHEDULER_CHUNK_SIZE
+    llm_concurrency = llm_concurrency or SCHEDULER_LLM_CONCURRENCY
+    user_threads = user_threads or SCHEDULER_USER_THREADS
+
+    db = get_db_session()
+    try:
+        resume_after = crud.get_scheduler_checkpoint(db, job=JOB_NAME, run_key=run_key)
+    finally:
+        db.close()
+
+    if resume_after:
+        logger.info("⏰ Resuming daily tasks for %s after user %s", run_key, resume_after)
+    else:
+        logger.info("⏰ Starting daily tasks for %s", run_key)
+
+    totals = {"users": 0, "ran": 0, "skipped": 0, "failed": 0, "failed_shards": 0}
+    # Shards in submission order; the checkpoint only advances past a shard
+    # once it and every shard before it has finished without failed tasks, so
+    # a rerun reaches the users whose tasks failed
+    in_order = deque()
+    pending = set()
+    checkpoint_blocked = False
+
+    def drain(return_when):
+        nonlocal checkpoint_blocked
+        done, _ = wait(pending, return_when=return_when)
+        pending.difference_update(done)
+        while in_order and in_order[0][1].done():
+            last_user_id, future = in_order.popleft()
+            try:
+                counts = future.result()
+            except Exception as e:
+                logger.error("❌ Scheduler shard ending at user %s failed: %s", last_user_id, e)
+                totals["failed_shards"] += 1
+                checkpoint_blocked = True
+                continue
+            for key, value in counts.items():
+                totals[key] += value
+            if counts["failed"]:
+                checkpoint_blocked = True
+            if not checkpoint_blocked:
+                _save_checkpoint(run_key, last_user_id)
+
+    pool = _make_pool(executor, workers, llm_concurrency, user_threads)
+    try:
+        for user_ids in _iter_user_chunks(resume_after, chunk_size):
+            # Keep a bounded number of shards queued so enumeration doesn't
+            # run ahead of processing
+            while len(pending) >= workers * 2:
+                drain(FIRST_COMPLETED)
+            future = pool.submit(run_shard, user_ids, day_iso)
+            pending.add(future)
+            in_order.append((user_ids[-1], future))
+        while pending:
+            drain(FIRST_COMPLETED)
+    finally:
+        pool.shutdown(wait=True)
+        if executor != "process":
+            _user_pool.shutdown(wait=True)
+
+    logger.info("✅ Daily tasks for %s finished: %s", run_key, totals)
+    return totals
+
+
+if __name__ == "__main__":
+    target = date.fromisoformat(sys.argv[1]) if len(sys.argv) > 1 else None
+    run_all_daily_tasks(target)
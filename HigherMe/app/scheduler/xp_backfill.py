@@ -0,0 +1,381 @@
+"""
+Re-score historical XP after the rules in tools/xp_rules.py change.
+
+XP events don't reference the log they were awarded for, so the job rebuilds
+each deterministic award from the logs and pairs it with the event it
+produced:
+
+- mood and code logs: the live award made right after the log was written
+  (the first "mood" / "code" event within XP_BACKFILL_MATCH_SECONDS),
+- health logs are cumulative snapshots, so each row is diffed against the
+  previous one of the day to recover the action that wrote it (a meal
+  appended, water added, sleep or exercise set), paired with its
+  health_meal / health_water / health_sleep / health_exercise event; the
+  day's last row is paired with the end-of-day "health" award (made by the
+  next day's end at the latest). Days are the user's local days, the same
+  ones the live agents claim by.
+
+Awards that came from the LLM (daily mood performance, days whose meals the
+food matcher doesn't recognise) have no rule to re-score them and are left
+alone, as are events no log accounts for.
+
+Users are split into id-ordered chunks, handed to a thread or process pool
+like the end-of-day scheduler. A worker streams the chunk's logs and events
+with server-side cursors (yield_per), ordered by user, so memory holds one
+user's rows plus the chunk's corrections. Pairs are scored in batches with
+the vectorized rule path, and the corrections are written in batched
+transactions: the event amount is rewritten and the level moves by the
+difference.
+
+Progress is checkpointed per rule table (the run key defaults to a
+fingerprint of RULES), so a crashed run resumes after the last finished
+chunk and a changed table starts over. A run that finishes every chunk
+clears its checkpoint, so running again later, e.g. after new logs came
+in, starts from the first user. dry_run=True writes nothing and reports
+every change instead.
+
+Usage:
+    python -m scheduler.xp_backfill [--dry-run] [--diff PATH] [--workers N] [--chunk-size N]
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sys
+from collections import defaultdict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import timedelta
+from dotenv import load_dotenv
+from db import crud
+from db.database import get_db_session, engine
+from observability.logger import get_logger
+from tools import food_matcher, xp_rules
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+JOB_NAME = "xp_backfill"
+
+XP_BACKFILL_EXECUTOR = os.getenv("XP_BACKFILL_EXECUTOR", "thread")  # "thread" or "process"
+XP_BACKFILL_WORKERS = int(os.getenv("XP_BACKFILL_WORKERS", "4"))
+XP_BACKFILL_CHUNK_SIZE = int(os.getenv("XP_BACKFILL_CHUNK_SIZE", "200"))
+XP_BACKFILL_MATCH_SECONDS = float(os.getenv("XP_BACKFILL_MATCH_SECONDS", "120"))
+XP_BACKFILL_BATCH_SIZE = int(os.getenv("XP_BACKFILL_BATCH_SIZE", "5000"))
+STREAM_CHUNK_SIZE = 2000
+
+# A rebuilt award: which event type it should match, the window its event
+# must fall in, and the metrics to score it from
+Award = namedtuple("Award", "xp_type at until metrics")
+
+# XP types each log table can account for
+LOG_XP_TYPES = {
+    "mood": ["mood"],
+    "code": ["code"],
+    "health": ["health_meal", "health_water", "health_sleep", "health_exercise", "health"],
+}
+
+
+def rules_fingerprint(rules: dict = None) -> str:
+    """A short stable hash of the rule table, used as the default run key."""
+    return hashlib.sha1(repr(sorted((rules or xp_rules.RULES).items())).encode()).hexdigest()[:12]
+
+
+def _mood_awards(logs, window: timedelta):
+    for log in logs:
+        yield Award("mood", log.timestamp, log.timestamp + window,
+                    {"sentiment_score": log.sentiment or 0.0, "mood_text": log.mood_text or ""})
+
+
+def _code_awards(logs, window: timedelta):
+    for log in logs:
+        yield Award("code", log.date, log.date + window, {
+            "lines_added": log.lines_added or 0,
+            "lines_removed": log.lines_removed or 0,
+            "total_time_minutes": log.total_time_minutes or 0,
+        })
+
+
+def _health_action(previous, log):
+    """The (xp_type, metrics) of the logging call that wrote `log`, or None if it can't be told."""
+    # A day's first row was written on top of an empty day
+    before_meals = (previous.meals or "") if previous else ""
+    before_water = (previous.water_intake_liter or 0.0) if previous else 0.0
+    before_sleep = (previous.sleep_hours or 0.0) if previous else 0.0
+    before_exercise = (previous.exercise_minutes or 0) if previous else 0
+
+    meals, water = log.meals or "", log.water_intake_liter or 0.0
+    if meals != before_meals:
+        appended = before_meals and meals.startswith(before_meals + ", ")
+        description = meals[len(before_meals) + 2:] if appended else meals
+        return "health_meal", {"description": description, "meal_score": food_matcher.meal_score(description)}
+    if water > before_water:
+        return "health_water", {"water_intake_liters": round(water - before_water, 6), "total_water_today": water}
+    if (log.sleep_hours or 0.0) != before_sleep:
+        return "health_sleep", {"sleep_hours": log.sleep_hours}
+    if (log.exercise_minutes or 0) != before_exercise:
+        return "health_exercise", {"exercise_minutes": log.exercise_minutes}
+    return None
+
+
+def _health_awards(logs, window: timedelta):
+    for _, day_logs in itertools.groupby(logs, key=lambda log: log.local_day):
+        previous = None
+        for log in day_logs:
+            action = _health_action(previous, log)
+            if action:
+                yield Award(action[0], log.date, log.date + window, action[1])
+            previous = log
+        meal_score = food_matcher.score_meal(previous.meals or "")
+        if meal_score is not None or not previous.meals:
+            # The day ends less than a day after its last log, wherever the user is,
+            # so the next day's end is less than two days after it
+            end_of_next_day = previous.date + timedelta(days=2)
+            yield Award("health", previous.date, end_of_next_day, {
+                "sleep_hours": previous.sleep_hours or 0.0,
+                "water_intake_liters": previous.water_intake_liter or 0.0,
+                "exercise_minutes": previous.exercise_minutes or 0,
+                "meal_score": meal_score or 0.0,
+            })
+
+
+_AWARD_BUILDERS = {"mood": _mood_awards, "code": _code_awards, "health": _health_awards}
+
+
+def _by_user(rows):
+    for user_id, group in itertools.groupby(rows, key=lambda row: row.user_id):
+        yield user_id, group
+
+
+def match_awards(awards, events) -> list:
+    """
+    Pair rebuilt awards with one user's events, both in time order. Each award
+    takes the earliest unpaired event of its type inside [at, until].
+    Returns (award, event) pairs.
+    """
+    queues = defaultdict(deque)
+    for event in events:
+        queues[event.xp_type].append(event)
+    pairs = []
+    for award in awards:
+        queue = queues[award.xp_type]
+        while queue and queue[0].timestamp < award.at:
+            queue.popleft()  # an event no log accounts for, e.g. an LLM-scored daily award
+        if queue and queue[0].timestamp <= award.until:
+            pairs.append((award, queue.popleft()))
+    return pairs
+
+
+def _score_pairs(pairs: list, rules: dict) -> list:
+    """Score pairs in one vectorized pass per XP type; returns (event_id, user_id, old, new) for changed amounts."""
+    by_type = defaultdict(list)
+    for award, event in pairs:
+        by_type[award.xp_type].append((award, event))
+    corrections = []
+    for xp_type, typed in by_type.items():
+        fields = typed[0][0].metrics.keys()
+        columns = {field: [award.metrics[field] for award, _ in typed] for field in fields}
+        scores = xp_rules.score_columns(xp_type, columns, rules=rules)
+        for (award, event), new_amount in zip(typed, scores.tolist()):
+            if new_amount != (event.amount or 0):
+                corrections.append((event.id, event.user_id, event.amount or 0, new_amount, xp_type, event.timestamp))
+    return corrections
+
+
+def backfill_chunk(first_user_id: int, last_user_id: int, *, dry_run: bool = False, rules: dict = None,
+                   match_seconds: float = None, batch_size: int = None) -> dict:
+    """
+    Re-score one chunk of users. Runs inside a pool worker, so it only takes
+    picklable arguments and returns plain data.
+    """
+    window = timedelta(seconds=XP_BACKFILL_MATCH_SECONDS if match_seconds is None else match_seconds)
+    batch_size = batch_size or XP_BACKFILL_BATCH_SIZE
+    totals = {"awards": 0, "matched": 0, "changed": 0, "xp_delta": 0, "diff": []}
+    corrections = []
+
+    db = get_db_session()
+    try:
+        for log_type, xp_types in LOG_XP_TYPES.items():
+            logs = crud.stream_user_logs(db, log_type, first_user_id=first_user_id, last_user_id=last_user_id,
+                                         chunk_size=STREAM_CHUNK_SIZE)
+            events = _by_user(crud.stream_xp_events(db, first_user_id=first_user_id, last_user_id=last_user_id,
+                                                    xp_types=xp_types, chunk_size=STREAM_CHUNK_SIZE))
+            pending_events = next(events, None)
+            pairs = []
+            for user_id, user_logs in _by_user(logs):
+                while pending_events and pending_events[0] < user_id:
+                    pending_events = next(events, None)
+                awards = list(_AWARD_BUILDERS[log_type](user_logs, window))
+                totals["awards"] += len(awards)
+                if not pending_events or pending_events[0] != user_id:
+                    continue
+                pairs.extend(match_awards(awards, pending_events[1]))
+                pending_events = next(events, None)
+                if len(pairs) >= batch_size:
+                    totals["matched"] += len(pairs)
+                    corrections.extend(_score_pairs(pairs, rules))
+                    pairs = []
+            totals["matched"] += len(pairs)
+            corrections.extend(_score_pairs(pairs, rules))
+    finally:
+        db.close()
+
+    totals["changed"] = len(corrections)
+    totals["xp_delta"] = sum(new - old for _, _, old, new, _, _ in corrections)
+    if dry_run:
+        totals["diff"] = [
+            {"event_id": event_id, "user_id": user_id, "xp_type": xp_type,
+             "timestamp": timestamp.isoformat(), "old": old, "new": new}
+            for event_id, user_id, old, new, xp_type, timestamp in corrections
+        ]
+        return totals
+
+    db = get_db_session()
+    try:
+        for start in range(0, len(corrections), batch_size):
+            batch = [correction[:4] for correction in corrections[start:start + batch_size]]
+            if not crud.apply_xp_corrections(db, batch):
+                raise RuntimeError(f"could not write XP corrections for users {first_user_id}-{last_user_id}")
+    finally:
+        db.close()
+    return totals
+
+
+def _init_worker():
+    # Connections inherited from the parent process must not be reused
+    engine.dispose(close=False)
+
+
+def _iter_user_chunks(after_id: int, chunk_size: int):
+    """Yield (first, last) user id ranges after `after_id`, one page of users at a time."""
+    db = get_db_session()
+    try:
+        while True:
+            user_ids = crud.get_active_user_ids(db, after_id=after_id, limit=chunk_size, active_only=False)
+            if not user_ids:
+                return
+            yield user_ids[0], user_ids[-1]
+            after_id = user_ids[-1]
+    finally:
+        db.close()
+
+
+def run_xp_backfill(*, dry_run: bool = False, run_key: str = None, executor: str = None, workers: int = None,
+                    chunk_size: int = None, rules: dict = None, diff_out=None) -> dict:
+    """
+    Re-score every user's rule-based XP events under `rules` (the current
+    RULES by default).
+
+    Args:
+        dry_run: Write nothing; report each change instead.
+        run_key: Checkpoint key. Defaults to a fingerprint of the rule table.
+        executor: "thread" or "process". Defaults to XP_BACKFILL_EXECUTOR.
+        workers: Chunks processed at once. Defaults to XP_BACKFILL_WORKERS.
+        chunk_size: Users per chunk. Defaults to XP_BACKFILL_CHUNK_SIZE.
+        rules: An alternate rule table, e.g. for a what-if dry run.
+        diff_out: File to write the dry-run diff to, one JSON object per line.
+            Without it, the diff is returned under "diff".
+
+    Returns:
+        dict: Users seen, awards rebuilt, events matched and changed, the
+        net XP change and failed chunks.
+    """
+    run_key = run_key or rules_fingerprint(rules)
+    executor = executor or XP_BACKFILL_EXECUTOR
+    workers = max(1, workers or XP_BACKFILL_WORKERS)
+    chunk_size = chunk_size or XP_BACKFILL_CHUNK_SIZE
+
+    resume_after = 0
+    if not dry_run:
+        db = get_db_session()
+        try:
+            resume_after = crud.get_scheduler_checkpoint(db, job=JOB_NAME, run_key=run_key)
+        finally:
+            db.close()
+    logger.info("🔁 XP backfill %s%s, after user %s", run_key, " (dry run)" if dry_run else "", resume_after)
+
+    totals = {"chunks": 0, "awards": 0, "matched": 0, "changed": 0, "xp_delta": 0, "failed_chunks": 0}
+    diff = []
+    # Chunks in submission order; the checkpoint only advances past a chunk
+    # once it and every chunk before it has been written
+    in_order = deque()
+    pending = set()
+    checkpoint_blocked = False
+
+    def drain():
+        nonlocal checkpoint_blocked
+        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        pending.difference_update(done)
+        while in_order and in_order[0][1].done():
+            last_user_id, future = in_order.popleft()
+            try:
+                counts = future.result()
+            except Exception as e:
+                logger.error("❌ XP backfill chunk ending at user %s failed: %s", last_user_id, e)
+                totals["failed_chunks"] += 1
+                checkpoint_blocked = True
+                continue
+            totals["chunks"] += 1
+            for key in ("awards", "matched", "changed", "xp_delta"):
+                totals[key] += counts[key]
+            for change in counts["diff"]:
+                if diff_out is not None:
+                    diff_out.write(json.dumps(change) + "\n")
+                else:
+                    diff.append(change)
+            if not dry_run and not checkpoint_blocked:
+                db = get_db_session()
+                try:
+                    crud.save_scheduler_checkpoint(db, job=JOB_NAME, run_key=run_key, last_user_id=last_user_id)
+                finally:
+                    db.close()
+
+    if executor == "process":
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker)
+    else:
+        pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="xp-backfill")
+    try:
+        for first_user_id, last_user_id in _iter_user_chunks(resume_after, chunk_size):
+            # Keep a bounded number of chunks queued so enumeration doesn't run ahead
+            while len(pending) >= workers * 2:
+                drain()
+            future = pool.submit(backfill_chunk, first_user_id, last_user_id, dry_run=dry_run, rules=rules)
+            pending.add(future)
+            in_order.append((last_user_id, future))
+        while pending:
+            drain()
+    finally:
+        pool.shutdown(wait=True)
+
+    if not dry_run and not totals["failed_chunks"]:
+        db = get_db_session()
+        try:
+            crud.clear_scheduler_checkpoint(db, job=JOB_NAME, run_key=run_key)
+        finally:
+            db.close()
+    logger.info("✅ XP backfill %s finished: %s", run_key, totals)
+    if dry_run and diff_out is None:
+        totals["diff"] = diff
+    return totals
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-score historical XP events under the current XP rules.")
+    parser.add_argument("--dry-run", action="store_true", help="write nothing, print the changes as JSON lines")
+    parser.add_argument("--diff", help="write the dry-run diff to this file instead of stdout")
+    parser.add_argument("--run-key", help="checkpoint key (default: fingerprint of the rule table)")
+    parser.add_argument("--executor", choices=("thread", "process"))
+    parser.add_argument("--workers", type=int)
+    parser.add_argument("--chunk-size", type=int)
+    args = parser.parse_args()
+
+    out = open(args.diff, "w") if args.diff else sys.stdout
+    try:
+        result = run_xp_backfill(dry_run=args.dry_run, run_key=args.run_key, executor=args.executor,
+                                 workers=args.workers, chunk_size=args.chunk_size,
+                                 diff_out=out if args.dry_run else None)
+    finally:
+        if args.diff:
+            out.close()
+    print(json.dumps(result), file=sys.stderr)
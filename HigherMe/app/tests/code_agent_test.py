@@ -1,8 +0,0 @@
-from app.agents.code_agent import run_code_agent
-
-
-def test():
-    run_code_agent()
-
-if __name__ == "__main__":
-    test()
\ No newline at end of file
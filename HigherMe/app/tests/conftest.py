@@ -0,0 +1,91 @@
+import os
+import sys
+import tempfile
+
+# The app modules import each other as top-level packages (`from db import crud`),
+# so the app directory has to be importable the same way it is under uvicorn
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if APP_DIR not in sys.path:
+    sys.path.insert(0, APP_DIR)
+
+# Default to a throwaway SQLite database so tests never touch a real DB_URL
+os.environ.setdefault("DB_URL", "sqlite:///" + os.path.join(tempfile.mkdtemp(prefix="higherme-tests-"), "test.db"))
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+os.environ.setdefault("SECRET_KEY", "test-secret")
+
+import uuid
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+
+CASSETTE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "cassettes", "agents.json.zst")
+
+
+@pytest.fixture
+def llm_cassette():
+    """
+    Serve LLM calls from the recorded cassette; any prompt it doesn't know fails the test.
+
+    Re-record after changing a prompt (against Groq, or benchmarks/fake_llm.py via LLM_BASE_URL):
+        LLM_CASSETTE_MODE=record python -m pytest app/tests -k agent
+    """
+    from tools.llm_cassette import use_cassette
+
+    mode = os.getenv("LLM_CASSETTE_MODE", "replay")
+    with use_cassette(CASSETTE_PATH, "record" if mode == "record" else "replay") as cassette:
+        yield cassette
+    if cassette.misses:
+        kinds = ", ".join(sorted({miss["kind"] for miss in cassette.misses}))
+        pytest.fail(f"{len(cassette.misses)} LLM call(s) missing from the cassette ({kinds}); re-record it")
+
+
+@pytest.fixture
+def user_id():
+    """A fresh user with a level record."""
+    from db.database import Base, engine, get_db_session
+    from db.models import User, Level
+
+    Base.metadata.create_all(bind=engine)
+    db = get_db_session()
+    try:
+        name = f"user_{uuid.uuid4().hex[:12]}"
+        user = User(username=name, email=f"{name}@example.com", hashed_password="x", created_at=datetime.now())
+        db.add(user)
+        db.commit()
+        db.add(Level(user_id=user.id, current_level=1, total_xp=0, last_updated=datetime.now()))
+        db.commit()
+        return user.id
+    finally:
+        db.close()
+
+
+@pytest.fixture
+def register_user():
+    """
+    Register users through the API: register_user(**fields) returns one with
+    id, username, user (the /auth/register user body), token and headers.
+    """
+    from fastapi.testclient import TestClient
+    from api.main import app
+    from db.database import Base, engine
+
+    Base.metadata.create_all(bind=engine)
+    client = TestClient(app)
+
+    def register(**fields):
+        name = f"user_{uuid.uuid4().hex[:12]}"
+        response = client.post("/api/v1/auth/register", json={
+            "username": name, "email": f"{name}@example.com", "password": "secret123", **fields})
+        assert response.status_code == 200, response.text
+        body = response.json()
+        return SimpleNamespace(id=body["user"]["id"], username=body["user"]["username"], user=body["user"],
+                               token=body["access_token"],
+                               headers={"Authorization": f"Bearer {body['access_token']}"})
+
+    return register
+
+
+@pytest.fixture
+def registered_user(register_user):
+    """A user registered through the API, with their auth headers."""
+    return register_user()
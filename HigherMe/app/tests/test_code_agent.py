@@ -0,0 +1,18 @@
+from agents import code_agent
+from db.database import get_db_session
+from db.models import CodeLog, XPEvent
+
+
+def test_code_activity_awards_xp_from_git_stats(monkeypatch, user_id):
+    monkeypatch.setattr(code_agent, "get_git_stats", lambda: {"lines_added": 120, "lines_removed": 30})
+
+    code_log = code_agent.log_code_activity(user_id)
+
+    assert code_log is not None
+    db = get_db_session()
+    try:
+        assert db.get(CodeLog, code_log.id).processed
+        award = db.query(XPEvent).filter(XPEvent.user_id == user_id, XPEvent.xp_type == "code").one()
+        assert award.amount == 4  # 150 lines // 10 * 0.3
+    finally:
+        db.close()
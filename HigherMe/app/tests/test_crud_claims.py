@@ -0,0 +1,75 @@
+from datetime import datetime
+from db import crud
+from db.database import Base, engine, get_db_session
+from db.models import User, CodeLog, HealthLog, MoodLog, Level
+
+
+def _fresh_user(db, name):
+    Base.metadata.create_all(bind=engine)
+    user = User(username=name, email=f"{name}@example.com", hashed_password="x", created_at=datetime.now())
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+def test_claim_code_logs_sums_and_flips_once():
+    db = get_db_session()
+    try:
+        user_id = _fresh_user(db, "claim_code")
+        for added, removed, minutes in [(10, 2, 30.0), (5, 1, 15.0)]:
+            crud.create_code_log(db, lines_added=added, lines_removed=removed, total_time_minutes=minutes, user_id=user_id)
+        today = datetime.now().date()
+
+        totals = crud.claim_code_logs(db, user_id=user_id, day=today)
+        db.commit()
+        assert totals == {"count": 2, "lines_added": 15, "lines_removed": 3, "total_time_minutes": 45.0}
+        assert db.query(CodeLog).filter(CodeLog.user_id == user_id, CodeLog.processed == False).count() == 0
+
+        # Already processed rows are not claimed again
+        assert crud.claim_code_logs(db, user_id=user_id, day=today)["count"] == 0
+    finally:
+        db.close()
+
+
+def test_claim_skips_when_xp_already_awarded_today():
+    db = get_db_session()
+    try:
+        user_id = _fresh_user(db, "claim_mood")
+        crud.create_mood_log(db, mood_text="fine", sentiment=0.1, user_id=user_id)
+        crud.award_xp("mood", 5, user_id)
+
+        assert crud.claim_mood_logs(db, user_id=user_id, day=datetime.now().date()) == []
+        db.rollback()
+        assert db.query(MoodLog).filter(MoodLog.user_id == user_id, MoodLog.processed == False).count() == 1
+    finally:
+        db.close()
+
+
+def test_claim_health_logs_returns_latest_snapshot_and_awards_atomically():
+    db = get_db_session()
+    try:
+        user_id = _fresh_user(db, "claim_health")
+        crud.create_health_log(db, meals="oats", sleep_hours=7.0, exercise_minutes=0, water_intake_liter=0.5, user_id=user_id)
+        crud.create_health_log(db, meals="oats, salad", sleep_hours=7.0, exercise_minutes=30, water_intake_liter=1.5, user_id=user_id)
+
+        latest = crud.claim_health_logs(db, user_id=user_id, day=datetime.now().date())
+        assert latest["claimed_count"] == 2
+        assert latest["meals"] == "oats, salad"
+        assert latest["exercise_minutes"] == 30
+
+        assert crud.award_xp("health", 12, user_id, db=db) is not None
+        assert db.query(HealthLog).filter(HealthLog.user_id == user_id, HealthLog.processed == True).count() == 2
+        assert db.query(Level).filter(Level.user_id == user_id).one().total_xp == 12
+    finally:
+        db.close()
+
+
+def test_mark_logs_as_processed_returns_flipped_ids():
+    db = get_db_session()
+    try:
+        user_id = _fresh_user(db, "mark_processed")
+        log = crud.create_mood_log(db, mood_text="ok", sentiment=0.0, user_id=user_id)
+        assert crud.mark_logs_as_processed(db, [log.id], "mood") == [log.id]
+        assert crud.mark_logs_as_processed(db, [], "mood") == []
+    finally:
+        db.close()
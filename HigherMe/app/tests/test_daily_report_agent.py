@@ -0,0 +1,30 @@
+from agents.daily_report_agent import build_daily_report
+from agents.health_agent import log_meal, log_water_intake
+from agents.mood_agent import log_mood
+from datetime import datetime
+from db import crud
+from db.database import get_db_session
+
+
+def test_daily_report_has_every_section(llm_cassette, user_id):
+    log_mood("Shipped the feature, feeling great!", user_id)
+    log_mood("A bit tired in the evening but content.", user_id)
+    log_meal("salmon, rice and steamed broccoli", user_id)
+    log_water_intake(2.0, user_id)
+
+    db = get_db_session()
+    try:
+        report = build_daily_report(db, user_id)
+        today = datetime.now().date()
+        snapshot = crud.get_report_snapshots(db, user_id=user_id, period="day", start=today, end=today)[(today, today)]
+    finally:
+        db.close()
+
+    assert "🔢 **XP Breakdown:**" in report
+    assert "🧠 **Mood:**" in report
+    assert "💪 **Health:**" in report
+    assert "🎯 **Overall:**" in report
+    assert "Failed to generate summary" not in report
+    # Stored for the weekly and monthly reports
+    assert snapshot.summary and snapshot.summary in report
+    assert snapshot.metrics["mood_entries"] == 2 and snapshot.metrics["water_liters_sum"] == 2.0
@@ -0,0 +1,46 @@
+from datetime import datetime
+from fastapi.testclient import TestClient
+from api.main import app
+from db import crud
+from db.database import get_db_session
+
+client = TestClient(app)
+
+
+def test_dashboard_returns_fast_sections_and_defers_an_unbuilt_report(registered_user):
+    name, headers = registered_user.username, registered_user.headers
+    client.post("/api/v1/health/water", headers=headers, json={"water_intake": 1.0})
+
+    response = client.get("/api/v1/dashboard", headers=headers)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["user"]["username"] == name
+    assert body["stats"] == client.get("/api/v1/stats", headers=headers).json()
+    assert body["code_activity"] == {"code_logs": [], "total_logs": 0}
+    assert body["report_status"] == "pending" and body["report"] is None
+
+    skipped = client.get("/api/v1/dashboard", headers=headers, params={"report": "none"}).json()
+    assert skipped["report_status"] == "skipped"
+    assert client.get("/api/v1/dashboard", headers=headers, params={"report": "later"}).status_code == 400
+
+
+def test_dashboard_inlines_a_report_already_built_for_the_current_data(registered_user):
+    headers = registered_user.headers
+    pending = client.get("/api/v1/dashboard", headers=headers)
+    user_id = pending.json()["user"]["id"]
+
+    db = get_db_session()
+    try:
+        today = datetime.now().date()
+        crud.save_report_snapshot(db, user_id=user_id, period="day", start=today, end=today, summary="A calm day.",
+                                  report="🌅 **Daily Report**\nA calm day.", metrics={"days": 1, "active_days": 1},
+                                  data_version=crud.get_data_version(db, user_id=user_id))
+    finally:
+        db.close()
+
+    ready = client.get("/api/v1/dashboard", headers={**headers, "If-None-Match": pending.headers["etag"]})
+    assert ready.status_code == 200
+    assert ready.json()["report_status"] == "ready"
+    assert ready.json()["report"] == "🌅 **Daily Report**\nA calm day."
+    # The daily report route serves the same stored build instead of calling the LLM again
+    assert client.get("/api/v1/daily-report", headers=headers).json()["report"] == ready.json()["report"]
@@ -0,0 +1,42 @@
+import pytest
+from tools import food_matcher, xp_calculator
+from tools.food_matcher import FoodMatcher
+
+
+def test_bundled_knowledge_base_loads_with_plurals():
+    matcher = food_matcher.matcher()
+    assert len(matcher) > 1500
+    assert [m.term for m in matcher.find("Apples and 2 bananas")] == ["apples", "bananas"]
+
+
+def test_leftmost_longest_whole_word_matches():
+    matcher = FoodMatcher({"rice": 0.0, "fried rice": -0.6, "tea": 0.3, "pea": 0.8}, {"fried": -0.5})
+    assert [m.term for m in matcher.find("Fried rice, steak & peas")] == ["fried rice"]
+    assert [m.term for m in matcher.find("fried tea")] == ["fried", "tea"]
+
+
+@pytest.mark.parametrize("meal, low, high", [
+    ("Grilled salmon with steamed broccoli", 0.9, 1.0),
+    ("breakfast: oats and banana", 0.5, 1.0),
+    ("2 slices of pizza, fries and a coke", -1.0, -0.5),
+    ("Deep-fried Oreos", -1.0, -0.9),
+])
+def test_meal_scores(meal, low, high):
+    assert low <= food_matcher.meal_score(meal) <= high
+
+
+def test_modifiers_stay_in_their_clause():
+    assert food_matcher.score_meal("fried fish, salad") > food_matcher.score_meal("fried fish, fried salad")
+    assert food_matcher.score_meal("sugar free lemonade") > food_matcher.score_meal("lemonade")
+
+
+def test_unknown_meal_is_none_for_score_and_neutral_for_xp():
+    assert food_matcher.score_meal("zxqv blorp") is None
+    assert food_matcher.meal_score("zxqv blorp") == 0.0
+
+
+def test_meal_xp_rewards_healthier_meals():
+    healthy = xp_calculator.calculateXp("health", {"activity_type": "meal", "description": "lentil soup with spinach and brown rice"})
+    junk = xp_calculator.calculateXp("health", {"activity_type": "meal", "description": "double cheeseburger with large fries"})
+    assert healthy["xp"] > junk["xp"] == 8
+    assert "meal score" in healthy["details"]
@@ -1,12 +1,32 @@
-from app.agents.health_agent import run_health_agent
-
-def test():
-    run_health_agent(
-        meals="breakfast: oats and banana, lunch: grilled chicken and salad, dinner: paneer wrap",
-        sleep_hours=7.5,
-        exercise_minutes=45,
-        water_liters=2.0
-    )
-
-if __name__ == "__main__":
-    test()
+from agents.health_agent import log_meal, log_sleep, log_exercise, log_water_intake, run_health_agent
+from db.database import get_db_session
+from db.models import HealthLog, XPEvent
+
+
+def test_health_logs_accumulate_and_daily_xp_is_awarded_once(llm_cassette, user_id):
+    log_sleep(7.5, user_id)
+    log_meal("breakfast: oats and banana", user_id)
+    log_meal("lunch: grilled chicken and salad", user_id)
+    log_water_intake(1.25, user_id)
+    log_exercise(45, user_id)
+    log_meal("dinner: paneer wrap", user_id)
+
+    db = get_db_session()
+    try:
+        latest = db.query(HealthLog).filter(HealthLog.user_id == user_id).order_by(HealthLog.id.desc()).first()
+        assert latest.meals == "breakfast: oats and banana, lunch: grilled chicken and salad, dinner: paneer wrap"
+        assert latest.sleep_hours == 7.5
+        assert latest.exercise_minutes == 45
+    finally:
+        db.close()
+
+    assert run_health_agent(user_id) is not False
+    assert run_health_agent(user_id) is None  # nothing left to claim
+
+    db = get_db_session()
+    try:
+        awards = db.query(XPEvent).filter(XPEvent.user_id == user_id, XPEvent.xp_type == "health").all()
+        assert len(awards) == 1
+        assert 0 <= awards[0].amount <= 30
+    finally:
+        db.close()
@@ -0,0 +1,119 @@
+import threading
+import time
+import uuid
+from fastapi import FastAPI, Response
+from fastapi.testclient import TestClient
+from api import idempotency, main
+from db import crud
+from db.database import get_db_session
+from db.models import HealthLog, XPEvent
+
+client = TestClient(main.app)
+
+
+def _counts(user_id):
+    db = get_db_session()
+    try:
+        return (db.query(HealthLog).filter(HealthLog.user_id == user_id).count(),
+                db.query(XPEvent).filter(XPEvent.user_id == user_id).count())
+    finally:
+        db.close()
+
+
+def test_a_retry_replays_the_first_response_without_logging_again(registered_user):
+    user_id, headers = registered_user.id, registered_user.headers
+    keyed = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+
+    first = client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 0.5})
+    idempotency.store.clear()  # the retry reaches another worker: only the table knows the key
+    retry = client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 0.5})
+
+    assert first.status_code == retry.status_code == 200
+    assert retry.json() == first.json()
+    assert retry.headers["idempotent-replayed"] == "true" and "idempotent-replayed" not in first.headers
+    assert _counts(user_id) == (1, 1)
+
+    reused = client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 2.0})
+    assert reused.status_code == 422
+    # Without a key every request runs
+    client.post("/api/v1/health/water", headers=headers, json={"water_intake": 0.5})
+    assert _counts(user_id) == (2, 2)
+
+
+def test_concurrent_duplicates_wait_for_the_running_request(monkeypatch, registered_user):
+    headers = registered_user.headers
+    keyed = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+    calls = []
+
+    def slow_log(liters, user_id):
+        calls.append(liters)
+        time.sleep(0.3)
+
+    monkeypatch.setattr(main, "log_water_intake", slow_log)
+    responses = []
+    threads = [threading.Thread(target=lambda: responses.append(
+        client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 1.0}))) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert calls == [1.0]
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    assert sum(response.headers.get("idempotent-replayed") == "true" for response in responses) == 2
+
+
+def test_failed_requests_release_the_key_and_abandoned_claims_time_out(monkeypatch, registered_user):
+    user_id, headers = registered_user.id, registered_user.headers
+    keyed = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+
+    def broken_log(liters, user_id):
+        raise RuntimeError("database went away")
+
+    monkeypatch.setattr(main, "log_water_intake", broken_log)
+    assert client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 1.0}).status_code == 500
+    monkeypatch.undo()
+    assert client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 1.0}).status_code == 200
+
+    # Another worker holds this key and hasn't finished
+    key = uuid.uuid4().hex
+    db = get_db_session()
+    try:
+        assert crud.claim_idempotency_key(db, user_id=user_id, key=key, fingerprint="elsewhere",
+                                          ttl_seconds=60, lock_seconds=60) is None
+    finally:
+        db.close()
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_WAIT_SECONDS", 0.2)
+    waiting = client.post("/api/v1/health/water", headers={**headers, "Idempotency-Key": key}, json={"water_intake": 1.0})
+    assert waiting.status_code == 422  # a different request already holds the key
+
+    monkeypatch.setattr(idempotency, "IDEMPOTENCY_LOCK_SECONDS", 0)
+    taken_over = client.post("/api/v1/health/water", headers={**headers, "Idempotency-Key": key}, json={"water_intake": 1.0})
+    assert taken_over.status_code == 200
+
+
+def test_replays_keep_repeated_headers_and_cors(registered_user):
+    headers = registered_user.headers
+    cookies = FastAPI()
+    cookies.middleware("http")(idempotency.idempotent_requests)
+
+    @cookies.post("/login-ish")
+    def set_two_cookies(response: Response):
+        response.set_cookie("a", "1")
+        response.set_cookie("b", "2")
+        return {"ok": True}
+
+    keyed = {**headers, "Idempotency-Key": uuid.uuid4().hex}
+    first = TestClient(cookies).post("/login-ish", headers=keyed)
+    idempotency.store.clear()
+    retry = TestClient(cookies).post("/login-ish", headers=keyed)
+    for response in (first, retry):
+        assert [value.split(";")[0] for value in response.headers.get_list("set-cookie")] == ["a=1", "b=2"]
+    assert retry.headers["idempotent-replayed"] == "true" and retry.json() == {"ok": True}
+
+    # On the app, replays still pass through CORS
+    keyed = {**headers, "Idempotency-Key": uuid.uuid4().hex, "Origin": "http://localhost:3000"}
+    client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 0.5})
+    replayed = client.post("/api/v1/health/water", headers=keyed, json={"water_intake": 0.5})
+    assert replayed.headers["idempotent-replayed"] == "true"
+    assert "access-control-allow-origin" in replayed.headers
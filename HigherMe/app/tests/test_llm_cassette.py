@@ -0,0 +1,27 @@
+import pytest
+from tools.llm_cassette import Cassette, CassetteMiss
+
+
+def test_recorded_pairs_replay_from_disk(tmp_path):
+    path = str(tmp_path / "c.json.zst")
+    recorder = Cassette(path, "record")
+    recorder.record("m", "rate this", "mood_sentiment", "0.5")
+
+    player = Cassette(path, "replay")
+    assert player.play("m", "rate this", "mood_sentiment") == "0.5"
+    assert not player.misses
+
+
+def test_replay_miss_raises_and_is_remembered(tmp_path):
+    path = str(tmp_path / "c.json.zst")
+    Cassette(path, "record").record("m", "known", "k", "x")
+    player = Cassette(path, "replay")
+
+    with pytest.raises(CassetteMiss):
+        player.play("other-model", "known", "k")
+    assert player.misses == [{"kind": "k", "prompt": "known"}]
+
+
+def test_replay_requires_an_existing_cassette(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        Cassette(str(tmp_path / "missing.json.zst"), "replay")
@@ -0,0 +1,131 @@
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from langchain_core.messages import AIMessage
+from fastapi.testclient import TestClient
+from agents import mood_agent, mood_summary
+from api.main import app
+from observability.metrics import LLM_DEADLINE_EXCEEDED, LLM_HEDGES, LLM_HEDGE_WINS
+from tools import llm, llm_deadline, llm_queue, xp_calculator
+
+
+class _SlowModel:
+    """Stands in for ChatGroq: the n-th call takes delays[n] seconds."""
+
+    def __init__(self, *delays, content="0.5"):
+        self.delays = list(delays)
+        self.content = content
+        self.timeouts = []
+        self._lock = threading.Lock()
+
+    def invoke(self, prompt, timeout=None):
+        with self._lock:
+            self.timeouts.append(timeout)
+            delay = self.delays[min(len(self.timeouts), len(self.delays)) - 1]
+        time.sleep(delay)
+        return AIMessage(content=f"{self.content} after {delay}")
+
+
+def test_calls_get_the_remaining_budget_and_give_up_at_the_deadline(monkeypatch):
+    client = llm.create_llm("tests")
+    model = _SlowModel(1.5)
+    monkeypatch.setattr(client, "_llm", model)
+    before = LLM_DEADLINE_EXCEEDED.value(kind="slow")
+
+    start = time.monotonic()
+    with llm_deadline.deadline(0.2):
+        with pytest.raises(llm_deadline.DeadlineExceeded):
+            client.invoke("hello", kind="slow")
+    assert time.monotonic() - start < 0.5
+    assert 0 < model.timeouts[0] <= 0.2
+    assert LLM_DEADLINE_EXCEEDED.value(kind="slow") == before + 1
+
+
+def test_nested_deadlines_only_shorten_the_budget():
+    with llm_deadline.deadline(5):
+        with llm_deadline.deadline(60):
+            assert llm_deadline.remaining() <= 5
+    assert llm_deadline.remaining() is None
+
+
+def test_rule_based_xp_answers_when_the_budget_runs_out(monkeypatch):
+    monkeypatch.setattr(xp_calculator.llm, "_llm", _SlowModel(1.5))
+    logs = [SimpleNamespace(timestamp=datetime.now(), mood_text="good day", sentiment=0.6)]
+
+    start = time.monotonic()
+    with llm_deadline.deadline(0.2):
+        result = xp_calculator._calculate_mood_performance_xp(logs)
+    assert time.monotonic() - start < 0.5
+    assert result == {"xp": 24, "details": "🧠 Mood XP: +24 (fallback calculation)"}
+
+
+def test_slow_calls_are_hedged_and_the_first_answer_wins(monkeypatch):
+    client = llm.create_llm("tests")
+    monkeypatch.setattr(client, "_llm", _SlowModel(1.0, 0.01))
+    monkeypatch.setattr(llm_deadline, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    hedges, wins = LLM_HEDGES.value(kind="hedged"), LLM_HEDGE_WINS.value(kind="hedged")
+
+    with llm_deadline.deadline(0.8):
+        response = llm_deadline.call(lambda timeout: client._request("hello", "hedged", None, timeout), kind="hedged", hedge=True)
+
+    assert response.content == "0.5 after 0.01"
+    assert LLM_HEDGES.value(kind="hedged") == hedges + 1
+    assert LLM_HEDGE_WINS.value(kind="hedged") == wins + 1
+
+
+def test_abandoned_and_losing_requests_keep_their_queue_slot(monkeypatch):
+    scheduler = llm_queue.FairScheduler(slots=2, reserved=0)
+    monkeypatch.setattr(llm_queue, "scheduler", scheduler)
+    monkeypatch.setattr(llm_deadline, "LLM_HEDGE", True)
+    monkeypatch.setattr(llm_deadline, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    client = llm.create_llm("tests")
+    model = _SlowModel(0.6, 0.6, 0.6)
+    monkeypatch.setattr(client, "_llm", model)
+
+    with llm_deadline.deadline(0.2):
+        with pytest.raises(llm_deadline.DeadlineExceeded):
+            client.invoke("hello", kind="abandoned")
+    # The first request and its hedge are still running, so both slots stay taken
+    assert scheduler.stats()["batch"]["active"] == 2
+    assert not scheduler.acquire("batch", timeout=0)
+
+    time.sleep(0.7)
+    assert scheduler.stats()["batch"]["active"] == 0
+    assert len(model.timeouts) == 2
+
+
+def test_a_hedge_waits_for_a_free_slot(monkeypatch):
+    scheduler = llm_queue.FairScheduler(slots=1, reserved=0)
+    monkeypatch.setattr(llm_queue, "scheduler", scheduler)
+    monkeypatch.setattr(llm_deadline, "LLM_HEDGE", True)
+    monkeypatch.setattr(llm_deadline, "LLM_HEDGE_DEFAULT_DELAY_SECONDS", 0.05)
+    client = llm.create_llm("tests")
+    model = _SlowModel(0.2, 0.01)
+    monkeypatch.setattr(client, "_llm", model)
+    hedges = LLM_HEDGES.value(kind="unhedged")
+
+    assert client.invoke("hello", kind="unhedged").content == "0.5 after 0.2"
+    assert LLM_HEDGES.value(kind="unhedged") == hedges
+    assert len(model.timeouts) == 1
+
+
+def test_hedge_delay_follows_the_p95_once_there_are_enough_samples():
+    tracker = llm_deadline.LatencyTracker(window=100)
+    assert tracker.hedge_delay("k") == llm_deadline.LLM_HEDGE_DEFAULT_DELAY_SECONDS
+    for i in range(100):
+        tracker.observe("k", i / 100)
+    assert tracker.p95("k") == 0.95
+
+
+def test_mood_post_answers_within_the_requested_budget(monkeypatch, registered_user):
+    monkeypatch.setattr(mood_agent.llm, "_llm", _SlowModel(1.5))
+    monkeypatch.setattr(mood_summary.llm, "_llm", _SlowModel(1.5))
+    client = TestClient(app)
+
+    start = time.monotonic()
+    response = client.post("/api/v1/mood", json={"mood_text": "in a hurry"},
+                           headers={**registered_user.headers, "X-Latency-Budget-Ms": "300"})
+    assert response.status_code == 200
+    assert time.monotonic() - start < 1.5
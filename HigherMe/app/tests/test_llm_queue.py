@@ -0,0 +1,67 @@
+import threading
+import time
+from observability.metrics import LLM_QUEUE_DEPTH
+from tools.llm_queue import FairScheduler
+
+
+def _queue_up(scheduler, lane, user_id, served):
+    """Start a call that waits for a slot, records its turn and gives the slot back."""
+    before = scheduler.stats()[lane]["queued"]
+
+    def run():
+        assert scheduler.acquire(lane, user_id, timeout=5)
+        served.append((lane, user_id))
+        scheduler.release(lane)
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    while scheduler.stats()[lane]["queued"] == before:
+        time.sleep(0.001)
+    return thread
+
+
+def _serve(scheduler, waiting, holder_lane="batch"):
+    scheduler.release(holder_lane)
+    for thread in waiting:
+        thread.join(5)
+
+
+def test_interactive_calls_go_before_queued_batch_work():
+    scheduler = FairScheduler(slots=1, reserved=0)
+    assert scheduler.acquire("batch", "backfill")
+    served = []
+    waiting = [_queue_up(scheduler, "batch", "backfill", served),
+               _queue_up(scheduler, "report", 2, served),
+               _queue_up(scheduler, "interactive", 1, served)]
+
+    _serve(scheduler, waiting)
+    assert [lane for lane, _ in served] == ["interactive", "report", "batch"]
+
+
+def test_users_take_turns_within_a_lane():
+    scheduler = FairScheduler(slots=1, reserved=0)
+    assert scheduler.acquire("interactive", "holder")
+    served = []
+    waiting = [_queue_up(scheduler, "interactive", "heavy", served) for _ in range(4)]
+    waiting.append(_queue_up(scheduler, "interactive", "light", served))
+
+    _serve(scheduler, waiting, holder_lane="interactive")
+    assert [user for _, user in served] == ["heavy", "light", "heavy", "heavy", "heavy"]
+
+
+def test_batch_never_takes_the_reserved_slots():
+    scheduler = FairScheduler(slots=2, reserved=1)
+    assert scheduler.acquire("batch", "a")
+    assert not scheduler.acquire("batch", "b", timeout=0.05)
+    assert scheduler.acquire("interactive", 1, timeout=0.05)
+
+
+def test_a_call_that_waits_out_its_timeout_leaves_the_queue():
+    scheduler = FairScheduler(slots=1, reserved=0)
+    assert scheduler.acquire("report", 1)
+    assert not scheduler.acquire("report", 2, timeout=0.05)
+
+    assert scheduler.stats()["report"] == {"queued": 0, "active": 1}
+    assert LLM_QUEUE_DEPTH.value(lane="report") == 0
+    scheduler.release("report")
+    assert scheduler.acquire("report", 3, timeout=0.05)
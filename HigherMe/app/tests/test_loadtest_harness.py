@@ -0,0 +1,28 @@
+import json
+from benchmarks.fake_llm import fake_completion
+from benchmarks.loadtest import percentile, parse_mix
+
+
+def test_fake_llm_answers_in_the_shape_each_prompt_asks_for():
+    sentiment = fake_completion('Only return a float. No words.\nEntry: "great day"')
+    assert -1.0 <= float(sentiment) <= 1.0
+    xp = json.loads(fake_completion('Respond with ONLY this JSON format:\n{"xp": <number>, "details": "..."}\n0 to 30'))
+    assert 0 <= xp["xp"] <= 30
+    assert fake_completion("Summary:") == fake_completion("Summary:")
+
+
+def test_percentile_nearest_rank():
+    values = sorted(range(1, 101))
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+def test_parse_mix_rejects_unknown_actions():
+    assert parse_mix("mood=3,stats=1") == {"mood": 3.0, "stats": 1.0}
+    try:
+        parse_mix("mood=1,teleport=2")
+    except ValueError as e:
+        assert "teleport" in str(e)
+    else:
+        raise AssertionError("expected ValueError")
@@ -0,0 +1,34 @@
+import json
+import logging
+from observability.logger import JsonFormatter, SamplingFilter, DeferredQueueHandler
+
+
+class _ExplodingRepr:
+    def __str__(self):
+        raise AssertionError("message was formatted on the calling thread")
+
+
+def test_deferred_handler_queues_records_unformatted():
+    import queue
+    q = queue.Queue()
+    handler = DeferredQueueHandler(q)
+    record = logging.makeLogRecord({"msg": "report: %s", "args": (_ExplodingRepr(),)})
+    handler.emit(record)
+    queued = q.get_nowait()
+    assert queued.msg == "report: %s"
+    assert queued.args == record.args
+
+
+def test_json_formatter_includes_extra_fields():
+    record = logging.makeLogRecord({"name": "db.crud", "levelname": "INFO", "msg": "awarded %s", "args": (5,), "user_id": 7})
+    payload = json.loads(JsonFormatter().format(record))
+    assert payload["msg"] == "awarded 5"
+    assert payload["logger"] == "db.crud"
+    assert payload["user_id"] == 7
+
+
+def test_sampling_filter_respects_rate():
+    sampling = SamplingFilter()
+    assert sampling.filter(logging.makeLogRecord({"msg": "always"}))
+    assert not sampling.filter(logging.makeLogRecord({"msg": "never", "sample_rate": 0.0}))
+    assert sampling.filter(logging.makeLogRecord({"msg": "kept", "sample_rate": 1.0}))
@@ -0,0 +1,31 @@
+import threading
+from observability.metrics import Counter, Histogram
+
+
+def test_histogram_merges_thread_shards_into_cumulative_buckets():
+    hist = Histogram("test_merge_seconds", "test", ("stage",), buckets=(0.1, 1.0))
+
+    def record():
+        for value in (0.05, 0.5, 5.0):
+            hist.observe(value, stage="llm")
+
+    threads = [threading.Thread(target=record) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    lines = hist.render()
+    assert 'test_merge_seconds_bucket{stage="llm",le="0.1"} 4' in lines
+    assert 'test_merge_seconds_bucket{stage="llm",le="1.0"} 8' in lines
+    assert 'test_merge_seconds_bucket{stage="llm",le="+Inf"} 12' in lines
+    assert 'test_merge_seconds_count{stage="llm"} 12' in lines
+    assert hist.count(stage="llm") == 12
+
+
+def test_counter_labels_are_escaped():
+    counter = Counter("test_escape", "test", ("path",))
+    counter.inc(path='a"b')
+    counter.inc(path='a"b')
+    assert counter.value(path='a"b') == 2
+    assert counter.render() == ['test_escape_total{path="a\\"b"} 2']
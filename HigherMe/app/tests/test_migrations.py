@@ -0,0 +1,36 @@
+from sqlalchemy import create_engine, inspect, text
+from db.database import Base
+from db.migrations import upgrade_schema
+import db.models  # noqa: F401
+
+
+def test_upgrade_adds_new_columns_to_existing_tables(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE users (id INTEGER PRIMARY KEY, username VARCHAR NOT NULL, "
+                          "email VARCHAR NOT NULL, hashed_password VARCHAR NOT NULL)"))
+        conn.execute(text("INSERT INTO users (username, email, hashed_password) VALUES ('old', 'old@example.com', 'x')"))
+
+    result = upgrade_schema(engine, Base.metadata)
+
+    assert "users.data_version" in result["columns"]
+    assert "data_version" in {c["name"] for c in inspect(engine).get_columns("users")}
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT data_version FROM users")).scalar() == 0
+    assert upgrade_schema(engine, Base.metadata) == {"columns": [], "indexes": []}
+
+
+def test_upgrade_backfills_local_days_from_server_timestamps(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'old.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE xp_events (id INTEGER PRIMARY KEY, user_id INTEGER NOT NULL, xp_type VARCHAR, "
+                          "amount INTEGER, timestamp DATETIME, details VARCHAR)"))
+        conn.execute(text("INSERT INTO xp_events (user_id, xp_type, amount, timestamp) "
+                          "VALUES (1, 'mood', 5, '2025-06-01 23:30:00.000000')"))
+
+    result = upgrade_schema(engine, Base.metadata)
+
+    assert "xp_events.local_day" in result["columns"]
+    assert "ix_xp_events_user_local_day" in result["indexes"]
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT local_day FROM xp_events")).scalar() == "2025-06-01"
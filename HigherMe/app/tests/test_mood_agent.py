@@ -0,0 +1,47 @@
+from datetime import datetime, time
+from agents.mood_agent import log_mood, calculate_daily_mood_xp
+from db import crud
+from db.database import get_db_session
+from db.models import MoodLog, XPEvent
+
+
+def test_log_mood_scores_sentiment_and_awards_xp(llm_cassette, user_id):
+    result = log_mood("Woke up feeling meh, dragged through the morning.", user_id)
+
+    assert result["success"]
+    assert -1.0 <= result["sentiment_score"] <= 1.0
+    db = get_db_session()
+    try:
+        log = db.get(MoodLog, result["mood_log_id"])
+        assert log.processed
+        assert db.query(XPEvent).filter(XPEvent.user_id == user_id, XPEvent.xp_type == "mood").count() == 1
+    finally:
+        db.close()
+
+
+def test_daily_mood_xp_from_several_entries(llm_cassette, user_id):
+    # Fixed times of day, because the performance prompt includes them
+    today = datetime.now().date()
+    entries = [
+        (time(8, 15), "Woke up feeling meh, dragged through the morning.", -0.3),
+        (time(12, 40), "Got into flow around lunch, banged out some code.", 0.6),
+        (time(19, 5), "Had a nice walk, feeling calm and clear-headed.", 0.7),
+    ]
+    db = get_db_session()
+    try:
+        for at, text, sentiment in entries:
+            db.add(MoodLog(user_id=user_id, mood_text=text, sentiment=sentiment,
+                           timestamp=datetime.combine(today, at), processed=False))
+        db.commit()
+    finally:
+        db.close()
+
+    assert calculate_daily_mood_xp(user_id) is not False
+
+    db = get_db_session()
+    try:
+        award = db.query(XPEvent).filter(XPEvent.user_id == user_id, XPEvent.xp_type == "mood").one()
+        assert 0 <= award.amount <= 30
+        assert crud.claim_mood_logs(db, user_id=user_id, day=today) == []
+    finally:
+        db.close()
@@ -0,0 +1,100 @@
+from fastapi.testclient import TestClient
+from api.main import app
+from db import crud, mood_search
+from db.database import get_db_session
+from db.models import MoodLog
+
+client = TestClient(app)
+
+
+def _fresh_journal(user_id, *entries):
+    db = get_db_session()
+    try:
+        # SQLite reuses the ids of users other tests deleted
+        db.query(MoodLog).filter(MoodLog.user_id == user_id).delete()
+        db.commit()
+        mood_search.index.clear()
+        return [crud.create_mood_log(db, mood_text=text, sentiment=0.0, user_id=user_id).id for text in entries]
+    finally:
+        db.close()
+
+
+def _search(user_id, query, **kwargs):
+    db = get_db_session()
+    try:
+        return mood_search.search_mood_logs(db, user_id=user_id, query=query, **kwargs)
+    finally:
+        db.close()
+
+
+def test_terms_are_stemmed_and_stop_words_dropped():
+    assert mood_search.terms("I was running and my knees were worried") == ["run", "knee", "worry"]
+    assert mood_search.terms("stressed") == mood_search.terms("stress")
+    assert mood_search.terms("focused") == mood_search.terms("focus")
+
+
+def test_matches_need_every_word_and_rank_by_relevance(user_id):
+    anxious, _, both = _fresh_journal(
+        user_id,
+        "Felt anxious before the meeting but the walk helped",
+        "Great day at the beach",
+        "Anxious again, anxious about the deadline and anxious at night",
+    )
+
+    results = _search(user_id, "anxious")["results"]
+    assert [r["id"] for r in results] == [both, anxious]
+    assert "<b>Anxious</b>" in results[0]["snippet"]
+
+    assert [r["id"] for r in _search(user_id, "anxious walks")["results"]] == [anxious]
+    assert _search(user_id, "anxious beach")["results"] == []
+
+
+def test_snippets_escape_the_entry_text(user_id):
+    _fresh_journal(user_id, 'Anxious <img src=x onerror="alert(1)"> & tired')
+
+    snippet = _search(user_id, "anxious")["results"][0]["snippet"]
+    assert snippet == '<b>Anxious</b> &lt;img src=x onerror=&quot;alert(1)&quot;&gt; &amp; tired'
+    # Postgres marks matches with sentinels; only those become tags
+    assert mood_search._headline_html("\x02anxious\x03 <b>x</b>") == "<b>anxious</b> &lt;b&gt;x&lt;/b&gt;"
+
+
+def test_pages_report_whether_more_results_follow(user_id):
+    ids = _fresh_journal(user_id, *(f"tired after shift {i}" for i in range(5)))
+
+    first = _search(user_id, "tired", limit=2)
+    last = _search(user_id, "tired", limit=2, offset=4)
+    assert first["has_more"] and not last["has_more"]
+    assert [r["id"] for r in first["results"]] == [ids[4], ids[3]]  # equal scores, newest first
+    assert len(last["results"]) == 1
+
+
+def test_entries_written_elsewhere_are_picked_up_on_the_next_search(user_id):
+    _fresh_journal(user_id, "Slept badly")
+    assert _search(user_id, "grateful")["results"] == []
+
+    db = get_db_session()
+    try:
+        # Bypasses crud, like a write from another process
+        log = MoodLog(user_id=user_id, mood_text="Grateful for friends", sentiment=0.8, processed=False)
+        db.add(log)
+        db.commit()
+        log_id = log.id
+    finally:
+        db.close()
+
+    assert [r["id"] for r in _search(user_id, "grateful")["results"]] == [log_id]
+
+
+def test_search_endpoint_returns_a_page_of_the_users_entries(registered_user):
+    headers = registered_user.headers
+    _fresh_journal(registered_user.id, "Proud of finishing the marathon", "Lazy sunday")
+
+    response = client.get("/api/v1/mood/search", headers=headers, params={"q": "marathon", "limit": 5})
+    assert response.status_code == 200
+    body = response.json()
+    assert body["has_more"] is False
+    assert [r["mood_text"] for r in body["results"]] == ["Proud of finishing the marathon"]
+    assert isinstance(body["results"][0]["timestamp"], str)
+
+    assert client.get("/api/v1/mood/search", headers=headers, params={"q": "  "}).status_code == 400
+    assert client.get("/api/v1/mood/search", headers=headers, params={"q": "x", "limit": 500}).status_code == 400
@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+from db import crud, mood_similarity
+from db.database import get_db_session
+from db.models import MoodLog, MoodLSHBucket
+
+
+def _fresh_journal(db, user_id):
+    # SQLite reuses the ids of users other tests deleted
+    db.query(MoodLSHBucket).filter(MoodLSHBucket.user_id == user_id).delete()
+    db.query(MoodLog).filter(MoodLog.user_id == user_id).delete()
+    db.commit()
+
+
+def test_signatures_estimate_jaccard_similarity():
+    a = "Anxious about the presentation tomorrow, could not sleep at all"
+    b = "Anxious about the presentation tomorrow and could barely sleep"
+    exact = len(mood_similarity.shingles(a) & mood_similarity.shingles(b)) / len(mood_similarity.shingles(a) | mood_similarity.shingles(b))
+
+    estimate = mood_similarity.similarity(mood_similarity.signature(a), mood_similarity.signature(b))
+    assert abs(estimate - exact) < 0.2
+    assert mood_similarity.similarity(mood_similarity.signature(a), mood_similarity.signature("Great run by the river")) < 0.2
+    assert mood_similarity.signature("  !! ") is None
+
+
+def test_new_entries_find_similar_past_ones(user_id):
+    db = get_db_session()
+    try:
+        _fresh_journal(db, user_id)
+        anxious = crud.create_mood_log(db, mood_text="Anxious about the presentation tomorrow, could not sleep", sentiment=-0.6, user_id=user_id)
+        crud.create_mood_log(db, mood_text="Lovely dinner with my sister", sentiment=0.8, user_id=user_id)
+        new = crud.create_mood_log(db, mood_text="Anxious about my presentation tomorrow, can't sleep", sentiment=-0.5, user_id=user_id)
+
+        assert db.query(MoodLSHBucket).filter(MoodLSHBucket.mood_log_id == new.id).count() == mood_similarity.BANDS
+        similar = mood_similarity.similar_entries(db, user_id=user_id, sig=mood_similarity.unpack(new.minhash), exclude_id=new.id)
+        assert [entry["id"] for entry in similar] == [anxious.id]
+        assert similar[0]["sentiment"] == -0.6
+        assert similar[0]["similarity"] >= mood_similarity.SIMILAR_MIN
+    finally:
+        db.close()
+
+
+def test_entries_logged_before_signatures_are_backfilled(user_id):
+    db = get_db_session()
+    try:
+        _fresh_journal(db, user_id)
+        db.add(MoodLog(user_id=user_id, mood_text="Burnt out after a long week at work", sentiment=-0.7, processed=False))
+        db.commit()
+
+        assert mood_similarity.backfill_signatures(db) >= 1
+        sig = mood_similarity.signature("Burnt out after a long week of work")
+        assert [entry["mood_text"] for entry in mood_similarity.similar_entries(db, user_id=user_id, sig=sig)] == [
+            "Burnt out after a long week at work"
+        ]
+    finally:
+        db.close()
+
+
+def test_near_duplicates_are_dropped_before_summaries_keeping_the_later_one():
+    logs = [SimpleNamespace(mood_text=text) for text in (
+        "feeling tired today",
+        "Great workout this morning",
+        "Feeling tired today!!",
+    )]
+    assert [log.mood_text for log in mood_similarity.distinct_entries(logs)] == [
+        "Great workout this morning", "Feeling tired today!!"
+    ]
@@ -0,0 +1,68 @@
+from datetime import datetime
+from types import SimpleNamespace
+from agents import mood_summary
+from db import crud
+from db.database import get_db_session
+
+
+class _ScriptedLLM:
+    def __init__(self):
+        self.prompts = []
+        self.fail = False
+
+    def invoke(self, prompt, *, kind):
+        self.prompts.append(prompt)
+        if self.fail:
+            raise RuntimeError("model unavailable")
+        return SimpleNamespace(content=f"summary #{len(self.prompts)}")
+
+
+def _log(db, user_id, text, sentiment):
+    mood_log = crud.create_mood_log(db, mood_text=text, sentiment=sentiment, user_id=user_id)
+    return mood_summary.fold_mood_summary(db, user_id, mood_log.timestamp.date())
+
+
+def test_each_entry_is_folded_into_the_previous_summary(user_id, monkeypatch):
+    llm = _ScriptedLLM()
+    monkeypatch.setattr(mood_summary, "llm", llm)
+    db = get_db_session()
+    try:
+        _log(db, user_id, "woke up tired", -0.4)
+        _log(db, user_id, "coffee helped a lot", 0.5)
+        state = _log(db, user_id, "shipped the feature", 0.9)
+
+        assert len(llm.prompts) == 3
+        last = llm.prompts[-1]
+        assert "summary #2" in last and "shipped the feature" in last
+        assert "woke up tired" not in last and "coffee" not in last
+
+        assert state.summary == "summary #3"
+        assert (state.entry_count, state.sentiment_count) == (3, 3)
+        assert round(state.sentiment_sum, 6) == 1.0
+        assert (state.sentiment_min, state.sentiment_max) == (-0.4, 0.9)
+    finally:
+        db.close()
+
+
+def test_report_reads_the_rolling_summary_and_catches_up_after_failures(user_id, monkeypatch):
+    llm = _ScriptedLLM()
+    monkeypatch.setattr(mood_summary, "llm", llm)
+    db = get_db_session()
+    try:
+        _log(db, user_id, "rough morning", -0.6)
+        llm.fail = True
+        state = _log(db, user_id, "lunch with friends", 0.6)
+        assert state.summary == "summary #1"  # kept; the missed entry waits for the next fold
+    finally:
+        db.close()
+
+    llm.fail = False
+    result = mood_summary.mood_summary_with_sentiment(user_id, datetime.now().date())
+    assert "lunch with friends" in llm.prompts[-1] and "rough morning" not in llm.prompts[-1]
+    assert result["summary"] == "summary #3"
+    assert result["total_entries"] == 2
+    assert result["average_sentiment"] == 0.0
+
+    # Up to date now: reading again doesn't call the LLM
+    mood_summary.mood_summary_with_sentiment(user_id, datetime.now().date())
+    assert len(llm.prompts) == 3
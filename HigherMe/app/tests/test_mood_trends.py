@@ -0,0 +1,94 @@
+import statistics
+from datetime import date, datetime, timedelta
+from fastapi.testclient import TestClient
+from agents.mood_trends import mood_trends
+from api.main import app
+from db.database import get_db_session
+from db.models import HealthLog, MoodLog
+
+END = date(2025, 6, 29)  # a Sunday
+
+
+def _seed_year(db, user_id):
+    """A year of days: sentiment tracks sleep, weekends are better, every 10th day is skipped."""
+    # SQLite reuses the ids of users other tests deleted
+    db.query(MoodLog).filter(MoodLog.user_id == user_id).delete()
+    db.query(HealthLog).filter(HealthLog.user_id == user_id).delete()
+    daily = {}
+    for offset in range(400):
+        day = END - timedelta(days=offset)
+        if offset % 10 == 3:
+            continue
+        sleep = 5 + offset % 4
+        sentiment = (sleep - 6.5) / 2 + (0.3 if day.weekday() >= 5 else 0.0)
+        noon = datetime.combine(day, datetime.min.time()) + timedelta(hours=12)
+        # Two entries a day around the day's mean
+        db.add_all([
+            MoodLog(user_id=user_id, mood_text="x", sentiment=sentiment - 0.1, timestamp=noon, processed=True),
+            MoodLog(user_id=user_id, mood_text="x", sentiment=sentiment + 0.1, timestamp=noon + timedelta(hours=6), processed=True),
+            # Cumulative snapshots: the day's last row holds its totals
+            HealthLog(user_id=user_id, sleep_hours=sleep, exercise_minutes=0, date=noon),
+            HealthLog(user_id=user_id, sleep_hours=sleep, exercise_minutes=20 + offset % 3, date=noon + timedelta(hours=1)),
+        ])
+        daily[day] = sentiment
+    db.commit()
+    return daily
+
+
+def test_rolling_stats_weekdays_and_correlations_over_a_year(user_id):
+    db = get_db_session()
+    try:
+        daily = _seed_year(db, user_id)
+        trends = mood_trends(db, user_id=user_id, days=365, end=END)
+    finally:
+        db.close()
+
+    assert len(trends["daily"]) == 365
+    assert trends["daily"][-1]["day"] == END.isoformat()
+    assert trends["days_with_entries"] == sum(1 for day in daily if day > END - timedelta(days=365))
+
+    last = trends["daily"][-1]
+    window = [daily[END - timedelta(days=i)] for i in range(7) if END - timedelta(days=i) in daily]
+    assert last["entries"] == 2
+    assert last["mean_7d"] == round(statistics.fmean(window), 3)
+    assert last["volatility_7d"] == round(statistics.pstdev(window), 3)
+
+    # Windows reach back before the first day shown
+    first = trends["daily"][0]
+    first_day = date.fromisoformat(first["day"])
+    earlier = [daily[first_day - timedelta(days=i)] for i in range(30) if first_day - timedelta(days=i) in daily]
+    assert first["mean_30d"] == round(statistics.fmean(earlier), 3)
+
+    skipped = next(row for row in trends["daily"] if date.fromisoformat(row["day"]) not in daily)
+    assert skipped["sentiment"] is None and skipped["entries"] == 0
+
+    weekdays = {row["day"]: row for row in trends["day_of_week"]}
+    assert weekdays["Saturday"]["mean_sentiment"] > weekdays["Wednesday"]["mean_sentiment"]
+    assert sum(row["days"] for row in trends["day_of_week"]) == trends["days_with_entries"]
+
+    assert trends["correlations"]["sleep_hours"]["r"] > 0.9
+    assert abs(trends["correlations"]["exercise_minutes"]["r"]) < 0.5
+
+
+def test_a_user_without_entries_gets_empty_trends(user_id):
+    db = get_db_session()
+    try:
+        db.query(MoodLog).filter(MoodLog.user_id == user_id).delete()
+        db.commit()
+        trends = mood_trends(db, user_id=user_id, days=30, end=END)
+    finally:
+        db.close()
+
+    assert trends["days_with_entries"] == 0
+    assert all(row["mean_7d"] is None for row in trends["daily"])
+    assert trends["correlations"]["sleep_hours"]["r"] is None
+
+
+def test_trends_endpoint_validates_the_range(registered_user):
+    client = TestClient(app)
+    headers = registered_user.headers
+
+    response = client.get("/api/v1/mood/trends", headers=headers, params={"days": 14})
+    assert response.status_code == 200
+    assert len(response.json()["daily"]) == 14
+    assert client.get("/api/v1/mood/trends", headers=headers, params={"days": 5000}).status_code == 400
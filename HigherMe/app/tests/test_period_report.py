@@ -0,0 +1,186 @@
+from datetime import date, datetime, timedelta
+from types import SimpleNamespace
+from fastapi.testclient import TestClient
+from agents import daily_report_agent, period_report_agent
+from api.main import app
+from db import crud
+from db.database import get_db_session
+from db.models import CodeLog, HealthLog, MoodLog, ReportSnapshot, XPEvent
+from tools.timezones import local_day
+from tools.prompt_budget import LLM_PROMPT_MAX_TOKENS, count_tokens
+
+JUNE = date(2025, 6, 1)  # a Sunday, so June splits into 6 week segments
+
+
+class _ScriptedClient:
+    def __init__(self):
+        self.calls = []
+
+    def invoke(self, prompt, *, kind, json_mode=False):
+        self.calls.append({"prompt": prompt, "kind": kind})
+        return SimpleNamespace(content=f"Review #{len(self.calls)}")
+
+
+def _seed_days(db, user_id, first: date, last: date):
+    """Day snapshots as the daily report leaves them: weekdays active, weekends quiet."""
+    # SQLite reuses the ids of users other tests deleted
+    for model in (ReportSnapshot, MoodLog, HealthLog, CodeLog, XPEvent):
+        db.query(model).filter(model.user_id == user_id).delete()
+    db.commit()
+    version = crud.get_data_version(db, user_id=user_id)
+    day = first
+    while day <= last:
+        active = day.weekday() < 5
+        metrics = {"days": 1, "active_days": int(active), "xp_total": 10 * active, "xp_by_type": {"mood": 10} if active else {},
+                   "mood_entries": 2 * active, "sentiment_sum": 0.5 * active, "sentiment_count": 2 * active}
+        crud.save_report_snapshot(db, user_id=user_id, period="day", start=day, end=day,
+                                  summary=f"Summary of {day.isoformat()}" if active else None,
+                                  report=None, metrics=metrics, data_version=version)
+        day += timedelta(days=1)
+
+
+def test_week_segments_split_months_at_mondays():
+    start, end = period_report_agent.period_bounds("month", date(2025, 6, 18))
+    assert (start, end) == (JUNE, date(2025, 6, 30))
+    segments = period_report_agent.week_segments(start, end)
+    assert segments[0] == (JUNE, JUNE)
+    assert segments[1] == (date(2025, 6, 2), date(2025, 6, 8))
+    assert segments[-1] == (date(2025, 6, 30), date(2025, 6, 30))
+    assert period_report_agent.period_bounds("week", date(2025, 6, 18)) == (date(2025, 6, 16), date(2025, 6, 22))
+
+
+def test_week_reduces_day_snapshots_once(user_id, monkeypatch):
+    client = _ScriptedClient()
+    monkeypatch.setattr(period_report_agent, "llm", client)
+    db = get_db_session()
+    try:
+        _seed_days(db, user_id, date(2025, 6, 2), date(2025, 6, 8))
+        report = period_report_agent.build_period_report(db, user_id, "week", date(2025, 6, 4))
+        again = period_report_agent.build_period_report(db, user_id, "week", date(2025, 6, 8))
+    finally:
+        db.close()
+
+    assert [call["kind"] for call in client.calls] == ["week_review"]
+    prompt = client.calls[0]["prompt"]
+    assert "Summary of 2025-06-06" in prompt and "2025-06-07" not in prompt.split("Day summaries:")[1]
+    assert "- XP earned: +50 (Mood +50)" in prompt
+    assert "- Active days: 5 of 7" in prompt
+    assert "📅 **Weekly Report**" in report and "Review #1" in report
+    assert again == report
+
+
+def test_month_reduces_weeks_and_shares_them_with_weekly_reports(user_id, monkeypatch):
+    client = _ScriptedClient()
+    monkeypatch.setattr(period_report_agent, "llm", client)
+    db = get_db_session()
+    try:
+        _seed_days(db, user_id, JUNE, date(2025, 6, 30))
+        # The Sunday on its own is quiet, so only the 5 segments with activity cost a call
+        report = period_report_agent.build_period_report(db, user_id, "month", date(2025, 6, 15))
+        week_calls = [call for call in client.calls if call["kind"] == "week_review"]
+        month_calls = [call for call in client.calls if call["kind"] == "month_review"]
+
+        before = len(client.calls)
+        period_report_agent.build_period_report(db, user_id, "week", date(2025, 6, 11))
+        period_report_agent.build_period_report(db, user_id, "month", date(2025, 6, 1))
+        assert len(client.calls) == before
+    finally:
+        db.close()
+
+    assert len(week_calls) == 5 and len(month_calls) == 1
+    assert "- Active days: 21 of 30" in month_calls[0]["prompt"]
+    assert "📅 **Monthly Report**" in report
+    # Each level costs one prompt of about the same size
+    sizes = [count_tokens(call["prompt"]) for call in client.calls]
+    assert max(sizes) <= LLM_PROMPT_MAX_TOKENS
+    assert count_tokens(month_calls[0]["prompt"]) < 2 * count_tokens(week_calls[1]["prompt"])
+
+
+def test_open_periods_go_stale_with_the_data_version_and_closed_ones_never():
+    today = datetime.now()
+    open_week = SimpleNamespace(summary="ok", metrics={"active_days": 1}, built_at=today,
+                                period_end=today.date() + timedelta(days=3), data_version=4)
+    assert period_report_agent.is_fresh(open_week, 4)
+    assert not period_report_agent.is_fresh(open_week, 5)
+
+    closed_week = SimpleNamespace(**{**vars(open_week), "period_end": today.date() - timedelta(days=1)})
+    assert period_report_agent.is_fresh(closed_week, 5)
+    # A failed narrative is retried while the period is open, and final once it's closed
+    assert not period_report_agent.is_fresh(SimpleNamespace(**{**vars(open_week), "summary": None}), 4)
+    assert period_report_agent.is_fresh(SimpleNamespace(**{**vars(closed_week), "summary": None}), 5)
+
+
+def test_a_day_is_only_closed_once_it_has_ended_where_the_user_is():
+    zone = "Etc/GMT+12"
+    # Just past midnight on the server, still the evening before in UTC-12
+    built_at = datetime(2025, 6, 5, 0, 30)
+    day = local_day(zone, built_at)
+    assert built_at.date() > day
+    snapshot = SimpleNamespace(summary="ok", metrics={"active_days": 1}, built_at=built_at, period_end=day, data_version=4)
+    assert not period_report_agent.is_fresh(snapshot, 5, zone)
+    assert period_report_agent.is_fresh(snapshot, 4, zone)
+    assert period_report_agent.is_fresh(SimpleNamespace(**{**vars(snapshot), "built_at": built_at + timedelta(days=1)}), 5, zone)
+
+
+def test_days_without_a_snapshot_count_by_their_totals_without_running_daily_reports(user_id, monkeypatch):
+    client = _ScriptedClient()
+    monkeypatch.setattr(period_report_agent, "llm", client)
+    monkeypatch.setattr(daily_report_agent, "llm", client)
+    db = get_db_session()
+    try:
+        _seed_days(db, user_id, date(2025, 6, 2), date(2025, 6, 8))
+        # Wednesday was active but never got its snapshot
+        db.query(ReportSnapshot).filter(ReportSnapshot.user_id == user_id, ReportSnapshot.period_start == date(2025, 6, 4)).delete()
+        db.add(MoodLog(user_id=user_id, mood_text="steady", sentiment=0.2, timestamp=datetime(2025, 6, 4, 9), processed=True))
+        db.commit()
+        report = period_report_agent.build_period_report(db, user_id, "week", date(2025, 6, 4))
+    finally:
+        db.close()
+
+    assert [call["kind"] for call in client.calls] == ["week_review"]
+    assert "- Wed 04 Jun: (no summary)" in client.calls[0]["prompt"]
+    assert "- Mood entries: 9" in report
+
+
+def test_scheduler_task_stores_the_days_snapshot_once(user_id, monkeypatch):
+    client = _ScriptedClient()
+    monkeypatch.setattr(daily_report_agent, "llm", client)
+    day = date(2025, 6, 4)
+    db = get_db_session()
+    try:
+        _seed_days(db, user_id, day, day)
+        db.query(ReportSnapshot).filter(ReportSnapshot.user_id == user_id).delete()
+        db.add(MoodLog(user_id=user_id, mood_text="steady", sentiment=0.2, timestamp=datetime(2025, 6, 4, 9), processed=True))
+        db.commit()
+    finally:
+        db.close()
+
+    assert daily_report_agent.run_daily_report_agent(user_id, day) is None
+    calls = len(client.calls)
+    assert calls > 0
+    assert daily_report_agent.run_daily_report_agent(user_id, day) is None
+    assert len(client.calls) == calls
+
+    db = get_db_session()
+    try:
+        snapshot = crud.get_report_snapshots(db, user_id=user_id, period="day", start=day, end=day)[(day, day)]
+        assert snapshot.summary and snapshot.metrics["mood_entries"] == 1
+    finally:
+        db.close()
+
+
+def test_period_report_endpoints_build_quiet_periods_without_the_llm(monkeypatch, registered_user):
+    client = _ScriptedClient()
+    monkeypatch.setattr(period_report_agent, "llm", client)
+    http = TestClient(app)
+    headers = registered_user.headers
+
+    response = http.get("/api/v1/weekly-report", headers=headers, params={"date": "2025-06-04"})
+    assert response.status_code == 200
+    assert response.json()["start"] == "2025-06-02"
+    assert "No activity logged this week." in response.json()["report"]
+    assert client.calls == []
+
+    assert http.get("/api/v1/monthly-report", headers=headers, params={"date": "June"}).status_code == 400
+    future = (datetime.now().date() + timedelta(days=40)).isoformat()
+    assert http.get("/api/v1/monthly-report", headers=headers, params={"date": future}).status_code == 400
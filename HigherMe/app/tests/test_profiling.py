@@ -0,0 +1,62 @@
+import pytest
+import time
+from observability import profiling
+
+
+def _busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+def test_sampling_profile_collects_collapsed_stacks():
+    with profiling.profile("sample", explicit=True) as capture:
+        _busy(0.1)
+    assert capture.duration >= 0.1
+    assert any("_busy" in stack for stack in capture.stacks)
+    line = capture.collapsed().splitlines()[0]
+    assert line.rsplit(" ", 1)[1].isdigit()
+
+
+def test_cprofile_mode_produces_pstats_text():
+    with profiling.profile("cprofile", explicit=True) as capture:
+        _busy(0.01)
+    assert "_busy" in capture.report()
+
+
+def test_store_keeps_slowest_per_route():
+    store = profiling.ProfileStore(keep=2)
+    for duration in (0.1, 0.5, 0.3):
+        capture = profiling.Capture("sample", explicit=False)
+        capture.route, capture.method, capture.duration = "/api/v1/daily-report", "GET", duration
+        store.add(capture)
+    kept = store.list()["slowest"]["GET /api/v1/daily-report"]
+    assert [c["duration_ms"] for c in kept] == [500.0, 300.0]
+
+
+def test_token_required(monkeypatch):
+    monkeypatch.setattr(profiling, "PROFILING_ENABLED", True)
+    monkeypatch.setattr(profiling, "PROFILING_TOKEN", "s3cret")
+    assert profiling.token_is_valid("s3cret")
+    assert not profiling.token_is_valid("wrong")
+    assert not profiling.token_is_valid("")
+
+
+def test_only_one_cprofile_capture_at_a_time():
+    with profiling.profile("cprofile", explicit=True):
+        with pytest.raises(profiling.ProfilerBusy):
+            with profiling.profile("cprofile", explicit=True):
+                pass
+    with profiling.profile("cprofile", explicit=True) as capture:
+        _busy(0.01)
+    assert "_busy" in capture.report()
+
+
+def test_capture_counts_requests_that_overlapped_it():
+    traffic = profiling._Traffic()
+    other = traffic.enter()
+    mine = traffic.enter()
+    traffic.leave()
+    traffic.enter()
+    assert traffic.overlapping(mine) == 2
+    assert traffic.overlapping(other) == 2
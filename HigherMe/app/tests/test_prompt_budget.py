@@ -0,0 +1,47 @@
+from tools.prompt_budget import bounded_list_prompt, count_tokens, dedupe, select_entries, truncate_tokens
+
+HEAD = "Summarize these entries:\n"
+TAIL = "\n\nSummary:"
+
+
+def test_small_prompts_are_unchanged():
+    entries = ['- "slept badly, grumpy"', '- "lunch with friends cheered me up"']
+    assert bounded_list_prompt(HEAD, entries, TAIL) == HEAD + "\n".join(entries) + TAIL
+
+
+def test_cumulative_rows_collapse_to_the_latest():
+    rows = [
+        "- meal: oats",
+        "- meal: oats, water: 1.0 liters",
+        "- meal: oats, salad, water: 1.0 liters",
+        "- meal: oats, salad, water: 1.5 liters, exercise: 30 minutes",
+    ]
+    assert dedupe(rows) == [3]
+
+
+def test_prompt_stays_within_budget_however_much_is_logged():
+    entries = [f'- "entry {i}: ' + " ".join(f"word{i}_{j}" for j in range(i % 7 + 1)) + '"' for i in range(5000)]
+    prompt = bounded_list_prompt(HEAD, entries, TAIL, max_tokens=400)
+
+    assert count_tokens(prompt) <= 400
+    assert prompt.startswith(HEAD) and prompt.endswith(TAIL)
+    assert "entries not shown)" in prompt
+
+
+def test_most_informative_entries_are_kept_in_original_order():
+    entries = ["ok", "a long day of meetings then a great run by the river", "fine", "argued with my manager about the release plan"]
+    lines, omitted = select_entries(entries, 29)
+
+    assert lines == [entries[1], entries[3]]
+    assert omitted == 2
+
+    lines, _ = select_entries(entries, 5, scores=[9, 0, 8, 0])
+    assert lines == ["ok", "fine"]
+
+
+def test_long_entries_are_truncated():
+    text = "rambling " * 500
+    cut = truncate_tokens(text, 50)
+    assert cut.endswith("…")
+    assert count_tokens(cut) <= 51
+    assert truncate_tokens("short", 50) == "short"
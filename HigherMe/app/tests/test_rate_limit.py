@@ -0,0 +1,115 @@
+from datetime import date, datetime, timedelta
+import pytest
+from fastapi.testclient import TestClient
+from api import rate_limit
+from api.main import app
+from db import crud
+from db.database import get_db_session
+from observability.metrics import LLM_DENIED
+from tools import llm, llm_budget
+from tools.timezones import local_day
+
+client = TestClient(app)
+
+
+class _Response:
+    def __init__(self, content, total_tokens=None):
+        self.content = content
+        self.usage_metadata = {"total_tokens": total_tokens} if total_tokens is not None else {}
+
+
+@pytest.fixture
+def fresh_budget(monkeypatch):
+    budget = llm_budget.DailyTokenBudget(limit=100, flush_seconds=3600, refresh_seconds=3600)
+    monkeypatch.setattr(llm_budget, "budget", budget)
+    monkeypatch.setattr(budget, "_ensure_flusher", lambda: None)
+    return budget
+
+
+def test_bucket_refills_at_capacity_per_period():
+    store = rate_limit.MemoryBucketStore()
+    assert [store.take("mood:1", 2, 60, now=0.0) for _ in range(3)] == [True, True, False]
+    assert not store.take("mood:1", 2, 60, now=15.0)  # half a token back
+    assert store.take("mood:1", 2, 60, now=30.0)
+    assert store.take("mood:2", 2, 60, now=30.0)  # buckets are per user
+
+
+def test_parse_limits():
+    assert rate_limit.parse_limits("mood=12/60, report=6/30") == {"mood": (12.0, 60.0), "report": (6.0, 30.0)}
+
+
+def test_rate_limited_scope_refuses_calls_and_serves_the_last_summary(monkeypatch, fresh_budget):
+    client_llm = llm.create_llm("tests")
+    monkeypatch.setattr(client_llm, "_call", lambda prompt, kind, json_mode=False, lease=None: _Response("You had a calm day.", 40))
+
+    with llm_budget.llm_scope(7001):
+        assert client_llm.invoke("summarize", kind="overall_summary").content == "You had a calm day."
+
+    checks = []
+    with llm_budget.llm_scope(7001, rate_check=lambda: checks.append(1) or False):
+        assert client_llm.invoke("summarize", kind="overall_summary").content == "You had a calm day."
+        with pytest.raises(llm_budget.LLMUnavailable) as refused:
+            client_llm.invoke("rate this", kind="mood_sentiment")
+    assert refused.value.reason == "rate_limited"
+    assert len(checks) == 1  # one bucket token per request, not per call
+
+    # The next day, yesterday's summary isn't passed off as today's
+    monkeypatch.setattr(fresh_budget, "today", lambda user_id: date.today() + timedelta(days=1))
+    with llm_budget.llm_scope(7001, rate_check=lambda: False):
+        with pytest.raises(llm_budget.LLMUnavailable):
+            client_llm.invoke("summarize", kind="overall_summary")
+
+
+def test_budget_is_exhausted_after_charges_and_flushes_to_llm_usage(user_id, fresh_budget, monkeypatch):
+    client_llm = llm.create_llm("tests")
+    monkeypatch.setattr(client_llm, "_call", lambda prompt, kind, json_mode=False, lease=None: _Response("0.5", 60))
+
+    with llm_budget.llm_scope(user_id):
+        client_llm.invoke("rate this", kind="mood_sentiment")
+        client_llm.invoke("rate this", kind="mood_sentiment")
+        with pytest.raises(llm_budget.LLMUnavailable) as refused:
+            client_llm.invoke("rate this", kind="mood_sentiment")
+    assert refused.value.reason == "over_budget"
+
+    assert fresh_budget.flush()
+    db = get_db_session()
+    try:
+        assert crud.get_llm_usage(db, user_id=user_id, day=datetime.now().date()) == 120
+    finally:
+        db.close()
+
+    # Another process reads the flushed total back
+    other = llm_budget.DailyTokenBudget(limit=100)
+    assert other.exhausted(user_id)
+
+
+def test_budget_is_kept_per_user_local_day(user_id, fresh_budget):
+    db = get_db_session()
+    try:
+        assert crud.set_user_timezone(db, user_id=user_id, timezone="Pacific/Kiritimati")
+    finally:
+        db.close()
+    today = local_day("Pacific/Kiritimati")
+
+    fresh_budget.charge(user_id, 70)
+    assert fresh_budget.today(user_id) == today
+    assert fresh_budget.flush()
+    db = get_db_session()
+    try:
+        assert crud.get_llm_usage(db, user_id=user_id, day=today) == 70
+    finally:
+        db.close()
+
+
+def test_token_estimate_without_usage_metadata():
+    assert llm_budget.response_tokens(_Response("x" * 40), "y" * 40) == 21
+
+
+def test_rate_limited_mood_post_is_logged_without_the_llm(monkeypatch, fresh_budget, registered_user):
+    monkeypatch.setattr(rate_limit, "limits", {"mood": (0.0, 60.0)})
+    before = LLM_DENIED.value(reason="rate_limited", kind="mood_sentiment")
+
+    response = client.post("/api/v1/mood", headers=registered_user.headers, json={"mood_text": "busy but fine"})
+
+    assert response.status_code == 200
+    assert LLM_DENIED.value(reason="rate_limited", kind="mood_sentiment") == before + 1
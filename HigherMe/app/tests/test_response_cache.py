@@ -0,0 +1,42 @@
+from fastapi.testclient import TestClient
+from api import response_cache
+from api.main import app
+
+client = TestClient(app)
+
+
+def test_stats_revalidate_to_304_until_a_write_bumps_the_version(registered_user):
+    headers = registered_user.headers
+
+    first = client.get("/api/v1/stats", headers=headers)
+    assert first.status_code == 200
+    etag = first.headers["etag"]
+
+    again = client.get("/api/v1/stats", headers={**headers, "If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.content == b""
+
+    client.post("/api/v1/health/water", headers=headers, json={"water_intake": 0.5})
+
+    changed = client.get("/api/v1/stats", headers={**headers, "If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["etag"] != etag
+    assert changed.json()["todays_xp"] > 0
+
+
+def test_cached_body_is_reused_for_the_same_version(monkeypatch, registered_user):
+    headers = registered_user.headers
+    calls = []
+    dumps = response_cache.orjson.dumps
+    monkeypatch.setattr(response_cache.orjson, "dumps", lambda value: calls.append(value) or dumps(value))
+
+    client.get("/api/v1/stats", headers=headers)
+    client.get("/api/v1/stats", headers=headers)
+    assert len(calls) == 1
+
+
+def test_large_bodies_are_compressed_for_clients_that_accept_it():
+    assert response_cache._pick_encoding("gzip, deflate, br, zstd") == "zstd"
+    assert response_cache._pick_encoding("gzip;q=0.5, zstd;q=0") == "gzip"
+    assert response_cache._pick_encoding("") == "identity"
+    assert response_cache._etag_matches('W/"abc", "def"', '"abc"')
@@ -0,0 +1,135 @@
+from datetime import datetime, date, timedelta
+from db import crud
+from db.database import Base, engine, get_db_session
+from db.models import User, TaskCompletion, SchedulerCheckpoint, CodeLog, XPEvent
+from scheduler import scheduler
+from tools.timezones import local_day
+
+
+def _create_users(count):
+    Base.metadata.create_all(bind=engine)
+    db = get_db_session()
+    try:
+        db.query(TaskCompletion).delete()
+        db.query(SchedulerCheckpoint).delete()
+        db.query(User).delete()
+        for i in range(count):
+            db.add(User(username=f"sched{i}", email=f"sched{i}@example.com", hashed_password="x",
+                        created_at=datetime.now(), is_active=i != 0))
+        db.commit()
+        return [u.id for u in db.query(User).filter(User.is_active == True).order_by(User.id)]
+    finally:
+        db.close()
+
+
+def test_runs_each_task_once_per_user_and_day(monkeypatch):
+    active_ids = _create_users(7)
+    calls = []
+    monkeypatch.setattr(scheduler, "DAILY_TASKS", [
+        ("code", lambda user_id, day: calls.append(("code", user_id)), False),
+        ("mood", lambda user_id, day: calls.append(("mood", user_id)), True),
+    ])
+
+    totals = scheduler.run_all_daily_tasks(date(2025, 1, 1), workers=2, chunk_size=2, user_threads=2)
+    assert totals["users"] == len(active_ids)
+    assert totals["ran"] == 2 * len(active_ids)
+    assert sorted(calls) == sorted([(task, uid) for uid in active_ids for task in ("code", "mood")])
+
+    # A second run for the same day resumes after the checkpoint and does nothing
+    calls.clear()
+    totals = scheduler.run_all_daily_tasks(date(2025, 1, 1), workers=2, chunk_size=2, user_threads=2)
+    assert calls == []
+    assert totals["users"] == 0
+
+
+def test_failed_task_is_retried_on_next_run(monkeypatch):
+    active_ids = _create_users(4)
+    failing = {active_ids[1]}
+    calls = []
+
+    def flaky_agent(user_id, day):
+        calls.append(user_id)
+        if user_id in failing:
+            return False
+
+    monkeypatch.setattr(scheduler, "DAILY_TASKS", [("health", flaky_agent, True)])
+    totals = scheduler.run_all_daily_tasks(date(2025, 1, 2), workers=1, chunk_size=10, user_threads=2)
+    assert totals["failed"] == 1
+
+    # The checkpoint stops short of the failed task, so a plain rerun retries it
+    failing.clear()
+    calls.clear()
+    totals = scheduler.run_all_daily_tasks(date(2025, 1, 2), workers=1, chunk_size=10, user_threads=2)
+    assert calls == [active_ids[1]]
+    assert totals["skipped"] == len(active_ids) - 1
+
+
+def _delete_activity(user_id):
+    # Users are recreated with reused ids, so their rows mustn't outlive the test
+    db = get_db_session()
+    try:
+        db.query(CodeLog).filter(CodeLog.user_id == user_id).delete()
+        db.query(XPEvent).filter(XPEvent.user_id == user_id).delete()
+        db.query(TaskCompletion).filter(TaskCompletion.user_id == user_id).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_closing_out_a_past_day_claims_that_days_logs(monkeypatch, user_id):
+    _delete_activity(user_id)
+    db = get_db_session()
+    try:
+        today = crud.user_today(db, user_id=user_id)
+        yesterday = today - timedelta(days=1)
+        for day, lines in ((yesterday, 10), (today, 99)):
+            db.add(CodeLog(user_id=user_id, date=datetime.now(), local_day=day, lines_added=lines,
+                           lines_removed=0, total_time_minutes=0, processed=False))
+        db.commit()
+    finally:
+        db.close()
+
+    # The close-out for yesterday runs after midnight
+    monkeypatch.setattr(scheduler, "DAILY_TASKS", [("code", scheduler.run_code_agent, False)])
+    totals = scheduler.run_all_daily_tasks(yesterday, workers=1, chunk_size=10, user_threads=1)
+    assert totals["failed"] == 0
+
+    db = get_db_session()
+    try:
+        processed = dict(db.query(CodeLog.local_day, CodeLog.processed).filter(CodeLog.user_id == user_id))
+        assert processed == {yesterday: True, today: False}
+        assert [e.local_day for e in db.query(XPEvent).filter(XPEvent.user_id == user_id, XPEvent.xp_type == "code")] == [yesterday]
+    finally:
+        db.close()
+        _delete_activity(user_id)
+
+
+def test_default_run_closes_out_each_user_on_their_own_yesterday(monkeypatch, user_id):
+    _delete_activity(user_id)
+    zone = "Etc/GMT+12"  # UTC-12, behind any server
+    db = get_db_session()
+    try:
+        assert crud.set_user_timezone(db, user_id=user_id, timezone=zone)
+        today = local_day(zone)
+        closing = scheduler.closing_day(zone)
+        assert closing == today - timedelta(days=1)
+        for day, lines in ((closing, 10), (today, 99)):
+            db.add(CodeLog(user_id=user_id, date=datetime.now(), local_day=day, lines_added=lines,
+                           lines_removed=0, total_time_minutes=0, processed=False))
+        db.commit()
+    finally:
+        db.close()
+
+    monkeypatch.setattr(scheduler, "DAILY_TASKS", [("code", scheduler.run_code_agent, False)])
+    assert scheduler.run_all_daily_tasks(workers=1, chunk_size=10, user_threads=1)["failed"] == 0
+
+    db = get_db_session()
+    try:
+        # The user's evening is still going: only the day that has ended where they are is closed out
+        processed = dict(db.query(CodeLog.local_day, CodeLog.processed).filter(CodeLog.user_id == user_id))
+        assert processed == {closing: True, today: False}
+        assert [e.local_day for e in db.query(XPEvent).filter(XPEvent.user_id == user_id)] == [closing]
+        assert [row.day for row in db.query(TaskCompletion).filter(TaskCompletion.user_id == user_id)] == [closing]
+    finally:
+        db.close()
+        _delete_activity(user_id)
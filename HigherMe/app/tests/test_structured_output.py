@@ -0,0 +1,65 @@
+from datetime import datetime
+from types import SimpleNamespace
+import pytest
+from observability.metrics import LLM_PARSE
+from tools import xp_calculator
+from tools.structured_output import StructuredOutputError, extract_json, extract_number, invoke_json, invoke_number
+
+
+class _ScriptedClient:
+    def __init__(self, *replies):
+        self.replies = list(replies)
+        self.calls = []
+
+    def invoke(self, prompt, *, kind, json_mode=False):
+        self.calls.append({"prompt": prompt, "kind": kind, "json_mode": json_mode})
+        return SimpleNamespace(content=self.replies.pop(0))
+
+
+@pytest.mark.parametrize("reply", [
+    '{"xp": 12, "details": "ok"}',
+    '```json\n{"xp": 12, "details": "ok"}\n```',
+    'Sure! Here is the XP:\n{"xp": 12, "details": "ok"} Hope that helps.',
+    '{"xp": 12, "details": "ok",}',
+    '{“xp”: 12, “details”: “ok”}',
+    '{"note": {"a": 1}} then {"xp": 12, "details": "ok"}',
+])
+def test_json_is_salvaged_from_fences_and_prose(reply):
+    assert extract_json(reply, ("xp",))["xp"] == 12
+
+
+def test_numbers_are_salvaged_within_range():
+    assert extract_number("Score: 0.4", -1, 1) == 0.4
+    assert extract_number("-.6", -1, 1) == -0.6
+    with pytest.raises(ValueError):
+        extract_number("I'd say 7/10", -1, 1)
+
+
+def test_unparseable_reply_gets_one_short_repair_request():
+    client = _ScriptedClient("The user did great today!", '{"xp": 20, "details": "nice"}')
+    before = LLM_PARSE.value(kind="xp_test", outcome="repaired")
+
+    result = invoke_json(client, "a long original prompt about JSON", kind="xp_test", required=("xp",))
+
+    assert result["xp"] == 20
+    assert [call["kind"] for call in client.calls] == ["xp_test", "xp_test_repair"]
+    assert all(call["json_mode"] for call in client.calls)
+    assert "a long original prompt" not in client.calls[1]["prompt"]
+    assert LLM_PARSE.value(kind="xp_test", outcome="repaired") == before + 1
+
+
+def test_failed_repair_raises_and_is_counted():
+    client = _ScriptedClient("about seven", "still no number")
+    before = LLM_PARSE.value(kind="score_test", outcome="failed")
+    with pytest.raises(StructuredOutputError):
+        invoke_number(client, "rate it", kind="score_test", low=-1, high=1)
+    assert LLM_PARSE.value(kind="score_test", outcome="failed") == before + 1
+
+
+def test_mood_xp_uses_a_fenced_reply_instead_of_falling_back(monkeypatch):
+    client = _ScriptedClient('```json\n{"xp": 18, "details": "🧠 Honest reflection."}\n```')
+    monkeypatch.setattr(xp_calculator, "llm", client)
+    logs = [SimpleNamespace(timestamp=datetime.now(), mood_text="tough but ok", sentiment=0.1)]
+
+    assert xp_calculator._calculate_mood_performance_xp(logs) == {"xp": 18, "details": "🧠 Honest reflection."}
+    assert len(client.calls) == 1
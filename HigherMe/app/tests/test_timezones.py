@@ -0,0 +1,74 @@
+import uuid
+from datetime import datetime, timedelta
+from fastapi.testclient import TestClient
+from api.main import app
+from db import crud
+from db.database import get_db_session
+from db.models import CodeLog, MoodLog, XPEvent
+from tools.timezones import local_day
+
+# UTC+14 and UTC-12 are 26 hours apart, so their calendar days always differ
+EAST, WEST = "Pacific/Kiritimati", "Etc/GMT+12"
+
+
+def test_local_day_follows_the_zone_and_falls_back_to_server_time():
+    moment = datetime(2025, 6, 1, 12, 0)
+    assert local_day(EAST, moment) != local_day(WEST, moment)
+    assert local_day(EAST, moment) - local_day(WEST, moment) == timedelta(days=1)
+    assert local_day(None, moment) == local_day("Not/AZone", moment) == moment.date()
+
+
+def test_logs_are_filed_and_claimed_under_the_users_day(user_id):
+    db = get_db_session()
+    try:
+        assert crud.set_user_timezone(db, user_id=user_id, timezone=EAST)
+        today = crud.user_today(db, user_id=user_id)
+        assert today == local_day(EAST)
+
+        log = crud.create_code_log(db, lines_added=10, lines_removed=2, total_time_minutes=30.0, user_id=user_id)
+        assert log.local_day == today
+        assert [row.id for row in crud.get_day_logs(db, CodeLog, user_id=user_id, day=today)] == [log.id]
+        assert crud.get_day_logs(db, CodeLog, user_id=user_id, day=local_day(WEST)) == []
+
+        totals = crud.claim_code_logs(db, user_id=user_id, day=today)
+        assert totals["count"] == 1
+        crud.award_xp("code", 15, user_id, db=db)
+        assert [event.amount for event in crud.get_day_logs(db, XPEvent, user_id=user_id, day=today)] == [15]
+        # Already awarded for the user's day, so a second log isn't claimed
+        crud.create_code_log(db, lines_added=1, lines_removed=0, total_time_minutes=1.0, user_id=user_id)
+        assert crud.claim_code_logs(db, user_id=user_id, day=today)["count"] == 0
+        db.rollback()
+    finally:
+        db.close()
+
+
+def test_rows_inserted_without_a_local_day_use_their_timestamp(user_id):
+    db = get_db_session()
+    try:
+        moment = datetime(2025, 6, 1, 23, 30)
+        log = MoodLog(user_id=user_id, mood_text="late", sentiment=0.1, timestamp=moment, processed=True)
+        db.add(log)
+        db.commit()
+        assert log.local_day == moment.date()
+    finally:
+        db.close()
+
+
+def test_timezone_is_set_at_registration_and_moves_todays_stats(register_user):
+    client = TestClient(app)
+    name = f"tz_{uuid.uuid4().hex[:10]}"
+    register = {"username": name, "email": f"{name}@example.com", "password": "secret123"}
+    assert client.post("/api/v1/auth/register", json={**register, "timezone": "Mars/Olympus"}).status_code == 400
+
+    user = register_user(timezone=WEST)
+    assert user.user["timezone"] == WEST
+    headers = user.headers
+    client.post("/api/v1/health/water", headers=headers, json={"water_intake": 1.0})
+    assert client.get("/api/v1/stats", headers=headers).json()["todays_xp"] > 0
+
+    # The water was logged on the western day; the eastern user's today is empty
+    updated = client.patch("/api/v1/auth/me", headers=headers, json={"timezone": EAST})
+    assert updated.status_code == 200
+    assert client.get("/api/v1/auth/me", headers=headers).json()["user"]["timezone"] == EAST
+    assert client.get("/api/v1/stats", headers=headers).json()["todays_xp"] == 0
+    assert client.patch("/api/v1/auth/me", headers=headers, json={"timezone": ""}).status_code == 400
@@ -0,0 +1,173 @@
+import dataclasses
+import io
+import json
+from datetime import datetime, timedelta
+from db import crud
+from db.database import get_db_session
+from db.models import CodeLog, HealthLog, MoodLog, XPEvent, Level
+from scheduler import xp_backfill
+from tools import xp_rules
+
+DAY = datetime(2024, 3, 5)
+
+
+def _at(hour, minute=0, second=0):
+    return DAY + timedelta(hours=hour, minutes=minute, seconds=second)
+
+
+def _seed_history(user_id):
+    """A day of logs, each with the award it got under older rules."""
+    db = get_db_session()
+    try:
+        # SQLite reuses the ids of users other tests deleted; start from a clean slate
+        for model in (CodeLog, HealthLog, MoodLog, XPEvent, Level):
+            db.query(model).filter(model.user_id == user_id).delete()
+        snapshots = [  # cumulative rows: (hour, meals, water, sleep, exercise)
+            (8, "oats and banana", 0.0, 0.0, 0),
+            (9, "oats and banana", 1.0, 0.0, 0),
+            (10, "oats and banana", 1.0, 8.0, 0),
+            (13, "oats and banana, grilled salmon with a big green salad", 1.0, 8.0, 0),
+        ]
+        for hour, meals, water, sleep, exercise in snapshots:
+            db.add(HealthLog(user_id=user_id, meals=meals, water_intake_liter=water, sleep_hours=sleep,
+                             exercise_minutes=exercise, date=_at(hour)))
+        db.add(MoodLog(user_id=user_id, mood_text="calm and focused", sentiment=0.5, timestamp=_at(11)))
+        db.add(CodeLog(user_id=user_id, lines_added=100, lines_removed=0, total_time_minutes=60, date=_at(12)))
+
+        events = {
+            "meal": XPEvent(user_id=user_id, xp_type="health_meal", amount=5, timestamp=_at(8, second=1)),
+            "water": XPEvent(user_id=user_id, xp_type="health_water", amount=4, timestamp=_at(9, second=1)),
+            "sleep": XPEvent(user_id=user_id, xp_type="health_sleep", amount=20, timestamp=_at(10, second=1)),
+            "mood": XPEvent(user_id=user_id, xp_type="mood", amount=3, timestamp=_at(11, second=2)),
+            "code": XPEvent(user_id=user_id, xp_type="code", amount=7, timestamp=_at(12, second=1)),
+            "lunch": XPEvent(user_id=user_id, xp_type="health_meal", amount=5, timestamp=_at(13, second=1)),
+            "mood_daily": XPEvent(user_id=user_id, xp_type="mood", amount=17, timestamp=_at(23, 50)),  # LLM-scored
+            "health_daily": XPEvent(user_id=user_id, xp_type="health", amount=0, timestamp=_at(23, 55)),
+            "orphan": XPEvent(user_id=user_id, xp_type="health_water", amount=6, timestamp=_at(15)),
+        }
+        db.add_all(events.values())
+        db.add(Level(user_id=user_id, current_level=1, total_xp=sum(event.amount for event in events.values())))
+        db.commit()
+        return {name: event.id for name, event in events.items()}
+    finally:
+        db.close()
+
+
+def _amounts(ids):
+    db = get_db_session()
+    try:
+        by_id = {event.id: event.amount for event in db.query(XPEvent).filter(XPEvent.id.in_(ids.values()))}
+        return {name: by_id[event_id] for name, event_id in ids.items()}
+    finally:
+        db.close()
+
+
+def _total_xp(user_id):
+    db = get_db_session()
+    try:
+        return db.query(Level.total_xp).filter(Level.user_id == user_id).scalar()
+    finally:
+        db.close()
+
+
+def test_health_snapshots_are_split_back_into_the_actions_that_wrote_them():
+    rows = [HealthLog(meals="toast", water_intake_liter=0.0, sleep_hours=0.0, exercise_minutes=0, date=_at(8)),
+            HealthLog(meals="toast", water_intake_liter=0.0, sleep_hours=0.0, exercise_minutes=40, date=_at(9)),
+            HealthLog(meals="toast, soup", water_intake_liter=0.0, sleep_hours=0.0, exercise_minutes=40, date=_at(12))]
+    for row in rows:
+        row.local_day = DAY.date()
+    awards = list(xp_backfill._health_awards(rows, timedelta(seconds=60)))
+    assert [(a.xp_type, a.metrics.get("description") or a.metrics.get("exercise_minutes")) for a in awards[:3]] == [
+        ("health_meal", "toast"), ("health_exercise", 40), ("health_meal", "soup")]
+    assert awards[3].xp_type == "health" and awards[3].until == _at(12) + timedelta(days=2)
+
+
+def test_health_days_follow_the_users_local_day():
+    # Written 20:00 and 23:00 server time, but the second row is already the next day where the user is
+    rows = [HealthLog(meals="", water_intake_liter=1.0, sleep_hours=0.0, exercise_minutes=0, date=_at(20)),
+            HealthLog(meals="", water_intake_liter=0.5, sleep_hours=0.0, exercise_minutes=0, date=_at(23))]
+    rows[0].local_day, rows[1].local_day = DAY.date(), DAY.date() + timedelta(days=1)
+    awards = list(xp_backfill._health_awards(rows, timedelta(seconds=60)))
+    # Each row starts its own day, so the second is a fresh 0.5L rather than nothing new
+    assert [(a.xp_type, a.metrics.get("water_intake_liters")) for a in awards] == [
+        ("health_water", 1.0), ("health", 1.0), ("health_water", 0.5), ("health", 0.5)]
+
+
+def test_backfill_rescores_rule_based_awards_and_moves_the_level(user_id):
+    ids = _seed_history(user_id)
+    before = _amounts(ids)
+    total_before = _total_xp(user_id)
+
+    totals = xp_backfill.backfill_chunk(user_id, user_id)
+
+    after = _amounts(ids)
+    expected = {
+        "meal": xp_rules.evaluate("health_meal", {"description": "oats and banana", "meal_score": 0.75})["xp"],
+        "mood": xp_rules.evaluate("mood", {"sentiment_score": 0.5, "mood_text": "calm and focused"})["xp"],
+    }
+    assert after["meal"] == expected["meal"] != before["meal"]
+    assert after["mood"] == expected["mood"] != before["mood"]
+    assert after["lunch"] > before["lunch"]
+    assert after["health_daily"] > 0
+    # Already correct, LLM-scored, or not accounted for by any log: untouched
+    for name in ("water", "sleep", "code", "mood_daily", "orphan"):
+        assert after[name] == before[name]
+    assert totals["changed"] == 4
+    assert _total_xp(user_id) == total_before + totals["xp_delta"] == total_before + sum(after.values()) - sum(before.values())
+
+    # Re-scoring corrected history changes nothing
+    assert xp_backfill.backfill_chunk(user_id, user_id)["changed"] == 0
+
+
+def test_dry_run_reports_a_what_if_diff_without_writing(user_id):
+    ids = _seed_history(user_id)
+    before = _amounts(ids)
+    rules = dict(xp_rules.RULES, mood=dataclasses.replace(xp_rules.RULES["mood"], terms=(xp_rules.Const(1),), cap=None))
+    out = io.StringIO()
+
+    xp_backfill.run_xp_backfill(dry_run=True, rules=rules, workers=2, chunk_size=3, diff_out=out)
+
+    diff = [json.loads(line) for line in out.getvalue().splitlines()]
+    mine = {change["event_id"]: change for change in diff if change["user_id"] == user_id}
+    assert mine[ids["mood"]]["old"] == 3 and mine[ids["mood"]]["new"] == 1
+    assert ids["mood_daily"] not in mine
+    assert _amounts(ids) == before
+
+
+def test_backfill_resumes_after_its_checkpoint(user_id):
+    ids = _seed_history(user_id)
+    # A crashed run under this key had already finished every chunk up to this user
+    db = get_db_session()
+    try:
+        crud.save_scheduler_checkpoint(db, job=xp_backfill.JOB_NAME, run_key="test-resume", last_user_id=user_id)
+    finally:
+        db.close()
+
+    resumed = xp_backfill.run_xp_backfill(run_key="test-resume", workers=2, chunk_size=3)
+    assert resumed["failed_chunks"] == 0
+    assert _amounts(ids)["mood"] == 3
+
+    # The finished run cleared its checkpoint, so the next one starts over
+    assert xp_backfill.run_xp_backfill(run_key="test-resume", workers=2, chunk_size=3)["chunks"] >= 1
+    assert _amounts(ids)["mood"] != 3
+
+
+def test_running_again_with_the_same_rules_picks_up_new_history(user_id):
+    _seed_history(user_id)
+    first = xp_backfill.run_xp_backfill(workers=2, chunk_size=3)
+    assert first["chunks"] >= 1 and first["failed_chunks"] == 0
+
+    db = get_db_session()
+    try:
+        log = MoodLog(user_id=user_id, mood_text="a quiet evening", sentiment=0.9, timestamp=_at(20))
+        event = XPEvent(user_id=user_id, xp_type="mood", amount=1, timestamp=_at(20, second=1))
+        db.add_all([log, event])
+        db.commit()
+        event_id = event.id
+    finally:
+        db.close()
+
+    second = xp_backfill.run_xp_backfill(workers=2, chunk_size=3)
+    assert second["chunks"] >= 1 and second["changed"] >= 1
+    assert _amounts({"late": event_id})["late"] == xp_rules.evaluate(
+        "mood", {"sentiment_score": 0.9, "mood_text": "a quiet evening"})["xp"]
@@ -0,0 +1,56 @@
+import dataclasses
+import numpy as np
+import pytest
+from tools import xp_rules
+from tools.xp_calculator import calculateXp
+
+_COLUMNS = {
+    "health_meal": {"description_length": (0, 80), "meal_score": (-1, 1)},
+    "health_water": {"water_intake_liters": (0, 3), "total_water_today": (0, 4)},
+    "health_sleep": {"sleep_hours": (0, 11)},
+    "health_exercise": {"exercise_minutes": (0, 120)},
+    "health": {"sleep_hours": (0, 11), "water_intake_liters": (0, 4), "exercise_minutes": (0, 120), "meal_score": (-1, 1)},
+    "mood": {"sentiment_score": (-1, 1), "mood_text_length": (0, 80)},
+    "code": {"lines_added": (0, 3000), "lines_removed": (0, 1000), "total_time_minutes": (0, 400)},
+}
+
+
+@pytest.mark.parametrize("xp_type", sorted(xp_rules.RULES))
+def test_vectorized_scores_match_the_scalar_path(xp_type):
+    rng = np.random.default_rng(7)
+    columns = {field: np.round(rng.uniform(low, high, 2000), 2) for field, (low, high) in _COLUMNS[xp_type].items()}
+    scores = xp_rules.score_columns(xp_type, columns)
+    for i in range(len(scores)):
+        row = {field: float(values[i]) for field, values in columns.items()}
+        assert scores[i] == xp_rules.evaluate(xp_type, row)["xp"], row
+
+
+@pytest.mark.parametrize("event_type, metrics, xp", [
+    ("health", {"activity_type": "sleep", "sleep_hours": 8}, 20),
+    ("health", {"activity_type": "sleep", "sleep_hours": 10}, 15),
+    ("health", {"activity_type": "water", "water_intake_liters": 0.5, "total_water_today": 2.0}, 4),
+    ("health", {"activity_type": "exercise", "exercise_minutes": 45}, 20),
+    ("health", {"activity_type": "meal", "description": "toast", "meal_score": 1.0}, 12),
+    ("health", {"activity_type": "yoga"}, 5),
+    ("health", {"sleep_hours": 7.5, "water_intake_liters": 2, "exercise_minutes": 10, "meal_score": 0.2}, 19),
+    ("mood", {"sentiment_score": 0.8, "mood_text": "a long and thoughtful reflection on the day"}, 17),
+    ("mood", {"sentiment_score": -0.6, "mood_text": "rough"}, 6),
+    ("coding", {"lines_added": 400, "lines_removed": 100, "total_time_minutes": 150}, 30),
+])
+def test_rule_table_reproduces_the_live_awards(event_type, metrics, xp):
+    assert calculateXp(event_type, metrics)["xp"] == xp
+
+
+def test_details_follow_the_matching_tier():
+    assert xp_rules.evaluate("health_sleep", {"sleep_hours": 5})["details"].startswith("😴 Some rest! +10 XP")
+    assert "Overall health score: 6.2/10" in xp_rules.evaluate("health", {"sleep_hours": 8, "water_intake_liters": 3})["details"]
+
+
+def test_what_if_over_history_with_a_changed_table():
+    minutes = np.array([10, 45, 90, 200])
+    rules = dict(xp_rules.RULES)
+    rules["health_exercise"] = dataclasses.replace(
+        rules["health_exercise"], terms=(xp_rules.Tiers("exercise_minutes", ((90, None, 30), (30, None, 20)), default=5),))
+
+    assert xp_rules.score_columns("health_exercise", {"exercise_minutes": minutes}).tolist() == [10, 20, 25, 25]
+    assert xp_rules.score_columns("health_exercise", {"exercise_minutes": minutes}, rules=rules).tolist() == [5, 20, 30, 30]
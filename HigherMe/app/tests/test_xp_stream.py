@@ -0,0 +1,51 @@
+import asyncio
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from api.main import app
+from tools import pubsub
+
+client = TestClient(app)
+
+
+def test_awards_are_pushed_to_the_connected_user(registered_user):
+    token, headers = registered_user.token, registered_user.headers
+    with client.websocket_connect("/api/v1/ws/xp") as socket:
+        socket.send_json({"token": token})
+        snapshot = socket.receive_json()
+        assert snapshot == {"type": "stats", **client.get("/api/v1/stats", headers=headers).json()}
+
+        client.post("/api/v1/health/water", headers=headers, json={"water_intake": 1.0})
+        update = socket.receive_json()
+        assert update["type"] == "xp" and update["xp_type"] == "health_water"
+        assert update["xp_delta"] > 0 and update["total_xp"] == snapshot["total_xp"] + update["xp_delta"]
+        stats = client.get("/api/v1/stats", headers=headers).json()
+        assert (update["total_xp"], update["current_level"]) == (stats["total_xp"], stats["current_level"])
+
+    assert pubsub.broker.subscriber_count() == 0
+
+
+def test_connections_without_a_valid_token_are_closed():
+    with client.websocket_connect("/api/v1/ws/xp") as socket:
+        socket.send_json({"token": "not-a-token"})
+        with pytest.raises(WebSocketDisconnect) as closed:
+            socket.receive_json()
+    assert closed.value.code == 1008
+
+
+def test_a_slow_subscriber_keeps_the_newest_messages():
+    async def scenario():
+        broker = pubsub.LocalBroker()
+        subscription = broker.subscribe("xp:1")
+        for amount in range(pubsub.SUBSCRIPTION_QUEUE_SIZE + 5):
+            broker.publish("xp:1", {"xp_delta": amount})
+        broker.publish("xp:2", {"xp_delta": -1})
+        await asyncio.sleep(0)
+        first = await subscription.get()
+        subscription.close()
+        return first, subscription.queue.qsize(), broker.subscriber_count()
+
+    first, remaining, subscribers = asyncio.run(scenario())
+    assert first == {"xp_delta": 5}
+    assert remaining == pubsub.SUBSCRIPTION_QUEUE_SIZE - 1
+    assert subscribers == 0
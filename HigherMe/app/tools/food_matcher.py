@@ -0,0 +1,182 @@
+"""
+Rule-based meal scoring from a bundled nutrition knowledge base.
+
+tools/data/nutrition.tsv lists over a thousand foods, dishes and drinks
+with a healthiness weight in [-1, 1], plus cooking methods and descriptors
+("grilled", "deep fried", "sugar free") under [modifiers]. Plurals are
+added at load time. All terms are compiled once into an Aho-Corasick
+automaton, so a meal description is matched in a single pass over its
+characters, however many terms there are.
+
+Matches must sit on word boundaries; where they overlap, the leftmost and
+then longest wins ("sugar free" over "sugar", "fried rice" over "rice").
+A modifier shifts the next food in the same comma-separated clause, so
+"grilled salmon" scores above "salmon" and "fried fish, salad" only
+penalises the fish. A meal's score is the mean of its food scores.
+
+score_meal() returns None when nothing in the text is recognised, so a
+caller can tell "unknown food" apart from "neutral food".
+"""
+import functools
+import os
+import re
+from collections import deque
+from typing import NamedTuple, Optional
+
+NUTRITION_PATH = os.path.join(os.path.dirname(__file__), "data", "nutrition.tsv")
+
+_SEPARATORS = re.compile(r"[,;.+/\n]+")
+_NON_WORD = re.compile(r"[^a-z0-9&]+")
+
+
+class Match(NamedTuple):
+    term: str
+    start: int
+    end: int
+    weight: float
+    modifier: bool
+
+
+def normalize(text: str) -> str:
+    """Lowercase words separated by single spaces, with clause breaks kept as ' , '."""
+    clauses = (_NON_WORD.sub(" ", clause).strip() for clause in _SEPARATORS.split(text.lower()))
+    return " , ".join(clause for clause in clauses if clause)
+
+
+def _plurals(term: str):
+    if term.endswith("s") or term[-1].isdigit():
+        return
+    if term.endswith("y") and term[-2:-1] not in ("a", "e", "i", "o", "u"):
+        yield term[:-1] + "ies"
+    elif term.endswith(("ch", "sh", "x", "o")):
+        yield term + "es"
+    yield term + "s"
+
+
+class FoodMatcher:
+    def __init__(self, foods: dict, modifiers: dict = None):
+        self._patterns = []
+        self._terminal = {}
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        for terms, modifier in ((foods, False), ((modifiers or {}), True)):
+            for term, weight in terms.items():
+                self._add(term, weight, modifier)
+        self._build_links()
+
+    def __len__(self):
+        return len(self._patterns)
+
+    def _add(self, term: str, weight: float, modifier: bool):
+        node = 0
+        for char in term:
+            nxt = self._goto[node].get(char)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[node][char] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            node = nxt
+        if node in self._terminal:
+            self._patterns[self._terminal[node]] = (term, weight, modifier)
+        else:
+            self._terminal[node] = len(self._patterns)
+            self._out[node].append(len(self._patterns))
+            self._patterns.append((term, weight, modifier))
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                self._out[child] = self._out[child] + self._out[self._fail[child]]
+                queue.append(child)
+
+    def find(self, text: str) -> list:
+        """Non-overlapping whole-word matches in `text`, left to right, as offsets into normalize(text)."""
+        return self._find(normalize(text))
+
+    def _find(self, text: str) -> list:
+        found = []
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self._goto[node]:
+                node = self._fail[node]
+            node = self._goto[node].get(char, 0)
+            if not self._out[node] or (i + 1 < len(text) and text[i + 1] != " "):
+                continue
+            for index in self._out[node]:
+                term, weight, modifier = self._patterns[index]
+                start = i + 1 - len(term)
+                if start == 0 or text[start - 1] == " ":
+                    found.append(Match(term, start, i + 1, weight, modifier))
+
+        # Leftmost, then longest, wins among overlapping matches
+        found.sort(key=lambda m: (m.start, -m.end))
+        matches, end = [], 0
+        for match in found:
+            if match.start >= end:
+                matches.append(match)
+                end = match.end
+        return matches
+
+    def score(self, text: str) -> Optional[float]:
+        """Healthiness in [-1, 1] of the foods in `text`, or None if none are recognised."""
+        text = normalize(text)
+        scores, shift, last_end = [], 0.0, 0
+        for match in self._find(text):
+            if "," in text[last_end:match.start]:
+                shift = 0.0  # a modifier doesn't carry past the end of its clause
+            last_end = match.end
+            if match.modifier:
+                shift += match.weight
+            else:
+                scores.append(max(-1.0, min(1.0, match.weight + shift)))
+                shift = 0.0
+        if not scores:
+            return None
+        return round(sum(scores) / len(scores), 3)
+
+
+def load(path: str = NUTRITION_PATH) -> FoodMatcher:
+    """Build a matcher from a `term<TAB>weight` file; terms after [modifiers] are modifiers."""
+    foods, modifiers = {}, {}
+    section = foods
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line == "[modifiers]":
+                section = modifiers
+                continue
+            term, weight = line.split("\t")
+            term = normalize(term)
+            section[term] = float(weight)
+            if section is foods:
+                for plural in _plurals(term):
+                    foods.setdefault(plural, float(weight))
+    return FoodMatcher(foods, modifiers)
+
+
+@functools.lru_cache(maxsize=1)
+def matcher() -> FoodMatcher:
+    """The shared matcher for the bundled knowledge base, built on first use."""
+    return load()
+
+
+def score_meal(text: str) -> Optional[float]:
+    """Healthiness in [-1, 1] of a meal description, or None if no food is recognised."""
+    return matcher().score(text or "")
+
+
+def meal_score(text: str) -> float:
+    """Healthiness in [-1, 1] of a meal description; 0.0 (neutral) if no food is recognised."""
+    score = score_meal(text)
+    return 0.0 if score is None else score
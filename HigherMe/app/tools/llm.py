@@ -0,0 +1,148 @@
+"""
+Shared LLM client for the agents and the XP calculator.
+
+Every module used to build its own ChatGroq with identical settings. They now
+call `create_llm(__name__)` and pass a short `kind` label on each invoke,
+which is what the latency metrics are broken down by.
+
+LLM_BASE_URL points every client at another Groq-compatible endpoint, e.g.
+the fake server in benchmarks/fake_llm.py. With a cassette active (see
+tools/llm_cassette.py) calls are recorded or replayed instead.
+
+Calls made inside a user's LLM scope (tools/llm_budget.py) are charged to the
+user's daily token budget. They are refused with LLMUnavailable when the user
+is rate limited or over budget. A refused summary is answered with the last
+summary of the same kind generated for that user on their current day, when
+there is one; an earlier day's summary would describe the wrong day.
+
+The size of every prompt is reported to llm_prompt_tokens; the summary
+prompts are kept within a budget by tools/prompt_budget.py.
+
+Inside a latency budget (tools/llm_deadline.py) a call gets the time left
+as its timeout and raises DeadlineExceeded when it runs out, so the
+caller's fallback answers in time. Slow calls can also be hedged.
+
+Calls queue for a slot first, by priority lane and fairly across users
+(tools/llm_queue.py).
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+from langchain_core.messages import AIMessage
+from langchain_groq import ChatGroq
+from observability.metrics import LLM_REQUEST_SECONDS, LLM_DENIED, LLM_PROMPT_TOKENS
+from tools import llm_budget, llm_cassette, llm_deadline, llm_queue
+from tools.prompt_budget import count_tokens
+
+load_dotenv()
+
+DEFAULT_MODEL = "llama-3.1-8b-instant"
+LLM_BASE_URL = os.getenv("LLM_BASE_URL") or None
+# Per-attempt HTTP timeout for calls without a latency budget (the scheduler)
+LLM_TIMEOUT_SECONDS = float(os.getenv("LLM_TIMEOUT_SECONDS", "30"))
+
+# Prose kinds whose last answer per user may stand in when a call is refused
+SUMMARY_KINDS = {
+    "mood_summary",
+    "mood_summary_from_xp",
+    "mood_summary_from_entries",
+    "health_summary",
+    "health_summary_from_xp",
+    "overall_summary",
+}
+SUMMARY_CACHE_SIZE = 50000
+
+_summaries = OrderedDict()
+_summaries_lock = threading.Lock()
+
+
+def _remember_summary(user_id: int, kind: str, content: str):
+    key = (user_id, llm_budget.budget.today(user_id), kind)
+    with _summaries_lock:
+        _summaries[key] = content
+        _summaries.move_to_end(key)
+        if len(_summaries) > SUMMARY_CACHE_SIZE:
+            _summaries.popitem(last=False)
+
+
+def _cached_summary(user_id: int, kind: str):
+    with _summaries_lock:
+        return _summaries.get((user_id, llm_budget.budget.today(user_id), kind))
+
+
+class LLMClient:
+    """Thin wrapper around ChatGroq that records latency per calling module and prompt kind."""
+
+    def __init__(self, module: str, model: str = DEFAULT_MODEL, temperature: float = 0.0, max_retries: int = 2,
+                 max_tokens: int = None):
+        self.module = module
+        self.model = model
+        self._llm = ChatGroq(
+            model=model,
+            temperature=temperature,
+            max_retries=max_retries,
+            max_tokens=max_tokens,
+            timeout=LLM_TIMEOUT_SECONDS,
+            base_url=LLM_BASE_URL,
+        )
+
+    def invoke(self, prompt: str, *, kind: str = "generic", json_mode: bool = False):
+        """`json_mode` asks Groq for a JSON object (the prompt must mention JSON); see tools/structured_output.py."""
+        LLM_PROMPT_TOKENS.observe(count_tokens(prompt), kind=kind)
+        scope = llm_budget.current_scope()
+        if scope is not None:
+            reason = llm_budget.denial_reason()
+            if reason is not None:
+                LLM_DENIED.inc(reason=reason, kind=kind)
+                cached = _cached_summary(scope.user_id, kind) if kind in SUMMARY_KINDS else None
+                if cached is not None:
+                    return AIMessage(content=cached)
+                raise llm_budget.LLMUnavailable(reason)
+
+        if scope is None:
+            lane, user_id = "batch", None
+        else:
+            lane, user_id = scope.lane, scope.user_id
+        with llm_queue.slot(lane, user_id, kind=kind) as lease:
+            response = self._call(prompt, kind, json_mode, lease)
+        if scope is not None:
+            llm_budget.record_usage(response, prompt)
+            if kind in SUMMARY_KINDS and response.content:
+                _remember_summary(scope.user_id, kind, response.content)
+        return response
+
+    def _call(self, prompt: str, kind: str, json_mode: bool = False, lease=None):
+        cassette = llm_cassette.active_cassette()
+        if cassette is not None and cassette.mode == "replay":
+            return AIMessage(content=cassette.play(self.model, prompt, kind))
+        if llm_deadline.needs_race():
+            return llm_deadline.call(lambda timeout: self._request(prompt, kind, cassette, timeout, json_mode),
+                                     kind=kind, lease=lease)
+        return self._request(prompt, kind, cassette, json_mode=json_mode)
+
+    def _request(self, prompt: str, kind: str, cassette, timeout: float = None, json_mode: bool = False):
+        start = time.perf_counter()
+        outcome = "error"
+        try:
+            options = {}
+            if timeout is not None:
+                options["timeout"] = timeout
+            if json_mode:
+                options["response_format"] = {"type": "json_object"}
+            response = self._llm.invoke(prompt, **options)
+            outcome = "ok"
+            if cassette is not None:
+                cassette.record(self.model, prompt, kind, response.content)
+            return response
+        finally:
+            elapsed = time.perf_counter() - start
+            LLM_REQUEST_SECONDS.observe(elapsed, module=self.module, kind=kind, outcome=outcome)
+            if outcome == "ok":
+                llm_deadline.latencies.observe(kind, elapsed)
+
+
+def create_llm(module: str, **kwargs) -> LLMClient:
+    """Build the LLM client for a module (pass `__name__`)."""
+    return LLMClient(module, **kwargs)
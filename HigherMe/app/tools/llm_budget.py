@@ -0,0 +1,270 @@
+"""
+Per-user gating of LLM calls: rate-limit decisions and a daily token budget.
+
+Code that spends LLM calls on behalf of a user runs inside `llm_scope(user_id)`.
+The API's rate-limit dependency opens one per request with `set_scope`, and
+the scheduler opens one per user. Inside a scope, `LLMClient.invoke` first asks
+`denial_reason()` whether the call may go ahead. A denied call raises
+LLMUnavailable, and the caller's existing fallback takes over: rule-based XP
+or a canned or cached summary. A denied request therefore degrades instead
+of failing. Calls outside any scope are not limited.
+
+Spend is taken from the usage metadata on each response, or estimated from
+text length when that is missing. The day is the user's own (their
+User.timezone, re-read every LLM_BUDGET_REFRESH_SECONDS), so the budget
+resets at their midnight rather than the server's. It accumulates in memory and is flushed
+to the llm_usage table every LLM_BUDGET_FLUSH_SECONDS by a background
+thread, so no LLM call waits on a write. Each process re-reads the
+per-user total every LLM_BUDGET_REFRESH_SECONDS, so processes sharing a
+database converge on one budget.
+
+Configuration (environment):
+    LLM_DAILY_TOKEN_BUDGET      tokens per user per day; 0 disables the budget (50000)
+    LLM_BUDGET_FLUSH_SECONDS    (5)
+    LLM_BUDGET_REFRESH_SECONDS  (60)
+"""
+import atexit
+import os
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date, timedelta
+from dotenv import load_dotenv
+from observability.logger import get_logger
+from tools.timezones import local_day
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+LLM_DAILY_TOKEN_BUDGET = int(os.getenv("LLM_DAILY_TOKEN_BUDGET", "50000"))
+LLM_BUDGET_FLUSH_SECONDS = float(os.getenv("LLM_BUDGET_FLUSH_SECONDS", "5"))
+LLM_BUDGET_REFRESH_SECONDS = float(os.getenv("LLM_BUDGET_REFRESH_SECONDS", "60"))
+
+
+class LLMUnavailable(RuntimeError):
+    """An LLM call was refused for this user (rate limited or over budget)."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"LLM unavailable: {reason}")
+        self.reason = reason
+
+
+class LLMScope:
+    """
+    Who LLM calls in the current context are for, and in which priority lane
+    they queue (tools/llm_queue.py). `rate_check` is consulted at most once,
+    on the first call, so requests that never reach the LLM (cache hits,
+    304s) don't use up the user's rate limit.
+    """
+    __slots__ = ("user_id", "lane", "_rate_check", "_rate_limited")
+
+    def __init__(self, user_id: int, rate_check=None, lane: str = "batch"):
+        self.user_id = user_id
+        self.lane = lane
+        self._rate_check = rate_check
+        self._rate_limited = None
+
+    @property
+    def rate_limited(self) -> bool:
+        if self._rate_check is None:
+            return False
+        if self._rate_limited is None:
+            self._rate_limited = not self._rate_check()
+        return self._rate_limited
+
+
+_scope = ContextVar("llm_scope", default=None)
+
+
+def current_scope():
+    return _scope.get()
+
+
+@contextmanager
+def llm_scope(user_id: int, rate_check=None, lane: str = "batch"):
+    """Attribute LLM calls in the block to `user_id`."""
+    token = _scope.set(LLMScope(user_id, rate_check, lane))
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def set_scope(user_id: int, rate_check=None, lane: str = "batch"):
+    """Open a scope for the rest of the current context, e.g. one request's task."""
+    _scope.set(LLMScope(user_id, rate_check, lane))
+
+
+class _Usage:
+    __slots__ = ("base", "local", "loaded_at")
+
+    def __init__(self, base: int, local: int, loaded_at: float):
+        self.base = base
+        self.local = local
+        self.loaded_at = loaded_at
+
+
+class DailyTokenBudget:
+    """Tokens spent per (user, day), read through from and flushed to the llm_usage table."""
+
+    def __init__(self, limit: int = LLM_DAILY_TOKEN_BUDGET, flush_seconds: float = LLM_BUDGET_FLUSH_SECONDS,
+                 refresh_seconds: float = LLM_BUDGET_REFRESH_SECONDS):
+        self.limit = limit
+        self.flush_seconds = flush_seconds
+        self.refresh_seconds = refresh_seconds
+        self._usage = {}
+        self._pending = {}
+        self._timezones = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def _load(self, user_id: int, day) -> int:
+        from db import crud
+        from db.database import get_db_session
+        db = get_db_session()
+        try:
+            return crud.get_llm_usage(db, user_id=user_id, day=day)
+        except Exception as e:
+            logger.warning("Could not read LLM usage for user %s: %s", user_id, e)
+            return 0
+        finally:
+            db.close()
+
+    def _timezone(self, user_id: int) -> str:
+        now = time.monotonic()
+        with self._lock:
+            cached = self._timezones.get(user_id)
+            if cached is not None and now - cached[1] < self.refresh_seconds:
+                return cached[0]
+        from db import crud
+        from db.database import get_db_session
+        db = get_db_session()
+        try:
+            timezone = crud.get_user_timezone(db, user_id=user_id)
+        except Exception as e:
+            logger.warning("Could not read the timezone of user %s: %s", user_id, e)
+            timezone = None
+        finally:
+            db.close()
+        with self._lock:
+            if len(self._timezones) > 100000:
+                self._timezones.clear()
+            self._timezones[user_id] = (timezone, now)
+        return timezone
+
+    def today(self, user_id: int) -> date:
+        """The user's current day, the one their spend is charged to."""
+        return local_day(self._timezone(user_id))
+
+    def used(self, user_id: int, day=None) -> int:
+        day = day or self.today(user_id)
+        key = (user_id, day)
+        now = time.monotonic()
+        with self._lock:
+            usage = self._usage.get(key)
+            if usage is not None and now - usage.loaded_at < self.refresh_seconds:
+                return usage.base + usage.local
+        base = self._load(user_id, day)
+        with self._lock:
+            # Flushed spend is in `base` now; only what's still unflushed stays local
+            pending_tokens = self._pending.get(key, (0, 0))[0]
+            self._usage[key] = _Usage(base, pending_tokens, now)
+            if len(self._usage) > 100000:
+                self._drop_old_days(day)
+            return base + pending_tokens
+
+    def exhausted(self, user_id: int) -> bool:
+        return self.limit > 0 and self.used(user_id) >= self.limit
+
+    def charge(self, user_id: int, tokens: int):
+        key = (user_id, self.today(user_id))
+        with self._lock:
+            usage = self._usage.get(key)
+            if usage is not None:
+                usage.local += tokens
+            pending_tokens, pending_calls = self._pending.get(key, (0, 0))
+            self._pending[key] = (pending_tokens + tokens, pending_calls + 1)
+        self._ensure_flusher()
+
+    def flush(self) -> bool:
+        """Write accumulated spend to the database. Failed writes are kept for the next flush."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return True
+        from db import crud
+        from db.database import get_db_session
+        db = get_db_session()
+        try:
+            ok = crud.add_llm_usage(db, usage=pending)
+        finally:
+            db.close()
+        if not ok:
+            with self._lock:
+                for key, (tokens, calls) in pending.items():
+                    old_tokens, old_calls = self._pending.get(key, (0, 0))
+                    self._pending[key] = (old_tokens + tokens, old_calls + calls)
+        return ok
+
+    def _drop_old_days(self, today):
+        # Users' days span up to two dates at once, depending on their timezone
+        for key in [key for key in self._usage if key[1] < today - timedelta(days=1)]:
+            del self._usage[key]
+
+    def _ensure_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_loop, name="llm-budget-flush", daemon=True)
+            self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_seconds)
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("LLM usage flush failed: %s", e)
+
+    def reset(self):
+        with self._lock:
+            self._usage.clear()
+            self._pending.clear()
+            self._timezones.clear()
+
+
+budget = DailyTokenBudget()
+atexit.register(lambda: budget.flush())
+
+
+def denial_reason():
+    """Why an LLM call in the current scope must not happen, or None if it may."""
+    scope = _scope.get()
+    if scope is None:
+        return None
+    if scope.rate_limited:
+        return "rate_limited"
+    if budget.exhausted(scope.user_id):
+        return "over_budget"
+    return None
+
+
+def response_tokens(response, prompt: str) -> int:
+    """Total tokens of a call, from the response's usage metadata, else estimated (~4 chars/token)."""
+    usage = getattr(response, "usage_metadata", None) or {}
+    total = usage.get("total_tokens")
+    if total is None:
+        total = (getattr(response, "response_metadata", None) or {}).get("token_usage", {}).get("total_tokens")
+    if total is None:
+        total = (len(prompt) + len(str(getattr(response, "content", "")))) // 4 + 1
+    return int(total)
+
+
+def record_usage(response, prompt: str):
+    scope = _scope.get()
+    if scope is not None:
+        budget.charge(scope.user_id, response_tokens(response, prompt))
@@ -0,0 +1,117 @@
+"""
+Record/replay of LLM calls, so the agent tests run offline and deterministically.
+
+Configuration (environment):
+    LLM_CASSETTE_MODE  "off" (default), "record" or "replay"
+    LLM_CASSETTE       path of the cassette file, zstd-compressed JSON
+
+In record mode every call still goes to the model, and each prompt→response
+pair is written to the cassette. In replay mode answers come only from the
+cassette, and a prompt that isn't in it raises CassetteMiss. The agents
+turn LLM errors into fallbacks, so a miss would otherwise pass silently.
+Every miss is therefore also kept on `cassette.misses`, and the test
+fixtures fail on any.
+
+Entries are keyed by sha256(model + prompt), so any change to a prompt
+template shows up as a miss and the cassette needs re-recording.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from contextlib import contextmanager
+import zstandard
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_CASSETTE_MODE = os.getenv("LLM_CASSETTE_MODE", "off").lower()
+LLM_CASSETTE = os.getenv("LLM_CASSETTE", "")
+
+MODES = ("record", "replay")
+FORMAT_VERSION = 1
+
+
+class CassetteMiss(LookupError):
+    """A replayed prompt has no recorded response."""
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str):
+        if mode not in MODES:
+            raise ValueError(f"cassette mode must be one of {MODES}, got {mode!r}")
+        self.path = path
+        self.mode = mode
+        self.misses = []
+        self._entries = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            self._entries = self._load(path)
+        elif mode == "replay":
+            raise FileNotFoundError(f"no cassette at {path}; record one with LLM_CASSETTE_MODE=record")
+
+    @staticmethod
+    def key(model: str, prompt: str) -> str:
+        return hashlib.sha256(f"{model}\n{prompt}".encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _load(path: str) -> dict:
+        with open(path, "rb") as f:
+            payload = json.loads(zstandard.ZstdDecompressor().decompress(f.read()))
+        if payload.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported cassette version {payload.get('version')!r} in {path}")
+        return payload["entries"]
+
+    def _save(self):
+        payload = json.dumps({"version": FORMAT_VERSION, "entries": self._entries},
+                             sort_keys=True, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(zstandard.ZstdCompressor(level=19).compress(payload))
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def play(self, model: str, prompt: str, kind: str) -> str:
+        entry = self._entries.get(self.key(model, prompt))
+        if entry is None:
+            with self._lock:
+                self.misses.append({"kind": kind, "prompt": prompt})
+            raise CassetteMiss(f"no recorded {kind!r} response for this prompt in {self.path}")
+        return entry["content"]
+
+    def record(self, model: str, prompt: str, kind: str, content: str):
+        key = self.key(model, prompt)
+        with self._lock:
+            if self._entries.get(key, {}).get("content") == content:
+                return
+            self._entries[key] = {"kind": kind, "content": content}
+            self._save()
+
+
+_active = None
+
+
+def active_cassette():
+    return _active
+
+
+@contextmanager
+def use_cassette(path: str, mode: str):
+    """Route every LLM client through the cassette at `path` for the `with` block."""
+    global _active
+    previous = _active
+    _active = Cassette(path, mode)
+    try:
+        yield _active
+    finally:
+        _active = previous
+
+
+if LLM_CASSETTE_MODE in MODES and LLM_CASSETTE:
+    _active = Cassette(LLM_CASSETTE, LLM_CASSETTE_MODE)
@@ -0,0 +1,182 @@
+"""
+Latency budgets for LLM calls.
+
+A request runs inside `deadline(seconds)`, which the API opens for every
+request (REQUEST_LATENCY_BUDGET_SECONDS; clients can ask for less with an
+X-Latency-Budget-Ms header). Nested deadlines only ever shorten it. Each
+LLM call then gets whatever is left of the budget, minus a small reserve
+for the rest of the request. That is passed to Groq as the request
+timeout, and the call is also abandoned when it runs out. An abandoned or
+failed call raises, and the caller's deterministic fallback
+(`_calculate_individual_mood_xp`, `_calculate_health_xp`, the canned
+summaries) answers in its place, so the response is ready within the
+budget either way. The fallbacks are cheap and local, so they run when
+the deadline fires rather than alongside the call. The abandoned request
+itself keeps running in the pool until its HTTP timeout, and keeps its
+LLM queue slot (`lease`) until then.
+
+With LLM_HEDGE enabled, a call still running after the p95 latency of its
+kind (the last LLM_HEDGE_WINDOW successful calls) fires a second, identical
+request, and the first answer wins. Only the winner is charged to the
+user's token budget. The hedge takes a queue slot of its own and is not
+sent when none is free.
+
+Rates for dashboards, as ratios of counters in /metrics:
+    hedge rate     llm_hedge_total / llm_request_seconds_count
+    hedge win rate llm_hedge_win_total / llm_hedge_total
+    fallback rate  llm_deadline_exceeded_total (and llm_fallback_total) / llm_request_seconds_count
+
+Configuration (environment):
+    REQUEST_LATENCY_BUDGET_SECONDS  per-request budget in the API; 0 disables (8)
+    LLM_DEADLINE_RESERVE_SECONDS    budget kept back for the rest of the request (0.05)
+    LLM_HEDGE                       "1" to hedge slow calls (off)
+    LLM_HEDGE_WINDOW                latencies kept per kind for the p95 (200)
+    LLM_HEDGE_DEFAULT_DELAY_SECONDS hedge delay until a kind has 20 samples (1.0)
+    LLM_POOL_SIZE                   threads for budgeted and hedged calls (32)
+"""
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dotenv import load_dotenv
+from observability.metrics import LLM_HEDGES, LLM_HEDGE_WINS, LLM_DEADLINE_EXCEEDED
+
+load_dotenv()
+
+REQUEST_LATENCY_BUDGET_SECONDS = float(os.getenv("REQUEST_LATENCY_BUDGET_SECONDS", "8"))
+LLM_DEADLINE_RESERVE_SECONDS = float(os.getenv("LLM_DEADLINE_RESERVE_SECONDS", "0.05"))
+LLM_HEDGE = os.getenv("LLM_HEDGE", "0") == "1"
+LLM_HEDGE_WINDOW = int(os.getenv("LLM_HEDGE_WINDOW", "200"))
+LLM_HEDGE_DEFAULT_DELAY_SECONDS = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY_SECONDS", "1.0"))
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "32"))
+
+# Samples a kind needs before its own p95 is trusted as the hedge delay
+MIN_SAMPLES = 20
+
+
+class DeadlineExceeded(TimeoutError):
+    """The latency budget ran out before the LLM answered."""
+
+
+_deadline = ContextVar("llm_deadline", default=None)
+
+
+@contextmanager
+def deadline(seconds: float):
+    """Give the block `seconds` of latency budget (never extending an outer one)."""
+    end = time.monotonic() + seconds
+    outer = _deadline.get()
+    token = _deadline.set(end if outer is None else min(outer, end))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    """Seconds left in the current budget, or None without one."""
+    end = _deadline.get()
+    return None if end is None else end - time.monotonic()
+
+
+class LatencyTracker:
+    """Recent successful latencies per kind, for the hedge delay."""
+
+    def __init__(self, window: int = LLM_HEDGE_WINDOW):
+        self.window = window
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def observe(self, kind: str, seconds: float):
+        with self._lock:
+            samples = self._samples.get(kind)
+            if samples is None:
+                samples = self._samples[kind] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def p95(self, kind: str):
+        with self._lock:
+            samples = sorted(self._samples.get(kind, ()))
+        if len(samples) < MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+    def hedge_delay(self, kind: str) -> float:
+        p95 = self.p95(kind)
+        return LLM_HEDGE_DEFAULT_DELAY_SECONDS if p95 is None else p95
+
+
+latencies = LatencyTracker()
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix="llm-call")
+    return _pool
+
+
+def needs_race() -> bool:
+    return LLM_HEDGE or _deadline.get() is not None
+
+
+def call(request, *, kind: str, hedge: bool = None, lease=None):
+    """
+    Run `request(timeout)` within the current budget, hedging it if enabled.
+    `timeout` is the seconds left for the HTTP call, or None without a budget.
+    Raises DeadlineExceeded when the budget runs out first.
+
+    `lease` is the caller's llm_queue.Lease. Every request sent is kept on it
+    until it finishes, so abandoned and losing requests still hold a slot.
+    """
+    left = remaining()
+    if left is not None:
+        left -= LLM_DEADLINE_RESERVE_SECONDS
+        if left <= 0:
+            LLM_DEADLINE_EXCEEDED.inc(kind=kind)
+            raise DeadlineExceeded(f"no latency budget left for {kind!r}")
+    end = None if left is None else time.monotonic() + left
+
+    def time_left():
+        return None if end is None else max(end - time.monotonic(), 0.0)
+
+    if hedge is None:
+        hedge = LLM_HEDGE
+    executor = _executor()
+    primary = executor.submit(request, left)
+    if lease is not None:
+        lease.keep(primary)
+    pending = {primary}
+
+    if hedge:
+        delay = latencies.hedge_delay(kind)
+        if end is None or delay < time_left():
+            done, _ = wait(pending, timeout=delay)
+            if not done and (lease is None or lease.spare()):
+                LLM_HEDGES.inc(kind=kind)
+                second = executor.submit(request, time_left())
+                if lease is not None:
+                    lease.keep(second)
+                pending.add(second)
+
+    error = None
+    while pending:
+        done, pending = wait(pending, timeout=time_left(), return_when=FIRST_COMPLETED)
+        if not done:
+            LLM_DEADLINE_EXCEEDED.inc(kind=kind)
+            raise DeadlineExceeded(f"{kind!r} did not answer within its latency budget")
+        for future in done:
+            if future.exception() is None:
+                if future is not primary:
+                    LLM_HEDGE_WINS.inc(kind=kind)
+                return future.result()
+            error = future.exception()
+    raise error
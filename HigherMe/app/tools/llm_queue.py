@@ -0,0 +1,212 @@
+"""
+Fair scheduling of LLM calls in a process.
+
+Every LLMClient call takes one of LLM_MAX_CONCURRENCY slots first. When all
+slots are busy, waiting calls are served by lane, and by weighted fair
+queuing across users within a lane:
+
+- lanes are strictly ordered: interactive (mood sentiment on POST) before
+  report (daily report) before batch (scheduler, backfills and anything
+  outside a user's scope). LLM_RESERVED_SLOTS slots are never given to
+  batch, so a backfill can't take every slot even while it is alone.
+- within a lane, each call gets a virtual finish tag:
+  max(lane clock, user's last tag) + 1/weight. The lowest tag goes first,
+  so a user with a hundred queued calls takes turns with a user who has one.
+
+A call's lane and user come from its LLM scope (tools/llm_budget.py).
+Time spent waiting counts against the request's latency budget; a call
+still queued when the budget runs out raises DeadlineExceeded like a slow
+call would.
+
+A slot is held for as long as HTTP requests made under it are running. A
+call that gives up at its deadline leaves its request running in the
+llm-call pool (tools/llm_deadline.py), and the slot stays taken until that
+request finishes. A hedge needs a second slot, and is skipped when none is
+free. So the requests in flight never exceed LLM_MAX_CONCURRENCY.
+
+Queue depth and active calls per lane are gauges (llm_queue_depth,
+llm_queue_active); waits go to llm_queue_wait_seconds.
+
+Configuration (environment):
+    LLM_MAX_CONCURRENCY  slots per process (64)
+    LLM_RESERVED_SLOTS   slots batch work may not use (4)
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+from dotenv import load_dotenv
+from observability.metrics import LLM_QUEUE_DEPTH, LLM_QUEUE_ACTIVE, LLM_QUEUE_WAIT_SECONDS, LLM_DEADLINE_EXCEEDED
+from tools import llm_deadline
+
+load_dotenv()
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "64"))
+LLM_RESERVED_SLOTS = int(os.getenv("LLM_RESERVED_SLOTS", "4"))
+
+# Highest priority first
+LANES = ("interactive", "report", "batch")
+
+
+class _Waiter:
+    __slots__ = ("event", "granted", "cancelled")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.cancelled = False
+
+
+class FairScheduler:
+    def __init__(self, slots: int = LLM_MAX_CONCURRENCY, reserved: int = LLM_RESERVED_SLOTS):
+        self.slots = max(1, slots)
+        self.reserved = min(max(0, reserved), self.slots - 1)
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._active = dict.fromkeys(LANES, 0)
+        self._queued = dict.fromkeys(LANES, 0)
+        self._heaps = {lane: [] for lane in LANES}
+        self._clock = dict.fromkeys(LANES, 0.0)
+        self._finish = {lane: {} for lane in LANES}
+
+    def acquire(self, lane: str, user_id=None, *, weight: float = 1.0, timeout: float = None) -> bool:
+        """Wait for a slot. Returns False if `timeout` passed first."""
+        waiter = _Waiter()
+        with self._lock:
+            finish = self._finish[lane]
+            tag = max(self._clock[lane], finish.get(user_id, 0.0)) + 1.0 / weight
+            finish[user_id] = tag
+            if len(finish) > 10000:
+                self._forget_idle_users(lane)
+            heapq.heappush(self._heaps[lane], (tag, next(self._seq), waiter))
+            self._queued[lane] += 1
+            self._dispatch()
+            self._publish(lane)
+        if waiter.event.wait(timeout):
+            return True
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.cancelled = True
+            self._queued[lane] -= 1
+            self._publish(lane)
+        return False
+
+    def release(self, lane: str):
+        with self._lock:
+            self._active[lane] -= 1
+            self._dispatch()
+            self._publish(lane)
+
+    def _dispatch(self):
+        # Called with the lock held: hand free slots to the waiters that should go next
+        while True:
+            busy = sum(self._active.values())
+            if busy >= self.slots:
+                return
+            for lane in LANES:
+                if lane == "batch" and busy >= self.slots - self.reserved:
+                    continue
+                heap = self._heaps[lane]
+                while heap and heap[0][2].cancelled:
+                    heapq.heappop(heap)
+                if heap:
+                    tag, _, waiter = heapq.heappop(heap)
+                    self._clock[lane] = tag
+                    self._queued[lane] -= 1
+                    self._active[lane] += 1
+                    waiter.granted = True
+                    waiter.event.set()
+                    self._publish(lane)
+                    break
+            else:
+                return
+
+    def _forget_idle_users(self, lane: str):
+        # A tag at or below the clock adds nothing over the clock itself
+        clock = self._clock[lane]
+        self._finish[lane] = {user: tag for user, tag in self._finish[lane].items() if tag > clock}
+
+    def _publish(self, lane: str):
+        LLM_QUEUE_DEPTH.set(self._queued[lane], lane=lane)
+        LLM_QUEUE_ACTIVE.set(self._active[lane], lane=lane)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {lane: {"queued": self._queued[lane], "active": self._active[lane]} for lane in LANES}
+
+
+scheduler = FairScheduler()
+
+
+def ensure_batch_capacity(slots: int, reserved: int = None):
+    """
+    Make room for `slots` concurrent batch calls, e.g. for the end-of-day
+    scheduler. A worker process that only runs batch work passes reserved=0.
+    Calls already holding a slot release it on the scheduler they took it from.
+    """
+    global scheduler
+    reserved = scheduler.reserved if reserved is None else reserved
+    if scheduler.slots - scheduler.reserved < slots or scheduler.reserved != reserved:
+        scheduler = FairScheduler(max(scheduler.slots, slots + reserved), reserved)
+
+
+class Lease:
+    """
+    The slot(s) taken by `slot()`. They are released once the block has
+    exited and every future passed to `keep` has finished.
+    """
+
+    def __init__(self, scheduler: FairScheduler, lane: str, user_id=None):
+        self._scheduler = scheduler
+        self._lane = lane
+        self._user_id = user_id
+        self._slots = 1
+        self._holders = 1
+        self._lock = threading.Lock()
+
+    def keep(self, future):
+        """Keep the lease until `future` is done, even if the block exits first."""
+        with self._lock:
+            self._holders += 1
+        future.add_done_callback(self._let_go)
+
+    def spare(self) -> bool:
+        """Take one more slot, without waiting, for a hedged request. False if none is free."""
+        if not self._scheduler.acquire(self._lane, self._user_id, timeout=0):
+            return False
+        with self._lock:
+            self._slots += 1
+        return True
+
+    def _let_go(self, _future=None):
+        with self._lock:
+            self._holders -= 1
+            if self._holders:
+                return
+            slots, self._slots = self._slots, 0
+        for _ in range(slots):
+            self._scheduler.release(self._lane)
+
+
+@contextmanager
+def slot(lane: str, user_id=None, *, kind: str = "generic"):
+    """
+    Hold an LLM slot for the block, waiting no longer than the latency budget
+    allows. Yields the Lease, so requests that outlive the block can keep it.
+    """
+    current = scheduler
+    timeout = llm_deadline.remaining()
+    start = time.perf_counter()
+    acquired = current.acquire(lane, user_id, timeout=None if timeout is None else max(timeout, 0.0))
+    LLM_QUEUE_WAIT_SECONDS.observe(time.perf_counter() - start, lane=lane)
+    if not acquired:
+        LLM_DEADLINE_EXCEEDED.inc(kind=kind)
+        raise llm_deadline.DeadlineExceeded(f"{kind!r} waited out its latency budget in the {lane} lane")
+    lease = Lease(current, lane, user_id)
+    try:
+        yield lease
+    finally:
+        lease._let_go()
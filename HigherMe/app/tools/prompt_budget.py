@@ -0,0 +1,117 @@
+"""
+Token-bounded prompt assembly for the summary prompts.
+
+The summary prompts list a user's entries for the day. Left alone, their
+size (and so the LLM's latency) grows with how much the user logs, and
+HealthLog rows are cumulative, so each row repeats everything before it.
+`bounded_list_prompt` keeps a prompt within a token budget:
+
+- entries that are near-duplicates of a later entry are dropped (later rows
+  win, since they carry the running totals),
+- single entries are truncated to LLM_PROMPT_ITEM_MAX_TOKENS,
+- if the rest still doesn't fit, the most informative entries are kept
+  (caller-supplied score, by default the number of distinct words) and
+  shown in their original order, with a note of how many were left out.
+
+A prompt that already fits and has no duplicates comes out unchanged.
+Tokens are counted locally with a tokenizer-free approximation, so no
+model vocabulary has to be loaded. LLMClient reports the size of every
+prompt it sends (llm_prompt_tokens).
+
+Configuration (environment):
+    LLM_PROMPT_MAX_TOKENS       budget for one summary prompt (1500)
+    LLM_PROMPT_ITEM_MAX_TOKENS  budget for one listed entry (120)
+    LLM_SUMMARY_MAX_TOKENS      cap on a summary's completion (250)
+"""
+import os
+import re
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LLM_PROMPT_MAX_TOKENS = int(os.getenv("LLM_PROMPT_MAX_TOKENS", "1500"))
+LLM_PROMPT_ITEM_MAX_TOKENS = int(os.getenv("LLM_PROMPT_ITEM_MAX_TOKENS", "120"))
+LLM_SUMMARY_MAX_TOKENS = int(os.getenv("LLM_SUMMARY_MAX_TOKENS", "250"))
+
+# Share of an entry's words found in a later entry above which it counts as a duplicate
+DUPLICATE_THRESHOLD = 0.8
+
+_PIECE = re.compile(r"\w+|[^\w\s]")
+_WORD = re.compile(r"\w+")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Approximate BPE token count: punctuation is a token, and words are a
+    token per 4 characters. Within ~10% of the Llama tokenizer on English
+    prose, erring high on long words.
+    """
+    return sum((len(piece) + 3) // 4 for piece in _PIECE.findall(text))
+
+
+def truncate_tokens(text: str, max_tokens: int) -> str:
+    """Cut `text` after about `max_tokens` tokens, marking the cut with an ellipsis."""
+    used = 0
+    for match in _PIECE.finditer(text):
+        used += (len(match.group()) + 3) // 4
+        if used > max_tokens:
+            return text[:match.start()].rstrip() + "…"
+    return text
+
+
+def _words(text: str) -> frozenset:
+    return frozenset(word.lower() for word in _WORD.findall(text))
+
+
+def dedupe(entries: list, threshold: float = DUPLICATE_THRESHOLD) -> list:
+    """
+    Indexes of the entries to keep. An entry is dropped when at least
+    `threshold` of its words appear in a kept later entry.
+    """
+    kept = []
+    kept_words = []
+    for index in range(len(entries) - 1, -1, -1):
+        words = _words(entries[index])
+        if words and any(len(words & other) >= threshold * len(words) for other in kept_words):
+            continue
+        kept.append(index)
+        kept_words.append(words)
+    kept.reverse()
+    return kept
+
+
+def select_entries(entries: list, max_tokens: int, *, scores: list = None, keys: list = None,
+                   item_max_tokens: int = LLM_PROMPT_ITEM_MAX_TOKENS) -> tuple:
+    """
+    Fit `entries` (one prompt line each) into `max_tokens`. Duplicates are
+    found by comparing `keys` (default: the entries themselves).
+    Returns (kept lines in original order, number of entries left out).
+    """
+    indexes = dedupe(keys if keys is not None else entries)
+    lines = {index: truncate_tokens(entries[index], item_max_tokens) for index in indexes}
+    sizes = {index: count_tokens(line) + 1 for index, line in lines.items()}  # +1 for the newline
+
+    if sum(sizes.values()) > max_tokens:
+        if scores is None:
+            scores = [len(_words(entry)) for entry in entries]
+        # Most informative first; among equals, the later entry
+        ranked = sorted(indexes, key=lambda index: (scores[index], index), reverse=True)
+        chosen, used = set(), 0
+        for index in ranked:
+            if used + sizes[index] <= max_tokens:
+                chosen.add(index)
+                used += sizes[index]
+        indexes = [index for index in indexes if index in chosen]
+
+    return [lines[index] for index in indexes], len(entries) - len(indexes)
+
+
+def bounded_list_prompt(head: str, entries: list, tail: str, *, max_tokens: int = LLM_PROMPT_MAX_TOKENS,
+                        scores: list = None, keys: list = None, omitted_line: str = "- (+{omitted} similar or less detailed entries not shown)") -> str:
+    """`head` + the entries that fit, one per line + `tail`, within `max_tokens` overall."""
+    # Leave room for the omission note in case it's needed
+    room = max_tokens - count_tokens(head) - count_tokens(tail) - count_tokens(omitted_line) - 2
+    lines, omitted = select_entries(entries, max(room, 0), scores=scores, keys=keys)
+    if omitted:
+        lines.append(omitted_line.format(omitted=omitted))
+    return head + "\n".join(lines) + tail
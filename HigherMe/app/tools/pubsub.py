@@ -0,0 +1,155 @@
+"""
+Publish/subscribe for pushing live updates to connected clients.
+
+Publishers are ordinary synchronous code: `crud.award_xp` publishes each
+award to the user's channel ("xp:<user id>") after it commits, from
+whatever thread it runs on. Subscribers are WebSocket handlers
+(api/xp_stream.py). Each subscription is a small bounded asyncio queue on
+its handler's event loop, fed with `call_soon_threadsafe`. A client that
+falls more than SUBSCRIPTION_QUEUE_SIZE messages behind loses the oldest
+ones, and gets a fresh stats snapshot when it reconnects.
+
+`LocalBroker` delivers within one process, which is all a single worker
+needs. With several workers, a user's award and their socket may live in
+different processes. Set PUBSUB_REDIS_URL to publish through Redis
+instead: every process then runs one listener thread that feeds Redis
+messages into its local subscribers. This needs the optional `redis`
+package, the same as shared rate limits. Another backend only has to
+provide `publish(channel, message)` and `subscribe(channel)`.
+
+Publishing never raises. With no subscribers a local publish is a dict
+lookup.
+
+Configuration (environment):
+    PUBSUB_REDIS_URL  redis://host:port/db to fan messages out across workers
+"""
+import asyncio
+import os
+import threading
+import time
+import orjson
+from dotenv import load_dotenv
+from observability.logger import get_logger
+from observability.metrics import PUBSUB_SUBSCRIBERS
+
+load_dotenv()
+
+logger = get_logger(__name__)
+
+PUBSUB_REDIS_URL = os.getenv("PUBSUB_REDIS_URL", "")
+SUBSCRIPTION_QUEUE_SIZE = 100
+
+
+class Subscription:
+    """One subscriber's queue on one channel. Use it from the event loop that created it."""
+
+    def __init__(self, broker, channel: str):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=SUBSCRIPTION_QUEUE_SIZE)
+
+    def _deliver(self, message: dict):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(message)
+
+    async def get(self) -> dict:
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Fan-out to the subscribers in this process."""
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel: str) -> Subscription:
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscription)
+            PUBSUB_SUBSCRIBERS.set(self.subscriber_count())
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+            PUBSUB_SUBSCRIBERS.set(self.subscriber_count())
+
+    def subscriber_count(self) -> int:
+        return sum(len(subscribers) for subscribers in self._channels.values())
+
+    def publish(self, channel: str, message: dict):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription._deliver, message)
+            except RuntimeError:
+                # The subscriber's loop has shut down; its handler is gone
+                self.unsubscribe(subscription)
+
+
+class RedisBroker:
+    """Publishes through Redis; one listener thread per process feeds a LocalBroker."""
+
+    PREFIX = "pubsub:"
+
+    def __init__(self, url: str):
+        import redis  # optional dependency, only needed across workers
+        self._client = redis.Redis.from_url(url)
+        self._local = LocalBroker()
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel: str, message: dict):
+        self._client.publish(self.PREFIX + channel, orjson.dumps(message))
+
+    def subscribe(self, channel: str) -> Subscription:
+        self._start_listener()
+        return self._local.subscribe(channel)
+
+    def unsubscribe(self, subscription: Subscription):
+        self._local.unsubscribe(subscription)
+
+    def _start_listener(self):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name="pubsub-listener", daemon=True)
+                self._listener.start()
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+                pubsub.psubscribe(self.PREFIX + "*")
+                for item in pubsub.listen():
+                    channel = item["channel"].decode().removeprefix(self.PREFIX)
+                    self._local.publish(channel, orjson.loads(item["data"]))
+            except Exception as e:
+                # Messages published while reconnecting are lost; clients resync on their next connect
+                logger.error("Pub/sub listener disconnected, reconnecting: %s", e)
+                time.sleep(1.0)
+
+
+broker = RedisBroker(PUBSUB_REDIS_URL) if PUBSUB_REDIS_URL else LocalBroker()
+
+
+def publish(channel: str, message: dict):
+    """Publish `message` to `channel`. Live updates are best effort, so this never raises."""
+    try:
+        broker.publish(channel, message)
+    except Exception as e:
+        logger.error("Pub/sub publish failed on %s: %s", channel, e)
+
+
+def subscribe(channel: str) -> Subscription:
+    return broker.subscribe(channel)
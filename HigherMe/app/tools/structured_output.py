@@ -0,0 +1,142 @@
+"""
+Structured answers (JSON objects, numbers) from the LLM.
+
+Parsing `response.content` with json.loads/float used to throw away any
+answer wrapped in a markdown fence or a preamble ("Score: 0.4"), and the
+caller then fell back after the call had already been paid for. Here:
+
+- JSON prompts are sent in Groq's JSON mode (response_format json_object),
+- the reply is parsed tolerantly: fences, surrounding prose, trailing
+  commas and typographic quotes are tolerated, and for numbers the first
+  number in range is taken,
+- a reply that still can't be parsed gets one short repair request that
+  carries only the bad reply and the expected format, not the original
+  prompt,
+- if that fails too, StructuredOutputError is raised and the caller's
+  existing fallback applies.
+
+Outcomes are counted per prompt kind in llm_parse (clean, salvaged,
+repaired, failed); failed / all is the parse-failure rate.
+"""
+import json
+import re
+from observability.metrics import LLM_PARSE
+from observability.logger import get_logger
+
+logger = get_logger(__name__)
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_NUMBER = re.compile(r"[-+]?(?:\d+\.?\d*|\.\d+)")
+_QUOTES = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+
+
+class StructuredOutputError(ValueError):
+    """The LLM's reply couldn't be parsed, even after a repair request."""
+
+
+def _json_candidates(text: str):
+    """Substrings of `text` that may hold the JSON object, most likely first."""
+    yield text
+    for fenced in _FENCE.findall(text):
+        yield fenced
+    # Every balanced {...} span, outermost first
+    depth, start = 0, None
+    in_string = escaped = False
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            in_string = True
+        elif char == "{":
+            if depth == 0:
+                start = i
+            depth += 1
+        elif char == "}" and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:i + 1]
+
+
+def extract_json(text: str, required: tuple = ()) -> dict:
+    """
+    The first JSON object in `text` that has every key in `required`.
+    Raises ValueError if there is none.
+    """
+    text = text.strip().translate(_QUOTES)
+    for candidate in _json_candidates(text):
+        candidate = candidate.strip()
+        for attempt in (candidate, _TRAILING_COMMA.sub(r"\1", candidate)):
+            try:
+                value = json.loads(attempt)
+            except ValueError:
+                continue
+            if isinstance(value, dict) and all(key in value for key in required):
+                return value
+    raise ValueError(f"no JSON object with keys {list(required)} in reply: {text[:80]!r}")
+
+
+def extract_number(text: str, low: float = None, high: float = None) -> float:
+    """The first number in `text` within [low, high]. Raises ValueError if there is none."""
+    for match in _NUMBER.findall(text):
+        value = float(match)
+        if (low is None or value >= low) and (high is None or value <= high):
+            return value
+    raise ValueError(f"no number in [{low}, {high}] in reply: {text[:80]!r}")
+
+
+def _parse(client, prompt: str, *, kind: str, parse, expected: str, json_mode: bool):
+    content = client.invoke(prompt, kind=kind, json_mode=json_mode).content
+    try:
+        value = parse(content)
+    except ValueError as e:
+        logger.warning("Unparseable %s reply, asking for a repair: %s", kind, e)
+    else:
+        clean = content.strip()
+        LLM_PARSE.inc(kind=kind, outcome="clean" if _is_clean(clean, json_mode) else "salvaged")
+        return value
+
+    repair_prompt = (
+        f"Your previous reply could not be parsed:\n{content.strip()[:500]}\n\n"
+        f"Reply again with {expected}. No other text."
+    )
+    try:
+        content = client.invoke(repair_prompt, kind=f"{kind}_repair", json_mode=json_mode).content
+        value = parse(content)
+    except Exception as e:
+        LLM_PARSE.inc(kind=kind, outcome="failed")
+        raise StructuredOutputError(f"{kind}: {e}") from e
+    LLM_PARSE.inc(kind=kind, outcome="repaired")
+    return value
+
+
+def _is_clean(content: str, json_mode: bool) -> bool:
+    if json_mode:
+        try:
+            json.loads(content)
+            return True
+        except ValueError:
+            return False
+    try:
+        float(content)
+        return True
+    except ValueError:
+        return False
+
+
+def invoke_json(client, prompt: str, *, kind: str, required: tuple = (), example: str = None) -> dict:
+    """Ask for a JSON object with the `required` keys, in JSON mode."""
+    expected = f"only this JSON object: {example}" if example else f"only a JSON object with the keys {', '.join(required)}"
+    return _parse(client, prompt, kind=kind, parse=lambda content: extract_json(content, required),
+                  expected=expected, json_mode=True)
+
+
+def invoke_number(client, prompt: str, *, kind: str, low: float = None, high: float = None) -> float:
+    """Ask for a single number in [low, high]."""
+    return _parse(client, prompt, kind=kind, parse=lambda content: extract_number(content, low, high),
+                  expected=f"only a number between {low} and {high}", json_mode=False)
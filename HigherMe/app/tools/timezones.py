@@ -0,0 +1,55 @@
+"""
+Per-user calendar days.
+
+Timestamps are stored as naive server-local datetimes, but "today" is the
+user's day: each user has an IANA timezone name (User.timezone), and every
+log and XP event stores `local_day`, the calendar day in its user's
+timezone when it was written. Day queries are then equality lookups on the
+(user_id, local_day) indexes, and a late-evening log in Tokyo lands on the
+same day the user saw on their clock.
+
+`local_day` records the day at write time, so changing a timezone only
+moves the boundary for what's logged afterwards.
+
+Users without a timezone, or with one this machine's tz database doesn't
+know, get DEFAULT_TIMEZONE, or the server's local zone when that's unset.
+
+Configuration (environment):
+    DEFAULT_TIMEZONE  zone for users without one, e.g. "UTC" (server local time)
+"""
+import os
+from datetime import date, datetime, tzinfo
+from functools import lru_cache
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE") or None
+
+
+@lru_cache(maxsize=1024)
+def get_zone(name: str) -> tzinfo:
+    """The tzinfo for an IANA zone name, or None if it's empty or unknown."""
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        return None
+
+
+def is_valid_timezone(name: str) -> bool:
+    return isinstance(name, str) and get_zone(name) is not None
+
+
+def local_day(timezone: str = None, moment: datetime = None) -> date:
+    """
+    The calendar day in `timezone` at `moment`, a naive server-local
+    datetime (default now).
+    """
+    moment = moment or datetime.now()
+    zone = get_zone(timezone) or get_zone(DEFAULT_TIMEZONE)
+    if zone is None:
+        return moment.date()
+    return moment.astimezone(zone).date()
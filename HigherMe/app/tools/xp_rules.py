@@ -0,0 +1,284 @@
+"""
+Declarative rules for the deterministic XP awards.
+
+Each XP type (the xp_type stored on XPEvent) has a Rule: a sum of terms,
+an optional cap, a scale applied after the cap, and bonuses added on top.
+Terms are small value objects:
+
+    Const(5)                               5
+    Bonus("total_water_today", ">=", 2, 2)  2 if the condition holds
+    Scaled("meal_score", 7, low=0, rounding="round")
+                                            round(max(meal_score, 0) * 7)
+    Tiers("sleep_hours", ((7, 9, 20), (6, None, 15)), default=5)
+                                            the first tier whose [low, high]
+                                            holds the value, else default
+
+A rule is evaluated two ways from the same table:
+
+- evaluate(xp_type, metrics) scores one live event from its metrics dict
+  and fills in the details message,
+- score_columns(xp_type, columns) scores many events at once from NumPy
+  column arrays (one array per metric), e.g. a year of history for a
+  what-if run over a changed table. NumPy is only needed for this path.
+
+Both paths give the same XP for the same inputs (tests/test_xp_rules.py
+checks this on random events). Missing metrics count as 0. The derived
+columns description_length, mood_text_length and total_lines are computed
+from the raw metrics when they aren't given.
+"""
+import operator
+from dataclasses import dataclass
+from typing import Optional
+
+_OPS = {">": operator.gt, ">=": operator.ge, "<": operator.lt, "<=": operator.le}
+
+
+@dataclass(frozen=True)
+class Const:
+    value: float
+
+    def scalar(self, metrics: dict) -> float:
+        return self.value
+
+    def vector(self, columns: dict, np):
+        return self.value
+
+
+@dataclass(frozen=True)
+class Bonus:
+    field: str
+    op: str
+    threshold: float
+    amount: float
+
+    def holds(self, metrics: dict) -> bool:
+        return _OPS[self.op](metrics.get(self.field, 0), self.threshold)
+
+    def scalar(self, metrics: dict) -> float:
+        return self.amount if self.holds(metrics) else 0
+
+    def vector(self, columns: dict, np):
+        return np.where(_OPS[self.op](columns[self.field], self.threshold), self.amount, 0)
+
+
+@dataclass(frozen=True)
+class Scaled:
+    """(max(value // step, low) + offset) * factor, rounded, then capped at `cap`."""
+    field: str
+    factor: float
+    offset: float = 0
+    step: Optional[float] = None
+    low: Optional[float] = None
+    cap: Optional[float] = None
+    rounding: Optional[str] = None  # None, "trunc" (like int()) or "round"
+
+    def scalar(self, metrics: dict) -> float:
+        value = metrics.get(self.field, 0)
+        if self.step:
+            value //= self.step
+        if self.low is not None:
+            value = max(self.low, value)
+        value = (value + self.offset) * self.factor
+        if self.rounding == "trunc":
+            value = int(value)
+        elif self.rounding == "round":
+            value = round(value)
+        return value if self.cap is None else min(self.cap, value)
+
+    def vector(self, columns: dict, np):
+        value = columns[self.field]
+        if self.step:
+            value = np.floor_divide(value, self.step)
+        if self.low is not None:
+            value = np.maximum(self.low, value)
+        value = (value + self.offset) * self.factor
+        if self.rounding == "trunc":
+            value = np.trunc(value)
+        elif self.rounding == "round":
+            value = np.round(value)  # half to even, like round()
+        return value if self.cap is None else np.minimum(self.cap, value)
+
+
+@dataclass(frozen=True)
+class Tiers:
+    """The value of the first (low, high, value) tier with low <= field <= high; None is unbounded."""
+    field: str
+    tiers: tuple
+    default: float = 0
+
+    def index(self, value) -> Optional[int]:
+        for i, (low, high, _) in enumerate(self.tiers):
+            if (low is None or value >= low) and (high is None or value <= high):
+                return i
+        return None
+
+    def scalar(self, metrics: dict) -> float:
+        i = self.index(metrics.get(self.field, 0))
+        return self.default if i is None else self.tiers[i][2]
+
+    def vector(self, columns: dict, np):
+        value = columns[self.field]
+        conditions = [
+            (np.ones_like(value, dtype=bool) if low is None else value >= low)
+            & (np.ones_like(value, dtype=bool) if high is None else value <= high)
+            for low, high, _ in self.tiers
+        ]
+        return np.select(conditions, [v for _, _, v in self.tiers], self.default)
+
+
+@dataclass(frozen=True)
+class Rule:
+    """
+    xp = trunc(min(cap, sum(terms)) * scale) + sum(after_cap).
+
+    `messages` are (Bonus or (Tiers, tier index), template) pairs checked in
+    order; the first that holds formats the details, else `details` does.
+    Templates see the metrics, {xp} and {subtotal} (the capped sum of terms).
+    """
+    terms: tuple
+    details: str
+    cap: Optional[float] = None
+    scale: float = 1
+    after_cap: tuple = ()
+    messages: tuple = ()
+
+    @property
+    def fields(self) -> set:
+        return {term.field for term in self.terms + self.after_cap if hasattr(term, "field")}
+
+    def subtotal(self, metrics: dict) -> float:
+        total = sum(term.scalar(metrics) for term in self.terms)
+        return total if self.cap is None else min(self.cap, total)
+
+    def score(self, metrics: dict) -> int:
+        return int(self.subtotal(metrics) * self.scale) + int(sum(term.scalar(metrics) for term in self.after_cap))
+
+    def score_columns(self, columns: dict, np):
+        total = sum((term.vector(columns, np) for term in self.terms), np.zeros(_length(columns, np)))
+        if self.cap is not None:
+            total = np.minimum(self.cap, total)
+        extra = sum((term.vector(columns, np) for term in self.after_cap), 0)
+        return (np.trunc(total * self.scale) + extra).astype(np.int64)
+
+    def message(self, metrics: dict, xp: int) -> str:
+        template = self.details
+        for condition, candidate in self.messages:
+            if isinstance(condition, tuple):
+                tiers, index = condition
+                holds = tiers.index(metrics.get(tiers.field, 0)) == index
+            else:
+                holds = condition.holds(metrics)
+            if holds:
+                template = candidate
+                break
+        return template.format(xp=xp, subtotal=self.subtotal(metrics), **metrics)
+
+
+def _length(columns: dict, np) -> int:
+    return len(next(iter(columns.values()))) if columns else 0
+
+
+_SLEEP = Tiers("sleep_hours", ((7, 9, 20), (6, None, 15), (4, None, 10)), default=5)
+_EXERCISE = Tiers("exercise_minutes", ((60, None, 25), (30, None, 20), (15, None, 15)), default=10)
+
+RULES = {
+    "health_meal": Rule(
+        terms=(Const(5),
+               Bonus("description_length", ">", 20, 3),  # detailed description
+               Scaled("meal_score", 7, low=0, rounding="round")),  # up to +7 for a healthy meal
+        cap=15,
+        details="🍽️ Meal logged! +{xp} XP for nutrition tracking (meal score {meal_score:+.1f})",
+    ),
+    "health_water": Rule(
+        terms=(Scaled("water_intake_liters", 4, cap=8, rounding="trunc"),),  # 4 XP per liter, max 8
+        after_cap=(Bonus("total_water_today", ">=", 2.0, 2),),
+        details="💧 Hydration! +{xp} XP for {water_intake_liters}L water",
+        messages=((Bonus("total_water_today", ">=", 2.0, 2),
+                   "💧 Hydration! +{xp} XP for {water_intake_liters}L water +2 bonus for reaching daily goal!"),),
+    ),
+    "health_sleep": Rule(
+        terms=(_SLEEP,),
+        details="😴 Rest logged! +{xp} XP for {sleep_hours} hours (aim for more rest!)",
+        messages=(((_SLEEP, 0), "😴 Perfect sleep! +{xp} XP for {sleep_hours} hours of optimal rest"),
+                  ((_SLEEP, 1), "😴 Good sleep! +{xp} XP for {sleep_hours} hours of rest"),
+                  ((_SLEEP, 2), "😴 Some rest! +{xp} XP for {sleep_hours} hours (try for 7-9 hours)")),
+    ),
+    "health_exercise": Rule(
+        terms=(_EXERCISE,),
+        details="💪 Activity logged! +{xp} XP for {exercise_minutes} minutes (aim for 30+ minutes)",
+        messages=(((_EXERCISE, 0), "💪 Intense workout! +{xp} XP for {exercise_minutes} minutes of exercise"),
+                  ((_EXERCISE, 1), "💪 Great workout! +{xp} XP for {exercise_minutes} minutes of exercise"),
+                  ((_EXERCISE, 2), "💪 Good effort! +{xp} XP for {exercise_minutes} minutes of exercise")),
+    ),
+    # End-of-day health award: a 0-10 health score, 3 XP per point
+    "health": Rule(
+        terms=(Bonus("sleep_hours", ">=", 7, 2.5),
+               Bonus("water_intake_liters", ">=", 2, 2.5),
+               Bonus("exercise_minutes", ">=", 30, 2.5),
+               Scaled("meal_score", 1.25, offset=1)),  # -1..1 -> 0..2.5
+        cap=10,
+        scale=3,
+        details="🏋️ Health XP: +{xp} (Overall health score: {subtotal:.1f}/10)",
+    ),
+    "mood": Rule(
+        terms=(Scaled("sentiment_score", 5, offset=1, rounding="trunc"), Const(2),  # 2-12 from sentiment
+               Bonus("mood_text_length", ">", 20, 3),
+               Bonus("mood_text_length", ">", 50, 2),
+               Bonus("sentiment_score", ">", 0.3, 3),
+               Bonus("sentiment_score", "<=", -0.3, 2)),  # for acknowledging difficult emotions
+        cap=20,
+        details="🧠 Mood tracked! +{xp} XP for emotional self-awareness",
+        messages=((Bonus("sentiment_score", ">", 0.3, 0),
+                   "🧠 Positive mood logged! +{xp} XP for emotional awareness and positivity"),
+                  (Bonus("sentiment_score", "<=", -0.3, 0),
+                   "🧠 Emotions acknowledged! +{xp} XP for honest self-reflection")),
+    ),
+    # Time spent counts more than raw line count
+    "code": Rule(
+        terms=(Scaled("total_time_minutes", 0.7, step=10), Scaled("total_lines", 0.3, step=10)),
+        cap=50,
+        after_cap=(Bonus("total_time_minutes", ">=", 120, 5),),  # 2+ hour session
+        details="💻 Coding XP: +{xp} ({total_lines} lines over {total_time_minutes} minutes)",
+        messages=((Bonus("total_time_minutes", ">=", 120, 5),
+                   "💻 Coding XP: +{xp} (Great coding session with {total_lines} lines over {total_time_minutes} minutes!)"),),
+    ),
+}
+
+
+def _with_derived(metrics: dict) -> dict:
+    metrics = dict(metrics)
+    metrics.setdefault("description_length", len(metrics.get("description") or ""))
+    metrics.setdefault("mood_text_length", len(metrics.get("mood_text") or ""))
+    metrics.setdefault("total_lines", metrics.get("lines_added", 0) + metrics.get("lines_removed", 0))
+    return metrics
+
+
+def evaluate(xp_type: str, metrics: dict, rules: dict = None) -> dict:
+    """{"xp", "details"} for one event of `xp_type`. KeyError if there's no rule for it."""
+    rule = (rules or RULES)[xp_type]
+    metrics = _with_derived(metrics)
+    for field in rule.fields:
+        metrics.setdefault(field, 0)
+    xp = rule.score(metrics)
+    return {"xp": xp, "details": rule.message(metrics, xp)}
+
+
+def score_columns(xp_type: str, columns: dict, rules: dict = None):
+    """
+    XP for every row of `columns` (metric name -> equal-length array) as an
+    int64 array. Pass `rules` to score history under a changed table.
+    """
+    import numpy as np  # optional dependency, only needed for batch scoring
+
+    rule = (rules or RULES)[xp_type]
+    columns = {name: np.asarray(values) for name, values in columns.items()}
+    n = _length(columns, np)
+    if "total_lines" not in columns and ("lines_added" in columns or "lines_removed" in columns):
+        columns["total_lines"] = columns.get("lines_added", 0) + columns.get("lines_removed", 0)
+    for text, length in (("description", "description_length"), ("mood_text", "mood_text_length")):
+        if length not in columns and text in columns:
+            columns[length] = np.char.str_len(columns[text].astype(str))
+    for field in rule.fields:
+        if field not in columns:
+            columns[field] = np.zeros(n)
+    return rule.score_columns(columns, np)
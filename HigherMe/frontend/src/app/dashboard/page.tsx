@@ -3,8 +3,9 @@
 import { useState, useEffect } from 'react';
 import { motion, AnimatePresence } from 'framer-motion';
 import { useAuth } from '@/hooks/useAuth';
+import { useXpStream } from '@/hooks/useXpStream';
 import { ApiClient } from '@/lib/api';
-import { UserStats, DailyReport } from '@/types/api';
+import { UserStats, DailyReport, Dashboard, XPUpdate } from '@/types/api';
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/Card';
 import { Button } from '@/components/ui/Button';
 import { Input } from '@/components/ui/Input';
@@ -435,6 +436,15 @@ const LoggingModal = ({ isOpen, onClose, type, onSubmit }: LoggingModalProps) =>
   );
 };
 
+const XP_TYPE_EMOJIS: Record<string, string> = {
+  mood: '🧠',
+  health_meal: '🍽️',
+  health_exercise: '💪',
+  health_sleep: '😴',
+  health_water: '💧',
+  code: '💻'
+};
+
 // Main Dashboard Component
 export default function Dashboard() {
   const { user, logout } = useAuth();
@@ -448,19 +458,42 @@ export default function Dashboard() {
   }>({ isOpen: false, type: null });
   const [xpNotifications, setXpNotifications] = useState<XPNotification[]>([]);
 
+  // XP awards are pushed as they happen; stats are only refetched while the stream is down
+  const xpStreamConnected = useXpStream(setStats, (update: XPUpdate) => {
+    const isToday = update.local_day === new Date().toLocaleDateString('en-CA');
+    setStats(prev => prev && {
+      ...prev,
+      total_xp: update.total_xp,
+      current_level: update.current_level,
+      todays_xp: isToday ? prev.todays_xp + update.xp_delta : prev.todays_xp,
+      xp_breakdown: isToday ? { ...prev.xp_breakdown, [update.xp_type]: update.xp_delta } : prev.xp_breakdown
+    });
+    const label = update.xp_type.replace('health_', '');
+    showXPNotification(update.xp_delta, `${XP_TYPE_EMOJIS[update.xp_type] || '⭐'} Great ${label} log!`, label);
+  });
+
   useEffect(() => {
     loadDashboardData();
   }, []);
 
   const loadDashboardData = async () => {
     try {
-      const [statsResponse, reportResponse] = await Promise.all([
-        ApiClient.getUserStats(),
-        ApiClient.getDailyReport(),
-      ]);
-      
-      setStats(statsResponse as UserStats);
-      setDailyReport(reportResponse as DailyReport);
+      // One round-trip for everything fast; the LLM report follows only if it isn't built yet
+      const dashboard = await ApiClient.getDashboard() as Dashboard;
+      setStats(dashboard.stats);
+      if (dashboard.report_status === 'ready') {
+        setDailyReport({ report: dashboard.report || '' });
+      }
+      setIsLoading(false);
+
+      if (dashboard.report_status === 'pending') {
+        setIsGeneratingSummary(true);
+        try {
+          setDailyReport(await ApiClient.getDailyReport() as DailyReport);
+        } finally {
+          setIsGeneratingSummary(false);
+        }
+      }
     } catch (error) {
       console.error('Error loading dashboard data:', error);
     } finally {
@@ -510,6 +543,9 @@ export default function Dashboard() {
           break;
       }
       
+      // The award arrives over the XP stream, which updates the stats and shows the notification
+      if (xpStreamConnected) return;
+      
       // Get fresh stats directly from API to calculate actual XP gained
       const freshStatsResponse = await ApiClient.getUserStats();
       const newXP = (freshStatsResponse as UserStats).total_xp;
@@ -0,0 +1,58 @@
+'use client';
+
+import { useEffect, useRef, useState } from 'react';
+import { ApiClient } from '@/lib/api';
+import { UserStats, XPUpdate } from '@/types/api';
+
+// Longest wait between reconnect attempts
+const MAX_RECONNECT_DELAY_MS = 30000;
+
+// Live XP awards from the backend's WebSocket. Returns whether the stream is
+// connected; while it is, stats don't need to be refetched after a log.
+export const useXpStream = (onStats: (stats: UserStats) => void, onUpdate: (update: XPUpdate) => void) => {
+  const [connected, setConnected] = useState(false);
+  const handlers = useRef({ onStats, onUpdate });
+  handlers.current = { onStats, onUpdate };
+
+  useEffect(() => {
+    let socket: WebSocket | null = null;
+    let reconnect: ReturnType<typeof setTimeout> | undefined;
+    let attempts = 0;
+    let stopped = false;
+
+    const connect = () => {
+      const token = localStorage.getItem('access_token');
+      if (!token || stopped) return;
+
+      socket = new WebSocket(ApiClient.websocketUrl('/api/v1/ws/xp'));
+      // The token goes in the first message rather than the URL
+      socket.onopen = () => socket?.send(JSON.stringify({ token }));
+      socket.onmessage = (event) => {
+        const { type, ...message } = JSON.parse(event.data);
+        if (type === 'stats') {
+          // Sent on every (re)connect, so anything missed while offline is caught up here
+          attempts = 0;
+          setConnected(true);
+          handlers.current.onStats(message as UserStats);
+        } else if (type === 'xp') {
+          handlers.current.onUpdate(message as XPUpdate);
+        }
+      };
+      socket.onclose = () => {
+        setConnected(false);
+        if (!stopped) {
+          reconnect = setTimeout(connect, Math.min(MAX_RECONNECT_DELAY_MS, 1000 * 2 ** attempts++));
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      stopped = true;
+      clearTimeout(reconnect);
+      socket?.close();
+    };
+  }, []);
+
+  return connected;
+};
@@ -1,4 +1,6 @@
 const API_BASE_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000';
+// Attempts for a request whose connection dropped before a response came back
+const NETWORK_ATTEMPTS = 3;
 
 class APIError extends Error {
   constructor(public status: number, message: string) {
@@ -13,6 +15,21 @@ export class ApiClient {
     return localStorage.getItem('access_token');
   }
 
+  static websocketUrl(endpoint: string) {
+    return `${API_BASE_URL.replace(/^http/, 'ws')}${endpoint}`;
+  }
+
+  private static async fetchWithRetry(url: string, init: RequestInit, retryable: boolean): Promise<Response> {
+    for (let attempt = 1; ; attempt++) {
+      try {
+        return await fetch(url, init);
+      } catch (networkError) {
+        if (!retryable || attempt >= NETWORK_ATTEMPTS) throw networkError;
+        await new Promise((resolve) => setTimeout(resolve, 250 * 2 ** attempt));
+      }
+    }
+  }
+
   private static async request<T>(
     endpoint: string,
     options: RequestInit = {}
@@ -27,15 +44,18 @@ export class ApiClient {
 
     if (token) {
       headers.Authorization = `Bearer ${token}`;
+      // Retries of a write reuse its key, so the server replays the first response instead of logging twice
+      if ((options.method || 'GET') !== 'GET' && !headers['Idempotency-Key']) {
+        headers['Idempotency-Key'] = crypto.randomUUID();
+      }
     }
 
     console.log('API Request:', { url, method: options.method || 'GET', headers, body: options.body });
 
     try {
-      const response = await fetch(url, {
-        ...options,
-        headers,
-      });
+      // Reads are safe to retry; writes only when they carry an idempotency key
+      const retryable = (options.method || 'GET') === 'GET' || Boolean(headers['Idempotency-Key']);
+      const response = await this.fetchWithRetry(url, { ...options, headers }, retryable);
 
       console.log('API Response:', { status: response.status, statusText: response.statusText });
 
@@ -66,12 +86,26 @@ export class ApiClient {
   }
 
   static async register(username: string, email: string, password: string) {
+    // The browser's timezone decides where the user's days start and end
+    const timezone = Intl.DateTimeFormat().resolvedOptions().timeZone;
     return this.request('/api/v1/auth/register', {
       method: 'POST',
-      body: JSON.stringify({ username, email, password }),
+      body: JSON.stringify({ username, email, password, timezone }),
+    });
+  }
+
+  static async updateTimezone(timezone: string) {
+    return this.request('/api/v1/auth/me', {
+      method: 'PATCH',
+      body: JSON.stringify({ timezone }),
     });
   }
 
+  // Dashboard: user, stats, code activity and (once built) the daily report in one request
+  static async getDashboard(report: 'auto' | 'inline' | 'none' = 'auto') {
+    return this.request(`/api/v1/dashboard?report=${report}`);
+  }
+
   // User stats
   static async getUserStats() {
     return this.request('/api/v1/stats');
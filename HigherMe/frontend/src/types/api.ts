@@ -3,6 +3,7 @@ export interface User {
   id: string;
   username: string;
   email: string;
+  timezone?: string | null;
 }
 
 export interface AuthResponse {
@@ -30,6 +31,15 @@ export interface UserStats {
   xp_breakdown: Record<string, number>;
 }
 
+// Pushed over /api/v1/ws/xp for every XP award
+export interface XPUpdate {
+  xp_delta: number;
+  total_xp: number;
+  current_level: number;
+  xp_type: string;
+  local_day: string;
+}
+
 export interface MoodLog {
   id: string;
   mood_rating: number;
@@ -59,3 +69,14 @@ export interface CodeLog {
 export interface DailyReport {
   report: string;
 }
+
+export interface Dashboard {
+  user: User;
+  stats: UserStats;
+  code_activity: {
+    code_logs: CodeLog[];
+    total_logs: number;
+  };
+  report: string | null;
+  report_status: 'ready' | 'pending' | 'skipped';
+}